@@ -1,159 +1,316 @@
-
-import sys
+#! /usr/bin/env python
+"""
+Runs the pybindgen micro benchmarks, or compares the results of two runs.
+
+The testapi module (testapi.h, wrapped by testapi-pybindgen.py) is
+generated, compiled, and every benchmark is timed on it.  Each
+benchmark is calibrated so that one measurement lasts at least
+--min-time seconds, measured --repeat times, and reported as the min,
+median, mean and standard deviation of the time per call.  Modules
+built from the same API by other binding tools (testapi_boost,
+testapi_swig, testapi_sip, see wscript) are benchmarked as well when
+found in --module-path; benchmarks they do not support are skipped.
+Usage::
+
+    python benchmarks/bench.py [--output results.json] [--repeat R] [--cxxflags="-O3 -march=native"]
+    python benchmarks/bench.py --compare old.json new.json [--threshold 0.05]
+
+The compiler flags start with a dash, so they must be attached to
+--cxxflags with an equals sign: --cxxflags -O3 is rejected.
+
+The compare mode flags the benchmarks whose median time changed by
+more than the threshold, and exits with status 1 if any got slower.
+"""
+
+import argparse
+import datetime
+import json
 import os
-from xml.dom.minidom import getDOMImplementation
-from timeit import Timer
+import platform
+import shutil
+import statistics
 import subprocess
-
-sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                '..', 'build', 'default', 'benchmarks'))
-
-
-TIMES = 10000000
-TIMES1 = TIMES/4
-
-import testapi_pybindgen
-import testapi_boost
-import testapi_swig
-import testapi_sip
-
-
-def bench(mod, dom, elem):
-    def bench():
-        return mod.func1()
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call function with no arguments")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-    
-    def bench():
-        return mod.func2(1.0, 2.0, 3.0)
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call function taking 3 doubles")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    def bench():
-        return mod.Multiplier()
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call class constructor with no arguments")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    def bench():
-        return mod.Multiplier(3.0)
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call class constructor with double")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    obj = mod.Multiplier(3.0)
-    def bench():
-        return obj.GetFactor()
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call simple method")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    obj = mod.Multiplier(3.0)
-    def bench():
-        return obj.SetFactor()
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call overloaded method 1")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    obj = mod.Multiplier(3.0)
-    def bench():
-        return obj.SetFactor(1.0)
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call overloaded method 2")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    obj = mod.Multiplier(3.0)
-    def bench():
-        return obj.Multiply(5.0)
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call non-overridden virtual method with double")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    class M(mod.Multiplier):
-        def Multiply(self, value):
-            return super(M, self).Multiply(value)
-    obj = M(2.0)
-    def bench():
-        return obj.Multiply(5.0)
-
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call python-overridden virtual method from Python")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES1)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
-
-    def bench():
-        return mod.call_virtual_from_cpp(obj, 5.0)
-    tst = elem.appendChild(dom.createElement('test'))
-    tst.setAttribute("description", "call python-overridden virtual method from C++")
-    tst.setAttribute("time", repr(Timer(bench).timeit(TIMES1)))
-    print "%s (%s): %s" % (tst.tagName, tst.getAttribute('description'), tst.getAttribute('time'))
+import sys
+import sysconfig
+import tempfile
+import timeit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+RESULTS_FORMAT = 1
+
+MODULES = [
+    ('pybindgen', 'testapi_pybindgen'),
+    ('boost_python', 'testapi_boost'),
+    ('swig', 'testapi_swig'),
+    ('sip', 'testapi_sip'),
+]
+
+## (name, description, setup, statement); the setup runs in a
+## namespace where 'mod' is the module being benchmarked
+BENCHMARKS = [
+    ('func1', "call function with no arguments",
+     "", "mod.func1()"),
+    ('func2', "call function taking 3 doubles",
+     "", "mod.func2(1.0, 2.0, 3.0)"),
+    ('overload_first', "call overloaded function, first overload",
+     "", "mod.overloaded(1)"),
+    ('overload_last', "call overloaded function, last overload",
+     "", "mod.overloaded('abc')"),
+    ('constructor', "call class constructor with no arguments",
+     "", "mod.Multiplier()"),
+    ('constructor_double', "call class constructor with double",
+     "", "mod.Multiplier(3.0)"),
+    ('method', "call simple method",
+     "obj = mod.Multiplier(3.0)", "obj.GetFactor()"),
+    ('method_overload_first', "call overloaded method, first overload",
+     "obj = mod.Multiplier(3.0)", "obj.SetFactor(1.0)"),
+    ('method_overload_last', "call overloaded method, last overload",
+     "obj = mod.Multiplier(3.0)", "obj.SetFactor()"),
+    ('virtual', "call non-overridden virtual method with double",
+     "obj = mod.Multiplier(3.0)", "obj.Multiply(5.0)"),
+    ('virtual_from_python', "call python-overridden virtual method from Python",
+     "class M(mod.Multiplier):\n"
+     "    def Multiply(self, value):\n"
+     "        return super(M, self).Multiply(value)\n"
+     "obj = M(2.0)", "obj.Multiply(5.0)"),
+    ('virtual_from_cpp', "call python-overridden virtual method from C++",
+     "class M(mod.Multiplier):\n"
+     "    def Multiply(self, value):\n"
+     "        return super(M, self).Multiply(value)\n"
+     "obj = M(2.0)", "mod.call_virtual_from_cpp(obj, 5.0)"),
+    ('attribute_get', "get a double instance attribute",
+     "obj = mod.Point()", "obj.x"),
+    ('attribute_set', "set a double instance attribute",
+     "obj = mod.Point()", "obj.x = 1.0"),
+    ('container_iterate', "iterate over a returned vector of 100 doubles",
+     "", "for value in mod.make_vector(100): pass"),
+    ('container_convert', "pass a list of 100 floats as a vector",
+     "values = [float(i) for i in range(100)]", "mod.sum_vector(values)"),
+    ('string', "pass and return a string",
+     "value = 'x' * 32", "mod.echo_string(value)"),
+    ('callback', "call a python callback from C++",
+     "def callback(value):\n"
+     "    return value", "mod.call_callback(callback, 1.0)"),
+]
+
+
+def summarize(times):
+    """statistics of a list of times per call, in seconds"""
+    return dict(min=min(times),
+                median=statistics.median(times),
+                mean=statistics.mean(times),
+                stdev=(len(times) > 1 and statistics.stdev(times) or 0.0),
+                repeat=len(times))
+
+
+def time_statement(namespace, statement, repeat, min_time):
+    timer = timeit.Timer(statement, globals=namespace)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = int(number*min_time/elapsed) + 1
+    result = summarize([elapsed/number for elapsed in timer.repeat(repeat, number)])
+    result['number'] = number
+    return result
+
+
+def time_import(module_dir, module_name, repeat):
+    """time the import of a module, each time in a fresh interpreter"""
+    code = ("import time\n"
+            "start = time.perf_counter()\n"
+            "import %s\n"
+            "print(time.perf_counter() - start)\n" % module_name)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([module_dir, os.environ.get('PYTHONPATH', '')]))
+    times = []
+    for dummy in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code], env=env)
+        times.append(float(output))
+    result = summarize(times)
+    result['number'] = 1
+    return result
+
+
+def build_pybindgen_module(build_dir, cxxflags):
+    """generate and compile testapi_pybindgen; returns its file name"""
+    source_name = os.path.join(build_dir, 'testapimodule.cc')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(BENCHMARKS_DIR, '..'),
+                                                       os.environ.get('PYTHONPATH', '')]))
+    with open(source_name, 'w') as source:
+        subprocess.check_call([sys.executable, os.path.join(BENCHMARKS_DIR, 'testapi-pybindgen.py')],
+                              stdout=source, env=env)
+    compiler = (sysconfig.get_config_var('CXX') or 'c++').split()
+    output = os.path.join(build_dir, 'testapi_pybindgen' + sysconfig.get_config_var('EXT_SUFFIX'))
+    subprocess.check_call(compiler + ['-shared', '-fPIC', '-w', '-fpermissive'] + cxxflags +
+                          ['-I' + sysconfig.get_paths()['include'], '-I' + BENCHMARKS_DIR,
+                           os.path.join(BENCHMARKS_DIR, 'testapi.cc'), source_name, '-o', output])
+    return output
+
+
+def bench_module(tool, module_dir, module_name, args):
+    try:
+        module = __import__(module_name)
+    except ImportError:
+        return None
+    print("%s results:" % tool)
+    ## swig modules are a python module over an _<name> extension
+    extension = sys.modules.get('_' + module_name, module)
+    result = dict(module=module_name,
+                  module_size=os.path.getsize(extension.__file__),
+                  benchmarks={})
+    for name, description, setup, statement in BENCHMARKS:
+        if args.filter and not any([pattern in name for pattern in args.filter]):
+            continue
+        namespace = dict(mod=module)
+        try:
+            exec(setup, namespace)
+            exec(statement, namespace)
+        except (AttributeError, TypeError, NameError):
+            print("  %-24s not supported" % name)
+            continue
+        timing = time_statement(namespace, statement, args.repeat, args.min_time)
+        timing['description'] = description
+        result['benchmarks'][name] = timing
+        print("  %-24s %10.1f ns  (+- %.1f)" % (name, timing['median']*1e9, timing['stdev']*1e9))
+    if not args.filter or any([pattern in 'import' for pattern in args.filter]):
+        timing = time_import(module_dir, module_name, args.repeat)
+        timing['description'] = "import the module"
+        result['benchmarks']['import'] = timing
+        print("  %-24s %10.1f us  (+- %.1f)" % ('import', timing['median']*1e6, timing['stdev']*1e6))
+    return result
+
+
+def get_environment(args):
+    try:
+        revision = subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                           cwd=BENCHMARKS_DIR, stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    from pybindgen.version import __version__
+    return dict(python=sys.version,
+                implementation=platform.python_implementation(),
+                platform=platform.platform(),
+                machine=platform.machine(),
+                compiler=sysconfig.get_config_var('CXX'),
+                cxxflags=' '.join(args.cxxflags),
+                pybindgen=__version__,
+                revision=revision,
+                date=datetime.datetime.now().isoformat())
+
+
+def run(args):
+    build_dir = tempfile.mkdtemp(prefix='pybindgen-bench-')
+    try:
+        if args.no_build:
+            pybindgen_dir = args.module_path[0]
+        else:
+            build_pybindgen_module(build_dir, args.cxxflags)
+            pybindgen_dir = build_dir
+        results = {}
+        for tool, module_name in MODULES:
+            if tool == 'pybindgen':
+                module_dir = pybindgen_dir
+            else:
+                module_dir = None
+                for directory in args.module_path:
+                    if [name for name in os.listdir(directory)
+                        if name.split('.')[0] in (module_name, '_' + module_name)]:
+                        module_dir = directory
+                        break
+                if module_dir is None:
+                    continue
+            sys.path.insert(0, module_dir)
+            try:
+                result = bench_module(tool, module_dir, module_name, args)
+            finally:
+                del sys.path[0]
+            if result is not None:
+                results[tool] = result
+    finally:
+        shutil.rmtree(build_dir)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(dict(format=RESULTS_FORMAT, environment=get_environment(args), results=results),
+                      output, indent=2, sort_keys=True)
+
+
+def format_time(seconds):
+    for unit, scale in [('s', 1), ('ms', 1e3), ('us', 1e6)]:
+        if seconds >= 1/scale:
+            return "%.2f %s" % (seconds*scale, unit)
+    return "%.1f ns" % (seconds*1e9)
+
+
+def compare(args):
+    old_file, new_file = args.compare
+    with open(old_file) as old_input:
+        old = json.load(old_input)
+    with open(new_file) as new_input:
+        new = json.load(new_input)
+    regressions = 0
+    print("%-14s %-24s %12s %12s %8s" % ("tool", "benchmark", "old", "new", "change"))
+    for tool in sorted(set(old['results']) & set(new['results'])):
+        old_benchmarks = old['results'][tool]['benchmarks']
+        new_benchmarks = new['results'][tool]['benchmarks']
+        ## known benchmarks in their usual order, then those of other
+        ## result files (genbench.py)
+        names = [name for name, dummy, dummy, dummy in BENCHMARKS] + ['import']
+        names += sorted(set(old_benchmarks) - set(names))
+        for name in names:
+            if name not in old_benchmarks or name not in new_benchmarks:
+                continue
+            old_timing = old_benchmarks[name]
+            new_timing = new_benchmarks[name]
+            change = new_timing['median']/old_timing['median'] - 1
+            ## only flag changes that also stand out of the noise of
+            ## both runs
+            if change > args.threshold and new_timing['min'] > old_timing['median']:
+                flag = "REGRESSION"
+                regressions += 1
+            elif change < -args.threshold and new_timing['median'] < old_timing['min']:
+                flag = "improvement"
+            else:
+                flag = ""
+            print("%-14s %-24s %12s %12s %+7.1f%% %s"
+                  % (tool, name, format_time(old_timing['median']), format_time(new_timing['median']),
+                     change*100, flag))
+    if regressions:
+        print("%i regression(s)" % regressions)
+        return 1
+    return 0
 
 
 def main():
-    impl = getDOMImplementation()
-    dom = impl.createDocument(None, "pybindgen-benchmarks", None)
-    top = dom.documentElement
-
-    env = top.appendChild(dom.createElement('environment'))
-    env.appendChild(dom.createElement('compiler')).appendChild(dom.createTextNode(
-            subprocess.Popen(["g++", "-v"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]))
-    env.appendChild(dom.createElement('python')).appendChild(dom.createTextNode(
-            sys.version))
-    env.appendChild(dom.createElement('swig')).appendChild(dom.createTextNode(
-            subprocess.Popen(["swig", "-version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]))
-    env.appendChild(dom.createElement('boost_python')).appendChild(dom.createTextNode(
-            subprocess.Popen(["dpkg", "-s", "libboost-python-dev"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]))
-    env.appendChild(dom.createElement('pybindgen')).appendChild(dom.createTextNode(
-            subprocess.Popen(["bzr", "version-info", '--check-clean'],
-                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]))
-
-    env.appendChild(dom.createElement('cpu')).appendChild(dom.createTextNode(
-            file("/proc/cpuinfo").read()))
-
-    if len(sys.argv) == 3:
-        env.appendChild(dom.createElement('CXXFLAGS')).appendChild(dom.createTextNode(sys.argv[2]))
-
-
-    res = top.appendChild(dom.createElement('results'))
-
-
-    print "pybindgen results:"
-    pbg = res.appendChild(dom.createElement('pybindgen'))
-    pbg.setAttribute("module-file-size", repr(os.stat("build/default/benchmarks/testapi_pybindgen.so").st_size))
-    bench(testapi_pybindgen, dom, pbg)
-
-    print "boost_python results:"
-    bp = res.appendChild(dom.createElement('boost_python'))
-    bp.setAttribute("module-file-size", repr(os.stat("build/default/benchmarks/testapi_boost.so").st_size))
-    bench(testapi_boost, dom, bp)
-
-    print "swig results:"
-    sw = res.appendChild(dom.createElement('swig'))
-    sw.setAttribute("module-file-size", repr(os.stat("build/default/benchmarks/_testapi_swig.so").st_size))
-    sw.setAttribute("module-python-file-size", repr(os.stat("build/default/benchmarks/testapi_swig.py").st_size))
-    bench(testapi_swig, dom, sw)
-
-    print "sip results:"
-    sip = res.appendChild(dom.createElement('sip'))
-    sip.setAttribute("module-file-size", repr(os.stat("build/default/benchmarks/testapi_sip.so").st_size))
-    bench(testapi_sip, dom, sip)
-
-    if len(sys.argv) == 3:
-        f = open(sys.argv[1], "wb")
-        dom.writexml(f, "", "  ", "\n")
-        f.close()
-
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--repeat', type=int, default=7,
+                        help="number of measurements of each benchmark")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="minimum duration of each measurement, in seconds")
+    parser.add_argument('--filter', action='append',
+                        help="only run the benchmarks whose name contains this string")
+    parser.add_argument('--cxxflags', default='-O2',
+                        help="flags used to compile the pybindgen module, "
+                        "given as --cxxflags=FLAGS (default: %(default)s)")
+    parser.add_argument('--module-path', action='append', default=[],
+                        help="directory where to look for modules built by other tools")
+    parser.add_argument('--no-build', action='store_true',
+                        help="use the testapi_pybindgen module found in the first --module-path")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two results files instead of running the benchmarks")
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help="relative change of the median flagged by --compare")
+    args = parser.parse_args()
+    args.cxxflags = args.cxxflags.split()
+
+    if args.compare:
+        return compare(args)
+    if args.no_build and not args.module_path:
+        parser.error("--no-build requires --module-path")
+    run(args)
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
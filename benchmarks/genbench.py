@@ -0,0 +1,308 @@
+#! /usr/bin/env python
+"""
+Measures how the code generator itself scales with the size of the
+wrapped API.
+
+A synthetic API model is built in memory, with a configurable number
+of classes, methods per class, overloads per method, inheritance
+depth, virtual methods and containers, and Module.generate is run on
+it, both into a single code sink and through a MultiSectionFactory.
+No C++ code is compiled.  For each API size the wall time of the
+generation, the peak python memory, the peak resident set size of the
+generator process, the number of bytes generated and the time spent
+in each phase of the generation are reported, along with the growth
+of the generation time relative to the API size, which should stay
+close to 1 (linear).  Usage::
+
+    python benchmarks/genbench.py [--classes 100,200,400] [--output results.json]
+
+The JSON results can be compared with bench.py --compare.
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+try:
+    import resource
+except ImportError: # not on Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+RESULTS_FORMAT = 1
+
+MODES = ['monolithic', 'multisection']
+
+## parameter lists of the successive overloads of each method
+OVERLOAD_PARAMETERS = [
+    [('int', 'a')],
+    [('double', 'a'), ('double', 'b')],
+    [('std::string', 'a')],
+    [('bool', 'a'), ('int', 'b'), ('double', 'c')],
+    [('unsigned int', 'a'), ('std::string', 'b')],
+    [('float', 'a'), ('float', 'b'), ('float', 'c'), ('float', 'd')],
+]
+
+
+class PhaseTimer(object):
+    """
+    Accumulates the time spent in some methods of the generator,
+    excluding the time spent in nested phases.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+
+    def _enter(self, phase):
+        now = time.perf_counter()
+        if self.stack:
+            parent, start = self.stack[-1]
+            self.times[parent] = self.times.get(parent, 0.0) + now - start
+        self.stack.append((phase, now))
+
+    def _leave(self):
+        now = time.perf_counter()
+        phase, start = self.stack.pop()
+        self.times[phase] = self.times.get(phase, 0.0) + now - start
+        if self.stack:
+            self.stack[-1] = (self.stack[-1][0], now)
+
+    def instrument(self, cls, method_name, phase):
+        original = getattr(cls, method_name)
+        timer = self
+
+        def wrapper(*args, **kwargs):
+            timer._enter(phase)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer._leave()
+        setattr(cls, method_name, wrapper)
+
+
+def instrument_generator(timer):
+    from pybindgen import module, cppclass, container, overloading
+    from pybindgen.typehandlers import base, codesink
+    timer.instrument(module.ModuleBase, 'generate_forward_declarations', 'forward_declarations')
+    timer.instrument(cppclass.CppClass, 'generate_forward_declarations', 'forward_declarations')
+    timer.instrument(cppclass.CppClass, 'generate', 'classes')
+    timer.instrument(container.Container, 'generate', 'containers')
+    timer.instrument(overloading.OverloadedWrapper, 'generate', 'wrappers')
+    timer.instrument(base.TypeMatcher, 'lookup', 'type_lookup')
+    timer.instrument(codesink.MemoryCodeSink, 'flush_to', 'code_sinks')
+
+
+def build_model(args, num_classes, sections):
+    """build the synthetic API; returns the root module"""
+    from pybindgen import Module, param, retval
+
+    mod = Module('genbench')
+    mod.add_include('"genbench.h"')
+    classes = []
+    for index in range(num_classes):
+        if sections > 1:
+            mod.begin_section('section%i' % (index % sections))
+        if index % args.inheritance_depth:
+            parent = classes[-1]
+        else:
+            parent = None
+        cls = mod.add_class('Class%i' % index, parent=parent,
+                            allow_subclassing=(args.virtuals > 0))
+        cls.add_constructor([])
+        cls.add_copy_constructor()
+        cls.add_constructor([param('int', 'value')])
+        cls.add_instance_attribute('m_value%i' % index, 'int')
+        for method in range(args.methods):
+            for overload in range(args.overloads):
+                parameters = OVERLOAD_PARAMETERS[overload % len(OVERLOAD_PARAMETERS)]
+                cls.add_method('Method%i_%i' % (index, method), 'int',
+                               [param(ctype, name) for ctype, name in parameters],
+                               is_virtual=(method < args.virtuals))
+        if index < args.containers:
+            container_name = 'std::vector< Class%i >' % index
+            mod.add_container(container_name, retval('Class%i' % index), 'vector')
+            cls.add_method('GetAll', retval(container_name), [], is_static=True)
+        mod.add_function('MakeClass%i' % index, retval('Class%i *' % index, caller_owns_return=True),
+                         [param('int', 'value')])
+        if sections > 1:
+            mod.end_section('section%i' % (index % sections))
+        classes.append(cls)
+    return mod
+
+
+def get_peak_rss():
+    """peak resident set size of this process, in bytes, or None"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak_rss
+    return peak_rss*1024 # kilobytes
+
+
+def generate(args, mode, num_classes, use_tracemalloc):
+    """generate the synthetic module once; returns the measurements"""
+    from pybindgen.module import MultiSectionFactory
+    from pybindgen.typehandlers.codesink import MemoryCodeSink
+    import pybindgen.settings
+    pybindgen.settings.deprecated_virtuals = False
+
+    if use_tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+    timer = PhaseTimer()
+    instrument_generator(timer)
+
+    class MemoryMultiSectionFactory(MultiSectionFactory):
+        def __init__(self):
+            self.sinks = {'__main__': MemoryCodeSink(), '__header__': MemoryCodeSink()}
+        def get_section_code_sink(self, section_name):
+            return self.sinks.setdefault(section_name, MemoryCodeSink())
+        def get_main_code_sink(self):
+            return self.sinks['__main__']
+        def get_common_header_code_sink(self):
+            return self.sinks['__header__']
+        def get_common_header_include(self):
+            return '"genbench.h"'
+
+    start = time.perf_counter()
+    timer._enter('model')
+    mod = build_model(args, num_classes, mode == 'multisection' and args.sections or 1)
+    timer._leave()
+    model_time = time.perf_counter() - start
+
+    if mode == 'multisection':
+        out = MemoryMultiSectionFactory()
+        sinks = out.sinks.values()
+    else:
+        out = MemoryCodeSink()
+        sinks = [out]
+    start = time.perf_counter()
+    timer._enter('other')
+    mod.generate(out)
+    timer._leave()
+    generate_time = time.perf_counter() - start
+
+    result = dict(model_time=model_time,
+                  generate_time=generate_time,
+                  generated_bytes=sum([len('\n'.join(sink.lines)) + 1 for sink in sinks]),
+                  phases=timer.times,
+                  peak_rss=get_peak_rss())
+    if use_tracemalloc:
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run_worker(args, mode, num_classes, use_tracemalloc):
+    """run one generation in a fresh interpreter, since type handlers
+    are registered globally"""
+    command = [sys.executable, os.path.abspath(__file__),
+               '--worker', mode, str(num_classes),
+               '--methods', str(args.methods), '--overloads', str(args.overloads),
+               '--inheritance-depth', str(args.inheritance_depth),
+               '--virtuals', str(args.virtuals), '--containers', str(args.containers),
+               '--sections', str(args.sections)]
+    if use_tracemalloc:
+        command.append('--tracemalloc')
+    output = subprocess.check_output(command)
+    return json.loads(output.decode('ascii').splitlines()[-1])
+
+
+def summarize(times):
+    return dict(min=min(times),
+                median=statistics.median(times),
+                mean=statistics.mean(times),
+                stdev=(len(times) > 1 and statistics.stdev(times) or 0.0),
+                repeat=len(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--classes', default='100,200,400',
+                        help="comma separated list of API sizes, in number of classes")
+    parser.add_argument('--methods', type=int, default=10, help="methods per class")
+    parser.add_argument('--overloads', type=int, default=2, help="overloads per method")
+    parser.add_argument('--inheritance-depth', type=int, default=3,
+                        help="length of the chains of derived classes")
+    parser.add_argument('--virtuals', type=int, default=2,
+                        help="virtual methods per class (among --methods)")
+    parser.add_argument('--containers', type=int, default=20,
+                        help="number of classes with a vector container")
+    parser.add_argument('--sections', type=int, default=8,
+                        help="number of sections in multisection mode")
+    parser.add_argument('--mode', action='append', choices=MODES,
+                        help="code sink setup to measure (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="number of generations timed")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'CLASSES'), help=argparse.SUPPRESS)
+    parser.add_argument('--tracemalloc', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, num_classes = args.worker
+        print(json.dumps(generate(args, mode, int(num_classes), args.tracemalloc)))
+        return
+
+    sizes = [int(size) for size in args.classes.split(',')]
+    results = {}
+    for mode in (args.mode or MODES):
+        print("%s:" % mode)
+        print("  %8s %10s %10s %12s %10s %10s  %s" % ("classes", "model (s)", "gen (s)", "bytes", "peak (MB)",
+                                                     "RSS (MB)", "phases (s)"))
+        benchmarks = {}
+        for num_classes in sizes:
+            runs = [run_worker(args, mode, num_classes, False) for dummy in range(args.repeat)]
+            memory_run = run_worker(args, mode, num_classes, True)
+            best = min(runs, key=lambda run: run['generate_time'])
+            timing = summarize([run['generate_time'] for run in runs])
+            timing.update(description="generate a module of %i classes" % num_classes,
+                          classes=num_classes,
+                          model_time=statistics.median([run['model_time'] for run in runs]),
+                          generated_bytes=best['generated_bytes'],
+                          peak_memory=memory_run['peak_memory'],
+                          peak_rss=max([run['peak_rss'] or 0 for run in runs]) or None,
+                          phases=best['phases'])
+            benchmarks['classes_%i' % num_classes] = timing
+            print("  %8i %10.3f %10.3f %12i %10.1f %10.1f  %s"
+                  % (num_classes, timing['model_time'], timing['median'], timing['generated_bytes'],
+                     timing['peak_memory']/1e6, (timing['peak_rss'] or 0)/1e6,
+                     ' '.join(["%s=%.3f" % item for item in sorted(best['phases'].items())])))
+        ## growth exponent of the generation time, between the
+        ## smallest and largest API: 1 is linear, 2 quadratic
+        if len(sizes) > 1:
+            smallest = benchmarks['classes_%i' % min(sizes)]
+            largest = benchmarks['classes_%i' % max(sizes)]
+            exponent = (math.log(largest['median']/smallest['median'])
+                        / math.log(float(max(sizes))/min(sizes)))
+            print("  generation time growth exponent: %.2f" % exponent)
+        else:
+            exponent = None
+        results[mode] = dict(benchmarks=benchmarks, growth_exponent=exponent)
+
+    if args.output:
+        from pybindgen.version import __version__
+        environment = dict(python=sys.version,
+                           implementation=platform.python_implementation(),
+                           platform=platform.platform(),
+                           pybindgen=__version__,
+                           date=datetime.datetime.now().isoformat(),
+                           parameters=dict(methods=args.methods, overloads=args.overloads,
+                                           inheritance_depth=args.inheritance_depth,
+                                           virtuals=args.virtuals, containers=args.containers,
+                                           sections=args.sections))
+        with open(args.output, 'w') as output:
+            json.dump(dict(format=RESULTS_FORMAT, environment=environment, results=results),
+                      output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
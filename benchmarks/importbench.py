@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+"""
+Measures the import time of a large generated extension module, with
+and without lazy initialization (see Module.set_lazy_init).
+
+A synthetic header with many small classes and enums is generated,
+wrapped twice (eager and lazy), compiled, and then each module is
+imported several times in fresh interpreters.  The compile time and
+size of each module are reported as well.  Usage::
+
+    python benchmarks/importbench.py [--classes N] [--repeat R]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pybindgen import Module, FileCodeSink, param, retval
+
+HEADER_NAME = 'importbench.h'
+
+
+def write_header(file_name, num_classes):
+    with open(file_name, 'w') as header:
+        header.write("#include <string>\n\n")
+        for index in range(num_classes):
+            header.write('''
+enum Color%(i)i { RED%(i)i, GREEN%(i)i, BLUE%(i)i };
+
+class Base%(i)i
+{
+public:
+    Base%(i)i () : m_value (%(i)i) {}
+    virtual ~Base%(i)i () {}
+    int GetValue () const { return m_value; }
+    void SetValue (int value) { m_value = value; }
+protected:
+    int m_value;
+};
+
+class Derived%(i)i : public Base%(i)i
+{
+public:
+    std::string GetName () const { return "Derived%(i)i"; }
+    Color%(i)i GetColor () const { return GREEN%(i)i; }
+};
+
+inline Base%(i)i *MakeDerived%(i)i () { return new Derived%(i)i; }
+''' % dict(i=index))
+
+
+def generate_module(file_name, module_name, num_classes, lazy):
+    mod = Module(module_name)
+    if lazy:
+        mod.set_lazy_init()
+    mod.add_include('"%s"' % HEADER_NAME)
+    for index in range(num_classes):
+        mod.add_enum('Color%i' % index, ['RED%i' % index, 'GREEN%i' % index, 'BLUE%i' % index])
+        base = mod.add_class('Base%i' % index)
+        base.add_constructor([])
+        base.add_method('GetValue', retval('int'), [], is_const=True)
+        base.add_method('SetValue', None, [param('int', 'value')])
+        derived = mod.add_class('Derived%i' % index, parent=base)
+        derived.add_constructor([])
+        derived.add_method('GetName', retval('std::string'), [], is_const=True)
+        derived.add_method('GetColor', retval('Color%i' % index), [], is_const=True)
+        mod.add_function('MakeDerived%i' % index,
+                         retval('Base%i *' % index, caller_owns_return=True), [])
+    with open(file_name, 'w') as out:
+        mod.generate(FileCodeSink(out))
+
+
+def compile_module(source_name, module_dir, module_name):
+    compiler = (sysconfig.get_config_var('CXX') or 'c++').split()
+    output = os.path.join(module_dir, module_name + sysconfig.get_config_var('EXT_SUFFIX'))
+    start = time.time()
+    subprocess.check_call(compiler + ['-shared', '-fPIC', '-O1', '-w', '-fpermissive',
+                                      '-I' + sysconfig.get_paths()['include'],
+                                      '-I' + module_dir, source_name, '-o', output])
+    return time.time() - start, os.path.getsize(output)
+
+
+def time_import(module_dir, module_name, statement, repeat):
+    code = ("import time\n"
+            "start = time.perf_counter()\n"
+            "import %s\n"
+            "%s\n"
+            "print(time.perf_counter() - start)\n" % (module_name, statement))
+    env = dict(os.environ, PYTHONPATH=module_dir)
+    times = []
+    for dummy in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code], env=env)
+        times.append(float(output))
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--classes', type=int, default=500,
+                        help="number of synthetic class pairs to wrap")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="number of imports to time; the best one is reported")
+    parser.add_argument('--generate', nargs=2, metavar=('SOURCE', 'MODULE'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--lazy', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        ## type handlers are registered globally, so each module is
+        ## generated in its own interpreter
+        source_name, module_name = args.generate
+        generate_module(source_name, module_name, args.classes, args.lazy)
+        return
+
+    build_dir = tempfile.mkdtemp(prefix='pybindgen-importbench-')
+    try:
+        write_header(os.path.join(build_dir, HEADER_NAME), args.classes)
+        for lazy in (False, True):
+            module_name = lazy and 'importbench_lazy' or 'importbench_eager'
+            source_name = os.path.join(build_dir, module_name + '.cc')
+            command = [sys.executable, os.path.abspath(__file__), '--classes', str(args.classes),
+                       '--generate', source_name, module_name]
+            if lazy:
+                command.append('--lazy')
+            subprocess.check_call(command)
+            compile_time, module_size = compile_module(source_name, build_dir, module_name)
+            import_time = time_import(build_dir, module_name, "", args.repeat)
+            use_time = time_import(build_dir, module_name,
+                                   "%s.Derived0().GetColor()" % module_name, args.repeat)
+            print("%-18s compile: %6.1f s   size: %6i kB   import: %8.2f ms   import + first use: %8.2f ms"
+                  % (module_name, compile_time, module_size // 1024, import_time*1e3, use_time*1e3))
+    finally:
+        shutil.rmtree(build_dir)
+
+
+if __name__ == '__main__':
+    main()
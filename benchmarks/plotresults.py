@@ -1,77 +1,71 @@
+#! /usr/bin/env python
+"""
+Plots the results written by bench.py --output.  Usage::
 
-import pylab
-from xml.dom.minidom import parse, Node
-import sys
-import numpy as np
-import shutil
+    python benchmarks/plotresults.py results.json OUTPUT_DIR
+
+OUTPUT_DIR is recreated, and receives one bar chart per benchmark,
+comparing the binding tools, and an index.html showing them all.
+"""
+
+import json
 import os
+import shutil
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot
 
 DPI = 75
 
-def getText(nodelist):
-    rc = ""
-    for node in nodelist:
-        if node.nodeType == node.TEXT_NODE:
-            rc = rc + node.data
-    return rc
+
+def bar_chart(output_name, title, labels, values, errors=None):
+    pyplot.figure()
+    ind = range(len(values))
+    pyplot.bar(ind, values, yerr=errors)
+    pyplot.xticks(ind, labels)
+    pyplot.title(title)
+    pyplot.savefig(output_name, dpi=DPI)
+    pyplot.close()
+
 
 def main(argv):
-    input_fname = sys.argv[1]
-    dom = parse(input_fname)
-    outdir = sys.argv[2]
-    res = dom.getElementsByTagName("results")[0]
-    tools = [e for e in res.childNodes if e.nodeType == Node.ELEMENT_NODE]
-
-    # get the pybindgen revno
-    pbg_env = dom.getElementsByTagName("environment")[0].getElementsByTagName("pybindgen")[0]
-    pbg_txt = getText(pbg_env.childNodes).split("\n")
-    for l in pbg_txt:
-        k, s, v = l.partition(':')
-        k = k.strip()
-        if k == 'revno':
-            v = v.strip()
-            revno = v
-            break
-
-    num_tests = len(tools[0].getElementsByTagName("test"))
+    input_fname = argv[1]
+    outdir = argv[2]
+    with open(input_fname) as input_file:
+        data = json.load(input_file)
+    results = data['results']
+    tools = sorted(results)
+
     shutil.rmtree(outdir, True)
     os.mkdir(outdir)
     shutil.copy2(input_fname, outdir)
 
     figures = []
 
-
-    sizes = [float(t.getAttribute('module-file-size')) for t in tools]
-    labels= [t.tagName for t in tools]
-    ind = range(len(sizes))    
-    pylab.bar(ind, sizes)
-    pylab.xticks([0.5+x for x in ind], labels)
-    pylab.title("Extension module file size (B)")
     fname = "sizes.png"
-    pylab.savefig(os.path.join(outdir, fname), dpi=DPI)
+    bar_chart(os.path.join(outdir, fname), "Extension module file size (B)",
+              tools, [results[tool]['module_size'] for tool in tools])
     figures.append(fname)
-    
-    
-    for t in range(num_tests):
-        pylab.figure()
-        labels = []
-        values = []
-        for x, tool in enumerate(tools):
-            labels.append(tool.tagName)
-            values.append(float(tool.getElementsByTagName("test")[t].getAttribute('time')))
-        ind = range(len(values))
-        pylab.bar(ind, values)
-        pylab.xticks([0.5+x for x in ind], labels)
-
-        desc = tools[0].getElementsByTagName("test")[t].getAttribute("description")
-        pylab.title(desc)
-        
-        fname = "%s.png" % (desc)
-        pylab.savefig(os.path.join(outdir, fname), dpi=DPI)
+
+    names = []
+    for tool in tools:
+        for name in results[tool]['benchmarks']:
+            if name not in names:
+                names.append(name)
+    for name in names:
+        labels = [tool for tool in tools if name in results[tool]['benchmarks']]
+        timings = [results[tool]['benchmarks'][name] for tool in labels]
+        fname = "%s.png" % name
+        bar_chart(os.path.join(outdir, fname), "%s (us)" % timings[0]['description'], labels,
+                  [timing['median']*1e6 for timing in timings],
+                  [timing['stdev']*1e6 for timing in timings])
         figures.append(fname)
 
-    index_html = file("%s/index.html" % outdir, "wt")
-    print >> index_html, """
+    environment = data['environment']
+    with open(os.path.join(outdir, "index.html"), "w") as index_html:
+        index_html.write("""
 <html>
 <head>
 <title> PyBindGen Benchmarks </title>
@@ -79,27 +73,24 @@ def main(argv):
 
 <body>
 
-  <div>Details in the <a href=\"%s\">Raw XML file</a>.
-  <a href=\"http://bazaar.launchpad.net/~gjc/pybindgen/trunk/files/%s/benchmarks/\">Source files for the benchmarks</a>.
+  <div>PyBindGen %s (%s), Python %s, %s.
+  Details in the <a href="%s">raw JSON file</a>.
   </div>
+""" % ('.'.join([str(x) for x in environment['pybindgen']]), environment['revision'],
+       environment['python'].split()[0], environment['platform'], os.path.basename(input_fname)))
 
-""" % (os.path.basename(input_fname), revno)
-
-    for fig in figures:
-        print >> index_html, """
+        for fig in figures:
+            index_html.write("""
   <div>
-    <img src=\"%s\"/>
+    <img src="%s"/>
   </div>
-""" % (fig,)
+""" % (fig,))
 
-    print >> index_html, """
+        index_html.write("""
 </body>
-"""
-    
-    index_html.close()
-    
-    
+</html>
+""")
+
 
 if __name__ == '__main__':
     main(sys.argv)
-
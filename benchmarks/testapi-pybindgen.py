@@ -28,7 +28,24 @@ def my_module_gen(out_file):
     Multiplier.add_method('Multiply', 'double', [param('double', 'value')], is_virtual=True, is_const=True)
 
     mod.add_function('call_virtual_from_cpp', 'double', [param('Multiplier const *', 'obj'), param('double', 'value')])
-    
+
+    mod.add_function('overloaded', 'int', [param('int', 'x')])
+    mod.add_function('overloaded', 'int', [param('double', 'x'), param('double', 'y')])
+    mod.add_function('overloaded', 'int', [param('std::string const &', 's')])
+
+    Point = mod.add_struct('Point')
+    Point.add_instance_attribute('x', 'double')
+    Point.add_instance_attribute('y', 'double')
+
+    mod.add_container('std::vector<double>', 'double', 'vector')
+    mod.add_function('make_vector', retval('std::vector<double>'), [param('int', 'size')])
+    mod.add_function('sum_vector', 'double', [param('std::vector<double>', 'vec')])
+
+    mod.add_function('echo_string', 'std::string', [param('std::string const &', 'str')])
+
+    mod.add_function('call_callback', 'double', [param('PyObject*', 'callback', transfer_ownership=False),
+                                                 param('double', 'value')])
+
 
     mod.generate(FileCodeSink(out_file))
 
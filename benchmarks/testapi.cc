@@ -1,4 +1,5 @@
 // -*- Mode: C++; c-file-style: "stroustrup"; indent-tabs-mode:nil; -*-
+#include <Python.h>
 #include "testapi.h"
 
 void func1 (void)
@@ -53,3 +54,60 @@ call_virtual_from_cpp (Multiplier const *obj, double value)
     return obj->Multiply (value);
 }
 
+
+int overloaded (int x)
+{
+    return x;
+}
+
+int overloaded (double x, double y)
+{
+    return (int) (x + y);
+}
+
+int overloaded (std::string const &s)
+{
+    return (int) s.size ();
+}
+
+std::vector<double>
+make_vector (int size)
+{
+    std::vector<double> vec;
+    for (int i = 0; i < size; i++)
+    {
+        vec.push_back (i);
+    }
+    return vec;
+}
+
+double
+sum_vector (std::vector<double> vec)
+{
+    double sum = 0;
+    for (std::vector<double>::const_iterator iter = vec.begin (); iter != vec.end (); iter++)
+    {
+        sum += *iter;
+    }
+    return sum;
+}
+
+std::string
+echo_string (std::string const &str)
+{
+    return str;
+}
+
+double
+call_callback (PyObject *callback, double value)
+{
+    PyObject *result = PyObject_CallFunction (callback, (char *) "d", value);
+    if (result == NULL)
+    {
+        PyErr_Clear ();
+        return 0;
+    }
+    double retval = PyFloat_AsDouble (result);
+    Py_DECREF (result);
+    return retval;
+}
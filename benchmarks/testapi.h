@@ -2,6 +2,8 @@
 #ifndef   	TESTAPI_H_
 # define   	TESTAPI_H_
 
+#include <string>
+#include <vector>
 
 void func1 (void);
 
@@ -25,4 +27,24 @@ public:
 
 double call_virtual_from_cpp (Multiplier const *obj, double value);
 
+// overload resolution: first versus last overload
+int overloaded (int x);
+int overloaded (double x, double y);
+int overloaded (std::string const &s);
+
+struct Point
+{
+    double x;
+    double y;
+};
+
+std::vector<double> make_vector (int size);
+double sum_vector (std::vector<double> vec);
+
+std::string echo_string (std::string const &str);
+
+typedef struct _object PyObject;
+// calls callback(value), which must return a float
+double call_callback (PyObject *callback, double value);
+
 #endif
@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+"""
+Compares the tokenizers of the C type parser (ctypeparser):
+GetTokens, the general C++ source tokenizer, and GetTypeTokens, the
+regular expression based tokenizer of type expressions that
+parse_type uses.
+
+Two corpora of type strings are measured: the examples of the
+ctypeparser doctests, and the type strings parsed while generating a
+real API, by default the foo test module (tests/foomodulegen.py).  A
+dump of the type strings of a larger API, one per line, can be given
+instead; such a dump is written by --dump.  Usage::
+
+    python benchmarks/typeparsebench.py [--type-strings types.txt] [--output results.json]
+
+The JSON results can be compared with bench.py --compare.
+"""
+
+import argparse
+import datetime
+import doctest
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+RESULTS_FORMAT = 1
+
+TOKENIZERS = ['GetTokens', 'GetTypeTokens']
+
+_string_literal_rx = re.compile(r"""(['"])(.+?)\1""")
+
+
+def doctests_corpus():
+    """the string literals of the ctypeparser doctests examples"""
+    from pybindgen.typehandlers import ctypeparser
+    type_strings = []
+    for test in doctest.DocTestFinder().find(ctypeparser):
+        for example in test.examples:
+            if example.source.startswith(('normalize_type_string(', 't = TypeTraits(')):
+                type_strings.extend([m.group(2) for m in _string_literal_rx.finditer(example.source)])
+    return type_strings
+
+
+def api_corpus():
+    """the type strings parsed while generating the foo test module"""
+    from pybindgen.typehandlers.ctypeparser import tokenizer
+    tests_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests')
+    sys.path.insert(0, tests_directory)
+    import foomodulegen
+
+    type_strings = []
+    get_type_tokens = tokenizer.GetTypeTokens
+    def recording_get_type_tokens(source):
+        type_strings.append(source)
+        return get_type_tokens(source)
+    tokenizer.GetTypeTokens = recording_get_type_tokens
+    try:
+        with open(os.devnull, 'w') as devnull:
+            foomodulegen.my_module_gen(devnull)
+    finally:
+        tokenizer.GetTypeTokens = get_type_tokens
+    return type_strings
+
+
+def get_tokenizer(name):
+    from pybindgen.typehandlers.ctypeparser import tokenizer
+    if name == 'GetTokens':
+        ## the way parse_type used to call it
+        return lambda source: list(tokenizer.GetTokens(source + '\n'))
+    return getattr(tokenizer, name)
+
+
+def check_tokens(type_strings):
+    """both tokenizers must return the same tokens"""
+    def key(tokens):
+        return [(token.token_type, token.name, token.start, token.end) for token in tokens]
+    expected, actual = [get_tokenizer(name) for name in TOKENIZERS]
+    for type_string in type_strings:
+        if key(expected(type_string)) != key(actual(type_string)):
+            raise AssertionError("different tokens for type %r" % type_string)
+
+
+def measure(function, type_strings, args):
+    """median, etc. time of one call of function on each type string"""
+    number = 1
+    while 1:
+        start = time.perf_counter()
+        for dummy in range(number):
+            for type_string in type_strings:
+                function(type_string)
+        if time.perf_counter() - start >= args.min_time:
+            break
+        number *= 2
+    times = []
+    for dummy in range(args.repeat):
+        start = time.perf_counter()
+        for dummy in range(number):
+            for type_string in type_strings:
+                function(type_string)
+        times.append((time.perf_counter() - start)/number)
+    return dict(min=min(times),
+                median=statistics.median(times),
+                mean=statistics.mean(times),
+                stdev=(len(times) > 1 and statistics.stdev(times) or 0.0),
+                repeat=len(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--type-strings', help="file with the type strings of an API, one per line")
+    parser.add_argument('--dump', help="write the type strings of the API corpus to this file")
+    parser.add_argument('--repeat', type=int, default=7, help="number of measurements of each benchmark")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="minimum duration of each measurement, in seconds")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    from pybindgen.typehandlers import ctypeparser
+    from pybindgen.typehandlers.ctypeparser import tokenizer
+
+    if args.type_strings:
+        with open(args.type_strings) as type_strings_file:
+            api_type_strings = [line.rstrip('\n') for line in type_strings_file if line.strip()]
+    else:
+        api_type_strings = api_corpus()
+    if args.dump:
+        with open(args.dump, 'w') as dump:
+            for type_string in api_type_strings:
+                dump.write(type_string + '\n')
+    corpora = [('doctests', doctests_corpus()), ('api', api_type_strings)]
+    for dummy, type_strings in corpora:
+        check_tokens(type_strings)
+
+    results = {}
+    print("%-14s %-20s %8s %14s %14s" % ("tokenizer", "benchmark", "strings", "median (s)", "per type (us)"))
+    for name in TOKENIZERS:
+        benchmarks = {}
+        function = get_tokenizer(name)
+        for corpus, type_strings in corpora:
+            benchmarks['%s_tokenize' % corpus] = measure(function, type_strings, args)
+            benchmarks['%s_tokenize' % corpus].update(
+                description="tokenize the %i %s type strings" % (len(type_strings), corpus))
+            ## the whole parse, with this tokenizer
+            get_type_tokens = tokenizer.GetTypeTokens
+            tokenizer.GetTypeTokens = function
+            try:
+                benchmarks['%s_parse' % corpus] = measure(ctypeparser.parse_type, type_strings, args)
+            finally:
+                tokenizer.GetTypeTokens = get_type_tokens
+            benchmarks['%s_parse' % corpus].update(
+                description="parse the %i %s type strings" % (len(type_strings), corpus))
+            for benchmark in ('%s_tokenize' % corpus, '%s_parse' % corpus):
+                print("%-14s %-20s %8i %14.6f %14.3f"
+                      % (name, benchmark, len(type_strings), benchmarks[benchmark]['median'],
+                         benchmarks[benchmark]['median']/len(type_strings)*1e6))
+        results[name] = dict(benchmarks=benchmarks)
+
+    if args.output:
+        from pybindgen.version import __version__
+        environment = dict(python=sys.version,
+                           implementation=platform.python_implementation(),
+                           platform=platform.platform(),
+                           pybindgen=__version__,
+                           date=datetime.datetime.now().isoformat(),
+                           parameters=dict(type_strings=args.type_strings))
+        with open(args.output, 'w') as output:
+            json.dump(dict(format=RESULTS_FORMAT, environment=environment, results=results),
+                      output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""
+API models: a compact, data driven alternative to the python scripts
+written by the pygen mode of
+:class:`pybindgen.gccxmlparser.ModuleParser`.
+
+An :class:`ApiModelCodeSink` can be used wherever ModuleParser expects
+a pygen code sink, directly or in a
+:class:`pybindgen.gccxmlparser.PygenSection`.  It translates the pygen
+statements, as they are written, into the records of an API model
+file: one JSON document per line, and per statement.  The model is
+turned back into :class:`pybindgen.Module`, :class:`pybindgen.CppClass`,
+etc. objects by :func:`load_api_model`, which interprets the records
+instead of compiling and running a large python script::
+
+  module_parser = ModuleParser('foo', '::')
+  module_parser.parse(['foo.h'], includes=['"foo.h"'],
+                      pygen_sink=ApiModelCodeSink(open('foo.json', 'w')))
+  ...
+  root_module = load_api_model('foo.json')
+  root_module.generate(FileCodeSink(sys.stdout))
+
+With pygen sections, the model of each section must be written to a
+file named after the section, with the extension of the main model
+file, in the same directory (e.g. foo.json, foo_section1.json,
+...).  Sections are loaded only when one of their functions is first
+called, and their local customizations modules, if any, are imported
+and called just like the pygen scripts do.
+
+The records of the model are: ``{"def": [name, [parameters]]}``,
+``{"set": [name, expression]}``, ``{"do": expression}``,
+``{"return": expression}``, ``{"customize": [module name, function name,
+[expressions]]}`` and ``{"error_handler": "warn"}``.  Expressions are
+JSON values, or objects with a single key: ``{"name": name}``,
+``{"attr": [expression, name]}``, ``{"item": [expression,
+expression]}``, ``{"call": [expression, [expressions], {name:
+expression}]}``, ``{"tuple": [expressions]}`` and ``{"dict": [[expression,
+expression]]}``.
+"""
+
+import ast
+import functools
+import io
+import json
+import os.path
+import re
+import textwrap
+import warnings
+
+from pybindgen.typehandlers.codesink import CodeSink
+from pybindgen.module import Module
+from pybindgen.utils import param, retval
+from pybindgen import settings
+from pybindgen import cppclass
+from pybindgen import typehandlers
+from pybindgen.typehandlers.codesink import FileCodeSink
+
+
+_def_rx = re.compile(r"^def\s+(\w+)\((.*)\):$")
+
+
+def _encode_value(value):
+    if isinstance(value, list):
+        return [_encode_value(item) for item in value]
+    if isinstance(value, tuple):
+        return {'tuple': [_encode_value(item) for item in value]}
+    if isinstance(value, dict):
+        return {'dict': [[_encode_value(key), _encode_value(val)] for key, val in value.items()]}
+    return value
+
+
+def _encode_expression(node):
+    try:
+        return _encode_value(ast.literal_eval(node))
+    except ValueError:
+        pass
+    if isinstance(node, ast.Name):
+        return {'name': node.id}
+    if isinstance(node, ast.Attribute):
+        return {'attr': [_encode_expression(node.value), node.attr]}
+    if isinstance(node, ast.Subscript):
+        index = node.slice
+        if isinstance(index, ast.Index): # python < 3.9
+            index = index.value
+        return {'item': [_encode_expression(node.value), _encode_expression(index)]}
+    if isinstance(node, ast.Call):
+        return {'call': [_encode_expression(node.func),
+                         [_encode_expression(arg) for arg in node.args],
+                         dict([(keyword.arg, _encode_expression(keyword.value))
+                               for keyword in node.keywords])]}
+    if isinstance(node, ast.List):
+        return [_encode_expression(item) for item in node.elts]
+    if isinstance(node, ast.Tuple):
+        return {'tuple': [_encode_expression(item) for item in node.elts]}
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mod):
+        ## string formatting of constants
+        return ast.literal_eval(node.left) % ast.literal_eval(node.right)
+    raise ValueError("cannot translate pygen expression %r" % ast.dump(node))
+
+
+class ApiModelCodeSink(CodeSink):
+    """
+    A code sink that receives the python code written by the pygen
+    mode of ModuleParser and writes the equivalent API model to a
+    file-like object.
+    """
+    def __init__(self, file_):
+        """
+        :param file_: a file like object, opened in text mode
+        """
+        CodeSink.__init__(self)
+        self.file = file_
+
+    def __repr__(self):
+        return "<pybindgen.apimodel.ApiModelCodeSink %r>" % (getattr(self.file, 'name', None),)
+
+    def _write_record(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')))
+        self.file.write('\n')
+
+    def writeln(self, line=''):
+        """Translate one or more statements of pygen code"""
+        code = textwrap.dedent(line).strip()
+        if not code or code.startswith('#'):
+            return
+        match = _def_rx.match(code)
+        if match is not None:
+            parameters = [name.strip() for name in match.group(2).split(',') if name.strip()]
+            self._write_record({'def': [match.group(1), parameters]})
+            return
+        for statement in ast.parse(code).body:
+            self._translate_statement(statement)
+
+    def _translate_statement(self, statement):
+        if isinstance(statement, ast.Expr):
+            self._write_record({'do': _encode_expression(statement.value)})
+        elif isinstance(statement, ast.Assign):
+            target, = statement.targets
+            if isinstance(target, ast.Name):
+                self._write_record({'set': [target.id, _encode_expression(statement.value)]})
+            elif isinstance(target, ast.Attribute) and target.attr == 'error_handler':
+                ## the main script installs an error handler that
+                ## turns errors into warnings
+                self._write_record({'error_handler': 'warn'})
+            else:
+                raise ValueError("cannot translate pygen assignment %r" % ast.dump(statement))
+        elif isinstance(statement, ast.Return):
+            if statement.value is None:
+                self._write_record({'return': None})
+            else:
+                self._write_record({'return': _encode_expression(statement.value)})
+        elif type(statement).__name__ in ('Try', 'TryExcept'):
+            ## import and call a local customizations module, if it exists
+            import_statement, = statement.body
+            call, = statement.orelse
+            self._write_record({'customize': [import_statement.names[0].name, call.value.func.attr,
+                                              [_encode_expression(arg) for arg in call.value.args]]})
+        elif isinstance(statement, (ast.Import, ast.ImportFrom, ast.ClassDef, ast.If)):
+            pass # sections are found by name, and scripts are not run as programs
+        else:
+            raise ValueError("cannot translate pygen statement %r" % ast.dump(statement))
+
+
+class _WarningErrorHandler(settings.ErrorHandler):
+    def handle_error(self, wrapper, exception, traceback_):
+        warnings.warn("exception %r in wrapper %s" % (exception, wrapper))
+        return True
+
+
+_GLOBALS = {
+    'Module': Module,
+    'FileCodeSink': FileCodeSink,
+    'param': param,
+    'retval': retval,
+    'cppclass': cppclass,
+    'typehandlers': typehandlers,
+    'dict': dict,
+    }
+
+
+class _ApiModelSection(object):
+    """the functions of one API model file, loaded on first use"""
+
+    def __init__(self, model, file_name):
+        self.model = model
+        self.file_name = file_name
+        self.functions = None # name -> (parameters, records)
+
+    def _load(self):
+        self.functions = {}
+        records = None
+        with io.open(self.file_name, encoding='utf-8') as model_file:
+            for line in model_file:
+                record = json.loads(line)
+                if 'def' in record:
+                    name, parameters = record['def']
+                    records = []
+                    self.functions[name] = (parameters, records)
+                elif 'error_handler' in record:
+                    settings.error_handler = _WarningErrorHandler()
+                elif records is not None:
+                    records.append(record)
+                    if 'return' in record:
+                        records = None
+
+    def call(self, function_name, *args):
+        if self.functions is None:
+            self._load()
+        try:
+            parameters, records = self.functions[function_name]
+        except KeyError:
+            raise AttributeError("API model %s has no function %r" % (self.file_name, function_name))
+        namespace = dict(zip(parameters, args))
+        for record in records:
+            if 'do' in record:
+                self._evaluate(record['do'], namespace)
+            elif 'set' in record:
+                name, expression = record['set']
+                namespace[name] = self._evaluate(expression, namespace)
+            elif 'return' in record:
+                return self._evaluate(record['return'], namespace)
+            elif 'customize' in record:
+                module_name, customize_function_name, arguments = record['customize']
+                try:
+                    customizations = __import__(module_name, {}, {}, ['__name__'])
+                except ImportError:
+                    pass
+                else:
+                    getattr(customizations, customize_function_name)(
+                        *[self._evaluate(argument, namespace) for argument in arguments])
+            else:
+                raise ValueError("bad API model record %r in %s" % (record, self.file_name))
+        return None
+
+    def _lookup(self, name, namespace):
+        try:
+            return namespace[name]
+        except KeyError:
+            pass
+        if name in self.functions:
+            return functools.partial(self.call, name)
+        try:
+            return _GLOBALS[name]
+        except KeyError:
+            pass
+        return self.model.get_section(name)
+
+    def _evaluate(self, expression, namespace):
+        if isinstance(expression, list):
+            return [self._evaluate(item, namespace) for item in expression]
+        if not isinstance(expression, dict):
+            return expression
+        (kind, value), = expression.items()
+        if kind == 'name':
+            return self._lookup(value, namespace)
+        elif kind == 'attr':
+            obj = self._evaluate(value[0], namespace)
+            if isinstance(obj, _ApiModelSection):
+                return functools.partial(obj.call, value[1])
+            return getattr(obj, value[1])
+        elif kind == 'item':
+            return self._evaluate(value[0], namespace)[self._evaluate(value[1], namespace)]
+        elif kind == 'call':
+            function, args, kwargs = value
+            return self._evaluate(function, namespace)(
+                *[self._evaluate(arg, namespace) for arg in args],
+                **dict([(str(name), self._evaluate(arg, namespace)) for name, arg in kwargs.items()]))
+        elif kind == 'tuple':
+            return tuple([self._evaluate(item, namespace) for item in value])
+        elif kind == 'dict':
+            return dict([(self._evaluate(key, namespace), self._evaluate(val, namespace))
+                         for key, val in value])
+        raise ValueError("bad API model expression %r in %s" % (expression, self.file_name))
+
+
+class ApiModel(object):
+    """
+    An API model written by ApiModelCodeSink, possibly split in
+    sections.
+    """
+
+    def __init__(self, file_name):
+        """
+        :param file_name: name of the file of the main section
+        """
+        self.directory = os.path.dirname(file_name)
+        self.extension = os.path.splitext(file_name)[1]
+        self._sections = {'__main__': _ApiModelSection(self, file_name)}
+
+    def get_section(self, section_name):
+        """Returns a section of the model; its file is loaded on first use"""
+        try:
+            return self._sections[section_name]
+        except KeyError:
+            pass
+        file_name = os.path.join(self.directory, section_name + self.extension)
+        if not os.path.exists(file_name):
+            raise NameError("name %r is not defined in the API model, and there is no file %s"
+                            % (section_name, file_name))
+        section = _ApiModelSection(self, file_name)
+        self._sections[section_name] = section
+        return section
+
+    def call(self, function_name, *args):
+        """Calls a function of the main section"""
+        return self._sections['__main__'].call(function_name, *args)
+
+    def load(self):
+        """
+        Builds the module, like the main() function of a pygen script
+        does, and returns the root module.
+        """
+        root_module = self.call('module_init')
+        self.call('register_types', root_module)
+        self.call('register_methods', root_module)
+        self.call('register_functions', root_module)
+        return root_module
+
+
+def load_api_model(file_name):
+    """
+    Loads an API model written by ApiModelCodeSink and returns the root
+    L{Module}, ready to generate.
+
+    :param file_name: name of the file of the main section
+    """
+    return ApiModel(file_name).load()
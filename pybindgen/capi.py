@@ -0,0 +1,202 @@
+"""
+Generates a C API, exported through a capsule, that lets other
+extension modules exchange wrapped objects with a pybindgen module
+without going through Python.
+
+The API is a structure of type and function pointers.  The module
+stores a pointer to it in a capsule named C{<module>._C_API}, and
+L{CApiExport.generate_header} writes a header that other extensions
+include to import it::
+
+    #include "foo_capi.h"
+    ...
+    if (Pyfoo_ImportCAPI() < 0)
+        return NULL;
+    Bar *bar = Pyfoo_API->foo_Bar_unwrap(obj);
+
+For each wrapped class the structure holds:
+
+ - C{<class>_Type}: the python type object;
+ - C{<class>_unwrap}: returns the C++ object held by a wrapper
+   (borrowed, no copy), or NULL with a TypeError set;
+ - C{<class>_from_c}, C{<class>_to_c}: only for copyable classes,
+   the python-to-C and C-to-python converters, which make copies.
+
+For each module and submodule, C{<module>_functions} points to its
+method table, whose entries are the raw function wrappers.  The
+C{version} field is a checksum of the structure layout.  The import
+function refuses an API whose layout differs from the one the header
+was generated for.
+"""
+
+import zlib
+
+from pybindgen.typehandlers.codesink import MemoryCodeSink
+from pybindgen.cppclass import get_python_to_c_converter, get_c_to_python_converter
+
+
+class CApiExport(object):
+    """
+    Generates the exported C API of a root L{Module<pybindgen.module.Module>}.
+    """
+
+    def __init__(self, module):
+        """
+        :param module: the root module
+        """
+        assert module.parent is None
+        self.module = module
+        self.struct_name = "Py%s_CAPI" % module.prefix
+        self.version_macro = "PY%s_CAPI_VERSION" % module.prefix.upper()
+        self.includes = None
+
+    def _get_modules(self):
+        modules = [self.module]
+        for module in modules:
+            modules.extend(module.submodules)
+        return modules
+
+    def _get_classes(self):
+        classes = []
+        for module in self._get_modules():
+            classes.extend([cls for cls in module.classes if not cls.import_from_module])
+        return classes
+
+    def _generate_struct(self, code_sink):
+        """generate the API structure definition and the version macro"""
+        members = MemoryCodeSink()
+        members.indent()
+        for module in self._get_modules():
+            members.writeln("const PyMethodDef *%s_functions;" % module.prefix)
+        for cls in self._get_classes():
+            name = cls.mangled_full_name
+            members.writeln("/* %s */" % cls.full_name)
+            members.writeln("PyTypeObject *%s_Type;" % name)
+            members.writeln("%s *(*%s_unwrap)(PyObject *obj);" % (cls.full_name, name))
+            if cls.has_copy_constructor:
+                members.writeln("PyObject *(*%s_from_c)(%s *cvalue);" % (name, cls.full_name))
+                members.writeln("int (*%s_to_c)(PyObject *value, %s *address);" % (name, cls.full_name))
+        members.unindent()
+        layout_text = '\n'.join(members.lines)
+
+        code_sink.writeln("#define %s 0x%08xU" % (self.version_macro,
+                                                   zlib.crc32(layout_text.encode('ascii')) & 0xffffffff))
+        code_sink.writeln()
+        code_sink.writeln("typedef struct {")
+        code_sink.writeln("    unsigned int version;")
+        members.flush_to(code_sink)
+        code_sink.writeln("} %s;" % self.struct_name)
+
+    def generate(self, code_sink, module_name):
+        """
+        Generates the API structure, its instance and the init code
+        exporting it.
+
+        :param code_sink: main code sink of the module
+        :param module_name: python name of the root module, as imported
+        """
+        self._generate_struct(self.module.header)
+        self.module.header.writeln()
+
+        initializers = ["%s" % self.version_macro]
+        for module in self._get_modules():
+            initializers.append("%s_functions" % module.prefix)
+
+        for cls in self._get_classes():
+            unwrap_name = "_wrap_%s__unwrap" % cls.pystruct
+            obj = "((%s *) obj)->obj" % cls.pystruct
+            if cls.memory_policy is not None:
+                obj = cls.memory_policy.get_pointer_to_void_name(obj)
+            code_sink.writeln('''
+static %(CTYPE)s *
+%(FUNC)s(PyObject *obj)
+{
+    if (!PyObject_TypeCheck(obj, &%(PYTYPESTRUCT)s)) {
+        PyErr_SetString(PyExc_TypeError, "expected %(CLASS)s");
+        return NULL;
+    }
+    return %(OBJ)s;
+}''' % dict(CTYPE=cls.full_name, FUNC=unwrap_name, PYTYPESTRUCT=cls.pytypestruct,
+            OBJ=obj, CLASS=cls.name))
+            initializers.append("&%s" % cls.pytypestruct)
+            initializers.append(unwrap_name)
+            if cls.has_copy_constructor:
+                c2py, dummy = get_c_to_python_converter(cls, self.module, code_sink)
+                py2c, dummy = get_python_to_c_converter(cls, self.module, code_sink)
+                initializers.append(c2py)
+                initializers.append(py2c)
+
+        api_name = "_wrap_%s_capi" % self.module.prefix
+        init_block = self.module.get_init_code_block()
+        if self.module.isolated:
+            ## the type pointers are only known once the interpreter
+            ## created its types, so each interpreter fills its own copy
+            self.module.declare_global(self.module.header, self.struct_name, api_name)
+            init_block.write_code("{\n    %s api = {\n        %s\n    };\n    %s = api;\n}"
+                                  % (self.struct_name, ',\n        '.join(initializers), api_name))
+        else:
+            code_sink.writeln()
+            code_sink.writeln("static %s %s = {" % (self.struct_name, api_name))
+            code_sink.indent()
+            for initializer in initializers:
+                code_sink.writeln("%s," % initializer)
+            code_sink.unindent()
+            code_sink.writeln("};")
+            code_sink.writeln()
+
+        init_block.write_code('PyModule_AddObject(m, (char *) "_C_API", '
+                              'PyCapsule_New((void *) &%s, "%s._C_API", NULL));'
+                              % (api_name, module_name))
+
+    def generate_header(self, code_sink, module_name=None):
+        """
+        Generates the header that other extension modules include to
+        use the API.  It declares a static C{Py<module>_API} pointer and
+        a C{Py<module>_ImportCAPI()} function that sets it, returning
+        -1 with an exception set on failure.
+
+        :param code_sink: a L{CodeSink<pybindgen.typehandlers.codesink.CodeSink>}
+        :param module_name: python name of the module, if it is not
+           the root module name (see the module_file_base_name
+           parameter of L{Module.generate<pybindgen.module.Module.generate>})
+        """
+        if module_name is None:
+            module_name = self.module.name
+        if self.includes is None:
+            includes = self.module.includes
+        else:
+            includes = self.includes
+        guard = "%s_H" % self.struct_name.upper()
+        code_sink.writeln("/* This file was generated by PyBindGen */")
+        code_sink.writeln("#ifndef %s" % guard)
+        code_sink.writeln("#define %s" % guard)
+        code_sink.writeln()
+        code_sink.writeln("#include <Python.h>")
+        for include in includes:
+            code_sink.writeln("#include %s" % include)
+        code_sink.writeln()
+        self._generate_struct(code_sink)
+        code_sink.writeln('''
+static %(STRUCT)s *Py%(PREFIX)s_API = NULL;
+
+static int
+Py%(PREFIX)s_ImportCAPI(void)
+{
+    %(STRUCT)s *api;
+
+    api = (%(STRUCT)s *) PyCapsule_Import("%(NAME)s._C_API", 0);
+    if (api == NULL) {
+        return -1;
+    }
+    if (api->version != %(VERSION)s) {
+        PyErr_Format(PyExc_ImportError,
+                     "%(NAME)s C API version mismatch: expected 0x%%08x, got 0x%%08x",
+                     %(VERSION)s, api->version);
+        return -1;
+    }
+    Py%(PREFIX)s_API = api;
+    return 0;
+}
+
+#endif /* %(GUARD)s */''' % dict(STRUCT=self.struct_name, PREFIX=self.module.prefix, NAME=module_name,
+                                 VERSION=self.version_macro, GUARD=guard))
@@ -9,8 +9,10 @@ from .typehandlers.base import ForwardWrapperBase, ReverseWrapperBase, \
     TypeConfigurationError, NotSupportedError
 
 from pybindgen.typehandlers import codesink
-from pybindgen.pytypeobject import PyTypeObject
+from pybindgen.pytypeobject import PyTypeObject, PySequenceMethods, PyMappingMethods
 from .typehandlers.ctypeparser import TypeTraits
+from .cppclass import CppClassReturnValue, CppClassPtrReturnValue, ReferenceCountingPolicy, \
+    common_shared_object_return, _add_ward
 from . import settings
 from . import utils
 
@@ -50,14 +52,23 @@ class IterNextWrapper(ForwardWrapperBase):
             "PyErr_SetNone(PyExc_StopIteration);")
         self.before_call.write_code("++(*self->iterator);")
         if self.container.key_type is None:
-            self.container.value_type.value = "(*%s)" % self.iter_variable_name
-            self.container.value_type.convert_c_to_python(self)
+            self._convert_value("(*%s)" % self.iter_variable_name)
         else:
-            self.container.value_type.value = "%s->second" % self.iter_variable_name
-            self.container.value_type.convert_c_to_python(self)
+            self._convert_value("%s->second" % self.iter_variable_name)
             self.container.key_type.value = "%s->first" % self.iter_variable_name
             self.container.key_type.convert_c_to_python(self)
 
+    def _convert_value(self, value):
+        if self.container.view:
+            py_item = self.declarations.declare_variable('PyObject*', 'py_item')
+            self.before_call.write_code("%s = %s(self->container, &%s);"
+                                        % (py_item, self.container.element_view_function_name, value))
+            self.before_call.write_error_check("%s == NULL" % py_item)
+            self.build_params.add_parameter("N", [py_item], prepend=True)
+        else:
+            self.container.value_type.value = value
+            self.container.value_type.convert_c_to_python(self)
+
     def generate(self, code_sink):
         """
         code_sink -- a CodeSink instance that will receive the generated code
@@ -74,23 +85,86 @@ class IterNextWrapper(ForwardWrapperBase):
         code_sink.writeln('}')
 
 
+class ElementViewWrapper(ForwardWrapperBase):
+    '''
+    Wraps an element of a view container in place: the element
+    wrapper references the C++ element inside the container, without
+    copying it, and keeps the container wrapper alive as its ward.
+    '''
+
+    HAVE_RETURN_VALUE = True
+
+    def __init__(self, container):
+        """
+        container -- the L{Container}
+        """
+        super(ElementViewWrapper, self).__init__(
+            None, [], "return NULL;", "return NULL;", no_c_retval=True)
+        assert isinstance(container, Container)
+        self.container = container
+        self.c_function_name = self.container.element_view_function_name
+
+    def generate_call(self):
+        value_type = self.container.value_type
+        cpp_class = value_type.cpp_class
+        type_is_pointer = isinstance(value_type, CppClassPtrReturnValue)
+        if type_is_pointer:
+            self.before_call.write_code("if (!(*cvalue)) {\n"
+                                        "    Py_INCREF(Py_None);\n"
+                                        "    return Py_None;\n"
+                                        "}")
+        py_name = self.declarations.declare_variable(
+            cpp_class.pystruct+'*', 'py_'+cpp_class.name)
+        common_shared_object_return("(*cvalue)", py_name, cpp_class, self.after_call,
+                                    value_type.type_traits, caller_owns_return=False,
+                                    reference_existing_object=True,
+                                    type_is_pointer=type_is_pointer)
+        _add_ward(self.after_call, "((PyObject *) %s)" % py_name, "((PyObject *) self)", cpp_class,
+                  failure_cleanup="Py_DECREF(%s);" % py_name)
+        self.build_params.add_parameter("N", [py_name], prepend=True)
+
+    def generate(self, code_sink):
+        """
+        code_sink -- a CodeSink instance that will receive the generated code
+        """
+
+        tmp_sink = codesink.MemoryCodeSink()
+        self.generate_body(tmp_sink)
+        code_sink.writeln("static PyObject* %s(%s *self, %s *cvalue)"
+                          % (self.c_function_name, self.container.pystruct,
+                             self.container.value_type.ctype))
+        code_sink.writeln('{')
+        code_sink.indent()
+        tmp_sink.flush_to(code_sink)
+        code_sink.unindent()
+        code_sink.writeln('}')
+
+
 class ContainerTraits(object):
-    def __init__(self, add_value_method, is_mapping=False):
+    def __init__(self, add_value_method, is_mapping=False, is_random_access=False, is_associative=False):
+        """
+        :param add_value_method: name of the method used to add an element
+        :param is_mapping: container holds (key, value) pairs
+        :param is_random_access: container supports O(1) indexing with operator[]
+        :param is_associative: container supports key lookup with find()
+        """
         self.add_value_method = add_value_method
         self.is_mapping = is_mapping
+        self.is_random_access = is_random_access
+        self.is_associative = is_associative
 
 container_traits_list = {
     'list': 		ContainerTraits(add_value_method='push_back'),
-    'deque': 		ContainerTraits(add_value_method='push_back'),
+    'deque': 		ContainerTraits(add_value_method='push_back', is_random_access=True),
     'queue': 		ContainerTraits(add_value_method='push'),
     'priority_queue':	ContainerTraits(add_value_method='push'),
-    'vector': 		ContainerTraits(add_value_method='push_back'),
+    'vector': 		ContainerTraits(add_value_method='push_back', is_random_access=True),
     'stack': 		ContainerTraits(add_value_method='push'),
-    'set': 		ContainerTraits(add_value_method='insert'),
-    'multiset': 	ContainerTraits(add_value_method='insert'),
-    'hash_set':		ContainerTraits(add_value_method='insert'),
-    'hash_multiset':	ContainerTraits(add_value_method='insert'),
-    'map':		ContainerTraits(add_value_method='insert', is_mapping=True),
+    'set': 		ContainerTraits(add_value_method='insert', is_associative=True),
+    'multiset': 	ContainerTraits(add_value_method='insert', is_associative=True),
+    'hash_set':		ContainerTraits(add_value_method='insert', is_associative=True),
+    'hash_multiset':	ContainerTraits(add_value_method='insert', is_associative=True),
+    'map':		ContainerTraits(add_value_method='insert', is_mapping=True, is_associative=True),
 }
 
 # from wikipedia: """Deque is sometimes written dequeue, but this use
@@ -99,7 +173,7 @@ container_traits_list = {
 container_traits_list['dequeue'] = container_traits_list['deque']
 
 class Container(object):
-    def __init__(self, name, value_type, container_type, outer_class=None, custom_name=None):
+    def __init__(self, name, value_type, container_type, outer_class=None, custom_name=None, view=False):
         """
         :param name: C++ type name of the container, e.g. std::vector<int> or MyIntList
 
@@ -117,6 +191,16 @@ class Container(object):
 
         :param custom_name: alternative name to register with in the Python module
 
+        :param view: if True, the elements, which must be instances
+            of a wrapped class held by value or by pointer, are not
+            copied when indexing or iterating the container: each
+            element wrapper references the element in place and keeps
+            the container wrapper alive.  Element wrappers are left
+            dangling if C++ code reallocates the elements of the
+            container, e.g. when it is passed by reference to a
+            function that inserts into it.  The element class must be
+            declared with allow_subclassing=True.
+
         """
         if '<' in name or '::' in name:
             self.name = utils.mangle_name(name)
@@ -149,6 +233,21 @@ class Container(object):
             self.value_type = utils.eval_retval(value_type, self)
         self.python_to_c_converter = None
 
+        self.view = view
+        if view:
+            if self.container_traits.is_associative and not self.container_traits.is_mapping:
+                raise TypeConfigurationError("view=True is not supported by %s containers, "
+                                             "whose elements cannot be modified" % container_type)
+            if not (isinstance(self.value_type, (CppClassReturnValue, CppClassPtrReturnValue))
+                    and not isinstance(self.value_type.cpp_class.memory_policy, ReferenceCountingPolicy)):
+                raise TypeConfigurationError("view=True needs elements of a wrapped class, by value "
+                                             "or by pointer, without reference counting (got %r)"
+                                             % self.value_type.ctype)
+            if not self.value_type.cpp_class.allow_subclassing:
+                raise TypeConfigurationError("view=True needs an element class with allow_subclassing=True, "
+                                             "whose wrappers can keep the container alive (got %s)"
+                                             % self.value_type.cpp_class.full_name)
+
         if name != 'dummy':
             ## register type handlers
 
@@ -220,6 +319,10 @@ class Container(object):
         return self._iter_pystruct
     iter_pystruct = property(get_iter_pystruct)
 
+    def get_element_view_function_name(self):
+        return "_wrap_%s__element_view" % (self.pystruct,)
+    element_view_function_name = property(get_element_view_function_name)
+
     def _update_names(self):
 
         prefix = settings.name_prefix.capitalize()
@@ -295,6 +398,7 @@ class Container(object):
 typedef struct {
     PyObject_HEAD
     %s *obj;
+    Py_ssize_t iterators; /* number of live iterators over obj */
 } %s;
     ''' % (self.full_name, self.pystruct))
 
@@ -308,8 +412,8 @@ typedef struct {
     ''' % (self.pystruct, self.full_name, self.iter_pystruct))
 
         code_sink.writeln()
-        code_sink.writeln('extern PyTypeObject %s;' % (self.pytypestruct,))
-        code_sink.writeln('extern PyTypeObject %s;' % (self.iter_pytypestruct,))
+        self.module.declare_type(code_sink, self.pytypestruct)
+        self.module.declare_type(code_sink, self.iter_pytypestruct)
         code_sink.writeln()
 
         this_type_converter = self.module.get_root().get_python_to_c_type_converter_function_name(
@@ -341,36 +445,30 @@ typedef struct {
     python_full_name = property(_get_python_full_name)
 
 
+    def write_allocate_instance(self, code_block, py_name):
+        """
+        Writes code that allocates a new wrapper instance into the
+        variable py_name; the caller is responsible for setting its obj.
+        """
+        code_block.write_code("%s = PyObject_New(%s, &%s);" % (py_name, self.pystruct, self.pytypestruct))
+        code_block.write_code("%s->iterators = 0;" % (py_name,))
+
     def generate(self, code_sink, module, docstring=None):
         """Generates the class to a code sink"""
 
         ## --- register the class type in the module ---
-        module.after_init.write_code("/* Register the '%s' class */" % self.full_name)
-
-        module.after_init.write_error_check('PyType_Ready(&%s)' % (self.pytypestruct,))
-        module.after_init.write_error_check('PyType_Ready(&%s)' % (self.iter_pytypestruct,))
-
-        class_python_name = self.python_name
-
-        if self.outer_class is None:
-            module.after_init.write_code(
-                'PyModule_AddObject(m, (char *) \"%s\", (PyObject *) &%s);' % (
-                class_python_name, self.pytypestruct))
-            module.after_init.write_code(
-                'PyModule_AddObject(m, (char *) \"%s\", (PyObject *) &%s);' % (
-                class_python_name+'Iter', self.iter_pytypestruct))
-        else:
-            module.after_init.write_code(
-                'PyDict_SetItemString((PyObject*) %s.tp_dict, (char *) \"%s\", (PyObject *) &%s);' % (
-                self.outer_class.pytypestruct, class_python_name, self.pytypestruct))
-            module.after_init.write_code(
-                'PyDict_SetItemString((PyObject*) %s.tp_dict, (char *) \"%s\", (PyObject *) &%s);' % (
-                self.outer_class.pytypestruct, class_python_name+'Iter', self.iter_pytypestruct))
+        module.write_type_registration(self.pytypestruct, self.python_name,
+                                       outer=self.outer_class)
+        module.write_type_registration(self.iter_pytypestruct, self.python_name+'Iter',
+                                       outer=self.outer_class)
 
         self._generate_gc_methods(code_sink)
         self._generate_destructor(code_sink)
+        if self.view:
+            ElementViewWrapper(self).generate(code_sink)
         self._generate_iter_methods(code_sink)
         self._generate_container_constructor(code_sink)
+        self._generate_sequence_methods(code_sink)
         self._generate_type_structure(code_sink, docstring)
 
     def _generate_type_structure(self, code_sink, docstring):
@@ -378,13 +476,13 @@ typedef struct {
 
         self.pytype.slots.setdefault("tp_basicsize", "sizeof(%s)" % (self.pystruct,))
         self.pytype.slots.setdefault("tp_flags", "Py_TPFLAGS_DEFAULT")
-        self.pytype.slots.setdefault("typestruct", self.pytypestruct)
+        self.pytype.slots.setdefault("typestruct", self.module.get_type_definition_name(self.pytypestruct))
         self.pytype.slots.setdefault("tp_name", self.python_full_name)
         self.pytype.generate(code_sink)
 
         self.iter_pytype.slots.setdefault("tp_basicsize", "sizeof(%s)" % (self.iter_pystruct,))
         self.iter_pytype.slots.setdefault("tp_flags", ("Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_GC"))
-        self.iter_pytype.slots.setdefault("typestruct", self.iter_pytypestruct)
+        self.iter_pytype.slots.setdefault("typestruct", self.module.get_type_definition_name(self.iter_pytypestruct))
         self.iter_pytype.slots.setdefault("tp_name", self.python_full_name + 'Iter')
         self.iter_pytype.generate(code_sink)
 
@@ -393,6 +491,13 @@ typedef struct {
                        "    self->iterator = NULL;\n")
         return delete_code
 
+    def _get_iter_release_container_code(self):
+        release_code = ("if (self->container) {\n"
+                        "        self->container->iterators--;\n"
+                        "    }\n"
+                        "    Py_CLEAR(self->container);")
+        return release_code
+
     def _get_container_delete_code(self):
         delete_code = ("delete self->obj;\n"
                        "    self->obj = NULL;\n")
@@ -409,10 +514,11 @@ typedef struct {
 static void
 %s(%s *self)
 {
-    Py_CLEAR(self->container);
+    %s
     %s
 }
-''' % (tp_clear_function_name, self.iter_pystruct, self._get_iter_delete_code()))
+''' % (tp_clear_function_name, self.iter_pystruct,
+       self._get_iter_release_container_code(), self._get_iter_delete_code()))
 
         ## --- iterator tp_traverse ---
         tp_traverse_function_name = "%s__tp_traverse" % (self.iter_pystruct,)
@@ -422,10 +528,11 @@ static void
 static int
 %s(%s *self, visitproc visit, void *arg)
 {
-    Py_VISIT((PyObject *) self->container);
+    Py_VISIT((PyObject *) self->container);%s
     return 0;
 }
-''' % (tp_traverse_function_name, self.iter_pystruct))
+''' % (tp_traverse_function_name, self.iter_pystruct,
+       self.module.get_root().isolated and '\n    Py_VISIT((PyObject *) Py_TYPE(self));' or ''))
 
 
     def _generate_destructor(self, code_sink):
@@ -438,10 +545,10 @@ static void
 %s(%s *self)
 {
     %s
-    Py_TYPE(self)->tp_free((PyObject*)self);
+    %s
 }
 ''' % (container_tp_dealloc_function_name, self.pystruct,
-       self._get_container_delete_code()))
+       self._get_container_delete_code(), self.module.get_instance_free_code('self')))
 
         self.pytype.slots.setdefault("tp_dealloc", container_tp_dealloc_function_name )
 
@@ -452,11 +559,13 @@ static void
 static void
 %s(%s *self)
 {
-    Py_CLEAR(self->container);
     %s
-    Py_TYPE(self)->tp_free((PyObject*)self);
+    %s
+    %s
 }
-''' % (iter_tp_dealloc_function_name, self.iter_pystruct, self._get_iter_delete_code()))
+''' % (iter_tp_dealloc_function_name, self.iter_pystruct,
+       self._get_iter_release_container_code(), self._get_iter_delete_code(),
+       self.module.get_instance_free_code('self')))
 
         self.iter_pytype.slots.setdefault("tp_dealloc", iter_tp_dealloc_function_name )
 
@@ -481,6 +590,7 @@ static PyObject*
     %(ITER_PYSTRUCT)s *iter = PyObject_GC_New(%(ITER_PYSTRUCT)s, &%(ITER_PYTYPESTRUCT)s);
     Py_INCREF(self);
     iter->container = self;
+    self->iterators++;
     iter->iterator = new %(CTYPE)s::iterator(self->obj->begin());
     return (PyObject*) iter;
 }
@@ -526,6 +636,7 @@ static PyObject*
             'ITEM_CTYPE': self.value_type.ctype,
             'CONTAINER_CONVERTER_FUNC_NAME': this_type_converter,
             'ADD_VALUE': self.container_traits.add_value_method,
+            'INSTANCE_CHECK': self.module.get_instance_check('arg', '&' + self.pytypestruct),
             }
 
         if self.key_type is None:
@@ -535,7 +646,7 @@ static PyObject*
             code_sink.writeln(r'''
 int %(CONTAINER_CONVERTER_FUNC_NAME)s(PyObject *arg, %(CTYPE)s *container)
 {
-    if (PyObject_IsInstance(arg, (PyObject*) &%(PYTYPESTRUCT)s)) {
+    if (%(INSTANCE_CHECK)s) {
         *container = *((%(PYSTRUCT)s*)arg)->obj;
     } else if (PyList_Check(arg)) {
         container->clear();
@@ -567,7 +678,7 @@ int %(CONTAINER_CONVERTER_FUNC_NAME)s(PyObject *arg, %(CTYPE)s *container)
             code_sink.writeln(r'''
 int %(CONTAINER_CONVERTER_FUNC_NAME)s(PyObject *arg, %(CTYPE)s *container)
 {
-    if (PyObject_IsInstance(arg, (PyObject*) &%(PYTYPESTRUCT)s)) {
+    if (%(INSTANCE_CHECK)s) {
         *container = *((%(PYSTRUCT)s*)arg)->obj;
     } else if (PyList_Check(arg)) {
         container->clear();
@@ -625,6 +736,156 @@ static int
         self.pytype.slots.setdefault("tp_init", container_tp_init_function_name)
 
 
+    def _get_item_c2py_call(self, code_sink, item_ptr):
+        """
+        Returns a call that converts the element pointed to by
+        item_ptr to a python object.
+        """
+        if self.view:
+            return "%s(self, %s)" % (self.element_view_function_name, item_ptr)
+        converter = self.module.get_root().generate_c_to_python_type_converter(
+            self.value_type, code_sink)
+        return "%s(%s)" % (converter, item_ptr)
+
+    def _generate_sequence_methods(self, code_sink):
+        """
+        Generate the sequence and mapping protocol slots: len() for
+        all containers, O(1) indexing for random access containers,
+        and find() based key lookup and membership tests for
+        associative containers.
+        """
+        root_module = self.module.get_root()
+        subst_vars = {
+            'PYSTRUCT': self.pystruct,
+            'CTYPE': self.full_name,
+            'PYTHON_NAME': self.python_name,
+            'ITEM_CTYPE': self.value_type.ctype,
+            }
+        pysequencemethods = PySequenceMethods()
+        pysequencemethods.slots['variable'] = "%s__py_sequence_methods" % (self.pystruct,)
+        pymappingmethods = None
+
+        ## -- len() --
+        subst_vars['FUNC'] = "_wrap_%s__sq_length" % (self.pystruct,)
+        code_sink.writeln(r'''
+static Py_ssize_t
+%(FUNC)s(%(PYSTRUCT)s *self)
+{
+    return (Py_ssize_t) self->obj->size();
+}
+''' % subst_vars)
+        if self.key_type is None:
+            pysequencemethods.slots['sq_length'] = subst_vars['FUNC']
+        else:
+            pymappingmethods = PyMappingMethods()
+            pymappingmethods.slots['variable'] = "%s__py_mapping_methods" % (self.pystruct,)
+            pymappingmethods.slots['mp_length'] = subst_vars['FUNC']
+
+        ## -- container[index] and container[index] = value --
+        if self.container_traits.is_random_access:
+            if self.view:
+                subst_vars['ITEM_COPY'] = ''
+                subst_vars['ITEM_C2PY_CALL'] = self._get_item_c2py_call(code_sink, "&(*self->obj)[index]")
+            else:
+                ## operator[] may return a proxy, e.g. for std::vector<bool>
+                subst_vars['ITEM_COPY'] = "    %s item = (*self->obj)[index];\n" % (self.value_type.ctype,)
+                subst_vars['ITEM_C2PY_CALL'] = self._get_item_c2py_call(code_sink, "&item")
+            subst_vars['ITEM_CONVERTER'] = root_module.generate_python_to_c_type_converter(
+                self.value_type, code_sink)
+
+            subst_vars['FUNC'] = "_wrap_%s__sq_item" % (self.pystruct,)
+            code_sink.writeln(r'''
+static PyObject*
+%(FUNC)s(%(PYSTRUCT)s *self, Py_ssize_t index)
+{
+    if (index < 0 || (size_t) index >= self->obj->size()) {
+        PyErr_SetString(PyExc_IndexError, "%(PYTHON_NAME)s index out of range");
+        return NULL;
+    }
+%(ITEM_COPY)s    return %(ITEM_C2PY_CALL)s;
+}
+''' % subst_vars)
+            pysequencemethods.slots['sq_item'] = subst_vars['FUNC']
+
+            subst_vars['FUNC'] = "_wrap_%s__sq_ass_item" % (self.pystruct,)
+            code_sink.writeln(r'''
+static int
+%(FUNC)s(%(PYSTRUCT)s *self, Py_ssize_t index, PyObject *value)
+{
+    if (value == NULL) {
+        PyErr_SetString(PyExc_TypeError, "%(PYTHON_NAME)s does not support item deletion");
+        return -1;
+    }
+    if (index < 0 || (size_t) index >= self->obj->size()) {
+        PyErr_SetString(PyExc_IndexError, "%(PYTHON_NAME)s assignment index out of range");
+        return -1;
+    }
+    %(ITEM_CTYPE)s item;
+    if (!%(ITEM_CONVERTER)s(value, &item)) {
+        return -1;
+    }
+    (*self->obj)[index] = item;
+    return 0;
+}
+''' % subst_vars)
+            pysequencemethods.slots['sq_ass_item'] = subst_vars['FUNC']
+
+        ## -- key in container, and container[key] for maps --
+        if self.container_traits.is_associative:
+            if self.key_type is None:
+                key_type = self.value_type
+            else:
+                key_type = self.key_type
+            subst_vars['KEY_CTYPE'] = key_type.ctype
+            subst_vars['KEY_CONVERTER'] = root_module.generate_python_to_c_type_converter(
+                key_type, code_sink)
+
+            subst_vars['FUNC'] = "_wrap_%s__sq_contains" % (self.pystruct,)
+            code_sink.writeln(r'''
+static int
+%(FUNC)s(%(PYSTRUCT)s *self, PyObject *py_key)
+{
+    %(KEY_CTYPE)s key;
+    if (!%(KEY_CONVERTER)s(py_key, &key)) {
+        if (PyErr_ExceptionMatches(PyExc_TypeError)) {
+            PyErr_Clear();
+            return 0;
+        }
+        return -1;
+    }
+    return self->obj->find(key) != self->obj->end();
+}
+''' % subst_vars)
+            pysequencemethods.slots['sq_contains'] = subst_vars['FUNC']
+
+            if self.key_type is not None:
+                subst_vars['ITEM_C2PY_CALL'] = self._get_item_c2py_call(code_sink, "&iter->second")
+                subst_vars['FUNC'] = "_wrap_%s__mp_subscript" % (self.pystruct,)
+                code_sink.writeln(r'''
+static PyObject*
+%(FUNC)s(%(PYSTRUCT)s *self, PyObject *py_key)
+{
+    %(KEY_CTYPE)s key;
+    if (!%(KEY_CONVERTER)s(py_key, &key)) {
+        return NULL;
+    }
+    %(CTYPE)s::iterator iter = self->obj->find(key);
+    if (iter == self->obj->end()) {
+        PyErr_SetObject(PyExc_KeyError, py_key);
+        return NULL;
+    }
+    return %(ITEM_C2PY_CALL)s;
+}
+''' % subst_vars)
+                pymappingmethods.slots['mp_subscript'] = subst_vars['FUNC']
+
+        pysequencemethods.generate(code_sink)
+        self.pytype.slots.setdefault("tp_as_sequence", '&' + pysequencemethods.slots['variable'])
+        if pymappingmethods is not None:
+            pymappingmethods.generate(code_sink)
+            self.pytype.slots.setdefault("tp_as_mapping", '&' + pymappingmethods.slots['variable'])
+
+
 
 ## ----------------------------
 ## Type Handlers
@@ -652,6 +913,50 @@ class ContainerParameterBase(Parameter):
         ## name of the PyFoo * variable used in parameter parsing
         self.py_name = None
 
+    def _parse_container_ptr(self, wrapper, default_value=None, mutable=False):
+        """
+        Parses the parameter and writes code that points a container
+        pointer variable directly at the storage of a wrapped
+        container instance, if one is given; only a python list is
+        converted into a temporary container.
+
+        If mutable is True the callee may modify the container, which
+        would invalidate any python iterators still open over it, so
+        a wrapped container with live iterators is copied into the
+        temporary instead.
+
+        Returns a (pointer variable, temporary variable) tuple.
+        """
+        self.py_name = wrapper.declarations.declare_variable(
+            'PyObject*', self.name, (default_value is not None and 'NULL' or None))
+        container_tmp_var = wrapper.declarations.declare_variable(
+            self.container_type.full_name, self.name + '_value', default_value)
+        container_ptr = wrapper.declarations.declare_variable(
+            self.container_type.full_name + '*', self.name + '_ptr', '&' + container_tmp_var)
+        wrapper.parse_params.add_parameter('O', ['&'+self.py_name], self.name,
+                                           optional=(default_value is not None))
+        if default_value is not None:
+            wrapper.before_call.write_code("if (%s) {" % self.py_name)
+            wrapper.before_call.indent()
+        if mutable:
+            no_live_iterators = " && ((%s *) %s)->iterators == 0" % (self.container_type.pystruct, self.py_name)
+        else:
+            no_live_iterators = ""
+        wrapper.before_call.write_code(
+            "if (PyObject_TypeCheck(%s, &%s)%s) {\n"
+            "    %s = ((%s *) %s)->obj;\n"
+            "} else {" % (self.py_name, self.container_type.pytypestruct, no_live_iterators,
+                          container_ptr, self.container_type.pystruct, self.py_name))
+        wrapper.before_call.indent()
+        wrapper.before_call.write_error_check("!%s(%s, %s)" % (self.container_type.python_to_c_converter,
+                                                              self.py_name, container_ptr))
+        wrapper.before_call.unindent()
+        wrapper.before_call.write_code("}")
+        if default_value is not None:
+            wrapper.before_call.unindent()
+            wrapper.before_call.write_code("}")
+        return container_ptr, container_tmp_var
+
 
 class ContainerReturnValueBase(ReturnValue):
     "Class return handlers -- base class"
@@ -679,11 +984,8 @@ class ContainerParameter(ContainerParameterBase):
 
         assert self.default_value is None, "default value not implemented for containers"
 
-        #self.py_name = wrapper.declarations.declare_variable('PyObject*', self.name)
-        container_tmp_var = wrapper.declarations.declare_variable(
-            self.container_type.full_name, self.name + '_value')
-        wrapper.parse_params.add_parameter('O&', [self.container_type.python_to_c_converter, '&'+container_tmp_var], self.name)
-        wrapper.call_params.append(container_tmp_var)
+        container_ptr, dummy_container_tmp_var = self._parse_container_ptr(wrapper)
+        wrapper.call_params.append('*' + container_ptr)
 
     def convert_c_to_python(self, wrapper):
         '''Write some code before calling the Python method.'''
@@ -691,9 +993,9 @@ class ContainerParameter(ContainerParameterBase):
 
         self.py_name = wrapper.declarations.declare_variable(
             self.container_type.pystruct+'*', 'py_'+self.container_type.name)
-        wrapper.before_call.write_code(
-            "%s = PyObject_New(%s, %s);" %
-            (self.py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
+        self.container_type.module.write_ensure_type_ready(
+            wrapper.before_call, '&'+self.container_type.pytypestruct)
+        self.container_type.write_allocate_instance(wrapper.before_call, self.py_name)
 
         wrapper.before_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, self.value))
 
@@ -713,23 +1015,44 @@ class ContainerRefParameter(ContainerParameterBase):
 
         #assert self.default_value is None, "default value not implemented for containers"
 
-        #self.py_name = wrapper.declarations.declare_variable('PyObject*', self.name)
-        container_tmp_var = wrapper.declarations.declare_variable(
-            self.container_type.full_name, self.name + '_value', self.default_value)
-
-        if self.direction & Parameter.DIRECTION_IN:
-            wrapper.parse_params.add_parameter('O&', [self.container_type.python_to_c_converter, '&'+container_tmp_var], self.name,
-                                               optional=(self.default_value is not None))
-
-        wrapper.call_params.append(container_tmp_var)
+        if self.direction == Parameter.DIRECTION_OUT:
+            ## the callee fills the storage of the new wrapper directly
+            py_name = wrapper.declarations.declare_variable(
+                self.container_type.pystruct+'*', 'py_'+self.container_type.name)
+            self.container_type.module.write_ensure_type_ready(
+                wrapper.before_call, '&'+self.container_type.pytypestruct)
+            self.container_type.write_allocate_instance(wrapper.before_call, py_name)
+            wrapper.before_call.write_code("%s->obj = new %s;" % (py_name, self.container_type.full_name))
+            wrapper.before_call.add_cleanup_code("Py_DECREF(%s);" % py_name)
+            wrapper.call_params.append("*%s->obj" % py_name)
+            wrapper.build_params.add_parameter("O", [py_name])
+            return
+
+        ## wrapped containers are passed by reference to their own
+        ## storage, without copying
+        container_ptr, container_tmp_var = self._parse_container_ptr(
+            wrapper, self.default_value, mutable=(not self.type_traits.target_is_const))
+        wrapper.call_params.append('*' + container_ptr)
 
         if self.direction & Parameter.DIRECTION_OUT:
             py_name = wrapper.declarations.declare_variable(
                 self.container_type.pystruct+'*', 'py_'+self.container_type.name)
+            self.container_type.module.write_ensure_type_ready(
+                wrapper.after_call, '&'+self.container_type.pytypestruct)
             wrapper.after_call.write_code(
-                "%s = PyObject_New(%s, %s);" %
-                (py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
-            wrapper.after_call.write_code("%s->obj = new %s(%s);" % (py_name, self.container_type.full_name, container_tmp_var))
+                "if (%s != &%s) {\n"
+                "    Py_INCREF(%s);\n"
+                "    %s = (%s *) %s;\n"
+                "} else {\n"
+                "    %s = PyObject_New(%s, %s);\n"
+                "    %s->iterators = 0;\n"
+                "    %s->obj = new %s(PYBINDGEN_MOVE(%s));\n"
+                "}" % (container_ptr, container_tmp_var,
+                       self.py_name,
+                       py_name, self.container_type.pystruct, self.py_name,
+                       py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct,
+                       py_name,
+                       py_name, self.container_type.full_name, container_tmp_var))
             wrapper.build_params.add_parameter("N", [py_name])
 
     def convert_c_to_python(self, wrapper):
@@ -738,9 +1061,9 @@ class ContainerRefParameter(ContainerParameterBase):
 
         self.py_name = wrapper.declarations.declare_variable(
             self.container_type.pystruct+'*', 'py_'+self.container_type.name)
-        wrapper.before_call.write_code(
-            "%s = PyObject_New(%s, %s);" %
-            (self.py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
+        self.container_type.module.write_ensure_type_ready(
+            wrapper.before_call, '&'+self.container_type.pytypestruct)
+        self.container_type.write_allocate_instance(wrapper.before_call, self.py_name)
 
         if self.direction & Parameter.DIRECTION_IN:
             wrapper.before_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, self.name))
@@ -781,13 +1104,12 @@ class ContainerPtrParameter(ContainerParameterBase):
 
 
         if self.direction == Parameter.DIRECTION_IN:
-            container_tmp_var = wrapper.declarations.declare_variable(
-                self.container_type.full_name, self.name + '_value')
-            wrapper.parse_params.add_parameter('O&', [self.container_type.python_to_c_converter, '&'+container_tmp_var], self.name)
+            container_ptr, dummy_container_tmp_var = self._parse_container_ptr(
+                wrapper, mutable=(not self.transfer_ownership and not self.type_traits.target_is_const))
             if self.transfer_ownership:
-                wrapper.call_params.append("new %s(%s)" % (self.container_type.full_name, container_tmp_var))
+                wrapper.call_params.append("new %s(*%s)" % (self.container_type.full_name, container_ptr))
             else:
-                wrapper.call_params.append("&%s" % container_tmp_var)
+                wrapper.call_params.append(container_ptr)
 
         elif self.direction == Parameter.DIRECTION_OUT:
             container_tmp_var = wrapper.declarations.declare_variable(
@@ -798,9 +1120,9 @@ class ContainerPtrParameter(ContainerParameterBase):
             py_name = wrapper.declarations.declare_variable(
                 self.container_type.pystruct+'*', 'py_'+self.container_type.name)
 
-            wrapper.after_call.write_code(
-                "%s = PyObject_New(%s, %s);" %
-                (py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
+            self.container_type.module.write_ensure_type_ready(
+                wrapper.after_call, '&'+self.container_type.pytypestruct)
+            self.container_type.write_allocate_instance(wrapper.after_call, py_name)
 
             wrapper.after_call.write_code("%s->obj = %s;" % (py_name, container_tmp_var))
 
@@ -853,10 +1175,16 @@ class ContainerReturnValue(ContainerReturnValueBase):
 
         self.py_name = py_name
 
-        wrapper.after_call.write_code(
-            "%s = PyObject_New(%s, %s);" %
-            (py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
-        wrapper.after_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, self.value))
+        self.container_type.module.write_ensure_type_ready(
+            wrapper.after_call, '&'+self.container_type.pytypestruct)
+        self.container_type.write_allocate_instance(wrapper.after_call, py_name)
+        if self.value == 'retval':
+            ## the returned temporary is ours, so move it into the
+            ## wrapper instead of copying it (copies on pre-C++11 compilers)
+            value = "PYBINDGEN_MOVE(%s)" % self.value
+        else:
+            value = self.value
+        wrapper.after_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, value))
         wrapper.build_params.add_parameter("N", [py_name], prepend=True)
 
     def convert_python_to_c(self, wrapper):
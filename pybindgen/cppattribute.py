@@ -11,7 +11,7 @@ else:
     string_types = basestring,
 
 
-from pybindgen.typehandlers.base import ForwardWrapperBase, ReverseWrapperBase
+from pybindgen.typehandlers.base import ForwardWrapperBase, ReverseWrapperBase, write_profile_start
 from pybindgen.typehandlers import codesink
 from pybindgen import settings
 from pybindgen import utils
@@ -25,6 +25,9 @@ class PyGetter(ForwardWrapperBase):
     def generate_call(self):
         """(not actually called)"""
         raise AssertionError
+    def get_profile_name(self):
+        "virtual method implementation; do not call"
+        return '%s.%s.__get__' % (self.class_.get_python_full_name(), self.attribute_name)
 
 class PySetter(ReverseWrapperBase):
     """generates a setter, for use in a PyGetSetDef table"""
@@ -35,6 +38,17 @@ class PySetter(ReverseWrapperBase):
     def generate_python_call(self):
         """(not actually called)"""
         raise AssertionError
+    def get_profile_name(self):
+        "virtual method implementation; do not call"
+        return '%s.%s.__set__' % (self.class_.get_python_full_name(), self.attribute_name)
+    def _write_profile_start(self):
+        """(internal) instrument the setter for settings.wrapper_profiling"""
+        if settings.wrapper_profiling:
+            write_profile_start(self, self.before_call, self.get_profile_name())
+    def _write_profile_mark(self, code_block, mark):
+        """(internal) write PYBINDGEN_PROFILE_CALL() or PYBINDGEN_PROFILE_RETURN()"""
+        if settings.wrapper_profiling:
+            code_block.write_code('PYBINDGEN_PROFILE_%s();' % mark)
 
 
 class CppInstanceAttributeGetter(PyGetter):
@@ -142,6 +156,7 @@ class CppInstanceAttributeSetter(PySetter):
         :param code_sink: a CodeSink instance that will receive the generated code
         """
 
+        self._write_profile_start()
         self.declarations.declare_variable('PyObject*', 'py_retval')
         self.before_call.write_code(
             'py_retval = Py_BuildValue((char *) "(O)", value);')
@@ -168,11 +183,14 @@ class CppInstanceAttributeSetter(PySetter):
         parse_tuple_params.extend(params)
         self.before_call.write_error_check('!PyArg_ParseTuple(%s)' %
                                            (', '.join(parse_tuple_params),))
+        self._write_profile_mark(self.before_call, 'CALL')
 
         if self.setter is not None:
             ## if we have a setter method, now is the time to call it
             self.after_call.write_code("self->obj->%s(%s);" % (self.setter, value_var))
 
+        self._write_profile_mark(self.after_call, 'RETURN')
+
         ## cleanup and return
         self.after_call.write_cleanup()
         self.after_call.write_code('return 0;')
@@ -216,6 +234,7 @@ class CppStaticAttributeSetter(PySetter):
         :param code_sink: a CodeSink instance that will receive the generated code
         """
 
+        self._write_profile_start()
         self.declarations.declare_variable('PyObject*', 'py_retval')
         self.before_call.write_code(
             'py_retval = Py_BuildValue((char *) "(O)", value);')
@@ -228,6 +247,9 @@ class CppStaticAttributeSetter(PySetter):
         parse_tuple_params.extend(params)
         self.before_call.write_error_check('!PyArg_ParseTuple(%s)' %
                                            (', '.join(parse_tuple_params),))
+        self._write_profile_mark(self.before_call, 'CALL')
+        self._write_profile_mark(self.after_call, 'RETURN')
+
         ## cleanup and return
         self.after_call.write_cleanup()
         self.after_call.write_code('return 0;')
@@ -294,7 +316,7 @@ PyTypeObject %(pytypestruct)s = {
 	0,					/* tp_call */
 	0,					/* tp_str */
 	0,					/* tp_getattro */
-	0,					/* tp_setattro */
+	%(setattro)s,				/* tp_setattro */
 	0,					/* tp_as_buffer */
 	Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_GC|Py_TPFLAGS_BASETYPE, /* tp_flags */
  	0,					/* tp_doc */
@@ -324,9 +346,14 @@ PyTypeObject %(pytypestruct)s = {
         0,                                      /* tp_weaklist */
         0                                       /* tp_del */
 };
-''' % dict(pytypestruct=self.pytypestruct, name=self.name,
-           getset=(self.getsets and self.getsets.cname or '0')))
-
+''' % dict(pytypestruct=module.get_type_definition_name(self.pytypestruct), name=self.name,
+           getset=(self.getsets and self.getsets.cname or '0'),
+           setattro=(module.get_root().isolated and 'PyObject_GenericSetAttr' or '0')))
+
+        if module.get_root().isolated:
+            ## the heap type inherits the collector methods of its base
+            module.write_heap_type_creation(self.pytypestruct, [self.parent_metaclass_expr])
+            return
         module.after_init.write_code("""
 %(pytypestruct)s.tp_base = %(parent_metaclass)s;
 /* Some fields need to be manually inheritted from the parent metaclass */
@@ -106,6 +106,22 @@ class MemoryPolicy(object):
     def get_pystruct_init_code(self, cpp_class, obj):
         return ''
 
+    def generate_forward_declarations(self, cpp_class, code_sink, module):
+        """
+        Generate the declarations the policy needs in the common
+        header, for a class that uses it.
+        """
+        pass
+
+    def generate_methods(self, cpp_class, code_sink):
+        """
+        Generate the definitions the policy needs, and extra methods
+        for a class that uses it.
+
+        :returns: a list of method table entries to add to the class
+        """
+        return []
+
     def register_ptr_parameter_and_return(self, cls, name):
         class ThisClassPtrParameter(CppClassPtrParameter):
             """Register this C++ class as pass-by-pointer parameter"""
@@ -230,6 +246,311 @@ class FreeFunctionPolicy(MemoryPolicy):
     def __repr__(self):
         return 'cppclass.FreeFunctionPolicy(%r)' % self.free_function
 
+class PooledAllocationPolicy(MemoryPolicy):
+    """
+    Allocates the C++ objects created by the wrappers (constructors,
+    copies, objects returned by value) from a pool emitted into the
+    module, made of slabs of fixed size slots, with placement new.
+    They are destroyed with an explicit destructor call, and their slot
+    is reused by the next allocation.  Meant for small objects that
+    python code creates and destroys in large numbers.
+
+    The pool belongs to the class the policy is given to, and is
+    shared by its subclasses, which inherit the memory policy.  Objects
+    that were not allocated by the pool, like the ones returned by C++
+    with caller_owns_return=True, are freed with delete, as usual.  The
+    slabs are only freed when the program exits.  A pool allocated
+    object cannot be given to C++ with transfer_ownership=True, since
+    the callee would delete it; the wrapper raises TypeError instead.
+    Likewise, a python method overriding a virtual method that returns
+    a pointer with caller_owns_return=True gives C++ a copy allocated
+    with new, or raises TypeError if the class cannot be copied.
+
+    The class gets a static method, _pool_stats(), returning a dict
+    with the size of the slots, the number of slabs, their capacity
+    (in objects), the number of objects in use, the number of objects
+    allocated and freed so far, and the number of objects not
+    allocated by the pool that were deleted.
+    """
+
+    def __init__(self, slots_per_slab=256):
+        """
+        :param slots_per_slab: number of objects in each slab of the pool
+        """
+        super(PooledAllocationPolicy, self).__init__()
+        self.slots_per_slab = slots_per_slab
+        self.classes = []
+
+    def get_pool_class(self, cpp_class):
+        """Return the class that owns the pool used by cpp_class"""
+        pool_class = cpp_class
+        for cls in cpp_class.get_mro():
+            if cls.memory_policy is self:
+                pool_class = cls
+        return pool_class
+
+    def get_pool_name(self, cpp_class):
+        return "_wrap_%s__pool" % self.get_pool_class(cpp_class).pystruct
+
+    def get_instance_creation_function(self):
+        return self._create_instance
+
+    def _create_instance(self, cpp_class, code_block, lvalue, parameters, construct_type_name):
+        if self.get_pool_class(cpp_class).import_from_module:
+            ## the pool is not exported by the other module
+            default_instance_creation_function(cpp_class, code_block, lvalue, parameters, construct_type_name)
+            return
+        if cpp_class.incomplete_type:
+            raise CodeGenerationError("%s cannot be constructed (incomplete type)"
+                                      % cpp_class.full_name)
+        code_block.write_code(
+            "%s = new(%s) %s(%s);" % (lvalue, self.get_pool_name(cpp_class), construct_type_name, parameters))
+
+    def get_delete_code(self, cpp_class):
+        if cpp_class.destructor_visibility != 'public':
+            return "    self->obj = NULL;\n"
+        return ("    %s *tmp = self->obj;\n"
+                "    self->obj = NULL;\n"
+                "    if (!(self->flags&PYBINDGEN_WRAPPER_FLAG_OBJECT_NOT_OWNED)) {\n"
+                "        pybindgen_pool_delete(&%s, tmp);\n"
+                "    }" % (cpp_class.full_name, self.get_pool_name(cpp_class)))
+
+    def register_ptr_parameter_and_return(self, cls, name):
+        self.classes.append(cls)
+        super(PooledAllocationPolicy, self).register_ptr_parameter_and_return(cls, name)
+
+    def generate_forward_declarations(self, cpp_class, code_sink, module):
+        try:
+            module.get_root().declare_one_time_definition("PyBindGenObjectPool")
+        except KeyError:
+            pass
+        else:
+            if module.get_root().isolated:
+                ## the pools are shared by interpreters with their own GIL
+                code_sink.writeln(r'''
+#if PY_VERSION_HEX >= 0x030D0000
+typedef PyMutex PyBindGenSharedMutex;
+# define PYBINDGEN_SHARED_LOCK(mutex) PyMutex_Lock(&(mutex))
+# define PYBINDGEN_SHARED_UNLOCK(mutex) PyMutex_Unlock(&(mutex))
+#else
+# include <mutex>
+typedef std::mutex PyBindGenSharedMutex;
+# define PYBINDGEN_SHARED_LOCK(mutex) (mutex).lock()
+# define PYBINDGEN_SHARED_UNLOCK(mutex) (mutex).unlock()
+#endif''')
+                pool_code = dict(MUTEX="    PyBindGenSharedMutex mutex;\n",
+                                 LOCK="    PYBINDGEN_SHARED_LOCK(pool->mutex);\n",
+                                 UNLOCK="    PYBINDGEN_SHARED_UNLOCK(pool->mutex);\n")
+            elif settings.free_threading:
+                pool_code = dict(MUTEX="    PyBindGenMutex mutex;\n",
+                                 LOCK="    PYBINDGEN_LOCK(pool->mutex);\n",
+                                 UNLOCK="    PYBINDGEN_UNLOCK(pool->mutex);\n")
+            else:
+                pool_code = dict(MUTEX='', LOCK='', UNLOCK='')
+            code_sink.writeln(r'''
+#include <new>
+#include <stdlib.h>
+
+#ifndef PYBINDGEN_POOL_ALIGNMENT
+# define PYBINDGEN_POOL_ALIGNMENT 16
+#endif
+#define PYBINDGEN_POOL_SLOT_SIZE(size) \
+    (((size) + PYBINDGEN_POOL_ALIGNMENT - 1) / PYBINDGEN_POOL_ALIGNMENT * PYBINDGEN_POOL_ALIGNMENT)
+#define PYBINDGEN_POOL_MAX(a, b) ((a) > (b) ? (a) : (b))
+
+typedef struct {
+    size_t slot_size;
+    size_t slots_per_slab;
+    char **slabs; /* sorted by address */
+    size_t num_slabs;
+    size_t max_slabs;
+    void *free_slots; /* linked through their first word */
+    unsigned long long allocated;
+    unsigned long long freed;
+    unsigned long long deleted;
+%(MUTEX)s} PyBindGenObjectPool;
+
+static inline void *
+pybindgen_pool_find_slot(PyBindGenObjectPool *pool, const void *obj)
+{
+    Py_uintptr_t address = (Py_uintptr_t) obj, slab;
+    size_t low = 0, high = pool->num_slabs, middle;
+
+    /* the last slab starting at or before the address */
+    while (low < high) {
+        middle = (low + high) / 2;
+        if ((Py_uintptr_t) pool->slabs[middle] <= address) {
+            low = middle + 1;
+        } else {
+            high = middle;
+        }
+    }
+    if (low == 0) {
+        return NULL;
+    }
+    slab = (Py_uintptr_t) pool->slabs[low - 1];
+    if (address >= slab + pool->slot_size * pool->slots_per_slab) {
+        return NULL;
+    }
+    return (void *) (slab + (address - slab) / pool->slot_size * pool->slot_size);
+}
+
+static inline int
+pybindgen_pool_add_slab(PyBindGenObjectPool *pool)
+{
+    char *slab, **slabs;
+    size_t max_slabs, position, slot;
+
+    if (pool->num_slabs == pool->max_slabs) {
+        max_slabs = pool->max_slabs ? 2 * pool->max_slabs : 8;
+        slabs = (char **) realloc(pool->slabs, max_slabs * sizeof(char *));
+        if (slabs == NULL) {
+            return -1;
+        }
+        pool->slabs = slabs;
+        pool->max_slabs = max_slabs;
+    }
+    slab = (char *) malloc(pool->slot_size * pool->slots_per_slab);
+    if (slab == NULL) {
+        return -1;
+    }
+    for (position = pool->num_slabs;
+         position > 0 && (Py_uintptr_t) pool->slabs[position - 1] > (Py_uintptr_t) slab;
+         position--) {
+        pool->slabs[position] = pool->slabs[position - 1];
+    }
+    pool->slabs[position] = slab;
+    pool->num_slabs++;
+    for (slot = pool->slots_per_slab; slot > 0; slot--) {
+        *(void **) (slab + (slot - 1) * pool->slot_size) = pool->free_slots;
+        pool->free_slots = slab + (slot - 1) * pool->slot_size;
+    }
+    return 0;
+}
+
+static inline void *
+pybindgen_pool_allocate(PyBindGenObjectPool *pool, size_t size)
+{
+    void *slot;
+
+    if (size > pool->slot_size) { /* a subclass unknown to the module */
+        return ::operator new(size);
+    }
+%(LOCK)s    if (pool->free_slots == NULL && pybindgen_pool_add_slab(pool) == -1) {
+%(UNLOCK)s        throw std::bad_alloc();
+    }
+    slot = pool->free_slots;
+    pool->free_slots = *(void **) slot;
+    pool->allocated++;
+%(UNLOCK)s    return slot;
+}
+
+static inline void *
+pybindgen_pool_owns(PyBindGenObjectPool *pool, const void *obj)
+{
+    void *slot;
+
+%(LOCK)s    slot = pybindgen_pool_find_slot(pool, obj);
+%(UNLOCK)s    return slot;
+}
+
+static inline void
+pybindgen_pool_release(PyBindGenObjectPool *pool, void *slot)
+{
+%(LOCK)s    *(void **) slot = pool->free_slots;
+    pool->free_slots = slot;
+    pool->freed++;
+%(UNLOCK)s}
+
+inline void *
+operator new(size_t size, PyBindGenObjectPool &pool)
+{
+    return pybindgen_pool_allocate(&pool, size);
+}
+
+/* only called when the constructor throws */
+inline void
+operator delete(void *slot, PyBindGenObjectPool &pool)
+{
+    if (pybindgen_pool_owns(&pool, slot)) {
+        pybindgen_pool_release(&pool, slot);
+    } else {
+        ::operator delete(slot);
+    }
+}
+
+template <typename T> inline void
+pybindgen_pool_delete(PyBindGenObjectPool *pool, T *obj)
+{
+    void *slot;
+
+    if (obj == NULL) {
+        return;
+    }
+    /* also finds the slot from a pointer to a base class of the object */
+    slot = pybindgen_pool_owns(pool, obj);
+    if (slot == NULL) {
+%(LOCK)s        pool->deleted++;
+%(UNLOCK)s        delete obj;
+    } else {
+        obj->~T();
+        pybindgen_pool_release(pool, slot);
+    }
+}
+
+static inline PyObject *
+pybindgen_pool_stats(PyBindGenObjectPool *pool)
+{
+    PyObject *stats;
+
+%(LOCK)s    stats = Py_BuildValue((char *) "{s:n,s:n,s:n,s:K,s:K,s:K,s:K}",
+                          "slot_size", (Py_ssize_t) pool->slot_size,
+                          "slabs", (Py_ssize_t) pool->num_slabs,
+                          "capacity", (Py_ssize_t) (pool->num_slabs * pool->slots_per_slab),
+                          "in_use", pool->allocated - pool->freed,
+                          "allocated", pool->allocated, "freed", pool->freed,
+                          "deleted", pool->deleted);
+%(UNLOCK)s    return stats;
+}
+''' % pool_code)
+
+        if self.get_pool_class(cpp_class) is cpp_class and not cpp_class.import_from_module:
+            code_sink.writeln("extern PyBindGenObjectPool %s;" % self.get_pool_name(cpp_class))
+            code_sink.writeln()
+
+    def generate_methods(self, cpp_class, code_sink):
+        if self.get_pool_class(cpp_class) is not cpp_class:
+            return [] # the stats are inherited
+        slot_size = None
+        for cls in self.classes:
+            if self.get_pool_class(cls) is not cpp_class:
+                continue
+            sizes = ["sizeof(%s)" % cls.full_name]
+            if cls.helper_class is not None:
+                sizes.append("sizeof(%s)" % cls.helper_class.name)
+            for size in sizes:
+                if slot_size is None:
+                    slot_size = size
+                else:
+                    slot_size = "PYBINDGEN_POOL_MAX(%s, %s)" % (slot_size, size)
+        pool_name = self.get_pool_name(cpp_class)
+        stats_function_name = "_wrap_%s__pool_stats" % cpp_class.pystruct
+        code_sink.writeln('''
+PyBindGenObjectPool %s = { PYBINDGEN_POOL_SLOT_SIZE(%s), %i, NULL, 0, 0, NULL, 0, 0, 0 };
+
+static PyObject *
+%s(PyObject *PYBINDGEN_UNUSED(dummy), PyObject *PYBINDGEN_UNUSED(args))
+{
+    return pybindgen_pool_stats(&%s);
+}
+''' % (pool_name, slot_size, self.slots_per_slab, stats_function_name, pool_name))
+        return ['{(char *) "_pool_stats", (PyCFunction) %s, METH_NOARGS|METH_STATIC, NULL},'
+                % stats_function_name]
+
+    def __repr__(self):
+        return 'cppclass.PooledAllocationPolicy(slots_per_slab=%r)' % self.slots_per_slab
+
+
 class SmartPointerPolicy(MemoryPolicy):
     pointer_template = None # class should fill this or create descriptor/getter
 
@@ -637,9 +958,11 @@ class CppClass(object):
         self.cannot_be_constructed = '' # reason
         self.has_trivial_constructor = False
         self.has_copy_constructor = False
+        self.has_move_constructor = False
         self.has_output_stream_operator = False
         self._have_pure_virtual_methods = None
         self._wrapper_registry = None
+        self._hierarchy_accounting = None # see cache_wrapper_accounting
         self.binary_comparison_operators = set()
         self.binary_numeric_operators = dict()
         self.inplace_numeric_operators = dict()
@@ -1301,8 +1624,9 @@ class CppClass(object):
     def _register_typeid(self, module):
         """register this class with the typeid map root class"""
         root = self.get_type_narrowing_root()
-        module.after_init.write_code("%s.register_wrapper(typeid(%s), &%s);"
-                                     % (root.typeid_map_name, self.full_name, self.pytypestruct))
+        module.get_init_code_block().write_code(
+            "%s.register_wrapper(typeid(%s), &%s);"
+            % (root.typeid_map_name, self.full_name, self.pytypestruct))
 
     def _generate_typeid_map(self, code_sink, module):
         """generate the typeid map and fill it with values"""
@@ -1311,6 +1635,33 @@ class CppClass(object):
         except KeyError:
             pass
         else:
+            if settings.free_threading:
+                ## lookups must not insert entries in the map, and
+                ## are done under a lock, as other modules may still be
+                ## registering their wrappers
+                typemap_code = dict(MUTEX='''   PyBindGenMutex m_mutex;
+
+   PyTypeObject * find_wrapper(const char *type_name)
+   {
+       PyTypeObject *python_wrapper = NULL;
+       PYBINDGEN_LOCK(m_mutex);
+       std::map<std::string, PyTypeObject *>::const_iterator iter = m_map.find(type_name);
+       if (iter != m_map.end())
+           python_wrapper = iter->second;
+       PYBINDGEN_UNLOCK(m_mutex);
+       return python_wrapper;
+   }
+''',
+                                    REGISTER='''       PYBINDGEN_LOCK(m_mutex);
+       m_map[std::string(cpp_type_info.name())] = python_wrapper;
+       PYBINDGEN_UNLOCK(m_mutex);''',
+                                    LOOKUP="find_wrapper(cpp_type_info.name())",
+                                    LOOKUP_BASE="find_wrapper(_typeinfo->name())")
+            else:
+                typemap_code = dict(MUTEX='',
+                                    REGISTER="       m_map[std::string(cpp_type_info.name())] = python_wrapper;",
+                                    LOOKUP="m_map[cpp_type_info.name()]",
+                                    LOOKUP_BASE="m_map[std::string(_typeinfo->name())]")
             code_sink.writeln('''
 
 #include <map>
@@ -1327,7 +1678,7 @@ namespace pybindgen {
 class TypeMap
 {
    std::map<std::string, PyTypeObject *> m_map;
-
+%(MUTEX)s
 public:
 
    TypeMap() {}
@@ -1340,10 +1691,10 @@ public:
              << ", python_wrapper=" << python_wrapper->tp_name << ")" << std::endl;
 #endif
 
-       m_map[std::string(cpp_type_info.name())] = python_wrapper;
+%(REGISTER)s
    }
 
-''')
+''' % typemap_code)
 
             if settings.gcc_rtti_abi_complete:
                 code_sink.writeln('''
@@ -1354,7 +1705,7 @@ public:
    std::cerr << "lookup_wrapper(this=" << this << ", type_name=" << cpp_type_info.name() << ")" << std::endl;
 #endif
 
-       PyTypeObject *python_wrapper = m_map[cpp_type_info.name()];
+       PyTypeObject *python_wrapper = %(LOOKUP)s;
        if (python_wrapper)
            return python_wrapper;
        else {
@@ -1367,7 +1718,7 @@ public:
 #if PBG_TYPEMAP_DEBUG
           std::cerr << "  -> looking at C++ type " << _typeinfo->name() << std::endl;
 #endif
-           while (_typeinfo && (python_wrapper = m_map[std::string(_typeinfo->name())]) == 0) {
+           while (_typeinfo && (python_wrapper = %(LOOKUP_BASE)s) == 0) {
                _typeinfo = dynamic_cast<const abi::__si_class_type_info*> (_typeinfo->__base_type);
 #if PBG_TYPEMAP_DEBUG
                std::cerr << "  -> looking at C++ type " << _typeinfo->name() << std::endl;
@@ -1392,7 +1743,7 @@ public:
 };
 
 }
-''')
+''' % typemap_code)
             else:
                 code_sink.writeln('''
    PyTypeObject * lookup_wrapper(const std::type_info &cpp_type_info, PyTypeObject *fallback_wrapper)
@@ -1402,20 +1753,23 @@ public:
    std::cerr << "lookup_wrapper(this=" << this << ", type_name=" << cpp_type_info.name() << ")" << std::endl;
 #endif
 
-       PyTypeObject *python_wrapper = m_map[cpp_type_info.name()];
+       PyTypeObject *python_wrapper = %(LOOKUP)s;
        return python_wrapper? python_wrapper : fallback_wrapper;
    }
 };
 
 }
-''')
+''' % typemap_code)
         
 
+        code_sink.writeln()
         if self.import_from_module:
-            code_sink.writeln("\nextern pybindgen::TypeMap *_%s;\n" % self.typeid_map_name)
+            module.declare_global(code_sink, 'pybindgen::TypeMap *', '_' + self.typeid_map_name)
+            code_sink.writeln()
             code_sink.writeln("#define %s (*_%s)\n" % (self.typeid_map_name, self.typeid_map_name))
         else:
-            code_sink.writeln("\nextern pybindgen::TypeMap %s;\n" % self.typeid_map_name)
+            module.declare_global(code_sink, 'pybindgen::TypeMap', self.typeid_map_name)
+            code_sink.writeln()
 
     def _add_method_obj(self, method):
         """
@@ -1594,6 +1948,15 @@ public:
         if flag:
             self.helper_class = None
 
+    def set_has_move_constructor(self, flag=True):
+        """
+        Declare that the class has a public move constructor.  Objects
+        of this class returned by value are then moved, instead of
+        copied, into their python wrapper when the generated code is
+        compiled as C++11 or later.
+        """
+        self.has_move_constructor = flag
+
     def set_cannot_be_constructed(self, reason):
         assert isinstance(reason, string_types)
         self.cannot_be_constructed = reason
@@ -1802,6 +2165,46 @@ public:
             return self.parent._get_wrapper_registry()
     wrapper_registry = property(_get_wrapper_registry)
 
+    def _has_default_lifetime_slots(self):
+        tp_new = "_wrap_%s__tp_new" % self.pystruct
+        tp_dealloc = "_wrap_%s__tp_dealloc" % self.pystruct
+        return (self.slots.get("tp_new", tp_new) == tp_new
+                and self.slots.get("tp_dealloc", tp_dealloc) == tp_dealloc)
+
+    def _get_wrapper_accounting(self):
+        # classes with custom allocation or deallocation slots cannot
+        # keep their wrappers linked in the live wrappers list; and
+        # since subclasses inherit tp_new and share the instance
+        # layout of their base, a class hierarchy is either accounted
+        # as a whole or not at all
+        if not settings.wrapper_accounting:
+            return False
+        root_class = self
+        while root_class.parent is not None:
+            if root_class.import_from_module:
+                return False
+            root_class = root_class.parent
+        if root_class.import_from_module:
+            return False
+        if root_class._hierarchy_accounting is not None:
+            return root_class._hierarchy_accounting
+        modules = [self.module.get_root()]
+        for module in modules:
+            modules.extend(module.submodules)
+        for module in modules:
+            for class_ in module.classes:
+                ancestor = class_
+                while ancestor.parent is not None:
+                    ancestor = ancestor.parent
+                if ancestor is root_class and not class_._has_default_lifetime_slots():
+                    return False
+        return True
+    wrapper_accounting = property(_get_wrapper_accounting)
+
+    def _get_live_wrappers_name(self):
+        return "_wrap_%s__live" % self.pystruct
+    live_wrappers_name = property(_get_live_wrappers_name)
+
     def generate_forward_declarations(self, code_sink, module):
         """
         Generates forward declarations for the instance and type
@@ -1813,15 +2216,21 @@ public:
         else:
             pointer_type = self.full_name + " *"
 
+        if self.wrapper_accounting:
+            live_link = "    PyBindGenLiveLink live;\n"
+        else:
+            live_link = ""
+
         if self.allow_subclassing:
             code_sink.writeln('''
 typedef struct {
     PyObject_HEAD
     %sobj;
     PyObject *inst_dict;
+    PyObject *wards;
     PyBindGenWrapperFlags flags:8;
-} %s;
-    ''' % (pointer_type, self.pystruct))
+%s} %s;
+    ''' % (pointer_type, live_link, self.pystruct))
 
         else:
 
@@ -1830,18 +2239,20 @@ typedef struct {
     PyObject_HEAD
     %sobj;
     PyBindGenWrapperFlags flags:8;
-} %s;
-    ''' % (pointer_type, self.pystruct))
+%s} %s;
+    ''' % (pointer_type, live_link, self.pystruct))
 
         code_sink.writeln()
 
         if self.import_from_module:
-            code_sink.writeln('extern PyTypeObject *_%s;' % (self.pytypestruct,))
+            module.declare_global(code_sink, 'PyTypeObject *', '_' + self.pytypestruct)
             code_sink.writeln('#define %s (*_%s)' % (self.pytypestruct, self.pytypestruct))
         else:
-            code_sink.writeln('extern PyTypeObject %s;' % (self.pytypestruct,))
+            module.declare_type(code_sink, self.pytypestruct)
             if not self.static_attributes.empty():
-                code_sink.writeln('extern PyTypeObject Py%s_Type;' % (self.metaclass_name,))
+                module.declare_type(code_sink, 'Py%s_Type' % (self.metaclass_name,))
+            if self.wrapper_accounting:
+                code_sink.writeln('extern PyBindGenLiveList %s;' % (self.live_wrappers_name,))
 
         code_sink.writeln()
 
@@ -1859,6 +2270,9 @@ typedef struct {
         if self.typeid_map_name is not None:
             self._generate_typeid_map(code_sink, module)
 
+        if self.memory_policy is not None:
+            self.memory_policy.generate_forward_declarations(self, code_sink, module)
+
         if self.container_traits is not None:
             self.container_traits.generate_forward_declarations(code_sink, module)
 
@@ -1878,6 +2292,13 @@ typedef struct {
                 class_python_name = self.custom_name
         return class_python_name
 
+    def get_python_full_name(self):
+        ":return: the full python name of the class, including modules and outer classes"
+        if self.outer_class is None:
+            return '.'.join(self.module.get_module_path() + [self.get_python_name()])
+        else:
+            return '%s.%s' % (self.outer_class.get_python_full_name(), self.get_python_name())
+
     def _generate_import_from_module(self, code_sink, module):
         if module.parent is None:
             error_retcode = "MOD_ERROR"
@@ -1889,7 +2310,7 @@ typedef struct {
             module_name, type_name = self.import_from_module.split(" named ")
         else:
             module_name, type_name = self.import_from_module, self.name
-        code_sink.writeln("PyTypeObject *_%s;" % self.pytypestruct)
+        module.define_global(code_sink, 'PyTypeObject *', '_' + self.pytypestruct)
         module.after_init.write_code("/* Import the %r class from module %r */" % (self.full_name, self.import_from_module))
         module.after_init.write_code("{"); module.after_init.indent()
         module.after_init.write_code("PyObject *module = PyImport_ImportModule((char*) \"%s\");" % module_name)
@@ -1903,7 +2324,7 @@ typedef struct {
         module.after_init.write_code("if (PyErr_Occurred()) PyErr_Clear();")
 
         if self.typeid_map_name is not None:
-            code_sink.writeln("pybindgen::TypeMap *_%s;" % self.typeid_map_name)
+            module.define_global(code_sink, 'pybindgen::TypeMap *', '_' + self.typeid_map_name)
             module.after_init.write_code("/* Import the %r class type map from module %r */" % (self.full_name, self.import_from_module))
             module.after_init.write_code("PyObject *_cobj = PyObject_GetAttrString(module, (char*) \"_%s\");"
                                          % (self.typeid_map_name))
@@ -1917,7 +2338,7 @@ typedef struct {
                                          % (self.typeid_map_name, self.typeid_map_name))        
 
         if self.parent is None:
-            self.wrapper_registry.generate_import(code_sink, module.after_init, "module")
+            self.wrapper_registry.generate_import(code_sink, module.after_init, "module", module)
 
         module.after_init.unindent(); module.after_init.write_code("}")
 
@@ -1925,35 +2346,11 @@ typedef struct {
             self.helper_class.generate(code_sink)
 
 
-    def generate(self, code_sink, module):
-        """Generates the class to a code sink"""
-
-        if self.import_from_module:
-            self._generate_import_from_module(code_sink, module)
-            return # .......................... RETURN
-
-        if self.typeid_map_name is not None:
-            code_sink.writeln("\npybindgen::TypeMap %s;\n" % self.typeid_map_name)
-            module.after_init.write_code("PyModule_AddObject(m, (char *) \"_%s\", PyCObject_FromVoidPtr(&%s, NULL));"
-                                         % (self.typeid_map_name, self.typeid_map_name))
-
-        if self.automatic_type_narrowing:
-            self._register_typeid(module)
-
-        if self.parent is None:
-            self.wrapper_registry.generate(code_sink, module)
-
-        if self.helper_class is not None:
-            parent_caller_methods = self.helper_class.generate(code_sink)
-        else:
-            parent_caller_methods = []
-
-        ## generate getsets
-        instance_getsets = self.instance_attributes.generate(code_sink)
-        self.slots.setdefault("tp_getset", instance_getsets)
-        static_getsets = self.static_attributes.generate(code_sink)
-
-        ## --- register the class type in the module ---
+    def _generate_custom_registration(self, code_sink, module, static_getsets):
+        """
+        Generates the straight-line init code registering a class
+        that needs a metaclass or has multiple bases.
+        """
         module.after_init.write_code("/* Register the '%s' class */" % self.full_name)
 
         ## generate a metaclass if needed
@@ -1969,6 +2366,14 @@ typedef struct {
                                     self.static_attributes)
             metaclass.generate(code_sink, module)
 
+        class_python_name = self.get_python_name()
+        if module.get_root().isolated:
+            module.write_heap_type_creation(self.pytypestruct,
+                                            ['&' + base.pytypestruct for base in self.bases],
+                                            metaclass is not None and '&' + metaclass.pytypestruct or None)
+            module.write_type_addition(self.pytypestruct, class_python_name, self.outer_class)
+            return
+
         if self.parent is not None:
             assert isinstance(self.parent, CppClass)
             module.after_init.write_code('%s.tp_base = &%s;' %
@@ -1981,22 +2386,56 @@ typedef struct {
                                                  % (self.pytypestruct, basenum, base.pytypestruct))
 
         if metaclass is not None:
-            module.after_init.write_code('Py_TYPE(&%s) = &%s;' %
+            module.after_init.write_code('Py_SET_TYPE(&%s, &%s);' %
                                          (self.pytypestruct, metaclass.pytypestruct))
 
         module.after_init.write_error_check('PyType_Ready(&%s)'
                                           % (self.pytypestruct,))
+        module.write_type_addition(self.pytypestruct, class_python_name, self.outer_class)
+
+    def generate(self, code_sink, module):
+        """Generates the class to a code sink"""
 
+        if self.import_from_module:
+            self._generate_import_from_module(code_sink, module)
+            return # .......................... RETURN
+
+        if self.typeid_map_name is not None:
+            code_sink.writeln()
+            module.define_global(code_sink, 'pybindgen::TypeMap', self.typeid_map_name)
+            code_sink.writeln()
+            module.get_init_code_block().write_code(
+                "PyModule_AddObject(m, (char *) \"_%s\", PyCObject_FromVoidPtr(&%s, NULL));"
+                % (self.typeid_map_name, self.typeid_map_name))
+
+        if self.parent is None:
+            self.wrapper_registry.generate(code_sink, module)
+
+        if self.helper_class is not None:
+            parent_caller_methods = self.helper_class.generate(code_sink)
+        else:
+            parent_caller_methods = []
+
+        ## generate getsets
+        instance_getsets = self.instance_attributes.generate(code_sink)
+        self.slots.setdefault("tp_getset", instance_getsets)
+        static_getsets = self.static_attributes.generate(code_sink)
+
+        ## --- register the class type in the module ---
         class_python_name = self.get_python_name()
 
-        if self.outer_class is None:
-            module.after_init.write_code(
-                'PyModule_AddObject(m, (char *) \"%s\", (PyObject *) &%s);' % (
-                class_python_name, self.pytypestruct))
+        if static_getsets == '0' and len(self.bases) <= 1:
+            module.write_type_registration(self.pytypestruct, class_python_name,
+                                           base=self.parent, outer=self.outer_class)
         else:
-            module.after_init.write_code(
-                'PyDict_SetItemString((PyObject*) %s.tp_dict, (char *) \"%s\", (PyObject *) &%s);' % (
-                self.outer_class.pytypestruct, class_python_name, self.pytypestruct))
+            ## metaclasses and multiple bases need custom code, which
+            ## expects the types registered so far to be ready
+            module.flush_registrations()
+            self._generate_custom_registration(code_sink, module, static_getsets)
+
+        ## with isolated initialization the type only exists once registered
+        if self.automatic_type_narrowing:
+            self._register_typeid(module)
 
         have_constructor = self._generate_constructor(code_sink)
 
@@ -2007,6 +2446,9 @@ typedef struct {
 
         self._generate_destructor(code_sink, have_constructor)
 
+        if self.wrapper_accounting:
+            self._generate_wrapper_accounting(code_sink)
+
         if self.has_output_stream_operator:
             self._generate_str(code_sink)
         
@@ -2208,7 +2650,7 @@ typedef struct {
         self.slots.setdefault("tp_doc", (docstring is None and 'NULL'
                                          or "\"%s\"" % (docstring,)))
         dict_ = self.slots
-        dict_.setdefault("typestruct", self.pytypestruct)
+        dict_.setdefault("typestruct", self._module.get_type_definition_name(self.pytypestruct))
 
         if self.outer_class is None:
             mod_path = self._module.get_module_path()
@@ -2286,9 +2728,7 @@ static PyObject*\n%s(%s *self)
 
         py_copy = declarations.declare_variable("%s*" % self.pystruct, "py_copy")
         self.write_allocate_pystruct(code_block, py_copy)
-        code_block.write_code("%s->obj = new %s(*self->obj);" % (py_copy, construct_name))
-        if self.allow_subclassing:
-            code_block.write_code("%s->inst_dict = NULL;" % py_copy)
+        self.write_create_instance(code_block, "%s->obj" % py_copy, "*self->obj", construct_name)
         code_block.write_code("%s->flags = PYBINDGEN_WRAPPER_FLAG_NONE;" % py_copy)
 
         self.wrapper_registry.write_register_new_wrapper(code_block, py_copy, "%s->obj" % py_copy)
@@ -2403,6 +2843,9 @@ static PyObject*\n%s(%s *self)
             else:
                 method_defs.append('{(char *) "__copy__", (PyCFunction) %s, METH_NOARGS, NULL},' % copy_wrapper_name)
 
+        if self.memory_policy is not None:
+            method_defs.extend(self.memory_policy.generate_methods(self, code_sink))
+
         ## generate the method table
         code_sink.writeln("static PyMethodDef %s_methods[] = {" % (self.pystruct,))
         code_sink.indent()
@@ -2435,7 +2878,7 @@ static PyObject*\n%s(%s *self)
         return delete_code
 
     def _generate_gc_methods(self, code_sink):
-        """Generate tp_clear and tp_traverse"""
+        """Generate tp_clear, tp_traverse, tp_alloc and tp_setattro"""
 
         ## --- tp_clear ---
         tp_clear_function_name = "%s__tp_clear" % (self.pystruct,)
@@ -2447,6 +2890,7 @@ static void
 {
     Py_CLEAR(self->inst_dict);
     %s
+    Py_CLEAR(self->wards);
 }
 ''' % (tp_clear_function_name, self.pystruct, delete_code))
 
@@ -2462,20 +2906,137 @@ static void
             else:
                 peekref_code = " && self->obj->%s() == 1" % self.memory_policy.peekref_method
             visit_self = '''
-    if (self->obj && typeid(*self->obj).name() == typeid(%s).name() %s)
+    if (self->obj && typeid(*self->obj) == typeid(%s) %s)
         Py_VISIT((PyObject *) self);
 ''' % (self.helper_class.name, peekref_code)
+        if self.module.get_root().isolated:
+            ## instances of heap types reference their type
+            visit_self += "    Py_VISIT((PyObject *) Py_TYPE(self));\n"
 
         code_sink.writeln(r'''
 static int
 %s(%s *self, visitproc visit, void *arg)
 {
     Py_VISIT(self->inst_dict);
+    Py_VISIT(self->wards);
     %s
     return 0;
 }
 ''' % (tp_traverse_function_name, self.pystruct, visit_self))
 
+        ## --- tp_alloc ---
+        ## Only instances of Python subclasses can form reference
+        ## cycles through the helper class, so plain instances are
+        ## not tracked by the garbage collector until they acquire an
+        ## instance dictionary or wards.
+        tp_alloc_function_name = "%s__tp_alloc" % (self.pystruct,)
+        self.slots.setdefault("tp_alloc", tp_alloc_function_name)
+        if self.module.get_root().isolated:
+            ## the wrapper types are heap types too, but unlike Python
+            ## subclasses they are created with a defining module
+            wrapper_type_check = "((PyHeapTypeObject *) type)->ht_module != NULL"
+        else:
+            wrapper_type_check = "!(type->tp_flags & Py_TPFLAGS_HEAPTYPE)"
+        code_sink.writeln(r'''
+static PyObject*
+%s(PyTypeObject *type, Py_ssize_t nitems)
+{
+    PyObject *self = PyType_GenericAlloc(type, nitems);
+    if (self != NULL && %s) {
+        PyObject_GC_UnTrack(self);
+    }
+    return self;
+}
+''' % (tp_alloc_function_name, wrapper_type_check))
+
+        ## --- tp_setattro ---
+        tp_setattro_function_name = "%s__tp_setattro" % (self.pystruct,)
+        self.slots.setdefault("tp_setattro", tp_setattro_function_name)
+        code_sink.writeln(r'''
+static int
+%s(%s *self, PyObject *name, PyObject *value)
+{
+    int retval = PyObject_GenericSetAttr((PyObject *) self, name, value);
+    if (self->inst_dict != NULL && !PyObject_GC_IsTracked((PyObject *) self)) {
+        PyObject_GC_Track((PyObject *) self);
+    }
+    return retval;
+}
+''' % (tp_setattro_function_name, self.pystruct))
+
+    def _generate_wrapper_accounting(self, code_sink):
+        """Generate the live wrappers list, the function that counts
+        them, and a tp_new that links new wrappers into the list"""
+
+        count_function_name = "_wrap_%s__count_live" % (self.pystruct,)
+        code_sink.writeln(r'''
+static void
+%s(PyBindGenLiveCounts *counts)
+{''' % (count_function_name,))
+        code_sink.indent()
+        code_block = CodeBlock("return;", DeclarationsScope())
+        link = code_block.declare_variable("PyBindGenLiveLink*", "link")
+        wrapper = code_block.declare_variable("%s*" % self.pystruct, "wrapper")
+        if self.memory_policy is not None:
+            obj = self.memory_policy.get_pointer_to_void_name('%s->obj' % wrapper)
+        else:
+            obj = '%s->obj' % wrapper
+        if settings.free_threading:
+            code_block.write_code("PYBINDGEN_LOCK(%s.mutex);" % self.live_wrappers_name)
+        code_block.write_code("for (%s = %s.first; %s != NULL; %s = %s->next) {"
+                              % (link, self.live_wrappers_name, link, link, link))
+        code_block.indent()
+        code_block.write_code("%s = (%s *) %s->wrapper;" % (wrapper, self.pystruct, link))
+        code_block.write_code("counts->live++;")
+        code_block.write_code("if (%s == NULL) {\n"
+                              "    counts->detached++;\n"
+                              "    continue;\n"
+                              "}" % obj)
+        code_block.write_code("if (%s->flags & PYBINDGEN_WRAPPER_FLAG_OBJECT_NOT_OWNED) {\n"
+                              "    counts->borrowed++;\n"
+                              "} else {\n"
+                              "    counts->owned++;\n"
+                              "}" % wrapper)
+        ## a new reference, released with the list locked, could
+        ## deallocate the wrapper, whose unlinking would wait forever
+        ## for the lock
+        try:
+            registered = code_block.declare_variable("%s*" % self.pystruct, "registered")
+            self.wrapper_registry.write_lookup_wrapper(code_block, self.pystruct, registered, obj,
+                                                       new_reference=False)
+        except NotSupportedError:
+            pass
+        else:
+            code_block.write_code("if (%s == %s) {\n"
+                                  "    counts->registered++;\n"
+                                  "}" % (registered, wrapper))
+        code_block.unindent()
+        code_block.write_code("}")
+        if settings.free_threading:
+            code_block.write_code("PYBINDGEN_UNLOCK(%s.mutex);" % self.live_wrappers_name)
+        code_block.declarations.get_code_sink().flush_to(code_sink)
+        code_block.sink.flush_to(code_sink)
+        code_sink.unindent()
+        code_sink.writeln("}")
+
+        code_sink.writeln('''
+PyBindGenLiveList %s = { "%s", %s, NULL, 0, 0, 0, NULL };
+''' % (self.live_wrappers_name, self.get_python_full_name(), count_function_name))
+
+        tp_new_function_name = "_wrap_%s__tp_new" % (self.pystruct,)
+        self.slots.setdefault("tp_new", tp_new_function_name)
+        code_sink.writeln(r'''
+static PyObject*
+%s(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    %s *self = (%s *) PyType_GenericNew(type, args, kwds);
+    if (self != NULL) {
+        PYBINDGEN_LIVE_LINK(%s, self);
+    }
+    return (PyObject *) self;
+}
+''' % (tp_new_function_name, self.pystruct, self.pystruct, self.live_wrappers_name))
+
     def _generate_str(self, code_sink):
         """Generate a tp_str function and register it in the type"""
 
@@ -2546,17 +3107,21 @@ static void
 
         code_block = CodeBlock("PyErr_Print(); return;", DeclarationsScope())
 
+        if self.wrapper_accounting:
+            code_block.write_code("PYBINDGEN_LIVE_UNLINK(self);")
+
         if self.memory_policy is not None:
             self.wrapper_registry.write_unregister_wrapper(code_block, 'self', self.memory_policy.get_pointer_to_void_name('self->obj'))
         else:
             self.wrapper_registry.write_unregister_wrapper(code_block, 'self', 'self->obj')
 
         if self.allow_subclassing:
+            code_block.write_code("PyObject_GC_UnTrack((PyObject *) self);")
             code_block.write_code("%s(self);" % self.slots["tp_clear"])
         else:
             code_block.write_code(self._get_delete_code())
 
-        code_block.write_code('Py_TYPE(self)->tp_free((PyObject*)self);')
+        code_block.write_code(self.module.get_instance_free_code('self'))
 
         code_block.write_cleanup()
         
@@ -2639,11 +3204,17 @@ if (!PyObject_IsInstance((PyObject*) other, (PyObject*) &%s)) {
             new_func = 'PyObject_New'
         if wrapper_type is None:
             wrapper_type = '&'+self.pytypestruct
+        if not self.import_from_module:
+            self.module.write_ensure_type_ready(code_block, wrapper_type)
         code_block.write_code("%s = %s(%s, %s);" %
                               (lvalue, new_func, self.pystruct, wrapper_type))
+        if self.wrapper_accounting:
+            code_block.write_code("PYBINDGEN_LIVE_LINK(%s, %s);" % (self.live_wrappers_name, lvalue))
         if self.allow_subclassing:
             code_block.write_code(
                 "%s->inst_dict = NULL;" % (lvalue,))
+            code_block.write_code(
+                "%s->wards = NULL;" % (lvalue,))
         if self.memory_policy is not None:
             code_block.write_code(self.memory_policy.get_pystruct_init_code(self, lvalue))
         
@@ -2961,9 +3532,9 @@ class CppClassParameter(CppClassParameterBase):
                     wrapper.parse_params.add_parameter('O', ['&'+self.py_name], self.name, optional=True)
 
                 if self.default_value is None:
-                    wrapper.before_call.write_code("if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
+                    wrapper.before_call.write_code("if (%s) {\n"
                                                    "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, self.cpp_class.pytypestruct,
+                                                   (self.cpp_class.module.get_instance_check(self.py_name, '&' + self.cpp_class.pytypestruct),
                                                     tmp_value_variable,
                                                     self.cpp_class.pystruct, self.py_name))
                 else:
@@ -2972,15 +3543,15 @@ class CppClassParameter(CppClassParameterBase):
                         "    %s = %s;" %
                         (self.py_name, tmp_value_variable, self.default_value))
                     wrapper.before_call.write_code(
-                        "} else if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
+                        "} else if (%s) {\n"
                                                    "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, self.cpp_class.pytypestruct,
+                                                   (self.cpp_class.module.get_instance_check(self.py_name, '&' + self.cpp_class.pytypestruct),
                                                     tmp_value_variable,
                                                     self.cpp_class.pystruct, self.py_name))
                 for conversion_source in implicit_conversion_sources:
-                    wrapper.before_call.write_code("} else if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
+                    wrapper.before_call.write_code("} else if (%s) {\n"
                                                    "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, conversion_source.pytypestruct,
+                                                   (conversion_source.module.get_instance_check(self.py_name, '&' + conversion_source.pytypestruct),
                                                     tmp_value_variable,
                                                     conversion_source.pystruct, self.py_name))
                 wrapper.before_call.write_code("} else {\n")
@@ -3086,15 +3657,15 @@ class CppClassRefParameter(CppClassParameterBase):
                         self.cpp_class.full_name, self.name)
                     wrapper.parse_params.add_parameter('O', ['&'+self.py_name], self.name)
 
-                    wrapper.before_call.write_code("if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
+                    wrapper.before_call.write_code("if (%s) {\n"
                                                    "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, self.cpp_class.pytypestruct,
+                                                   (self.cpp_class.module.get_instance_check(self.py_name, '&' + self.cpp_class.pytypestruct),
                                                     tmp_value_variable,
                                                     self.cpp_class.pystruct, self.py_name))
                     for conversion_source in implicit_conversion_sources:
-                        wrapper.before_call.write_code("} else if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
+                        wrapper.before_call.write_code("} else if (%s) {\n"
                                                        "    %s = *((%s *) %s)->obj;" %
-                                                       (self.py_name, conversion_source.pytypestruct,
+                                                       (conversion_source.module.get_instance_check(self.py_name, '&' + conversion_source.pytypestruct),
                                                         tmp_value_variable,
                                                         conversion_source.pystruct, self.py_name))
                     wrapper.before_call.write_code("} else {\n")
@@ -3242,16 +3813,27 @@ class CppClassReturnValue(CppClassReturnValueBase):
                 "%s->inst_dict = NULL;" % (py_name,))
         wrapper.after_call.write_code("%s->flags = PYBINDGEN_WRAPPER_FLAG_NONE;" % (py_name,))
 
+        ## PYBINDGEN_MOVE still copies on pre-C++11 compilers, so a
+        ## copy constructor is required on both paths
         if not self.cpp_class.has_copy_constructor:
             raise CodeGenerationError("Class {0} cannot be copied".format(self.cpp_class.full_name))
-        self.cpp_class.write_create_instance(wrapper.after_call,
-                                             "%s->obj" % py_name,
-                                             self.value)
+        if self.cpp_class.has_move_constructor and self.value == 'retval' \
+                and not self.type_traits.type_is_reference:
+            ## the returned temporary is ours, so move it into the wrapper
+            self.cpp_class.write_create_instance(wrapper.after_call,
+                                                 "%s->obj" % py_name,
+                                                 "PYBINDGEN_MOVE(%s)" % self.value)
+            post_creation_value = "*%s->obj" % py_name
+        else:
+            self.cpp_class.write_create_instance(wrapper.after_call,
+                                                 "%s->obj" % py_name,
+                                                 self.value)
+            post_creation_value = self.value
         self.cpp_class.wrapper_registry.write_register_new_wrapper(wrapper.after_call, py_name,
                                                                    "%s->obj" % py_name)
         self.cpp_class.write_post_instance_creation_code(wrapper.after_call,
                                                          "%s->obj" % py_name,
-                                                         self.value)
+                                                         post_creation_value)
 
         #...
         wrapper.build_params.add_parameter("N", [py_name], prepend=True)
@@ -3433,8 +4015,9 @@ class CppClassPtrParameter(CppClassParameterBase):
 
                 wrapper.before_call.write_error_check(
 
-                    "%s && ((PyObject *) %s != Py_None) && !PyObject_IsInstance((PyObject *) %s, (PyObject *) &%s)"
-                    % (self.py_name, self.py_name, self.py_name, self.cpp_class.pytypestruct),
+                    "%s && ((PyObject *) %s != Py_None) && !%s"
+                    % (self.py_name, self.py_name,
+                       self.cpp_class.module.get_instance_check(self.py_name, '&' + self.cpp_class.pytypestruct)),
 
                     'PyErr_SetString(PyExc_TypeError, "Parameter %i must be of type %s");' % (num, self.cpp_class.name))
 
@@ -3457,6 +4040,14 @@ class CppClassPtrParameter(CppClassParameterBase):
         wrapper.call_params.append(value)
         
         if self.transfer_ownership:
+            if (isinstance(self.cpp_class.memory_policy, PooledAllocationPolicy)
+                    and not self.cpp_class.memory_policy.get_pool_class(self.cpp_class).import_from_module):
+                ## the callee would delete an object that belongs to the pool
+                wrapper.before_call.write_error_check(
+                    "%s && pybindgen_pool_owns(&%s, %s)"
+                    % (value_ptr, self.cpp_class.memory_policy.get_pool_name(self.cpp_class), value_ptr),
+                    'PyErr_SetString(PyExc_TypeError, "Parameter %s is allocated from a pool, '
+                    'its ownership cannot be transferred");' % (self.name,))
             if not isinstance(self.cpp_class.memory_policy, ReferenceCountingPolicy):
                 # if we transfer ownership, in the end we no longer own the object, so clear our pointer
                 wrapper.after_call.write_code('if (%s) {' % self.py_name)
@@ -3464,7 +4055,7 @@ class CppClassPtrParameter(CppClassParameterBase):
                 if self.cpp_class.memory_policy is not None:
                     self.cpp_class.wrapper_registry.write_unregister_wrapper(wrapper.after_call,
                                                                             '%s' % self.py_name,
-                                                                            self.memory_policy.get_pointer_to_void_name('%s->obj' % self.py_name))
+                                                                            self.cpp_class.memory_policy.get_pointer_to_void_name('%s->obj' % self.py_name))
                 else:
                     self.cpp_class.wrapper_registry.write_unregister_wrapper(wrapper.after_call,
                                                                             '%s' % self.py_name,
@@ -3770,13 +4361,22 @@ class CppClassPtrReturnValue(CppClassReturnValueBase):
         ## now the hairy part :)
         if self.caller_owns_return:
             if not isinstance(self.cpp_class.memory_policy, ReferenceCountingPolicy):
+                ## the caller deletes the object it receives, so it
+                ## must not belong to a pool
+                pooled = (isinstance(self.cpp_class.memory_policy, PooledAllocationPolicy)
+                          and not self.cpp_class.memory_policy.get_pool_class(self.cpp_class).import_from_module)
                 ## the caller receives a copy, if possible
                 try:
                     if not self.cpp_class.has_copy_constructor:
                         raise CodeGenerationError("Class {0} cannot be copied".format(self.cpp_class.full_name))
-                    self.cpp_class.write_create_instance(wrapper.after_call,
-                                                         "%s" % self.value,
-                                                         '*'+value)
+                    if pooled:
+                        default_instance_creation_function(self.cpp_class, wrapper.after_call,
+                                                           "%s" % self.value, '*'+value,
+                                                           self.cpp_class.get_construct_name())
+                    else:
+                        self.cpp_class.write_create_instance(wrapper.after_call,
+                                                             "%s" % self.value,
+                                                             '*'+value)
                 except CodeGenerationError:
                     copy_possible = False
                 else:
@@ -3787,6 +4387,12 @@ class CppClassPtrReturnValue(CppClassReturnValueBase):
                                                                      "%s" % self.value,
                                                                      '*'+value)
                 else:
+                    if pooled:
+                        wrapper.after_call.write_error_check(
+                            "pybindgen_pool_owns(&%s, %s)"
+                            % (self.cpp_class.memory_policy.get_pool_name(self.cpp_class), value),
+                            'PyErr_SetString(PyExc_TypeError, "The return value is allocated from a pool, '
+                            'its ownership cannot be transferred");')
                     # value = pyobj->obj; pyobj->obj = NULL;
                     wrapper.after_call.write_code(
                         "%s = %s;" % (self.value, value))
@@ -3839,9 +4445,71 @@ def scan_custodians_and_wards(wrapper):
 
 
 
-def _add_ward(code_block, custodian, ward):
+def cache_wrapper_accounting(classes, enabled=True):
+    """
+    Internal API, do not use.
+
+    Computes once, for each class hierarchy of the given classes,
+    whether its wrappers are accounted (see CppClass.wrapper_accounting),
+    instead of scanning all the classes each time a wrapper asks.  With
+    enabled=False, forgets the cached results.
+    """
+    root_classes = []
+    for class_ in classes:
+        root_class = class_
+        while root_class.parent is not None:
+            root_class = root_class.parent
+        root_class._hierarchy_accounting = None
+        root_classes.append(root_class)
+    if not enabled:
+        return
+    for class_, root_class in zip(classes, root_classes):
+        if root_class._hierarchy_accounting is None:
+            root_class._hierarchy_accounting = True
+        if not class_._has_default_lifetime_slots():
+            root_class._hierarchy_accounting = False
+
+
+def _add_ward(code_block, custodian, ward, custodian_class=None, check_type=False, failure_cleanup=None):
+    if custodian_class is not None and custodian_class.allow_subclassing:
+        ## the custodian wrapper has a dedicated 'wards' slot: a dict
+        ## keyed by the ward address, giving O(1) insertion without
+        ## looking up any attribute
+        wards = "((%s *) %s)->wards" % (custodian_class.pystruct, custodian)
+        ward_key = code_block.declare_variable('PyObject*', 'ward_key')
+        ## the error is only returned after the critical section ends
+        ward_status = code_block.declare_variable('int', 'ward_status')
+        if check_type:
+            condition = "%s && %s && PyObject_TypeCheck(%s, &%s)" % (
+                ward, custodian, custodian, custodian_class.pytypestruct)
+        else:
+            condition = ward
+        body = ("    if (%(wards)s == NULL) {\n"
+                "        %(wards)s = PyDict_New();\n"
+                "        if (%(wards)s != NULL && !PyObject_GC_IsTracked(%(custodian)s)) {\n"
+                "            PyObject_GC_Track(%(custodian)s);\n"
+                "        }\n"
+                "    }\n"
+                "    %(ward_key)s = (%(wards)s == NULL ? NULL : PyLong_FromVoidPtr(%(ward)s));\n"
+                "    if (%(ward_key)s == NULL) {\n"
+                "        %(ward_status)s = -1;\n"
+                "    } else {\n"
+                "        %(ward_status)s = PyDict_SetItem(%(wards)s, %(ward_key)s, %(ward)s);\n"
+                "        Py_DECREF(%(ward_key)s);\n"
+                "    }\n" % vars())
+        if settings.free_threading:
+            body = ("    PYBINDGEN_BEGIN_CRITICAL_SECTION(%s);\n"
+                    "%s"
+                    "    PYBINDGEN_END_CRITICAL_SECTION();\n" % (custodian, body))
+        code_block.write_code("%s = 0;" % ward_status)
+        code_block.write_code("if (%s) {\n%s}" % (condition, body))
+        code_block.write_error_check("%s == -1" % ward_status, failure_cleanup)
+        return
+
     wards = code_block.declare_variable(
         'PyObject*', 'wards')
+    if settings.free_threading:
+        code_block.write_code("PYBINDGEN_BEGIN_CRITICAL_SECTION(%s);" % custodian)
     code_block.write_code(
         "%(wards)s = PyObject_GetAttrString(%(custodian)s, (char *) \"__wards__\");"
         % vars())
@@ -3854,6 +4522,8 @@ def _add_ward(code_block, custodian, ward):
     code_block.write_code(
         "if (%(ward)s && !PySequence_Contains(%(wards)s, %(ward)s))\n"
         "    PyList_Append(%(wards)s, %(ward)s);" % dict(wards=wards, ward=ward))
+    if settings.free_threading:
+        code_block.write_code("PYBINDGEN_END_CRITICAL_SECTION();")
     code_block.add_cleanup_code("Py_DECREF(%s);" % wards)
             
 
@@ -3868,19 +4538,43 @@ def _get_custodian_or_ward(wrapper, num):
         return "((PyObject *) %s)" % wrapper.parameters[num-1].py_name
 
 
+def _get_custodian_class(wrapper, num):
+    """Returns the CppClass of the custodian object, or None if unknown"""
+    if num == -1:
+        cpp_class = getattr(wrapper.return_value, 'cpp_class', None)
+    elif num == 0:
+        cpp_class = getattr(wrapper, 'class_', None)
+    else:
+        cpp_class = getattr(wrapper.parameters[num-1], 'cpp_class', None)
+    if isinstance(cpp_class, CppClass):
+        return cpp_class
+    return None
+
+
+def _implement_custodian_and_ward(code_block, wrapper, custodian, ward):
+    if -1 in (custodian, ward):
+        ## the return value is not returned on error
+        failure_cleanup = "Py_DECREF(%s);" % wrapper.return_value.py_name
+    else:
+        failure_cleanup = None
+    _add_ward(code_block,
+              _get_custodian_or_ward(wrapper, custodian),
+              _get_custodian_or_ward(wrapper, ward),
+              _get_custodian_class(wrapper, custodian),
+              # parameters may be None, or of an unexpected type
+              check_type=(custodian > 0),
+              failure_cleanup=failure_cleanup)
+
+
 def implement_parameter_custodians_precall(wrapper):
     for custodian, ward, postcall in wrapper.custodians_and_wards:
         if not postcall:
-            _add_ward(wrapper.before_call,
-                      _get_custodian_or_ward(wrapper, custodian),
-                      _get_custodian_or_ward(wrapper, ward))
+            _implement_custodian_and_ward(wrapper.before_call, wrapper, custodian, ward)
 
 
 def implement_parameter_custodians_postcall(wrapper):
     for custodian, ward, postcall in wrapper.custodians_and_wards:
         if postcall:
-            _add_ward(wrapper.after_call,
-                      _get_custodian_or_ward(wrapper, custodian),
-                      _get_custodian_or_ward(wrapper, ward))
+            _implement_custodian_and_ward(wrapper.after_call, wrapper, custodian, ward)
 
 
@@ -98,7 +98,7 @@ class CppClassContainerTraits(object):
     iter_pytypestruct = property(get_iter_pytypestruct)
 
 
-    def generate_forward_declarations(self, code_sink, dummy_module):
+    def generate_forward_declarations(self, code_sink, module):
         """
         Generates forward declarations for the instance and type
         structures.
@@ -114,7 +114,7 @@ typedef struct {
     ''' % (self.cppclass.pystruct, self.cppclass.full_name, self.iterator_type, self.iter_pystruct))
 
         code_sink.writeln()
-        code_sink.writeln('extern PyTypeObject %s;' % (self.iter_pytypestruct,))
+        module.declare_type(code_sink, self.iter_pytypestruct)
         code_sink.writeln()
 
     def get_iter_python_name(self):
@@ -134,17 +134,8 @@ typedef struct {
         """Generates the class to a code sink"""
 
         ## --- register the iter type in the module ---
-        module.after_init.write_code("/* Register the '%s' class iterator*/" % self.cppclass.full_name)
-        module.after_init.write_error_check('PyType_Ready(&%s)' % (self.iter_pytypestruct,))
-
-        if self.cppclass.outer_class is None:
-            module.after_init.write_code(
-                'PyModule_AddObject(m, (char *) \"%s\", (PyObject *) &%s);' % (
-                self.get_iter_python_name(), self.iter_pytypestruct))
-        else:
-            module.after_init.write_code(
-                'PyDict_SetItemString((PyObject*) %s.tp_dict, (char *) \"%s\", (PyObject *) &%s);' % (
-                self.cppclass.outer_class.pytypestruct, self.cppclass.get_iter_python_name(), self.iter_pytypestruct))
+        module.write_type_registration(self.iter_pytypestruct, self.get_iter_python_name(),
+                                       outer=self.cppclass.outer_class)
 
         self._generate_gc_methods(code_sink)
         self._generate_destructor(code_sink)
@@ -155,7 +146,7 @@ typedef struct {
         """generate the type structure"""
         self.iter_pytype.slots.setdefault("tp_basicsize", "sizeof(%s)" % (self.iter_pystruct,))
         self.iter_pytype.slots.setdefault("tp_flags", ("Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_GC"))
-        self.iter_pytype.slots.setdefault("typestruct", self.iter_pytypestruct)
+        self.iter_pytype.slots.setdefault("typestruct", module.get_type_definition_name(self.iter_pytypestruct))
         self.iter_pytype.slots.setdefault("tp_name", self.get_iter_python_full_name(module))
         if docstring:
             self.iter_pytype.slots.setdefault("tp_doc", '"%s"' % docstring)
@@ -195,10 +186,11 @@ static void
 static int
 %s(%s *self, visitproc visit, void *arg)
 {
-    Py_VISIT((PyObject *) self->container);
+    Py_VISIT((PyObject *) self->container);%s
     return 0;
 }
-''' % (tp_traverse_function_name, self.iter_pystruct))
+''' % (tp_traverse_function_name, self.iter_pystruct,
+       self.cppclass.module.get_root().isolated and '\n    Py_VISIT((PyObject *) Py_TYPE(self));' or ''))
 
 
     def _generate_destructor(self, code_sink):
@@ -212,9 +204,10 @@ static void
 {
     Py_CLEAR(self->container);
     %s
-    Py_TYPE(self)->tp_free((PyObject*)self);
+    %s
 }
-''' % (iter_tp_dealloc_function_name, self.iter_pystruct, self._get_iter_delete_code()))
+''' % (iter_tp_dealloc_function_name, self.iter_pystruct, self._get_iter_delete_code(),
+       self.cppclass.module.get_instance_free_code('self')))
 
         self.iter_pytype.slots.setdefault("tp_dealloc", iter_tp_dealloc_function_name )
 
@@ -74,6 +74,7 @@ class CppCustomInstanceAttributeSetter(PySetter):
         :param code_sink: a CodeSink instance that will receive the generated code
         """
 
+        self._write_profile_start()
         self.declarations.declare_variable('PyObject*', 'py_retval')
         self.before_call.write_code(
             'py_retval = Py_BuildValue((char *) "(O)", value);')
@@ -100,6 +101,7 @@ class CppCustomInstanceAttributeSetter(PySetter):
         parse_tuple_params.extend(params)
         self.before_call.write_error_check('!PyArg_ParseTuple(%s)' %
                                            (', '.join(parse_tuple_params),))
+        self._write_profile_mark(self.before_call, 'CALL')
 
         if self.setter is not None:
             ## if we have a setter method, now is the time to call it
@@ -113,6 +115,8 @@ class CppCustomInstanceAttributeSetter(PySetter):
                 code += ">(*((%s *)self)->obj, %s);" % (self.class_.pystruct, value_var)
             self.after_call.write_code(code)
 
+        self._write_profile_mark(self.after_call, 'RETURN')
+
         ## cleanup and return
         self.after_call.write_cleanup()
         self.after_call.write_code('return 0;')
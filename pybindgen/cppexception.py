@@ -127,12 +127,12 @@ class CppException(object):
     python_full_name = property(_get_python_full_name)
 
 
-    def generate_forward_declarations(self, code_sink, dummy_module):
+    def generate_forward_declarations(self, code_sink, module):
         if self.is_standard_error:
             return
 
         code_sink.writeln()
-        code_sink.writeln('extern PyTypeObject *%s;' % (self.pytypestruct,))
+        module.declare_global(code_sink, 'PyTypeObject *', self.pytypestruct)
         code_sink.writeln()
 
 
@@ -143,15 +143,21 @@ class CppException(object):
         if self.is_standard_error:
             return
 
-        code_sink.writeln('PyTypeObject *%s;' % (self.pytypestruct,))
+        module.define_global(code_sink, 'PyTypeObject *', self.pytypestruct)
         ## --- register the class type in the module ---
         module.after_init.write_code("/* Register the '%s' exception */" % self.full_name)
         if self.parent is None:
             parent = 'NULL'
         else:
             parent = "(PyObject*) "+self.parent.pytypestruct
-        module.after_init.write_error_check('(%s = (PyTypeObject*) PyErr_NewException((char*)"%s", %s, NULL)) == NULL'
-                                            % (self.pytypestruct, self.python_full_name, parent))
+        if module.get_root().multi_phase_init:
+            ## the exec function runs once per interpreter; the
+            ## exception type is created only the first time
+            condition = '%s == NULL && ' % self.pytypestruct
+        else:
+            condition = ''
+        module.after_init.write_error_check('%s(%s = (PyTypeObject*) PyErr_NewException((char*)"%s", %s, NULL)) == NULL'
+                                            % (condition, self.pytypestruct, self.python_full_name, parent))
         if docstring:
             module.after_init.write_code("%s->tp_doc = (char*)\"%s\";" % (self.pytypestruct, docstring))
 
@@ -237,6 +237,10 @@ class CppMethod(ForwardWrapperBase):
         return self._class
     class_ = property(get_class, set_class)
 
+    def get_profile_name(self):
+        "virtual method implementation; do not call"
+        return '%s.%s' % (self.class_.get_python_full_name(), self.mangled_name)
+
     def generate_call(self, class_=None):
         "virtual method implementation; do not call"
         #assert isinstance(class_, CppClass)
@@ -620,6 +624,10 @@ class CppConstructor(ForwardWrapperBase):
         "Get the class wrapper object (CppClass)"
         return self._class
     class_ = property(get_class, set_class)
+
+    def get_profile_name(self):
+        "virtual method implementation; do not call"
+        return '%s.__init__' % self._class.get_python_full_name()
     
     def generate_call(self, class_=None):
         "virtual method implementation; do not call"
@@ -1000,6 +1008,28 @@ class CppVirtualMethodProxy(ReverseWrapperBase):
     helper_class = property(get_helper_class, set_helper_class)
 
 
+    def get_profile_name(self):
+        "virtual method implementation; do not call"
+        return '%s.%s (virtual)' % (self.class_.get_python_full_name(), self.method_name)
+
+    def _generate_gil_code(self):
+        ## called by the base constructor before self.method is set
+        method = getattr(self, 'method', None)
+        if (self.NO_GIL_LOCKING or method is None or method.class_ is None
+                or method.class_.module is None or not method.class_.module.get_root().isolated):
+            super(CppVirtualMethodProxy, self)._generate_gil_code()
+            return
+        ## PyGILState only knows the main interpreter, so a thread that
+        ## already runs in a subinterpreter must keep its own thread state
+        ensured_var = self.declarations.declare_variable('int', '__py_gil_ensured')
+        gil_state_var = self.declarations.declare_variable('PyGILState_STATE', '__py_gil_state')
+        self.before_call.write_code('%s = (PyEval_ThreadsInitialized() && PYBINDGEN_THREAD_STATE_GET() == NULL);'
+                                    % ensured_var)
+        self.before_call.write_code('%s = (%s ? PyGILState_Ensure() : PyGILState_UNLOCKED);'
+                                    % (gil_state_var, ensured_var))
+        self.before_call.add_cleanup_code('if (%s)\n'
+                                          '    PyGILState_Release(%s);' % (ensured_var, gil_state_var))
+
     def generate_python_call(self):
         """code to call the python method"""
         if settings._get_deprecated_virtuals():
@@ -1093,10 +1123,22 @@ Py_FatalError("Error detected, but parent virtual is pure virtual or private vir
                                (self.class_.full_name, self.class_.full_name))
         else:
             this_expression = "(%s*) this" % (self.class_.full_name)
-        self.before_call.write_code("reinterpret_cast< %s* >(m_pyself)->obj = %s;" %
-                                    (self.class_.pystruct, this_expression))
-        self.before_call.add_cleanup_code("reinterpret_cast< %s* >(m_pyself)->obj = %s;" %
-                                          (self.class_.pystruct, self_obj_before))
+        if settings.free_threading:
+            ## obj normally already points to this; not writing it
+            ## then keeps concurrent calls on the same object race free
+            self.before_call.write_code("if (%s != %s) {\n"
+                                        "    reinterpret_cast< %s* >(m_pyself)->obj = %s;\n"
+                                        "}" % (self_obj_before, this_expression,
+                                               self.class_.pystruct, this_expression))
+            self.before_call.add_cleanup_code("if (%s != %s) {\n"
+                                              "    reinterpret_cast< %s* >(m_pyself)->obj = %s;\n"
+                                              "}" % (self_obj_before, this_expression,
+                                                     self.class_.pystruct, self_obj_before))
+        else:
+            self.before_call.write_code("reinterpret_cast< %s* >(m_pyself)->obj = %s;" %
+                                        (self.class_.pystruct, this_expression))
+            self.before_call.add_cleanup_code("reinterpret_cast< %s* >(m_pyself)->obj = %s;" %
+                                              (self.class_.pystruct, self_obj_before))
         
         super(CppVirtualMethodProxy, self).generate(
             code_sink, '::'.join((self._helper_class.name, self.method_name)),
@@ -150,31 +150,18 @@ class Enum(object):
             for value in self.values:
                 if isinstance(value, tuple):
                     name, real_value = value
-                    module.after_init.write_code(
-                        "PyModule_AddIntConstant(m, (char *) \"%s\", %s);" % (name, real_value))
+                    module.write_constant_registration(name, real_value)
                 else:
-                    module.after_init.write_code(
-                        "PyModule_AddIntConstant(m, (char *) \"%s\", %s);"
-                        % (value, '::'.join(namespace + [self.values_prefix + value])))
+                    module.write_constant_registration(
+                        value, '::'.join(namespace + [self.values_prefix + value]))
         else:
-            module.after_init.write_code("{")
-            module.after_init.indent()
-            module.after_init.write_code("PyObject *tmp_value;")
             for value in self.values:
                 if isinstance(value, tuple):
                     value_name, value_str = value
                 else:
                     value_name = value
                     value_str = "%s::%s" % (self.outer_class.full_name, value)
-                module.after_init.write_code(
-                    ' // %s\n'
-                    'tmp_value = PyLong_FromLong(%s);\n'
-                    'PyDict_SetItemString((PyObject*) %s.tp_dict, \"%s\", tmp_value);\n'
-                    'Py_DECREF(tmp_value);'
-                    % (
-                    value_str, value_str, self.outer_class.pytypestruct, value_name))
-            module.after_init.unindent()
-            module.after_init.write_code("}")
+                module.write_constant_registration(value_name, value_str, outer=self.outer_class)
 
     def generate_declaration(self, sink, module):
         pass
@@ -220,6 +220,12 @@ class Function(ForwardWrapperBase):
             self.before_call.unindent()
             self.before_call.write_code('}')
 
+    def get_profile_name(self):
+        "virtual method implementation; do not call"
+        if self._module is None:
+            return super(Function, self).get_profile_name()
+        return '.'.join(self._module.get_module_path() + [self.mangled_name])
+
     def _before_call_hook(self):
         "hook that post-processes parameters and check for custodian=<n> CppClass parameters"
         from . import cppclass
@@ -43,6 +43,8 @@ from . import utils
 #    destructor_t, constructor_t, member_function_t
 from pygccxml.declarations.variable import variable_t
 import collections
+import multiprocessing
+import pickle
 
 
 ###
@@ -197,6 +199,50 @@ def _pygen_param(args, kwargs):
     return "param(%s)" % _pygen_args_kwargs(args, kwargs)
 
 
+## --- methods models (see ModuleParser._scan_class_methods_model) ---
+
+def _model_kwargs(kwargs):
+    """replaces the exception wrappers of method kwargs by their names"""
+    if 'throw' in kwargs:
+        kwargs = dict(kwargs)
+        kwargs['throw'] = [utils.ascii(exc.full_name) for exc in kwargs['throw']]
+    return kwargs
+
+
+class _MethodsModelSink(CodeSink):
+    """A code sink that appends the pygen lines written to it to a methods model"""
+    def __init__(self, model):
+        CodeSink.__init__(self)
+        self.model = model
+
+    def writeln(self, line=''):
+        self.model.append(('pygen', line))
+
+
+## the parser and the classes being scanned by _scan_methods_shard;
+## set only while ModuleParser._scan_classes_methods_models forks the
+## worker processes, which inherit it
+_scan_methods_state = None
+
+def _scan_methods_shard(shard):
+    """
+    Worker process function: returns the methods models of a shard of
+    classes, along with the warnings each scan emitted, and the state
+    of the annotations scanner.
+    """
+    module_parser, classes = _scan_methods_state
+    results = []
+    for index in shard:
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter('always')
+            models = [module_parser._scan_class_methods_model(cls, class_wrapper)
+                      for cls, class_wrapper in module_parser._get_class_methods_scopes(classes[index])]
+        results.append((index, models,
+                        [(str(warning.message), warning.category, warning.filename, warning.lineno)
+                         for warning in caught_warnings]))
+    return results, annotations_scanner.files, annotations_scanner.used_annotations
+
+
 class GccXmlTypeRegistry(object):
     def __init__(self, root_module):
         """
@@ -318,21 +364,127 @@ class GccXmlTypeRegistry(object):
 
 
 class AnnotationsScanner(object):
+    """
+    Extracts the annotations of declarations from the comments that
+    precede them in the header files.  Each header file is scanned
+    only once, into an index of the annotation blocks it contains; the
+    index can be saved to a cache file and reused by a later run, as
+    long as the header file is not modified.
+    """
+
     def __init__(self):
-        self.files = {} # file name -> list(lines)
-        self.used_annotations = {} # file name -> list(line_numbers)
+        self.files = {} # file name -> index, see _index_file
+        self.used_annotations = {} # file name -> set(line_numbers)
+        self._cache = {} # file name -> (mtime, size, index)
         self._comment_rx = re.compile(
             r"^\s*(?://\s+-#-(?P<annotation1>.*)-#-\s*)|(?:/\*\s+-#-(?P<annotation2>.*)-#-\s*\*/)")
         self._global_annotation_rx = re.compile(r"(\w+)(?:=([^\s;]+))?")
         self._param_annotation_rx = re.compile(r"@(\w+)\(([^;]+)\)")
 
-    def _declare_used_annotation(self, file_name, line_number):
+    def _merge(self, files, used_annotations):
+        """merges the state of the scanner of a worker process (see _scan_methods_shard)"""
+        for file_name, index in files.items():
+            self.files.setdefault(file_name, index)
+        for file_name, line_numbers in used_annotations.items():
+            self.used_annotations.setdefault(file_name, set()).update(line_numbers)
+
+    def _parse_annotation_line(self, line, line_number, global_annotations, parameter_annotations,
+                               problems):
+        for annotation_str in line.split(';'):
+            annotation_str = annotation_str.strip()
+            m = self._global_annotation_rx.match(annotation_str)
+            if m is not None:
+                global_annotations[m.group(1)] = m.group(2)
+                continue
+
+            m = self._param_annotation_rx.match(annotation_str)
+            if m is not None:
+                param_annotation = {}
+                parameter_annotations[m.group(1)] = param_annotation
+                for param in m.group(2).split(','):
+                    m = self._global_annotation_rx.match(param.strip())
+                    if m is not None:
+                        param_annotation[m.group(1)] = m.group(2)
+                    else:
+                        problems.append(("could not parse %r as parameter annotation element" %
+                                         (param.strip()), line_number))
+                continue
+            problems.append(("could not parse %r" % (annotation_str), line_number))
+
+    def _index_file(self, file_name):
+        """
+        Scans a header file, and returns a dict mapping the line number
+        following each block of consecutive annotation comments to
+        (annotation_line_numbers, global_annotations,
+        parameter_annotations, problems); problems is a list of
+        (message, line_number) of the annotations that could not be
+        parsed.
+        """
         try:
-            l = self.used_annotations[file_name]
-        except KeyError:
-            l = []
-            self.used_annotations[file_name] = l
-        l.append(line_number)
+            stat = os.stat(file_name)
+        except OSError:
+            stat = None
+        if stat is not None:
+            try:
+                mtime, size, index = self._cache[file_name]
+            except KeyError:
+                pass
+            else:
+                if (mtime, size) == (stat.st_mtime, stat.st_size):
+                    return index
+
+        with open(file_name, "rt") as header_file:
+            lines = header_file.readlines()
+        index = {}
+        block = [] # list of (line_number, annotation string)
+        for line_number, line in enumerate(lines + [''], 1):
+            m = self._comment_rx.match(line)
+            if m is not None:
+                s = m.group('annotation1')
+                if s is None:
+                    s = m.group('annotation2')
+                block.append((line_number, s.strip()))
+                continue
+            if not block:
+                continue
+            global_annotations = {}
+            parameter_annotations = {}
+            problems = []
+            ## the annotation closest to the declaration is parsed
+            ## first, so that earlier lines take precedence
+            for annotation_line_number, annotation in reversed(block):
+                self._parse_annotation_line(annotation, annotation_line_number,
+                                            global_annotations, parameter_annotations, problems)
+            index[line_number] = ([annotation_line_number for annotation_line_number, dummy in block],
+                                  global_annotations, parameter_annotations, problems)
+            block = []
+
+        if stat is not None:
+            self._cache[file_name] = (stat.st_mtime, stat.st_size, index)
+        return index
+
+    def load_cache(self, cache_file_name):
+        """
+        Loads the header files indexes saved by save_cache, if the file
+        exists; indexes of header files modified since are ignored.
+        """
+        try:
+            cache_file = open(cache_file_name, "rb")
+        except IOError:
+            return
+        with cache_file:
+            try:
+                cache = pickle.load(cache_file)
+            except Exception:
+                warnings.warn("ignoring invalid annotations cache %r" % cache_file_name)
+                return
+        for file_name, entry in cache.items():
+            self._cache.setdefault(file_name, entry)
+
+    def save_cache(self, cache_file_name):
+        """Saves the indexes of all the header files scanned so far"""
+        with open(cache_file_name, "wb") as cache_file:
+            pickle.dump(self._cache, cache_file, 2)
 
     def get_annotations(self, decl):
         """
@@ -346,51 +498,23 @@ class AnnotationsScanner(object):
             return {}, {}
 
         file_name = decl.location.file_name
-        line_number = decl.location.line
 
         try:
-            lines = self.files[file_name]
+            index = self.files[file_name]
         except KeyError:
-            lines = file(file_name, "rt").readlines()
-            self.files[file_name] = lines
-
-        line_number -= 2
-        global_annotations = {}
-        parameter_annotations = {}
-        while 1:
-            line = lines[line_number]
-            line_number -= 1
-            m = self._comment_rx.match(line)
-            if m is None:
-                break
-            s = m.group('annotation1')
-            if s is None:
-                s = m.group('annotation2')
-            line = s.strip()
-            self._declare_used_annotation(file_name, line_number + 2)
-            for annotation_str in line.split(';'):
-                annotation_str = annotation_str.strip()
-                m = self._global_annotation_rx.match(annotation_str)
-                if m is not None:
-                    global_annotations[m.group(1)] = m.group(2)
-                    continue
+            index = self._index_file(file_name)
+            self.files[file_name] = index
 
-                m = self._param_annotation_rx.match(annotation_str)
-                if m is not None:
-                    param_annotation = {}
-                    parameter_annotations[m.group(1)] = param_annotation
-                    for param in m.group(2).split(','):
-                        m = self._global_annotation_rx.match(param.strip())
-                        if m is not None:
-                            param_annotation[m.group(1)] = m.group(2)
-                        else:
-                            warnings.warn_explicit("could not parse %r as parameter annotation element" %
-                                                   (param.strip()),
-                                                   AnnotationsWarning, file_name, line_number)
-                    continue
-                warnings.warn_explicit("could not parse %r" % (annotation_str),
-                                       AnnotationsWarning, file_name, line_number)
-        return global_annotations, parameter_annotations
+        try:
+            line_numbers, global_annotations, parameter_annotations, problems = index[decl.location.line]
+        except KeyError:
+            return {}, {}
+        self.used_annotations.setdefault(file_name, set()).update(line_numbers)
+        for message, line_number in problems:
+            warnings.warn_explicit(message, AnnotationsWarning, file_name, line_number)
+        ## copies, since the scan hooks may modify the annotations
+        return (dict(global_annotations),
+                dict([(name, dict(annotations)) for name, annotations in parameter_annotations.items()]))
 
     def parse_boolean(self, value):
         if isinstance(value, int):
@@ -403,19 +527,13 @@ class AnnotationsScanner(object):
             raise ValueError("bad boolean value %r" % value)
 
     def warn_unused_annotations(self):
-        for file_name, lines in self.files.items():
-            try:
-                used_annotations = self.used_annotations[file_name]
-            except KeyError:
-                used_annotations = []
-            for line_number, line in enumerate(lines):
-                m = self._comment_rx.match(line)
-                if m is None:
-                    continue
-                #print >> sys.stderr, (line_number+1), used_annotations
-                if (line_number + 1) not in used_annotations:
-                    warnings.warn_explicit("unused annotation",
-                                           AnnotationsWarning, file_name, line_number+1)
+        for file_name, index in self.files.items():
+            used_annotations = self.used_annotations.get(file_name, ())
+            for line_numbers, dummy_global, dummy_param, dummy_problems in index.values():
+                for line_number in line_numbers:
+                    if line_number not in used_annotations:
+                        warnings.warn_explicit("unused annotation",
+                                               AnnotationsWarning, file_name, line_number)
 
 
 
@@ -487,6 +605,20 @@ class ModuleParser(object):
         to scan for all std containers, even the ones that have no
         typedef'ed name.  Enabled by default.
 
+    :attr parallel_jobs: number of processes scan_methods uses to scan
+        the classes members, sharded by pygen section; the result is
+        the same as a serial scan.  The pre-scan hooks of all the
+        members still run in the calling process, in the same order,
+        before the workers start.  The scan is always serial if
+        post-scan hooks are registered, or if the platform lacks
+        fork().  Defaults to 1 (serial).
+
+    :attr annotations_cache: name of a file where the index of the
+        annotations found in the header files is saved at the end of
+        the parse, and loaded from at the beginning of the next one,
+        so that unmodified header files are not scanned again.
+        Defaults to None (no cache).
+
     """
 
     def __init__(self, module_name, module_namespace_name='::'):
@@ -521,6 +653,9 @@ class ModuleParser(object):
         self._containers_to_register = []
         self._containers_registered = {}
         self.enable_anonymous_containers = True
+        self.parallel_jobs = 1
+        self.annotations_cache = None
+        self._member_annotations = None # id(member) -> annotations, see _get_member_annotations
 
     def add_pre_scan_hook(self, hook):
         """
@@ -674,6 +809,9 @@ class ModuleParser(object):
         else:
             assert isinstance(pygen_sink, CodeSink)
 
+        if self.annotations_cache is not None:
+            annotations_scanner.load_cache(self.annotations_cache)
+
         self.header_files = [os.path.abspath(f) for f in header_files]
         self.location_filter = declarations.custom_matcher_t(self.__location_match)
 
@@ -832,6 +970,7 @@ pybindgen.settings.error_handler = ErrorHandler()
             pygen_sink.unindent()
             pygen_sink.writeln()
 
+        classes = []
         for class_wrapper in self.type_registry.ordered_classes:
             if isinstance(class_wrapper.gccxml_definition, class_declaration_t):
                 continue # skip classes not fully defined
@@ -839,17 +978,26 @@ pybindgen.settings.error_handler = ErrorHandler()
                 continue # exceptions cannot have methods (yet)
             #if class_wrapper.import_from_module:
             #    continue # this is a foreign class from another module, we don't scan it
+            classes.append(class_wrapper)
+
+        models = self._scan_classes_methods_models(classes)
+
+        for index, class_wrapper in enumerate(classes):
             register_methods_func = "register_%s_methods"  % (class_wrapper.mangled_full_name,)
 
             pygen_sink =  self._get_pygen_sink_for_definition(class_wrapper.gccxml_definition)
             if pygen_sink:
                 pygen_sink.writeln("def %s(root_module, cls):" % (register_methods_func,))
                 pygen_sink.indent()
-            ## Add attributes from inner anonymous to each outer class (LP#237054)
-            for anon_cls, wrapper in self._anonymous_structs:
-                if wrapper is class_wrapper:
-                    self._scan_class_methods(anon_cls, wrapper, pygen_sink)
-            self._scan_class_methods(class_wrapper.gccxml_definition, class_wrapper, pygen_sink)
+            if models is None:
+                for cls, wrapper in self._get_class_methods_scopes(class_wrapper):
+                    self._scan_class_methods(cls, wrapper, pygen_sink)
+            else:
+                class_models, class_warnings = models[index]
+                for message, category, file_name, line in class_warnings:
+                    warnings.warn_explicit(message, category, file_name, line)
+                for (cls, wrapper), model in zip(self._get_class_methods_scopes(class_wrapper), class_models):
+                    self._realize_class_methods_model(cls, wrapper, model, pygen_sink)
 
             if pygen_sink:
                 pygen_sink.writeln("return")
@@ -857,8 +1005,84 @@ pybindgen.settings.error_handler = ErrorHandler()
                 pygen_sink.writeln()
 
 
+    def _get_class_methods_scopes(self, class_wrapper):
+        """
+        Returns the list of (pygccxml class, class wrapper) whose
+        members are wrapped as members of class_wrapper
+        """
+        scopes = []
+        ## Add attributes from inner anonymous to each outer class (LP#237054)
+        for anon_cls, wrapper in self._anonymous_structs:
+            if wrapper is class_wrapper:
+                scopes.append((anon_cls, wrapper))
+        scopes.append((class_wrapper.gccxml_definition, class_wrapper))
+        return scopes
+
+    def _scan_classes_methods_models(self, classes):
+        """
+        Scans the methods models of the classes in parallel_jobs
+        worker processes.  Returns a list with, for each class, the
+        list of its methods models (one per _get_class_methods_scopes
+        item) and the warnings emitted while scanning it, or None when
+        the classes should be scanned serially.
+        """
+        global _scan_methods_state
+        if self.parallel_jobs <= 1 or len(classes) < 2 or self._post_scan_hooks:
+            return None
+        try:
+            context = multiprocessing.get_context('fork')
+        except (AttributeError, ValueError):
+            return None # no fork() on this platform
+
+        ## one shard per pygen section, split further when there are
+        ## fewer sections than jobs
+        sections = collections.OrderedDict()
+        for index, class_wrapper in enumerate(classes):
+            if self._pygen_classifier is None:
+                section = None
+            else:
+                section = self._pygen_classifier.classify(class_wrapper.gccxml_definition)
+            sections.setdefault(section, []).append(index)
+        shard_splits = max(1, self.parallel_jobs // len(sections))
+        shards = []
+        for indices in sections.values():
+            for split in range(shard_splits):
+                if indices[split::shard_splits]:
+                    shards.append(indices[split::shard_splits])
+
+        ## the pre-scan hooks run here, in the order of a serial
+        ## scan, so that their side effects are not lost in the workers
+        member_annotations = {}
+        for class_wrapper in classes:
+            methods_to_ignore = self._get_methods_to_ignore(class_wrapper)
+            for cls, dummy_wrapper in self._get_class_methods_scopes(class_wrapper):
+                for member in cls.get_members():
+                    if member.name not in methods_to_ignore:
+                        member_annotations[id(member)] = self._get_member_annotations(member)
+
+        _scan_methods_state = (self, classes)
+        self._member_annotations = member_annotations
+        try:
+            pool = context.Pool(min(self.parallel_jobs, len(shards)))
+            try:
+                shards_results = pool.map(_scan_methods_shard, shards, chunksize=1)
+            finally:
+                pool.terminate()
+        finally:
+            _scan_methods_state = None
+            self._member_annotations = None
+
+        models = [None]*len(classes)
+        for results, files, used_annotations in shards_results:
+            annotations_scanner._merge(files, used_annotations)
+            for index, class_models, class_warnings in results:
+                models[index] = (class_models, class_warnings)
+        return models
+
     def parse_finalize(self):
         annotations_scanner.warn_unused_annotations()
+        if self.annotations_cache is not None:
+            annotations_scanner.save_cache(self.annotations_cache)
         pygen_sink = self._get_main_pygen_sink()
         if pygen_sink:
             pygen_sink.writeln("def main():")
@@ -942,6 +1166,108 @@ pybindgen.settings.error_handler = ErrorHandler()
                     return False
         return True
 
+    def _get_class_dependencies(self, cls, nested=False):
+        """
+        Yields (declaration, hard) for the declarations cls needs to
+        be registered after: its base classes (hard dependencies), the
+        classes it implicitly converts to and its template arguments.
+        The dependencies of its public nested classes, which get
+        registered along with it, are included as soft dependencies.
+        """
+        for cls_bases_item in cls.bases:
+            yield cls_bases_item.related_class, not nested
+        for operator in cls.casting_operators(allow_empty=True):
+            yield type_traits.remove_declarated(operator.return_type), False
+        if templates.is_instantiation(cls.decl_string):
+            dummy_cls_name, template_parameters = templates.split(cls.name)
+            for templ_param in template_parameters:
+                yield find_declaration_from_name(self.global_ns, templ_param), False
+        for nested_cls in cls.classes(function=self.location_filter, recursive=False, allow_empty=True):
+            if cls.find_out_member_access_type(nested_cls) != 'public':
+                continue
+            for dependency, dummy_hard in self._get_class_dependencies(nested_cls, nested=True):
+                yield dependency, False
+
+    def _sort_classes_for_registration(self, classes):
+        """
+        Returns the classes of a namespace, or the nested classes of a
+        class, in registration order: every class comes after the
+        classes of the list it depends on (see
+        _get_class_dependencies).  A dependency on a nested class
+        counts as a dependency on the class of the list that encloses
+        it.  Cycles of soft dependencies are broken; classes in a
+        cycle of base classes are dropped with a warning.
+        """
+        classes = sorted(classes, key=lambda cls: cls.decl_string)
+        position = dict([(cls, index) for index, cls in enumerate(classes)])
+
+        def find_class_in_list(decl):
+            while isinstance(decl, class_t):
+                if decl in position:
+                    return decl
+                decl = decl.parent
+            return None
+
+        hard_dependencies = dict([(cls, set()) for cls in classes])
+        dependents = dict([(cls, []) for cls in classes])
+        waiting = dict([(cls, 0) for cls in classes])
+        for cls in classes:
+            dependencies = {}
+            for decl, hard in self._get_class_dependencies(cls):
+                dependency = find_class_in_list(decl)
+                if dependency is None or dependency is cls:
+                    continue
+                dependencies[dependency] = dependencies.get(dependency, False) or hard
+            for dependency, hard in dependencies.items():
+                if hard:
+                    hard_dependencies[cls].add(dependency)
+                dependents[dependency].append(cls)
+            waiting[cls] = len(dependencies)
+
+        ready = collections.deque([cls for cls in classes if not waiting[cls]])
+        done = set()
+        ordered = []
+
+        def class_done(cls):
+            done.add(cls)
+            for dependent in dependents[cls]:
+                waiting[dependent] -= 1
+                if not waiting[dependent] and dependent not in done:
+                    ready.append(dependent)
+
+        while len(done) < len(classes):
+            if not ready:
+                ## only cycles, and classes depending on them, are left
+                remaining = [cls for cls in classes if cls not in done]
+                for cls in remaining:
+                    if not [dep for dep in hard_dependencies[cls] if dep not in done]:
+                        if DEBUG:
+                            print(">>> class %s registered before some of its dependencies (cycle)" % cls,
+                                  file=sys.stderr)
+                        ready.append(cls)
+                        break
+                else:
+                    cycle = [remaining[0]]
+                    while True:
+                        dependency = min([dep for dep in hard_dependencies[cycle[-1]] if dep not in done],
+                                         key=position.get)
+                        if dependency in cycle:
+                            cycle = cycle[cycle.index(dependency):]
+                            break
+                        cycle.append(dependency)
+                    warnings.warn_explicit("Classes %s ignored because their base classes form a cycle."
+                                           % ' -> '.join([cls.partial_decl_string for cls in cycle + cycle[:1]]),
+                                           ModuleParserWarning, cycle[0].location.file_name, cycle[0].location.line)
+                    for cls in cycle:
+                        class_done(cls)
+                    continue
+            cls = ready.popleft()
+            if cls in done:
+                continue
+            ordered.append(cls)
+            class_done(cls)
+        return ordered
+
     def _scan_namespace_types(self, module, module_namespace, outer_class=None, pygen_register_function_name=None):
         root_module = module.get_root()
 
@@ -1061,30 +1387,9 @@ pybindgen.settings.error_handler = ErrorHandler()
                     continue
                 typedefs.append(typedef)
 
-        def cls_cmp(a, b):
-            return cmp(a.decl_string, b.decl_string)
-        unregistered_classes.sort(cls_cmp)
-
-        def postpone_class(cls, reason):
-            ## detect the case of a class being postponed many times; that
-            ## is almost certainly an error and a sign of an infinite
-            ## loop.
-            count = getattr(cls, "_pybindgen_postpone_count", 0)
-            count += 1
-            cls._pybindgen_postpone_count = count
-            if count >= 10:
-                raise AssertionError("The class %s registration is being postponed for "
-                                     "the %ith time (last reason: %r, current reason: %r);"
-                                     " something is wrong, please file a bug report"
-                                     " (https://bugs.launchpad.net/pybindgen/+filebug) with a test case."
-                                     % (cls, count, cls._pybindgen_postpone_reason, reason))
-            cls._pybindgen_postpone_reason = reason
-            if DEBUG:
-                print(">>> class %s is being postponed (%s)" % (str(cls), reason), file=sys.stderr)
-            unregistered_classes.append(cls)
+        unregistered_classes = self._sort_classes_for_registration(unregistered_classes)
 
-        while unregistered_classes:
-            cls = unregistered_classes.pop(0)
+        for cls in unregistered_classes:
             if DEBUG:
                 print(">>> looking at class ", str(cls), file=sys.stderr)
             typedef = None
@@ -1124,15 +1429,12 @@ pybindgen.settings.error_handler = ErrorHandler()
                 try:
                     base_class_wrapper = self._registered_classes[base_cls]
                 except KeyError:
-                    ## base class not yet registered => postpone this class registration
-                    if base_cls not in unregistered_classes:
-                        warnings.warn_explicit("Class %s ignored because it uses a base class (%s) "
-                                               "which is not declared."
-                                               % (cls.partial_decl_string, base_cls.partial_decl_string),
-                                               ModuleParserWarning, cls.location.file_name, cls.location.line)
-                        bases_ok = False
-                        break
-                    postpone_class(cls, "waiting for base class %s to be registered first" % base_cls)
+                    ## base classes are sorted first, so it must have
+                    ## been ignored or not declared at all
+                    warnings.warn_explicit("Class %s ignored because it uses a base class (%s) "
+                                           "which is not declared."
+                                           % (cls.partial_decl_string, base_cls.partial_decl_string),
+                                           ModuleParserWarning, cls.location.file_name, cls.location.line)
                     bases_ok = False
                     break
                 else:
@@ -1142,28 +1444,6 @@ pybindgen.settings.error_handler = ErrorHandler()
             if not bases_ok:
                 continue
 
-            ## If this class implicitly converts to another class, but
-            ## that other class is not yet registered, postpone.
-            for operator in cls.casting_operators(allow_empty=True):
-                target_type = type_traits.remove_declarated(operator.return_type)
-                if not isinstance(target_type, class_t):
-                    continue
-                target_class_name = normalize_class_name(operator.return_type.partial_decl_string, '::')
-                try:
-                    dummy = root_module[target_class_name]
-                except KeyError:
-                    if target_class_name not in [normalize_class_name(t.partial_decl_string, '::') for t in unregistered_classes]:
-                        ok = True # (lp:455689)
-                    else:
-                        ok = False
-                    break
-            else:
-                ok = True
-            if not ok:
-                postpone_class(cls, ("waiting for implicit conversion target class %s to be registered first"
-                                     % (operator.return_type.partial_decl_string,)))
-                continue
-
             is_exception = self._apply_class_annotations(cls, global_annotations, kwargs)
 
             custom_template_class_name = None
@@ -1206,23 +1486,6 @@ pybindgen.settings.error_handler = ErrorHandler()
             if ignore_class:
                 continue
 
-            if 0: # this is disabled due to ns3
-                ## if any template argument is a class that is not yet
-                ## registered, postpone scanning/registering the template
-                ## instantiation class until the template argument gets
-                ## registered.
-                postponed = False
-                for templ in template_parameters_decls:
-                    if isinstance(templ, class_t):
-                        try:
-                            self._registered_classes[templ]
-                        except KeyError:
-                            if templ in unregistered_classes:
-                                postpone_class(cls, "waiting for template argument class %s to be registered first" % templ)
-                                postponed = True
-                if postponed:
-                    continue
-
             if base_class_wrappers:
                 if len(base_class_wrappers) > 1:
                     kwargs["parent"] = base_class_wrappers
@@ -1574,7 +1837,7 @@ pybindgen.settings.error_handler = ErrorHandler()
                 and not isinstance(cpp_type.base, cpptypes.const_t)
                 and str(cpp_type.base) == 'std::ostream')
 
-    def _scan_class_operators(self, cls, class_wrapper, pygen_sink):
+    def _scan_class_operators(self, cls, class_wrapper, model, pygen_sink):
 
         def _handle_operator(op, argument_types):
             #print >> sys.stderr, "<<<<<OP>>>>>  (OP %s in class %s) : %s --> %s" % \
@@ -1586,7 +1849,7 @@ pybindgen.settings.error_handler = ErrorHandler()
                     and self._is_ostream(argument_types[0]) \
                     and type_traits.is_convertible(cls, argument_types[1]):
                 #print >> sys.stderr, "<<<<<OUTPUT STREAM OP>>>>>  %s: %s " % (op.symbol, cls)
-                class_wrapper.add_output_stream_operator()
+                model.append(('output_stream_operator',))
                 pygen_sink.writeln("cls.add_output_stream_operator()")
                 return
 
@@ -1595,7 +1858,7 @@ pybindgen.settings.error_handler = ErrorHandler()
                     and type_traits.is_convertible(cls, argument_types[0]) \
                     and type_traits.is_convertible(cls, argument_types[1]):
                 #print >> sys.stderr, "<<<<<BINARY COMPARISON OP>>>>>  %s: %s " % (op.symbol, cls)
-                class_wrapper.add_binary_comparison_operator(op.symbol)
+                model.append(('binary_comparison_operator', op.symbol))
                 pygen_sink.writeln("cls.add_binary_comparison_operator(%r)" % (op.symbol,))
                 return
 
@@ -1630,16 +1893,9 @@ pybindgen.settings.error_handler = ErrorHandler()
                                                                parameter_annotations.get('right', {}))
 
                 arg_repr = _pygen_param(arg_spec[0], arg_spec[1])
-
-                try:
-                    param = Parameter.new(*arg_spec[0], **arg_spec[1])
-                except (TypeLookupError, TypeConfigurationError) as ex:
-                    warnings.warn_explicit("Parameter '%s' error (used in %s): %r"
-                                           % (argument_types[1].partial_decl_string, op, ex),
-                                           WrapperWarning, op.location.file_name, op.location.line)
-                    param = None
-
-                #print >> sys.stderr, "<<<<<potential NUMERIC OP>>>>> ", param, ('?' if param is None else param.ctype)
+                ## what the warning about a bad parameter needs
+                arg_context = (argument_types[1].partial_decl_string, str(op),
+                               op.location.file_name, op.location.line)
 
                 if op.symbol in ['+', '-', '/', '*']:
                     #print >> sys.stderr, "<<<<<potential NUMERIC OP>>>>>  %s: %s : %s --> %s" \
@@ -1647,8 +1903,8 @@ pybindgen.settings.error_handler = ErrorHandler()
 
                     pygen_sink.writeln("cls.add_binary_numeric_operator(%r, root_module[%r], root_module[%r], %s)"
                                        % (op.symbol, ret.full_name, arg0.full_name, arg_repr))
-                    if param is not None:
-                        class_wrapper.add_binary_numeric_operator(op.symbol, ret, arg0, param)
+                    model.append(('binary_numeric_operator', op.symbol, ret.full_name, arg0.full_name,
+                                  arg_spec, arg_context))
 
                 # -- inplace numeric operators --
                 if op.symbol in ['+=', '-=', '/=', '*=']:
@@ -1656,13 +1912,12 @@ pybindgen.settings.error_handler = ErrorHandler()
                     #    % (op.symbol, cls, [str(x) for x in argument_types], return_type)
 
                     pygen_sink.writeln("cls.add_inplace_numeric_operator(%r, %s)" % (op.symbol, arg_repr))
-                    if param is not None:
-                        class_wrapper.add_inplace_numeric_operator(op.symbol, param)
+                    model.append(('inplace_numeric_operator', op.symbol, arg_spec, arg_context))
 
             elif len(argument_types) == 1: # unary operator
                 if op.symbol in ['-']:
                     pygen_sink.writeln("cls.add_unary_numeric_operator(%r)" % (op.symbol,))
-                    class_wrapper.add_unary_numeric_operator(op.symbol)
+                    model.append(('unary_numeric_operator', op.symbol))
 
             else:
                 warnings.warn_explicit("NUMERIC OP: wrong number of arguments, got %i, expected 1 or 2"
@@ -1688,13 +1943,47 @@ pybindgen.settings.error_handler = ErrorHandler()
 
 
     def _scan_class_methods(self, cls, class_wrapper, pygen_sink):
+        model = self._scan_class_methods_model(cls, class_wrapper)
+        self._realize_class_methods_model(cls, class_wrapper, model, pygen_sink)
+
+    def _get_methods_to_ignore(self, class_wrapper):
+        """names of the members the memory policy of class_wrapper handles itself"""
+        if isinstance(class_wrapper.memory_policy, ReferenceCountingMethodsPolicy):
+            return [class_wrapper.memory_policy.incref_method,
+                    class_wrapper.memory_policy.decref_method,
+                    class_wrapper.memory_policy.peekref_method]
+        return []
+
+    def _get_member_annotations(self, member):
+        """
+        Returns the (global_annotations, parameter_annotations) of a
+        class member, as modified by the pre-scan hooks, which already
+        ran if the members are being scanned by worker processes (see
+        _scan_classes_methods_models).
+        """
+        if self._member_annotations is not None:
+            return self._member_annotations[id(member)]
+        global_annotations, parameter_annotations = annotations_scanner.get_annotations(member)
+        for hook in self._pre_scan_hooks:
+            hook(self, member, global_annotations, parameter_annotations)
+        return global_annotations, parameter_annotations
+
+    def _scan_class_methods_model(self, cls, class_wrapper):
+        """
+        Scans the members of a class, without modifying class_wrapper,
+        and returns its methods model: the list of the pygen lines to
+        write and of the wrappers to add, in order, as tuples of plain
+        data that can be sent across processes.  Members are referred
+        to by their index in cls.get_members(), and wrapper objects by
+        their full name.  See _realize_class_methods_model.
+        """
         have_trivial_constructor = False
         have_copy_constructor = False
 
-        if pygen_sink is None:
-            pygen_sink = NullCodeSink()
+        model = []
+        pygen_sink = _MethodsModelSink(model)
 
-        self._scan_class_operators(cls, class_wrapper, pygen_sink)
+        self._scan_class_operators(cls, class_wrapper, model, pygen_sink)
 
         for member in cls.get_members():
             if isinstance(member, calldef.member_function_t):
@@ -1714,20 +2003,12 @@ pybindgen.settings.error_handler = ErrorHandler()
                             self.type_registry.root_module.get(str(traits.target), None) is class_wrapper:
                         have_copy_constructor = True
 
-        methods_to_ignore = []
-        if isinstance(class_wrapper.memory_policy, ReferenceCountingMethodsPolicy):
-            methods_to_ignore.extend([class_wrapper.memory_policy.incref_method,
-                                      class_wrapper.memory_policy.decref_method,
-                                      class_wrapper.memory_policy.peekref_method,
-                                      ])
-
-        for member in cls.get_members():
+        methods_to_ignore = self._get_methods_to_ignore(class_wrapper)
+        for member_index, member in enumerate(cls.get_members()):
             if member.name in methods_to_ignore:
                 continue
 
-            global_annotations, parameter_annotations = annotations_scanner.get_annotations(member)
-            for hook in self._pre_scan_hooks:
-                hook(self, member, global_annotations, parameter_annotations)
+            global_annotations, parameter_annotations = self._get_member_annotations(member)
 
             if 'ignore' in global_annotations:
                 continue
@@ -1777,7 +2058,7 @@ pybindgen.settings.error_handler = ErrorHandler()
 
 
                 if pure_virtual and not class_wrapper.allow_subclassing:
-                    class_wrapper.set_cannot_be_constructed("pure virtual method and subclassing disabled")
+                    model.append(('cannot_be_constructed', "pure virtual method and subclassing disabled"))
                     #self.pygen_sink.writeln('cls.set_cannot_be_constructed("pure virtual method not wrapped")')
 
                 custom_template_method_name = None
@@ -1835,7 +2116,159 @@ pybindgen.settings.error_handler = ErrorHandler()
                          '\n' + 15*' ' + _pygen_retval(return_type_spec[0], return_type_spec[1]),
                          '\n' + 15*' ' + arglist_repr] + kwargs_repr))
 
-                ## --- realize the return type and parameters
+                model.append(('method', member_index, return_type_spec, argument_specs,
+                              _model_kwargs(kwargs)))
+
+
+            ## ------------ constructor --------------------
+            elif isinstance(member, calldef.constructor_t):
+                if member.access_type not in ['public', 'protected']:
+                    continue
+
+                if not member.arguments:
+                    have_trivial_constructor = True
+
+                argument_specs = []
+                for arg in member.arguments:
+                    argument_specs.append(self.type_registry.lookup_parameter(arg.type, arg.name,
+                                                                              default_value=arg.default_value))
+
+                arglist_repr = ("[" + ', '.join([_pygen_param(args_, kwargs_) for (args_, kwargs_) in argument_specs]) +  "]")
+                if 'pygen_comment' in global_annotations:
+                    pygen_sink.writeln('## ' + global_annotations['pygen_comment'])
+
+                kwargs = {}
+
+                if member.attributes:
+                    if 'deprecated' in member.attributes:
+                        kwargs['deprecated'] = True
+
+                if member.access_type != 'public':
+                    kwargs['visibility'] = member.access_type
+
+                throw = self._get_calldef_exceptions(member)
+                if throw:
+                    kwargs['throw'] = throw
+
+                kwargs_repr = _pygen_kwargs(kwargs)
+                if kwargs_repr:
+                    kwargs_repr[0] = '\n' + 20*' '+ kwargs_repr[0]
+                pygen_sink.writeln("cls.add_constructor(%s)" %
+                                   ", ".join([arglist_repr] + kwargs_repr))
+
+                model.append(('constructor', member_index, argument_specs, _model_kwargs(kwargs)))
+
+            ## ------------ attribute --------------------
+            elif isinstance(member, variable_t):
+                if not member.name:
+                    continue # anonymous structure
+                if member.access_type == 'protected':
+                    warnings.warn_explicit("%s: protected member variables not yet implemented "
+                                           "by PyBindGen."
+                                           % member,
+                                           NotSupportedWarning, member.location.file_name, member.location.line)
+                    continue
+                if member.access_type == 'private':
+                    continue
+
+                real_type = type_traits.remove_declarated(member.type)
+                if hasattr(real_type, 'name') and not real_type.name:
+                    warnings.warn_explicit("Member variable %s of class %s will not be wrapped, "
+                                           "because wrapping member variables of anonymous types "
+                                           "is not yet supported by pybindgen"
+                                           % (member.name, cls.partial_decl_string),
+                                           NotSupportedWarning, member.location.file_name, member.location.line)
+                    continue
+
+                return_type_spec = self.type_registry.lookup_return(member.type, global_annotations)
+
+                ## pygen...
+                if 'pygen_comment' in global_annotations:
+                    pygen_sink.writeln('## ' + global_annotations['pygen_comment'])
+                if member.type_qualifiers.has_static:
+                    pygen_sink.writeln("cls.add_static_attribute(%r, %s, is_const=%r)" %
+                                       (member.name, _pygen_retval(*return_type_spec),
+                                        type_traits.is_const(member.type)))
+                else:
+                    pygen_sink.writeln("cls.add_instance_attribute(%r, %s, is_const=%r)" %
+                                       (member.name, _pygen_retval(*return_type_spec),
+                                        type_traits.is_const(member.type)))
+
+                model.append(('attribute', member_index, return_type_spec))
+            elif isinstance(member, calldef.destructor_t):
+                pass
+
+        ## gccxml 0.9, unlike 0.7, does not explicitly report inheritted trivial constructors
+        ## thankfully pygccxml comes to the rescue!
+        if not have_trivial_constructor:
+            if type_traits.has_trivial_constructor(cls):
+                model.append(('trivial_constructor',))
+                pygen_sink.writeln("cls.add_constructor([])")
+
+        if not have_copy_constructor:
+            try: # pygccxml > 0.9
+                has_copy_constructor = type_traits.has_copy_constructor(cls)
+            except AttributeError: # pygccxml <= 0.9
+                has_copy_constructor = type_traits.has_trivial_copy(cls)
+            if has_copy_constructor:
+                ## unless a public copy constructor gets wrapped
+                model.append(('copy_constructor',))
+
+        return model
+
+    def _realize_class_methods_model(self, cls, class_wrapper, model, pygen_sink):
+        """
+        Adds the wrappers of a methods model (see
+        _scan_class_methods_model) to class_wrapper, calling the post
+        scan hooks, and writes its pygen lines to pygen_sink.
+        """
+        if pygen_sink is None:
+            pygen_sink = NullCodeSink()
+        root_module = self.type_registry.root_module
+        members = cls.get_members()
+        have_copy_constructor = False
+
+        for entry in model:
+            kind = entry[0]
+            if kind == 'pygen':
+                pygen_sink.writeln(entry[1])
+
+            elif kind == 'cannot_be_constructed':
+                class_wrapper.set_cannot_be_constructed(entry[1])
+
+            ## ------------ operators --------------------
+            elif kind == 'output_stream_operator':
+                class_wrapper.add_output_stream_operator()
+
+            elif kind == 'binary_comparison_operator':
+                class_wrapper.add_binary_comparison_operator(entry[1])
+
+            elif kind == 'unary_numeric_operator':
+                class_wrapper.add_unary_numeric_operator(entry[1])
+
+            elif kind in ['binary_numeric_operator', 'inplace_numeric_operator']:
+                arg_spec, (arg_decl_string, op_name, file_name, line) = entry[-2:]
+                try:
+                    param = Parameter.new(*arg_spec[0], **arg_spec[1])
+                except (TypeLookupError, TypeConfigurationError) as ex:
+                    warnings.warn_explicit("Parameter '%s' error (used in %s): %r"
+                                           % (arg_decl_string, op_name, ex),
+                                           WrapperWarning, file_name, line)
+                    continue
+                if kind == 'binary_numeric_operator':
+                    dummy_kind, symbol, ret_name, arg0_name = entry[:4]
+                    class_wrapper.add_binary_numeric_operator(symbol, root_module[ret_name],
+                                                              root_module[arg0_name], param)
+                else:
+                    class_wrapper.add_inplace_numeric_operator(entry[1], param)
+
+            ## ------------ method --------------------
+            elif kind == 'method':
+                dummy_kind, member_index, return_type_spec, argument_specs, kwargs = entry
+                member = members[member_index]
+                pure_virtual = (member.virtuality == calldef.VIRTUALITY_TYPES.PURE_VIRTUAL)
+                kwargs = self._realize_model_kwargs(kwargs)
+
                 try:
                     return_type = ReturnValue.new(*return_type_spec[0], **return_type_spec[1])
                 except (TypeLookupError, TypeConfigurationError) as ex:
@@ -1890,42 +2323,11 @@ pybindgen.settings.error_handler = ErrorHandler()
                     for hook in self._post_scan_hooks:
                         hook(self, member, method_wrapper)
 
-
             ## ------------ constructor --------------------
-            elif isinstance(member, calldef.constructor_t):
-                if member.access_type not in ['public', 'protected']:
-                    continue
-
-                if not member.arguments:
-                    have_trivial_constructor = True
-
-                argument_specs = []
-                for arg in member.arguments:
-                    argument_specs.append(self.type_registry.lookup_parameter(arg.type, arg.name,
-                                                                              default_value=arg.default_value))
-
-                arglist_repr = ("[" + ', '.join([_pygen_param(args_, kwargs_) for (args_, kwargs_) in argument_specs]) +  "]")
-                if 'pygen_comment' in global_annotations:
-                    pygen_sink.writeln('## ' + global_annotations['pygen_comment'])
-
-                kwargs = {}
-
-                if member.attributes:
-                    if 'deprecated' in member.attributes:
-                        kwargs['deprecated'] = True
-
-                if member.access_type != 'public':
-                    kwargs['visibility'] = member.access_type
-
-                throw = self._get_calldef_exceptions(member)
-                if throw:
-                    kwargs['throw'] = throw
-
-                kwargs_repr = _pygen_kwargs(kwargs)
-                if kwargs_repr:
-                    kwargs_repr[0] = '\n' + 20*' '+ kwargs_repr[0]
-                pygen_sink.writeln("cls.add_constructor(%s)" %
-                                   ", ".join([arglist_repr] + kwargs_repr))
+            elif kind == 'constructor':
+                dummy_kind, member_index, argument_specs, kwargs = entry
+                member = members[member_index]
+                kwargs = self._realize_model_kwargs(kwargs)
 
                 arguments = []
                 for a, kw in argument_specs:
@@ -1933,7 +2335,7 @@ pybindgen.settings.error_handler = ErrorHandler()
                         arguments.append(Parameter.new(*a, **kw))
                     except (TypeLookupError, TypeConfigurationError) as ex:
                         warnings.warn_explicit("Parameter '%s %s' error (used in %s): %r"
-                                               % (arg.type.partial_decl_string, arg.name, member, ex),
+                                               % (a[0], a[1], member, ex),
                                                WrapperWarning, member.location.file_name, member.location.line)
                         ok = False
                         break
@@ -1951,42 +2353,10 @@ pybindgen.settings.error_handler = ErrorHandler()
                     have_copy_constructor = True
 
             ## ------------ attribute --------------------
-            elif isinstance(member, variable_t):
-                if not member.name:
-                    continue # anonymous structure
-                if member.access_type == 'protected':
-                    warnings.warn_explicit("%s: protected member variables not yet implemented "
-                                           "by PyBindGen."
-                                           % member,
-                                           NotSupportedWarning, member.location.file_name, member.location.line)
-                    continue
-                if member.access_type == 'private':
-                    continue
+            elif kind == 'attribute':
+                dummy_kind, member_index, return_type_spec = entry
+                member = members[member_index]
 
-                real_type = type_traits.remove_declarated(member.type)
-                if hasattr(real_type, 'name') and not real_type.name:
-                    warnings.warn_explicit("Member variable %s of class %s will not be wrapped, "
-                                           "because wrapping member variables of anonymous types "
-                                           "is not yet supported by pybindgen"
-                                           % (member.name, cls.partial_decl_string),
-                                           NotSupportedWarning, member.location.file_name, member.location.line)
-                    continue
-
-                return_type_spec = self.type_registry.lookup_return(member.type, global_annotations)
-
-                ## pygen...
-                if 'pygen_comment' in global_annotations:
-                    pygen_sink.writeln('## ' + global_annotations['pygen_comment'])
-                if member.type_qualifiers.has_static:
-                    pygen_sink.writeln("cls.add_static_attribute(%r, %s, is_const=%r)" %
-                                       (member.name, _pygen_retval(*return_type_spec),
-                                        type_traits.is_const(member.type)))
-                else:
-                    pygen_sink.writeln("cls.add_instance_attribute(%r, %s, is_const=%r)" %
-                                       (member.name, _pygen_retval(*return_type_spec),
-                                        type_traits.is_const(member.type)))
-
-                ## convert the return value
                 try:
                     return_type = ReturnValue.new(*return_type_spec[0], **return_type_spec[1])
                 except (TypeLookupError, TypeConfigurationError) as ex:
@@ -2002,24 +2372,23 @@ pybindgen.settings.error_handler = ErrorHandler()
                     class_wrapper.add_instance_attribute(member.name, return_type,
                                                          is_const=type_traits.is_const(member.type))
                 ## TODO: invoke post_scan_hooks
-            elif isinstance(member, calldef.destructor_t):
-                pass
 
-        ## gccxml 0.9, unlike 0.7, does not explicitly report inheritted trivial constructors
-        ## thankfully pygccxml comes to the rescue!
-        if not have_trivial_constructor:
-            if type_traits.has_trivial_constructor(cls):
+            elif kind == 'trivial_constructor':
                 class_wrapper.add_constructor([])
-                pygen_sink.writeln("cls.add_constructor([])")
 
-        if not have_copy_constructor:
-            try: # pygccxml > 0.9
-                has_copy_constructor = type_traits.has_copy_constructor(cls)
-            except AttributeError: # pygccxml <= 0.9
-                has_copy_constructor = type_traits.has_trivial_copy(cls)
-            if has_copy_constructor:
-                class_wrapper.add_copy_constructor()
-                pygen_sink.writeln("cls.add_copy_constructor()")
+            elif kind == 'copy_constructor':
+                if not have_copy_constructor:
+                    class_wrapper.add_copy_constructor()
+                    pygen_sink.writeln("cls.add_copy_constructor()")
+
+            else:
+                raise AssertionError("unknown methods model entry %r" % (entry,))
+
+    def _realize_model_kwargs(self, kwargs):
+        if 'throw' in kwargs:
+            kwargs = dict(kwargs)
+            kwargs['throw'] = [self.type_registry.root_module[name] for name in kwargs['throw']]
+        return kwargs
 
 
     def _get_calldef_exceptions(self, calldef):
@@ -48,14 +48,18 @@ to create sub-modules for wrapping nested namespaces.  For instance::
 from pybindgen.function import Function, OverloadedFunction, CustomFunctionWrapper
 from pybindgen.typehandlers.base import CodeBlock, DeclarationsScope, ReturnValue, TypeHandler
 from pybindgen.typehandlers.codesink import MemoryCodeSink, CodeSink, FileCodeSink, NullCodeSink
-from pybindgen.cppclass import CppClass
+from pybindgen.cppclass import CppClass, cache_wrapper_accounting
 from pybindgen.cppexception import CppException
 from pybindgen.enum import Enum
 from pybindgen.container import Container
 from pybindgen.converter_functions import PythonToCConverter, CToPythonConverter
+from pybindgen.capi import CApiExport
+from pybindgen import settings
 from pybindgen import utils
 import warnings
 import traceback
+import heapq
+import os.path
 
 
 class MultiSectionFactory(object):
@@ -106,6 +110,255 @@ class MultiSectionFactory(object):
         """
         raise NotImplementedError
 
+    def get_precompiled_header_code_sink(self):
+        """
+        Create and/or return a code sink for a header meant to be
+        precompiled, or return None, the default, to not generate one.
+
+        The precompiled header receives the preamble and the #include
+        directives of the module (see L{ModuleBase.add_include}),
+        which seldom change.  The main file and the section files
+        include it before the common header, which keeps only the
+        declarations of the wrapped types and of the type converters.
+        """
+        return None
+
+    def get_precompiled_header_include(self):
+        """
+        Return the argument for an #include directive to include the
+        precompiled header, see L{get_precompiled_header_code_sink}.
+        """
+        raise NotImplementedError
+
+    def assign_sections(self, module):
+        """
+        Called by L{Module.generate} before any code is generated; may
+        be reimplemented to decide which section receives the code of
+        each wrapper (see L{get_wrapper_section}).  Does nothing by
+        default.
+
+        :param module: the root L{Module}
+        """
+        pass
+
+    def get_wrapper_section(self, wrapper):
+        """
+        Return the name of the section that receives the code of a
+        wrapper (function, class, container, exception or enum), or
+        None for the main file.  By default, it is the section that was
+        current when the wrapper was added to the module, see
+        L{ModuleBase.begin_section}.
+        """
+        return getattr(wrapper, "section", None)
+
+
+class BalancedMultiSectionFactory(MultiSectionFactory):
+    """
+    A L{MultiSectionFactory} that writes files, and splits the code of
+    the wrappers that were not explicitly put in a section (see
+    L{ModuleBase.begin_section}) into a given number of sections of
+    about the same size, so that they take about the same time to
+    compile in parallel.  The wrappers of explicit sections stay in
+    their section.
+
+    The size of the code of each wrapper is estimated by
+    L{estimate_wrapper_size}, and the wrappers are then assigned, from
+    the largest to the smallest, to the section with the least code.
+
+    For a main file name foomodule.cc, the generated files are
+    foomodule.h (the common header), foomodule_part0.cc to
+    foomodule_part<N-1>.cc, and <section name>.cc for each explicit
+    section, all in the directory of the main file.  Sections that
+    receive no code still get a file, so the list of files to compile
+    does not depend on the API.
+    """
+
+    def __init__(self, main_file_name, num_sections, header_file_name=None,
+                 precompiled_header=False):
+        """
+        :param main_file_name: name of the main file
+        :param num_sections: number of sections to split the code into
+        :param header_file_name: name of the common header file; by
+            default, the name of the main file with a .h extension
+        :param precompiled_header: if true, the preamble and the
+            includes of the module go to a separate header, meant to
+            be precompiled, named after the common header with a _pch
+            suffix (foomodule_pch.h).  That file is left untouched
+            when its contents do not change, so that the precompiled
+            header is not rebuilt needlessly.
+        """
+        if num_sections < 1:
+            raise ValueError("num_sections must be at least 1")
+        self.main_file_name = main_file_name
+        self.num_sections = num_sections
+        self.directory = os.path.dirname(main_file_name)
+        base_name, self.extension = os.path.splitext(os.path.basename(main_file_name))
+        if header_file_name is None:
+            header_file_name = os.path.join(self.directory, base_name + '.h')
+        self.header_file_name = header_file_name
+        if precompiled_header:
+            header_base_name, header_extension = os.path.splitext(header_file_name)
+            self.precompiled_header_file_name = header_base_name + '_pch' + header_extension
+        else:
+            self.precompiled_header_file_name = None
+        self.section_names = ['%s_part%i' % (base_name, index) for index in range(num_sections)]
+        self.explicit_section_names = []
+        self.section_sizes = {} # section name -> estimated number of lines
+        self._wrapper_sections = {} # id(wrapper) -> section name
+        self._sinks = {}
+        self._precompiled_header_sink = None
+
+    def _get_sink(self, file_name):
+        try:
+            return self._sinks[file_name]
+        except KeyError:
+            sink = FileCodeSink(open(file_name, "wt"))
+            self._sinks[file_name] = sink
+            return sink
+
+    def get_section_file_name(self, section_name):
+        "Return the name of the file of a section"
+        return os.path.join(self.directory, section_name + self.extension)
+
+    def get_section_code_sink(self, section_name):
+        if section_name == '__main__':
+            return self.get_main_code_sink()
+        return self._get_sink(self.get_section_file_name(section_name))
+
+    def get_main_code_sink(self):
+        return self._get_sink(self.main_file_name)
+
+    def get_common_header_code_sink(self):
+        return self._get_sink(self.header_file_name)
+
+    def get_common_header_include(self):
+        return '"%s"' % os.path.basename(self.header_file_name)
+
+    def get_precompiled_header_code_sink(self):
+        if self.precompiled_header_file_name is None:
+            return None
+        if self._precompiled_header_sink is None:
+            self._precompiled_header_sink = MemoryCodeSink()
+        return self._precompiled_header_sink
+
+    def get_precompiled_header_include(self):
+        return '"%s"' % os.path.basename(self.precompiled_header_file_name)
+
+    def get_build_hints(self):
+        """
+        Return a dictionary describing the generated files, for build
+        scripts: 'sources', the main file and the section files,
+        'headers', and 'precompiled_header', the name of the header to
+        precompile or None.  The explicit sections are only known once
+        the module is generated; the other files do not depend on the
+        API, so the hints can also be used to declare the outputs of
+        the generator before it runs.
+        """
+        sources = [self.main_file_name]
+        sources.extend([self.get_section_file_name(section_name)
+                        for section_name in self.section_names + self.explicit_section_names])
+        headers = [self.header_file_name]
+        if self.precompiled_header_file_name is not None:
+            headers.append(self.precompiled_header_file_name)
+        return dict(sources=sources, headers=headers,
+                    precompiled_header=self.precompiled_header_file_name)
+
+    def close(self):
+        """Close all the files"""
+        for sink in self._sinks.values():
+            sink.file.close()
+        self._sinks = {}
+        if self._precompiled_header_sink is not None:
+            contents = self._precompiled_header_sink.flush()
+            self._precompiled_header_sink = None
+            try:
+                with open(self.precompiled_header_file_name, "rt") as old_file:
+                    unchanged = (old_file.read() == contents)
+            except IOError:
+                unchanged = False
+            if not unchanged:
+                with open(self.precompiled_header_file_name, "wt") as new_file:
+                    new_file.write(contents)
+
+    def estimate_wrapper_size(self, wrapper):
+        """
+        Return an estimate of the number of lines of code generated for
+        a wrapper.  May be reimplemented to better fit a given API.
+        """
+        def overload_size(overload):
+            wrappers = overload.wrappers
+            size = sum([20 + 5*len(getattr(method, 'parameters', ())) for method in wrappers])
+            if len(wrappers) > 1:
+                size += 20 + 5*len(wrappers)
+            ## virtual methods also have a proxy in the helper class,
+            ## and a wrapper to call the parent implementation
+            size += sum([30 for method in wrappers if getattr(method, 'is_virtual', False)])
+            return size
+
+        if isinstance(wrapper, CppClass):
+            size = 150
+            for overload in wrapper.methods.values():
+                size += overload_size(overload)
+            size += sum([20 + 5*len(constructor.parameters) for constructor in wrapper.constructors])
+            size += 25*(len(wrapper.instance_attributes.attributes) + len(wrapper.static_attributes.attributes))
+            if wrapper.container_traits is not None:
+                size += 100
+            return size
+        elif isinstance(wrapper, OverloadedFunction):
+            return overload_size(wrapper)
+        elif isinstance(wrapper, Container):
+            return 250
+        elif isinstance(wrapper, Enum):
+            return 10 + 2*len(wrapper.values)
+        else:
+            return 40
+
+    def assign_sections(self, module):
+        wrappers = []
+        def collect(module):
+            wrappers.extend(module.functions.values())
+            wrappers.extend([class_ for class_ in module.classes if not class_.import_from_module])
+            wrappers.extend(module.containers)
+            wrappers.extend(module.exceptions)
+            wrappers.extend([enum for enum in module.enums if not enum.import_from_module])
+            for submodule in module.submodules:
+                collect(submodule)
+        collect(module)
+
+        self.section_sizes = dict([(section_name, 0) for section_name in self.section_names])
+        self.explicit_section_names = []
+        self._wrapper_sections = {}
+        unassigned = []
+        for wrapper in wrappers:
+            size = self.estimate_wrapper_size(wrapper)
+            section = getattr(wrapper, "section", None)
+            if section is None or section == '__main__':
+                unassigned.append((size, len(unassigned), wrapper))
+            else:
+                if section not in self.section_sizes:
+                    self.explicit_section_names.append(section)
+                self.section_sizes[section] = self.section_sizes.get(section, 0) + size
+
+        ## largest wrappers first, each one to the smallest section
+        unassigned.sort(key=lambda item: (-item[0], item[1]))
+        heap = [(0, index) for index in range(self.num_sections)]
+        for size, dummy, wrapper in unassigned:
+            section_size, index = heapq.heappop(heap)
+            section_name = self.section_names[index]
+            self._wrapper_sections[id(wrapper)] = section_name
+            self.section_sizes[section_name] += size
+            heapq.heappush(heap, (section_size + size, index))
+
+        ## create the files of all the sections, even empty ones
+        for section_name in self.section_names:
+            self.get_section_code_sink(section_name)
+
+    def get_wrapper_section(self, wrapper):
+        try:
+            return self._wrapper_sections[id(wrapper)]
+        except KeyError:
+            return getattr(wrapper, "section", None)
+
 
 class _SinkManager(object):
     """
@@ -120,6 +373,12 @@ class _SinkManager(object):
         raise NotImplementedError
     def get_includes_code_sink(self):
         raise NotImplementedError
+    def get_precompiled_includes_code_sink(self):
+        """
+        :returns: the code sink for the #include directives of the
+        module; by default, the same as get_includes_code_sink()
+        """
+        return self.get_includes_code_sink()
     def get_main_code_sink(self):
         raise NotImplementedError
     def close(self):
@@ -132,25 +391,38 @@ class _MultiSectionSinkManager(_SinkManager):
     def __init__(self, multi_section_factory):
         super(_MultiSectionSinkManager, self).__init__()
         self.multi_section_factory = multi_section_factory
-        utils.write_preamble(self.multi_section_factory.get_common_header_code_sink())
-        self.multi_section_factory.get_main_code_sink().writeln(
-            "#include %s" % self.multi_section_factory.get_common_header_include())
+        self.precompiled_header_sink = multi_section_factory.get_precompiled_header_code_sink()
+        if self.precompiled_header_sink is None:
+            utils.write_preamble(self.multi_section_factory.get_common_header_code_sink())
+        else:
+            utils.write_preamble(self.precompiled_header_sink)
+        self._write_includes(self.multi_section_factory.get_main_code_sink())
         self._already_initialized_sections = {}
         self._already_initialized_sections['__main__'] = True
 
     def get_code_sink_for_wrapper(self, wrapper):
         header_sink = self.multi_section_factory.get_common_header_code_sink()
-        section = getattr(wrapper, "section", None)
+        section = self.multi_section_factory.get_wrapper_section(wrapper)
         if section is None:
             return self.multi_section_factory.get_main_code_sink(), header_sink
         else:
             section_sink = self.multi_section_factory.get_section_code_sink(section)
             if section not in self._already_initialized_sections:
                 self._already_initialized_sections[section] = True
-                section_sink.writeln("#include %s" % self.multi_section_factory.get_common_header_include())
+                self._write_includes(section_sink)
             return section_sink, header_sink
+    def _write_includes(self, sink):
+        ## compilers only use a precompiled header included directly
+        ## by the source file, before anything else
+        if self.precompiled_header_sink is not None:
+            sink.writeln("#include %s" % self.multi_section_factory.get_precompiled_header_include())
+        sink.writeln("#include %s" % self.multi_section_factory.get_common_header_include())
     def get_includes_code_sink(self):
         return self.multi_section_factory.get_common_header_code_sink()
+    def get_precompiled_includes_code_sink(self):
+        if self.precompiled_header_sink is None:
+            return self.get_includes_code_sink()
+        return self.precompiled_header_sink
     def get_main_code_sink(self):
         return self.multi_section_factory.get_main_code_sink()
     def close(self):
@@ -179,6 +451,90 @@ class _MonolithicSinkManager(_SinkManager):
         self.code_sink.flush_to(self.final_code_sink)
 
 
+class _LazyRegistration(object):
+    """
+    Internal helper holding the deferred registration code of one
+    wrapped type (or enum, or typedef alias) when the root module is
+    generated with lazy initialization enabled.
+    """
+    def __init__(self, module, wrapper, function_name, names, dependencies, pytypes):
+        """
+        :param module: the L{ModuleBase} whose namespace receives the names
+        :param wrapper: the wrapper object (class, container, enum) or None
+        :param function_name: name of the generated registration function
+        :param names: python attribute names that trigger the registration
+        :param dependencies: wrappers that must be registered first
+        :param pytypes: type structure names readied by this registration
+        """
+        self.module = module
+        self.wrapper = wrapper
+        self.function_name = function_name
+        self.names = names
+        self.dependencies = dependencies
+        self.pytypes = pytypes
+        self.children = []
+        self.declarations = DeclarationsScope()
+        self.block = CodeBlock('return -1;', self.declarations)
+        self.code_sink = None
+
+    def generate(self, registrations):
+        """
+        Generates the registration function into L{code_sink}.
+
+        :param registrations: dict mapping id(wrapper) to the
+           L{_LazyRegistration} of every lazily registered wrapper
+        """
+        code_sink = self.code_sink
+        ## the registration proper; the public function below only
+        ## runs it once, and again after a failure
+        code_sink.writeln("static int\n%s__register(void)" % self.function_name)
+        code_sink.writeln("{")
+        code_sink.indent()
+        code_sink.writeln("PyObject * PYBINDGEN_UNUSED(m) = _wrap_%s__module;" % self.module.prefix)
+        self.declarations.get_code_sink().flush_to(code_sink)
+        code_sink.writeln()
+        for dependency in self.dependencies:
+            try:
+                registration = registrations[id(dependency)]
+            except KeyError:
+                continue
+            code_sink.writeln("if (%s() < 0) {" % registration.function_name)
+            code_sink.writeln("    return -1;")
+            code_sink.writeln("}")
+        self.block.write_cleanup()
+        self.block.sink.flush_to(code_sink)
+        for child in self.children:
+            code_sink.writeln("if (%s() < 0) {" % child.function_name)
+            code_sink.writeln("    return -1;")
+            code_sink.writeln("}")
+        code_sink.writeln("return 0;")
+        code_sink.unindent()
+        code_sink.writeln("}")
+        code_sink.writeln()
+
+        ## 'registering' breaks dependency cycles (an outer class
+        ## registers its nested classes, which depend on it)
+        code_sink.writeln("int\n%s(void)" % self.function_name)
+        code_sink.writeln("{")
+        code_sink.indent()
+        code_sink.writeln("static bool registered = false;")
+        code_sink.writeln("static bool registering = false;")
+        code_sink.writeln("int status;")
+        code_sink.writeln()
+        code_sink.writeln("if (registered || registering) {")
+        code_sink.writeln("    return 0;")
+        code_sink.writeln("}")
+        code_sink.writeln("registering = true;")
+        code_sink.writeln("status = %s__register();" % self.function_name)
+        code_sink.writeln("registering = false;")
+        code_sink.writeln("if (status == 0) {")
+        code_sink.writeln("    registered = true;")
+        code_sink.writeln("}")
+        code_sink.writeln("return status;")
+        code_sink.unindent()
+        code_sink.writeln("}")
+
+
 class ModuleBase(dict):
     """
     ModuleBase objects can be indexed dictionary style to access contained types.  Example::
@@ -255,6 +611,10 @@ class ModuleBase(dict):
         self.before_init = CodeBlock(error_return, self.declarations)
         self.after_init = CodeBlock(error_return, self.declarations,
                                     predecessor=self.before_init)
+        self._init_block = self.after_init
+        self._pending_type_registrations = [] # (pytypestruct, name, base, outer)
+        self._pending_constant_registrations = [] # (name, value, outer)
+        self._registration_tables_count = 0
         self.c_function_name_transformer = None
         self.set_strip_prefix(name + '_')
         if parent is None:
@@ -270,6 +630,554 @@ class ModuleBase(dict):
 
         self._current_section = '__main__'
 
+    def get_init_code_block(self):
+        """
+        Returns the code block of the module init function.  Unlike
+        C{after_init}, code written here always runs at import time,
+        even when the root module uses lazy initialization (see
+        L{Module.set_lazy_init}).
+        """
+        return self._init_block
+
+    def write_ensure_type_ready(self, code_block, pytype):
+        """
+        Writes code making sure a wrapper type is readied and
+        registered before an instance of it is created.  Does nothing
+        unless the root module uses lazy initialization.
+
+        :param code_block: the L{CodeBlock} to write to
+        :param pytype: C expression of type PyTypeObject* for the type
+        """
+        root = self.get_root()
+        if not root.lazy_init:
+            return
+        code_block.write_error_check("!PyType_HasFeature(%s, Py_TPFLAGS_READY)"
+                                     " && _wrap_%s__lazy_ready_type(%s) < 0"
+                                     % (pytype, root.prefix, pytype))
+
+    def get_instance_check(self, py_obj, pytype):
+        """
+        Returns a C expression that is true if py_obj is an instance
+        of a wrapper type, as checked by PyObject_IsInstance.  With
+        lazy initialization an unready type can have no instances yet,
+        and must not be given to PyObject_IsInstance, so the check
+        also tests that the type is ready.
+
+        :param py_obj: C expression of the object to check
+        :param pytype: C expression of type PyTypeObject* for the type
+        """
+        check = "PyObject_IsInstance((PyObject *) %s, (PyObject *) %s)" % (py_obj, pytype)
+        if not self.get_root().lazy_init:
+            return check
+        return "(PyType_HasFeature(%s, Py_TPFLAGS_READY) && %s)" % (pytype, check)
+
+    def declare_type(self, code_sink, pytypestruct):
+        """
+        Writes the declaration of the PyTypeObject structure of a
+        wrapper type.  With isolated initialization (see
+        L{Module.set_multi_phase_init}) the structure is only the
+        template of the heap types created by each interpreter, and
+        pytypestruct becomes a macro giving the heap type of the
+        current interpreter.
+
+        :param code_sink: the code sink of the forward declarations
+        :param pytypestruct: name of the PyTypeObject structure
+        """
+        root = self.get_root()
+        code_sink.writeln('extern PyTypeObject %s;' % self.get_type_definition_name(pytypestruct))
+        if root.isolated:
+            root._state_members.append(('PyTypeObject *', pytypestruct, True))
+
+    def get_type_definition_name(self, pytypestruct):
+        """
+        Returns the name under which the PyTypeObject structure of a
+        wrapper type is defined: pytypestruct itself, or the name of
+        its template with isolated initialization (see
+        L{declare_type}).
+        """
+        if self.get_root().isolated:
+            return pytypestruct + '__template'
+        return pytypestruct
+
+    def declare_global(self, code_sink, ctype, name):
+        """
+        Writes the declaration of a global variable of the module,
+        like a type map or a wrapper registry.  With isolated
+        initialization (see L{Module.set_multi_phase_init}) the
+        variable is a member of the per-interpreter module state
+        instead, name becomes a macro giving that member, and nothing
+        is written.
+
+        :param code_sink: the code sink of the forward declarations
+        :param ctype: C type of the variable
+        :param name: name of the variable
+        """
+        root = self.get_root()
+        if root.isolated:
+            root._state_members.append((ctype, name, False))
+        else:
+            code_sink.writeln('extern %s %s;' % (ctype, name))
+
+    def define_global(self, code_sink, ctype, name):
+        """
+        Writes the definition of a global variable declared with
+        L{declare_global}, unless it is a member of the module state.
+        """
+        if not self.get_root().isolated:
+            code_sink.writeln('%s %s;' % (ctype, name))
+
+    def write_heap_type_creation(self, pytypestruct, bases=(), metaclass=None):
+        """
+        Writes init code creating the heap type of a wrapper type
+        from its template, unless an earlier import in the same
+        interpreter created it already.  Only used with isolated
+        initialization (see L{declare_type}).
+
+        :param pytypestruct: name of the PyTypeObject structure
+        :param bases: C expressions of type PyTypeObject* of the base types
+        :param metaclass: C expression of type PyTypeObject* of the
+           metaclass, or None to derive it from the bases
+        """
+        root = self.get_root()
+        assert root.isolated
+        try:
+            self.declare_one_time_definition('_pybindgen_heap_type_new')
+        except KeyError:
+            pass
+        else:
+            self.body.writeln(r'''
+#include <stdarg.h>
+
+#define PYBINDGEN_TYPE_SLOT(id, value) \
+    if ((value) != NULL) { \
+        slots[nslots].slot = (id); \
+        slots[nslots].pfunc = (void *) (value); \
+        nslots++; \
+    }
+
+/* creates *type, unless it exists already, from the slots of a static
+   type structure that is never readied itself */
+static int
+pybindgen_heap_type_new(PyTypeObject **type, PyObject *module, PyTypeObject *metaclass,
+                        PyTypeObject *tmpl, int nbases, ...)
+{
+    PyType_Slot slots[96];
+    PyMemberDef members[3];
+    PyType_Spec spec;
+    PyTypeObject *base = NULL, *item;
+    PyObject *bases = NULL;
+    int nslots = 0, nmembers = 0, i;
+    unsigned long unlocked = 0;
+    va_list args;
+
+    if (*type != NULL) {
+        return 0;
+    }
+    if (nbases > 0 && (bases = PyTuple_New(nbases)) == NULL) {
+        return -1;
+    }
+    va_start(args, nbases);
+    for (i = 0; i < nbases; i++) {
+        item = va_arg(args, PyTypeObject *);
+        if (i == 0) {
+            base = item;
+        }
+        Py_INCREF(item);
+        PyTuple_SET_ITEM(bases, i, (PyObject *) item);
+    }
+    va_end(args);
+
+    PYBINDGEN_TYPE_SLOT(Py_tp_dealloc, tmpl->tp_dealloc);
+    PYBINDGEN_TYPE_SLOT(Py_tp_getattr, tmpl->tp_getattr);
+    PYBINDGEN_TYPE_SLOT(Py_tp_setattr, tmpl->tp_setattr);
+    PYBINDGEN_TYPE_SLOT(Py_tp_repr, tmpl->tp_repr);
+    PYBINDGEN_TYPE_SLOT(Py_tp_hash, tmpl->tp_hash);
+    PYBINDGEN_TYPE_SLOT(Py_tp_call, tmpl->tp_call);
+    PYBINDGEN_TYPE_SLOT(Py_tp_str, tmpl->tp_str);
+    PYBINDGEN_TYPE_SLOT(Py_tp_getattro, tmpl->tp_getattro);
+    PYBINDGEN_TYPE_SLOT(Py_tp_setattro, tmpl->tp_setattro);
+    PYBINDGEN_TYPE_SLOT(Py_tp_doc, tmpl->tp_doc);
+    PYBINDGEN_TYPE_SLOT(Py_tp_richcompare, tmpl->tp_richcompare);
+    PYBINDGEN_TYPE_SLOT(Py_tp_iter, tmpl->tp_iter);
+    PYBINDGEN_TYPE_SLOT(Py_tp_iternext, tmpl->tp_iternext);
+    PYBINDGEN_TYPE_SLOT(Py_tp_methods, tmpl->tp_methods);
+    PYBINDGEN_TYPE_SLOT(Py_tp_getset, tmpl->tp_getset);
+    PYBINDGEN_TYPE_SLOT(Py_tp_descr_get, tmpl->tp_descr_get);
+    PYBINDGEN_TYPE_SLOT(Py_tp_descr_set, tmpl->tp_descr_set);
+    PYBINDGEN_TYPE_SLOT(Py_tp_init, tmpl->tp_init);
+    PYBINDGEN_TYPE_SLOT(Py_tp_alloc, tmpl->tp_alloc);
+    PYBINDGEN_TYPE_SLOT(Py_tp_new, tmpl->tp_new);
+    PYBINDGEN_TYPE_SLOT(Py_tp_free, tmpl->tp_free);
+    PYBINDGEN_TYPE_SLOT(Py_tp_del, tmpl->tp_del);
+    PYBINDGEN_TYPE_SLOT(Py_tp_finalize, tmpl->tp_finalize);
+    if ((tmpl->tp_flags & Py_TPFLAGS_HAVE_GC) && tmpl->tp_traverse == NULL && base != NULL) {
+        /* a metaclass inherits the collector methods of its base */
+        PYBINDGEN_TYPE_SLOT(Py_tp_traverse, base->tp_traverse);
+        PYBINDGEN_TYPE_SLOT(Py_tp_clear, base->tp_clear);
+        PYBINDGEN_TYPE_SLOT(Py_tp_is_gc, base->tp_is_gc);
+    } else {
+        PYBINDGEN_TYPE_SLOT(Py_tp_traverse, tmpl->tp_traverse);
+        PYBINDGEN_TYPE_SLOT(Py_tp_clear, tmpl->tp_clear);
+        PYBINDGEN_TYPE_SLOT(Py_tp_is_gc, tmpl->tp_is_gc);
+    }
+    if (tmpl->tp_as_async != NULL) {
+        PYBINDGEN_TYPE_SLOT(Py_am_await, tmpl->tp_as_async->am_await);
+        PYBINDGEN_TYPE_SLOT(Py_am_aiter, tmpl->tp_as_async->am_aiter);
+        PYBINDGEN_TYPE_SLOT(Py_am_anext, tmpl->tp_as_async->am_anext);
+        PYBINDGEN_TYPE_SLOT(Py_am_send, tmpl->tp_as_async->am_send);
+    }
+    if (tmpl->tp_as_number != NULL) {
+        PYBINDGEN_TYPE_SLOT(Py_nb_add, tmpl->tp_as_number->nb_add);
+        PYBINDGEN_TYPE_SLOT(Py_nb_subtract, tmpl->tp_as_number->nb_subtract);
+        PYBINDGEN_TYPE_SLOT(Py_nb_multiply, tmpl->tp_as_number->nb_multiply);
+        PYBINDGEN_TYPE_SLOT(Py_nb_remainder, tmpl->tp_as_number->nb_remainder);
+        PYBINDGEN_TYPE_SLOT(Py_nb_divmod, tmpl->tp_as_number->nb_divmod);
+        PYBINDGEN_TYPE_SLOT(Py_nb_power, tmpl->tp_as_number->nb_power);
+        PYBINDGEN_TYPE_SLOT(Py_nb_negative, tmpl->tp_as_number->nb_negative);
+        PYBINDGEN_TYPE_SLOT(Py_nb_positive, tmpl->tp_as_number->nb_positive);
+        PYBINDGEN_TYPE_SLOT(Py_nb_absolute, tmpl->tp_as_number->nb_absolute);
+        PYBINDGEN_TYPE_SLOT(Py_nb_bool, tmpl->tp_as_number->nb_bool);
+        PYBINDGEN_TYPE_SLOT(Py_nb_invert, tmpl->tp_as_number->nb_invert);
+        PYBINDGEN_TYPE_SLOT(Py_nb_lshift, tmpl->tp_as_number->nb_lshift);
+        PYBINDGEN_TYPE_SLOT(Py_nb_rshift, tmpl->tp_as_number->nb_rshift);
+        PYBINDGEN_TYPE_SLOT(Py_nb_and, tmpl->tp_as_number->nb_and);
+        PYBINDGEN_TYPE_SLOT(Py_nb_xor, tmpl->tp_as_number->nb_xor);
+        PYBINDGEN_TYPE_SLOT(Py_nb_or, tmpl->tp_as_number->nb_or);
+        PYBINDGEN_TYPE_SLOT(Py_nb_int, tmpl->tp_as_number->nb_int);
+        PYBINDGEN_TYPE_SLOT(Py_nb_float, tmpl->tp_as_number->nb_float);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_add, tmpl->tp_as_number->nb_inplace_add);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_subtract, tmpl->tp_as_number->nb_inplace_subtract);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_multiply, tmpl->tp_as_number->nb_inplace_multiply);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_remainder, tmpl->tp_as_number->nb_inplace_remainder);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_power, tmpl->tp_as_number->nb_inplace_power);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_lshift, tmpl->tp_as_number->nb_inplace_lshift);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_rshift, tmpl->tp_as_number->nb_inplace_rshift);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_and, tmpl->tp_as_number->nb_inplace_and);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_xor, tmpl->tp_as_number->nb_inplace_xor);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_or, tmpl->tp_as_number->nb_inplace_or);
+        PYBINDGEN_TYPE_SLOT(Py_nb_floor_divide, tmpl->tp_as_number->nb_floor_divide);
+        PYBINDGEN_TYPE_SLOT(Py_nb_true_divide, tmpl->tp_as_number->nb_true_divide);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_floor_divide, tmpl->tp_as_number->nb_inplace_floor_divide);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_true_divide, tmpl->tp_as_number->nb_inplace_true_divide);
+        PYBINDGEN_TYPE_SLOT(Py_nb_index, tmpl->tp_as_number->nb_index);
+        PYBINDGEN_TYPE_SLOT(Py_nb_matrix_multiply, tmpl->tp_as_number->nb_matrix_multiply);
+        PYBINDGEN_TYPE_SLOT(Py_nb_inplace_matrix_multiply, tmpl->tp_as_number->nb_inplace_matrix_multiply);
+    }
+    if (tmpl->tp_as_sequence != NULL) {
+        PYBINDGEN_TYPE_SLOT(Py_sq_length, tmpl->tp_as_sequence->sq_length);
+        PYBINDGEN_TYPE_SLOT(Py_sq_concat, tmpl->tp_as_sequence->sq_concat);
+        PYBINDGEN_TYPE_SLOT(Py_sq_repeat, tmpl->tp_as_sequence->sq_repeat);
+        PYBINDGEN_TYPE_SLOT(Py_sq_item, tmpl->tp_as_sequence->sq_item);
+        PYBINDGEN_TYPE_SLOT(Py_sq_ass_item, tmpl->tp_as_sequence->sq_ass_item);
+        PYBINDGEN_TYPE_SLOT(Py_sq_contains, tmpl->tp_as_sequence->sq_contains);
+        PYBINDGEN_TYPE_SLOT(Py_sq_inplace_concat, tmpl->tp_as_sequence->sq_inplace_concat);
+        PYBINDGEN_TYPE_SLOT(Py_sq_inplace_repeat, tmpl->tp_as_sequence->sq_inplace_repeat);
+    }
+    if (tmpl->tp_as_mapping != NULL) {
+        PYBINDGEN_TYPE_SLOT(Py_mp_length, tmpl->tp_as_mapping->mp_length);
+        PYBINDGEN_TYPE_SLOT(Py_mp_subscript, tmpl->tp_as_mapping->mp_subscript);
+        PYBINDGEN_TYPE_SLOT(Py_mp_ass_subscript, tmpl->tp_as_mapping->mp_ass_subscript);
+    }
+    if (tmpl->tp_as_buffer != NULL) {
+        PYBINDGEN_TYPE_SLOT(Py_bf_getbuffer, tmpl->tp_as_buffer->bf_getbuffer);
+        PYBINDGEN_TYPE_SLOT(Py_bf_releasebuffer, tmpl->tp_as_buffer->bf_releasebuffer);
+    }
+
+    memset(members, 0, sizeof(members));
+    if (tmpl->tp_dictoffset != 0) {
+        members[nmembers].name = "__dictoffset__";
+        members[nmembers].type = Py_T_PYSSIZET;
+        members[nmembers].offset = tmpl->tp_dictoffset;
+        members[nmembers].flags = Py_READONLY;
+        nmembers++;
+    }
+    if (tmpl->tp_weaklistoffset != 0) {
+        members[nmembers].name = "__weaklistoffset__";
+        members[nmembers].type = Py_T_PYSSIZET;
+        members[nmembers].offset = tmpl->tp_weaklistoffset;
+        members[nmembers].flags = Py_READONLY;
+        nmembers++;
+    }
+    if (nmembers > 0) {
+        PYBINDGEN_TYPE_SLOT(Py_tp_members, members);
+    }
+    slots[nslots].slot = 0;
+    slots[nslots].pfunc = NULL;
+
+    spec.name = tmpl->tp_name;
+    spec.basicsize = (int) tmpl->tp_basicsize;
+    spec.itemsize = (int) tmpl->tp_itemsize;
+    /* static types are immutable, and cannot be instantiated without
+       a tp_new of their own if their base is object */
+    spec.flags = (unsigned int) tmpl->tp_flags | Py_TPFLAGS_IMMUTABLETYPE;
+    if (tmpl->tp_new == NULL && base == NULL) {
+        spec.flags |= Py_TPFLAGS_DISALLOW_INSTANTIATION;
+    }
+    spec.slots = slots;
+
+    /* a static type could derive from a type without
+       Py_TPFLAGS_BASETYPE, a heap type only if the flag is set while
+       it is created */
+    for (i = 0; i < nbases && i < (int) (8 * sizeof(unlocked)); i++) {
+        item = (PyTypeObject *) PyTuple_GET_ITEM(bases, i);
+        if (!(item->tp_flags & Py_TPFLAGS_BASETYPE)) {
+            item->tp_flags |= Py_TPFLAGS_BASETYPE;
+            unlocked |= 1UL << i;
+        }
+    }
+    *type = (PyTypeObject *) PyType_FromMetaclass(metaclass, module, &spec, bases);
+    for (i = 0; i < nbases && i < (int) (8 * sizeof(unlocked)); i++) {
+        if (unlocked & (1UL << i)) {
+            ((PyTypeObject *) PyTuple_GET_ITEM(bases, i))->tp_flags &= ~Py_TPFLAGS_BASETYPE;
+        }
+    }
+    Py_XDECREF(bases);
+    return *type == NULL ? -1 : 0;
+}
+''')
+        self.after_init.write_error_check(
+            'pybindgen_heap_type_new(&%s, m, %s, &%s, %i%s) < 0'
+            % (root._get_state_member(pytypestruct), metaclass or 'NULL',
+               self.get_type_definition_name(pytypestruct), len(bases),
+               ''.join([', ' + base for base in bases])))
+
+    def write_type_addition(self, pytypestruct, python_name, outer=None):
+        """
+        Writes init code adding a readied wrapper type to the module,
+        or to the dictionary of an outer class.
+
+        :param pytypestruct: name of the PyTypeObject structure
+        :param python_name: attribute name under which to add the type
+        :param outer: the L{CppClass} of the outer class, or None
+        """
+        if outer is not None:
+            self.after_init.write_code(
+                'PyDict_SetItemString((PyObject*) %s.tp_dict, (char *) \"%s\", (PyObject *) &%s);' % (
+                    outer.pytypestruct, python_name, pytypestruct))
+        elif self.get_root().isolated:
+            ## the module state keeps its own reference
+            self.after_init.write_error_check(
+                'PyModule_AddObjectRef(m, (char *) \"%s\", (PyObject *) &%s) < 0' % (
+                    python_name, pytypestruct))
+        else:
+            self.after_init.write_code(
+                'PyModule_AddObject(m, (char *) \"%s\", (PyObject *) &%s);' % (
+                    python_name, pytypestruct))
+
+    def get_instance_free_code(self, self_var):
+        """
+        Returns the C code freeing a wrapper instance at the end of
+        its tp_dealloc.  Instances of heap types (see L{declare_type})
+        also release their reference to the type.
+
+        :param self_var: name of the variable pointing to the instance
+        """
+        if self.get_root().isolated:
+            return ('{\n'
+                    '    PyTypeObject *type = Py_TYPE(%s);\n'
+                    '    type->tp_free((PyObject*)%s);\n'
+                    '    Py_DECREF(type);\n'
+                    '}' % (self_var, self_var))
+        return 'Py_TYPE(%s)->tp_free((PyObject*)%s);' % (self_var, self_var)
+
+    def _get_state_member(self, name):
+        """(internal) C expression of the module state member holding a global"""
+        return '_wrap_%s__state()->%s_' % (self.get_root().prefix, name)
+
+    def write_type_registration(self, pytypestruct, python_name, base=None, outer=None):
+        """
+        Registers a wrapper type with the module init code: sets its
+        tp_base, readies it and adds it to the module, or to the
+        dictionary of an outer class.  The registration is normally
+        collected in a static table, and the table processed by a
+        small loop (see L{flush_registrations}), which keeps the init
+        function short even for very large modules.
+
+        :param pytypestruct: name of the PyTypeObject structure
+        :param python_name: attribute name under which to add the type
+        :param base: the L{CppClass} of the base type, or None
+        :param outer: the L{CppClass} of the outer class, or None
+        """
+        if self.get_root().isolated:
+            ## the heap types must be created in order, before any
+            ## code takes their address
+            self.write_heap_type_creation(pytypestruct, base is not None and ['&' + base.pytypestruct] or [])
+            self.write_type_addition(pytypestruct, python_name, outer)
+        ## imported types are only known after the init function has
+        ## run for a while, so they cannot go into a static table; lazy
+        ## registration functions are small anyway
+        elif (self.get_root().lazy_init
+              or (base is not None and base.import_from_module)
+              or (outer is not None and outer.import_from_module)):
+            if base is not None:
+                self.after_init.write_code('%s.tp_base = &%s;' % (pytypestruct, base.pytypestruct))
+            self.after_init.write_error_check('PyType_Ready(&%s)' % (pytypestruct,))
+            self.write_type_addition(pytypestruct, python_name, outer)
+        else:
+            self._pending_type_registrations.append((pytypestruct, python_name, base, outer))
+
+    def write_constant_registration(self, name, value, outer=None):
+        """
+        Registers an integer constant (e.g. an enum value) with the
+        module init code, in the same way as L{write_type_registration}.
+
+        :param name: python name of the constant
+        :param value: C expression of the value
+        :param outer: the L{CppClass} of the outer class, or None
+        """
+        if (self.get_root().lazy_init or (outer is not None and outer.import_from_module)
+            or (outer is not None and self.get_root().isolated)):
+            if outer is None:
+                self.after_init.write_code(
+                    "PyModule_AddIntConstant(m, (char *) \"%s\", %s);" % (name, value))
+            else:
+                self.after_init.write_code(
+                    '{\n'
+                    '    PyObject *tmp_value = PyLong_FromLong(%s);\n'
+                    '    PyDict_SetItemString((PyObject*) %s.tp_dict, \"%s\", tmp_value);\n'
+                    '    Py_DECREF(tmp_value);\n'
+                    '}' % (value, outer.pytypestruct, name))
+        else:
+            self._pending_constant_registrations.append((name, value, outer))
+
+    def flush_registrations(self):
+        """
+        Writes the tables of the registrations collected so far, plus
+        the code to process them, to the module init code.  Must be
+        called before writing init code that depends on those types
+        being ready.
+        """
+        if not (self._pending_type_registrations or self._pending_constant_registrations):
+            return
+        try:
+            self.declare_one_time_definition('_wrap_register_types')
+        except KeyError:
+            pass
+        else:
+            ## names are stored as offsets into one string per table,
+            ## which saves a relocation per entry
+            self.body.writeln('''
+typedef struct {
+    PyTypeObject *type;
+    PyTypeObject *base;
+    PyTypeObject *outer;
+    unsigned int name;
+} PyBindGenTypeRegistration;
+
+typedef struct {
+    long value;
+    PyTypeObject *outer;
+    unsigned int name;
+} PyBindGenConstantRegistration;
+
+static int
+_wrap_register_types(PyObject *m, const PyBindGenTypeRegistration *types, size_t count,
+                     const char *names)
+{
+    size_t i;
+
+    for (i = 0; i < count; ++i) {
+        if (types[i].base != NULL) {
+            types[i].type->tp_base = types[i].base;
+        }
+        if (PyType_Ready(types[i].type)) {
+            return -1;
+        }
+        if (types[i].outer == NULL) {
+            PyModule_AddObject(m, (char *) names + types[i].name, (PyObject *) types[i].type);
+        } else {
+            PyDict_SetItemString((PyObject*) types[i].outer->tp_dict, names + types[i].name,
+                                 (PyObject *) types[i].type);
+        }
+    }
+    return 0;
+}
+
+static int
+_wrap_register_constants(PyObject *m, const PyBindGenConstantRegistration *constants, size_t count,
+                         const char *names)
+{
+    size_t i;
+    PyObject *tmp_value;
+
+    for (i = 0; i < count; ++i) {
+        if (constants[i].outer == NULL) {
+            PyModule_AddIntConstant(m, (char *) names + constants[i].name, constants[i].value);
+        } else {
+            tmp_value = PyLong_FromLong(constants[i].value);
+            if (tmp_value == NULL) {
+                return -1;
+            }
+            PyDict_SetItemString((PyObject*) constants[i].outer->tp_dict, names + constants[i].name,
+                                 tmp_value);
+            Py_DECREF(tmp_value);
+        }
+    }
+    return 0;
+}
+''')
+
+        def pointer(cls):
+            if cls is None:
+                return 'NULL'
+            return '&' + cls.pytypestruct
+
+        def write_table(kind, struct_name, entries):
+            table_name = "_wrap_%s_%s%i" % (self.prefix, kind, self._registration_tables_count)
+            self._registration_tables_count += 1
+            self.body.writeln("static const char %s_names[] =" % table_name)
+            self.body.indent()
+            for name, fields in entries:
+                self.body.writeln('"%s\\0"' % name)
+            self.body.writeln(";")
+            self.body.unindent()
+            self.body.writeln("static const %s %s[] = {" % (struct_name, table_name))
+            self.body.indent()
+            offset = 0
+            for name, fields in entries:
+                self.body.writeln('{%s, %i}, /* %s */' % (', '.join(fields), offset, name))
+                offset += len(name) + 1
+            self.body.unindent()
+            self.body.writeln("};")
+            self.after_init.write_error_check("_wrap_register_%s(m, %s, %i, %s_names) < 0"
+                                              % (kind, table_name, len(entries), table_name))
+
+        if self._pending_type_registrations:
+            write_table('types', 'PyBindGenTypeRegistration',
+                        [(python_name, ['&' + pytypestruct, pointer(base), pointer(outer)])
+                         for pytypestruct, python_name, base, outer in self._pending_type_registrations])
+            self._pending_type_registrations = []
+
+        if self._pending_constant_registrations:
+            write_table('constants', 'PyBindGenConstantRegistration',
+                        [(name, [value, pointer(outer)])
+                         for name, value, outer in self._pending_constant_registrations])
+            self._pending_constant_registrations = []
+
+    def _generate_lazily(self, registration, code_sink, generate, *args):
+        """
+        (internal) Calls generate(*args) with C{after_init} temporarily
+        redirected to the body of a lazy registration function.
+        """
+        registration.code_sink = code_sink
+        self.after_init = registration.block
+        try:
+            generate(*args)
+        finally:
+            self.after_init = self._init_block
+        self.get_root()._lazy_registrations.append(registration)
+        self.header.writeln("int %s(void);" % registration.function_name)
+
+        outer_class = getattr(registration.wrapper, 'outer_class', None)
+        if registration.names:
+            ## without PEP 562 there is no module __getattr__, so
+            ## everything is registered at import time
+            self.after_init.write_code('#if PY_VERSION_HEX < 0x03070000')
+            self.after_init.write_error_check('%s() < 0' % registration.function_name)
+            self.after_init.write_code('#endif')
+        elif outer_class is None or outer_class.import_from_module:
+            self.after_init.write_error_check('%s() < 0' % registration.function_name)
+
     def get_current_section(self):
         return self.get_root()._current_section
     current_section = property(get_current_section)
@@ -689,7 +1597,9 @@ class ModuleBase(dict):
 
             if self.parent is None:
                 for include in self.includes:
-                    out.get_includes_code_sink().writeln("#include %s" % include)
+                    out.get_precompiled_includes_code_sink().writeln("#include %s" % include)
+                if self.c_api is not None:
+                    self.c_api.includes = list(self.includes)
                 self.includes = None
 
             forward_declarations_sink.flush_to(out.get_includes_code_sink())
@@ -697,6 +1607,34 @@ class ModuleBase(dict):
         else:
             assert module_file_base_name is None, "only root modules can generate with alternate module_file_base_name"
 
+        lazy_init = self.get_root().lazy_init
+        if lazy_init and settings.free_threading:
+            raise ValueError("lazy initialization cannot be combined with settings.free_threading")
+        if settings.wrapper_profiling and settings.free_threading:
+            ## the statistics of each wrapper are linked into a list on
+            ## its first call, without any lock
+            raise ValueError("settings.wrapper_profiling cannot be combined with settings.free_threading")
+        if lazy_init:
+            if self.parent is None:
+                self.header.writeln("typedef struct {\n"
+                                    "    const char *name;\n"
+                                    "    int (*init)(void);\n"
+                                    "} PyBindGenLazyAttr;\n")
+                self.header.writeln("int _wrap_%s__lazy_ready_type(PyTypeObject *type);" % self.prefix)
+            self.header.writeln("extern PyObject *_wrap_%s__module;" % self.prefix)
+
+        profiling = settings.wrapper_profiling and self.parent is None
+        if profiling:
+            self.header.writeln("#ifdef PYBINDGEN_PROFILE\n"
+                                "#define PYBINDGEN_PROFILE_LIST _wrap_%(PREFIX)s__profile_list\n"
+                                "extern PyBindGenWrapperStats *_wrap_%(PREFIX)s__profile_list;\n"
+                                "#endif\n" % dict(PREFIX=self.prefix))
+        accounting = settings.wrapper_accounting and self.parent is None
+        if accounting:
+            self.header.writeln("#define PYBINDGEN_LIVE_LISTS _wrap_%(PREFIX)s__live_lists\n"
+                                "extern PyBindGenLiveLists _wrap_%(PREFIX)s__live_lists;\n"
+                                % dict(PREFIX=self.prefix))
+
         ## generate the submodules
         for submodule in self.submodules:
             submodule.do_generate(out)
@@ -707,7 +1645,22 @@ class ModuleBase(dict):
             mod_init_name = '.'.join(self.get_module_path())
         else:
             mod_init_name = module_file_base_name
-        self.before_init.write_code('#if PY_VERSION_HEX >= 0x03000000')
+        multi_phase_init = self.parent is None and self.multi_phase_init
+        if multi_phase_init:
+            if lazy_init:
+                raise ValueError("lazy initialization cannot be combined with multi-phase initialization")
+            if self.isolated and (settings.wrapper_profiling or settings.wrapper_accounting):
+                raise ValueError("isolated initialization cannot be combined with "
+                                 "settings.wrapper_profiling or settings.wrapper_accounting")
+            ## the module object is created by the import machinery
+            ## and passed to the exec function
+            self.before_init.write_code('#if PY_VERSION_HEX >= 0x03050000')
+            self.before_init.write_code("m = module;")
+            if self.isolated:
+                self.before_init.write_error_check("_wrap_%s__create_state() < 0" % self.prefix)
+            self.before_init.write_code('#elif PY_VERSION_HEX >= 0x03000000')
+        else:
+            self.before_init.write_code('#if PY_VERSION_HEX >= 0x03000000')
         self.before_init.write_code(
             "m = PyModule_Create(&%s_moduledef);"
             % (self.prefix))
@@ -718,6 +1671,12 @@ class ModuleBase(dict):
                self.docstring and '"'+self.docstring+'"' or 'NULL'))
         self.before_init.write_code('#endif')
         self.before_init.write_error_check("m == NULL")
+        if settings.free_threading and self.parent is None and not multi_phase_init:
+            self.before_init.write_code('#ifdef Py_GIL_DISABLED')
+            self.before_init.write_code("PyUnstable_Module_SetGIL(m, Py_MOD_GIL_NOT_USED);")
+            self.before_init.write_code('#endif')
+        if lazy_init:
+            self.before_init.write_code("_wrap_%s__module = m;" % self.prefix)
 
         main_sink = out.get_main_code_sink()
 
@@ -742,12 +1701,44 @@ class ModuleBase(dict):
                 py_method_defs.append(overload.get_py_method_def(func_name))
                 del sink
 
+        if lazy_init:
+            main_sink.writeln("PyObject *_wrap_%s__module = NULL;" % self.prefix)
+            main_sink.writeln('#if PY_VERSION_HEX >= 0x03070000')
+            main_sink.writeln("static PyObject *_wrap_%s__getattr__(PyObject *module, PyObject *name);"
+                              % self.prefix)
+            main_sink.writeln("static PyObject *_wrap_%s__dir__(PyObject *module, PyObject *PYBINDGEN_UNUSED(dummy));"
+                              % self.prefix)
+            main_sink.writeln("static int _wrap_%s__set_all(PyObject *module);" % self.prefix)
+            main_sink.writeln('#endif')
+
+        if profiling:
+            self._generate_profile_functions(main_sink)
+        if accounting:
+            self._generate_accounting_function(main_sink)
+
         ## generate the function table
         main_sink.writeln("static PyMethodDef %s_functions[] = {"
                           % (self.prefix,))
         main_sink.indent()
         for py_method_def in py_method_defs:
             main_sink.writeln(py_method_def)
+        if profiling:
+            main_sink.writeln('#ifdef PYBINDGEN_PROFILE')
+            main_sink.writeln('{(char *) "_wrapper_stats", (PyCFunction) _wrap_%s__wrapper_stats, METH_NOARGS, NULL },'
+                              % self.prefix)
+            main_sink.writeln('{(char *) "_reset_wrapper_stats", (PyCFunction) _wrap_%s__reset_wrapper_stats, '
+                              'METH_NOARGS, NULL },' % self.prefix)
+            main_sink.writeln('#endif')
+        if accounting:
+            main_sink.writeln('{(char *) "_wrapper_accounting", (PyCFunction) _wrap_%s__wrapper_accounting, '
+                              'METH_NOARGS, NULL },' % self.prefix)
+        if lazy_init:
+            main_sink.writeln('#if PY_VERSION_HEX >= 0x03070000')
+            main_sink.writeln('{(char *) "__getattr__", (PyCFunction) _wrap_%s__getattr__, METH_O, NULL },'
+                              % self.prefix)
+            main_sink.writeln('{(char *) "__dir__", (PyCFunction) _wrap_%s__dir__, METH_NOARGS, NULL },'
+                              % self.prefix)
+            main_sink.writeln('#endif')
         main_sink.writeln("{NULL, NULL, 0, NULL}")
         main_sink.unindent()
         main_sink.writeln("};")
@@ -764,7 +1755,24 @@ class ModuleBase(dict):
             for class_ in [c for c in self.classes if not c.import_from_module]:
                 sink, header_sink = out.get_code_sink_for_wrapper(class_)
                 sink.writeln()
-                class_.generate(sink, self)
+                if lazy_init:
+                    names = []
+                    pytypes = ['&' + class_.pytypestruct]
+                    if class_.outer_class is None:
+                        names.append(class_.get_python_name())
+                    if class_.container_traits is not None:
+                        if class_.outer_class is None:
+                            names.append(class_.container_traits.get_iter_python_name())
+                        pytypes.append('&' + class_.container_traits.iter_pytypestruct)
+                    dependencies = list(class_.bases)
+                    if class_.outer_class is not None:
+                        dependencies.append(class_.outer_class)
+                    registration = _LazyRegistration(
+                        self, class_, "_wrap_lazy_register_%s" % class_.pytypestruct,
+                        names, dependencies, pytypes)
+                    self._generate_lazily(registration, sink, class_.generate, sink, self)
+                else:
+                    class_.generate(sink, self)
                 sink.writeln()
 
         ## generate the containers
@@ -774,36 +1782,91 @@ class ModuleBase(dict):
             for container in self.containers:
                 sink, header_sink = out.get_code_sink_for_wrapper(container)
                 sink.writeln()
-                container.generate(sink, self)
+                if lazy_init:
+                    if container.outer_class is None:
+                        names = [container.python_name, container.python_name + 'Iter']
+                        dependencies = []
+                    else:
+                        names = []
+                        dependencies = [container.outer_class]
+                    registration = _LazyRegistration(
+                        self, container, "_wrap_lazy_register_%s" % container.pytypestruct,
+                        names, dependencies,
+                        ['&' + container.pytypestruct, '&' + container.iter_pytypestruct])
+                    self._generate_lazily(registration, sink, container.generate, sink, self)
+                else:
+                    container.generate(sink, self)
                 sink.writeln()
 
         ## generate the exceptions
         if self.exceptions:
             main_sink.writeln('/* --- exceptions --- */')
             main_sink.writeln()
+            self.flush_registrations()
             for exc in self.exceptions:
                 sink, header_sink = out.get_code_sink_for_wrapper(exc)
                 sink.writeln()
+                ## exceptions are always registered at import time, but
+                ## may need to be stored in a lazily registered class
+                if (lazy_init and exc.outer_class is not None
+                    and not exc.outer_class.import_from_module):
+                    self.after_init.write_error_check(
+                        "_wrap_lazy_register_%s() < 0" % exc.outer_class.pytypestruct)
                 exc.generate(sink, self)
                 sink.writeln()
 
         # typedefs
+        if self.typedefs:
+            self.flush_registrations()
         for (wrapper, alias) in self.typedefs:
             if isinstance(wrapper, CppClass):
                 cls = wrapper
-                cls.generate_typedef(self, alias)
+                if lazy_init and not cls.import_from_module:
+                    sink, header_sink = out.get_code_sink_for_wrapper(cls)
+                    registration = _LazyRegistration(
+                        self, None, "_wrap_lazy_register_%s__%s" % (self.prefix, utils.mangle_name(alias)),
+                        [alias], [cls], [])
+                    self._generate_lazily(registration, sink, cls.generate_typedef, self, alias)
+                else:
+                    cls.generate_typedef(self, alias)
 
         ## generate the enums
         if self.enums:
             main_sink.writeln('/* --- enumerations --- */')
             main_sink.writeln()
-            for enum in self.enums:
+            for enum_index, enum in enumerate(self.enums):
                 sink, header_sink = out.get_code_sink_for_wrapper(enum)
                 sink.writeln()
-                enum.generate(sink)
+                if lazy_init and not enum.import_from_module:
+                    if enum.full_name is None: # anonymous enum
+                        function_name = "_wrap_lazy_register_%s__enum%i" % (self.prefix, enum_index)
+                    else:
+                        function_name = "_wrap_lazy_register_%s" % utils.mangle_name(enum.full_name)
+                    if enum.outer_class is None:
+                        names = [isinstance(value, tuple) and value[0] or value
+                                 for value in enum.values]
+                        dependencies = []
+                    else:
+                        names = []
+                        dependencies = [enum.outer_class]
+                    registration = _LazyRegistration(
+                        self, enum, function_name, names, dependencies, [])
+                    self._generate_lazily(registration, sink, enum.generate, sink)
+                else:
+                    enum.generate(sink)
                 enum.generate_declaration(header_sink, self)
                 sink.writeln()
 
+        self.flush_registrations()
+
+        if lazy_init:
+            self._generate_lazy_attribute_lookup(main_sink)
+            if self.parent is None:
+                self._generate_lazy_registrations(main_sink)
+
+        if self.parent is None and self.c_api is not None:
+            self.c_api.generate(main_sink, mod_init_name)
+
         ## register the submodules
         if self.submodules:
             submodule_var = self.declarations.declare_variable('PyObject*', 'submodule')
@@ -815,6 +1878,16 @@ class ModuleBase(dict):
             self.after_init.write_code('PyModule_AddObject(m, (char *) "%s", %s);'
                                        % (submodule.name, submodule_var,))
 
+        if lazy_init:
+            ## must come last, once every eager name is in the dict
+            self.after_init.write_code('#if PY_VERSION_HEX >= 0x03070000')
+            self.after_init.write_error_check('_wrap_%s__set_all(m) < 0' % self.prefix)
+            self.after_init.write_code('#endif')
+
+        if self.parent is None and self.isolated:
+            self._generate_module_state(self.header)
+            self._generate_module_state_functions(self.body, mod_init_name)
+
         ## flush the header section
         self.header.flush_to(out.get_includes_code_sink())
 
@@ -822,19 +1895,51 @@ class ModuleBase(dict):
         self.body.flush_to(main_sink)
 
         ## now generate the module init function itself
+        if multi_phase_init:
+            self._generate_module_slots(main_sink)
+            slots = ('#if PY_VERSION_HEX >= 0x03050000\n'
+                     '    %s_slots,\n'
+                     '#endif\n' % self.prefix)
+        else:
+            slots = ''
         main_sink.writeln('#if PY_VERSION_HEX >= 0x03000000\n'
             'static struct PyModuleDef %s_moduledef = {\n'
             '    PyModuleDef_HEAD_INIT,\n'
             '    "%s",\n'
             '    %s,\n'
-            '    -1,\n'
+            '    %s,\n'
             '    %s_functions,\n'
+            '%s'
             '};\n'
             '#endif' % (self.prefix, mod_init_name,
                         self.docstring and '"'+self.docstring+'"' or 'NULL',
-                        self.prefix))
+                        multi_phase_init and '0' or '-1',
+                        self.prefix, slots))
         main_sink.writeln()
-        if self.parent is None:
+        if multi_phase_init:
+            main_sink.writeln('''
+#if PY_VERSION_HEX >= 0x03050000
+    #define MOD_ERROR -1
+    #define MOD_INIT(name) PyObject* PyInit_##name(void)
+#elif PY_VERSION_HEX >= 0x03000000
+    #define MOD_ERROR NULL
+    #define MOD_INIT(name) PyObject* PyInit_##name(void)
+    #define MOD_RETURN(val) val
+#else
+    #define MOD_ERROR
+    #define MOD_INIT(name) void init##name(void)
+    #define MOD_RETURN(val)
+#endif
+#if PY_VERSION_HEX < 0x03050000
+#if defined(__cplusplus)
+extern "C"
+#endif
+#if defined(__GNUC__) && __GNUC__ >= 4
+__attribute__ ((visibility("default")))
+#endif
+#endif
+''')
+        elif self.parent is None:
             main_sink.writeln('''
 #if PY_VERSION_HEX >= 0x03000000
     #define MOD_ERROR NULL
@@ -855,7 +1960,14 @@ __attribute__ ((visibility("default")))
 ''')
         else:
             main_sink.writeln("static PyObject *")
-        if self.parent is None:
+        if multi_phase_init:
+            main_sink.writeln('#if PY_VERSION_HEX >= 0x03050000')
+            main_sink.writeln("static int")
+            main_sink.writeln("_wrap_%s__exec(PyObject *module)" % (self.prefix,))
+            main_sink.writeln('#else')
+            main_sink.writeln("MOD_INIT(%s)" % (self.name,))
+            main_sink.writeln('#endif')
+        elif self.parent is None:
             main_sink.writeln("MOD_INIT(%s)" % (self.name,))
         elif module_file_base_name is None:
             main_sink.writeln("%s(void)" % (self.init_function_name,))
@@ -869,11 +1981,410 @@ __attribute__ ((visibility("default")))
         self.after_init.sink.flush_to(main_sink)
         if self.parent is not None:
             main_sink.writeln("return m;")
+        elif multi_phase_init:
+            main_sink.writeln('#if PY_VERSION_HEX >= 0x03050000')
+            main_sink.writeln("return 0;")
+            main_sink.writeln('#else')
+            main_sink.writeln("return MOD_RETURN(m);")
+            main_sink.writeln('#endif')
         else:
             main_sink.writeln("return MOD_RETURN(m);")
         main_sink.unindent()
         main_sink.writeln('}')
+        if multi_phase_init:
+            main_sink.writeln('''
+#if PY_VERSION_HEX >= 0x03050000
+#if defined(__cplusplus)
+extern "C"
+#endif
+#if defined(__GNUC__) && __GNUC__ >= 4
+__attribute__ ((visibility("default")))
+#endif
+MOD_INIT(%s)
+{
+    return PyModuleDef_Init(&%s_moduledef);
+}
+#endif''' % (self.name, self.prefix))
+
+    def _generate_module_slots(self, code_sink):
+        """(internal) generate the PEP 489 slots of a multi-phase init module"""
+        code_sink.writeln('''#if PY_VERSION_HEX >= 0x03050000
+static int _wrap_%(PREFIX)s__exec(PyObject *module);
+
+static PyModuleDef_Slot %(PREFIX)s_slots[] = {
+    {Py_mod_exec, (void *) _wrap_%(PREFIX)s__exec},
+#ifdef Py_mod_multiple_interpreters
+    {Py_mod_multiple_interpreters, %(INTERPRETERS)s},
+#endif
+%(GIL)s    {0, NULL}
+};
+#endif''' % dict(PREFIX=self.prefix,
+                  ## static types cannot be shared by interpreters
+                  INTERPRETERS=(self.isolated and 'Py_MOD_PER_INTERPRETER_GIL_SUPPORTED'
+                                or 'Py_MOD_MULTIPLE_INTERPRETERS_NOT_SUPPORTED'),
+                  GIL=(settings.free_threading and ('#ifdef Py_GIL_DISABLED\n'
+                                                    '    {Py_mod_gil, Py_MOD_GIL_NOT_USED},\n'
+                                                    '#endif\n') or '')))
+
+    def _generate_module_state(self, code_sink):
+        """(internal) generate the module state structure of an isolated module, and the macros giving its members"""
+        code_sink.writeln('''
+#if PY_VERSION_HEX < 0x030C0000
+# error "isolated multi-phase initialization needs Python 3.12 or later"
+#elif PY_VERSION_HEX >= 0x030D0000
+# define PYBINDGEN_THREAD_STATE_GET() PyThreadState_GetUnchecked()
+#else
+# define PYBINDGEN_THREAD_STATE_GET() _PyThreadState_UncheckedGet()
+#endif
+
+struct _wrap_%s__State {''' % (self.prefix,))
+        code_sink.indent()
+        for ctype, name, dummy_dereference in self._state_members:
+            code_sink.writeln('%s %s_;' % (ctype, name))
+        code_sink.unindent()
+        code_sink.writeln('};\n')
+        code_sink.writeln('_wrap_%s__State *_wrap_%s__state(void);' % (self.prefix, self.prefix))
+        for ctype, name, dereference in self._state_members:
+            code_sink.writeln('#define %s (%s%s)' % (name, dereference and '*' or '', self._get_state_member(name)))
+        code_sink.writeln()
+
+    def _generate_module_state_functions(self, code_sink, mod_init_name):
+        """(internal) generate the functions creating, finding and freeing the module state of an isolated module"""
+        subst_vars = dict(PREFIX=self.prefix, NAME=mod_init_name, KEY=mod_init_name + '._pybindgen_state')
+        code_sink.writeln('''
+/* the module state of each interpreter is kept in the interpreter
+   dictionary, and cached per thread; interpreter IDs are never reused */
+static thread_local int64_t _wrap_%(PREFIX)s__state_cache_id = -1;
+static thread_local _wrap_%(PREFIX)s__State *_wrap_%(PREFIX)s__state_cache = NULL;
+
+static void
+_wrap_%(PREFIX)s__free_state(PyObject *capsule)
+{
+    _wrap_%(PREFIX)s__State *state =
+        (_wrap_%(PREFIX)s__State *) PyCapsule_GetPointer(capsule, "%(KEY)s");
+
+    if (_wrap_%(PREFIX)s__state_cache == state) {
+        _wrap_%(PREFIX)s__state_cache_id = -1;
+        _wrap_%(PREFIX)s__state_cache = NULL;
+    }''' % subst_vars)
+        code_sink.indent()
+        for ctype, name, dummy_dereference in reversed(self._state_members):
+            if ctype in ('PyTypeObject *', 'PyObject *'):
+                code_sink.writeln('Py_CLEAR(state->%s_);' % name)
+        code_sink.writeln('delete state;')
+        code_sink.unindent()
+        code_sink.writeln('''}
+
+static int
+_wrap_%(PREFIX)s__create_state(void)
+{
+    PyObject *dict = PyInterpreterState_GetDict(PyInterpreterState_Get());
+    PyObject *capsule;
+    _wrap_%(PREFIX)s__State *state;
+    int retval;
+
+    if (dict == NULL) {
+        PyErr_SetString(PyExc_RuntimeError, "no interpreter dictionary to keep the %(NAME)s module state in");
+        return -1;
+    }
+    if (PyDict_GetItemString(dict, "%(KEY)s") != NULL) {
+        return 0;
+    }
+    state = new _wrap_%(PREFIX)s__State();
+    capsule = PyCapsule_New(state, "%(KEY)s", _wrap_%(PREFIX)s__free_state);
+    if (capsule == NULL) {
+        delete state;
+        return -1;
+    }
+    retval = PyDict_SetItemString(dict, "%(KEY)s", capsule);
+    Py_DECREF(capsule);
+    return retval;
+}
+
+_wrap_%(PREFIX)s__State *
+_wrap_%(PREFIX)s__state(void)
+{
+    PyInterpreterState *interp = PyInterpreterState_Get();
+    int64_t id = PyInterpreterState_GetID(interp);
+    PyObject *dict, *capsule = NULL;
+
+    if (id != _wrap_%(PREFIX)s__state_cache_id) {
+        dict = PyInterpreterState_GetDict(interp);
+        if (dict != NULL) {
+            capsule = PyDict_GetItemString(dict, "%(KEY)s");
+        }
+        if (capsule == NULL) {
+            Py_FatalError("the %(NAME)s module is used by an interpreter that did not import it, "
+                          "or after its state was freed");
+        }
+        _wrap_%(PREFIX)s__state_cache = (_wrap_%(PREFIX)s__State *) PyCapsule_GetPointer(capsule, "%(KEY)s");
+        _wrap_%(PREFIX)s__state_cache_id = id;
+    }
+    return _wrap_%(PREFIX)s__state_cache;
+}
+''' % subst_vars)
+
+    def _generate_profile_functions(self, code_sink):
+        """(internal) generate the _wrapper_stats and _reset_wrapper_stats functions"""
+        code_sink.writeln('''#ifdef PYBINDGEN_PROFILE
+PyBindGenWrapperStats *_wrap_%(PREFIX)s__profile_list = NULL;
+
+static PyObject *
+_wrap_%(PREFIX)s__wrapper_stats(PyObject *PYBINDGEN_UNUSED(module), PyObject *PYBINDGEN_UNUSED(dummy))
+{
+    PyBindGenWrapperStats *stats;
+    PyObject *result, *entry, *histogram;
+    int bucket;
+
+    result = PyDict_New();
+    if (result == NULL) {
+        return NULL;
+    }
+    for (stats = _wrap_%(PREFIX)s__profile_list; stats != NULL; stats = stats->next) {
+        histogram = PyList_New(PYBINDGEN_PROFILE_BUCKETS);
+        if (histogram == NULL) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        for (bucket = 0; bucket < PYBINDGEN_PROFILE_BUCKETS; bucket++) {
+            PyList_SET_ITEM(histogram, bucket, PyLong_FromUnsignedLongLong(stats->histogram[bucket]));
+        }
+        entry = Py_BuildValue((char *) "{s:K,s:K,s:K,s:K,s:K,s:N}",
+                              "calls", stats->calls, "misses", stats->misses,
+                              "conversion_ns", stats->conversion_ns, "call_ns", stats->call_ns,
+                              "return_ns", stats->return_ns, "histogram", histogram);
+        if (entry == NULL || PyDict_SetItemString(result, stats->name, entry) == -1) {
+            Py_XDECREF(entry);
+            Py_DECREF(result);
+            return NULL;
+        }
+        Py_DECREF(entry);
+    }
+    return result;
+}
+
+static PyObject *
+_wrap_%(PREFIX)s__reset_wrapper_stats(PyObject *PYBINDGEN_UNUSED(module), PyObject *PYBINDGEN_UNUSED(dummy))
+{
+    PyBindGenWrapperStats *stats;
+
+    for (stats = _wrap_%(PREFIX)s__profile_list; stats != NULL; stats = stats->next) {
+        stats->calls = stats->misses = 0;
+        stats->conversion_ns = stats->call_ns = stats->return_ns = 0;
+        memset(stats->histogram, 0, sizeof(stats->histogram));
+    }
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+#endif
+''' % dict(PREFIX=self.prefix))
+
+
+    def _generate_accounting_function(self, code_sink):
+        """(internal) generate the _wrapper_accounting function"""
+        code_sink.writeln('''PyBindGenLiveLists _wrap_%(PREFIX)s__live_lists;
+
+static PyObject *
+_wrap_%(PREFIX)s__wrapper_accounting(PyObject *PYBINDGEN_UNUSED(module), PyObject *PYBINDGEN_UNUSED(dummy))
+{
+    PyBindGenLiveList *list;
+    PyBindGenLiveCounts counts;
+    PyObject *result, *entry;
+
+    result = PyDict_New();
+    if (result == NULL) {
+        return NULL;
+    }
+    for (list = _wrap_%(PREFIX)s__live_lists.first; list != NULL; list = list->next) {
+        memset(&counts, 0, sizeof(counts));
+        list->count(&counts);
+        entry = Py_BuildValue((char *) "{s:K,s:K,s:K,s:K,s:K,s:K,s:K}",
+                              "live", counts.live, "owned", counts.owned,
+                              "borrowed", counts.borrowed, "detached", counts.detached,
+                              "registered", counts.registered,
+                              "allocated", list->allocated, "freed", list->freed);
+        if (entry == NULL || PyDict_SetItemString(result, list->name, entry) == -1) {
+            Py_XDECREF(entry);
+            Py_DECREF(result);
+            return NULL;
+        }
+        Py_DECREF(entry);
+    }
+    return result;
+}
+''' % dict(PREFIX=self.prefix))
+
+    def _generate_lazy_attribute_lookup(self, code_sink):
+        """(internal) generate the module __getattr__ and __dir__ functions (PEP 562)"""
+        lazy_attrs = {}
+        for registration in self.get_root()._lazy_registrations:
+            if registration.module is not self:
+                continue
+            for name in registration.names:
+                lazy_attrs.setdefault(name, registration.function_name)
+        ## sorted for the binary search done by __getattr__
+        names = sorted(lazy_attrs, key=lambda name: name.encode('ascii'))
+        table_name = "_wrap_%s__lazy_attrs" % self.prefix
+
+        code_sink.writeln('#if PY_VERSION_HEX >= 0x03070000')
+        code_sink.writeln("static const PyBindGenLazyAttr %s[] = {" % table_name)
+        code_sink.indent()
+        for name in names:
+            code_sink.writeln('{"%s", %s},' % (name, lazy_attrs[name]))
+        code_sink.writeln("{NULL, NULL}")
+        code_sink.unindent()
+        code_sink.writeln("};")
+        code_sink.writeln('''
+static PyObject *
+_wrap_%(PREFIX)s__getattr__(PyObject *module, PyObject *name)
+{
+    const char *attr;
+    int low = 0, high = %(COUNT)i;
+    PyObject *value;
+
+    attr = PyUnicode_AsUTF8(name);
+    if (attr == NULL) {
+        return NULL;
+    }
+    while (low < high) {
+        int middle = (low + high) / 2;
+        int cmp = strcmp(attr, %(TABLE)s[middle].name);
+        if (cmp == 0) {
+            if (%(TABLE)s[middle].init() < 0) {
+                return NULL;
+            }
+            value = PyDict_GetItemWithError(PyModule_GetDict(module), name);
+            if (value != NULL) {
+                Py_INCREF(value);
+                return value;
+            }
+            if (PyErr_Occurred()) {
+                return NULL;
+            }
+            break;
+        }
+        if (cmp < 0) {
+            high = middle;
+        } else {
+            low = middle + 1;
+        }
+    }
+    PyErr_Format(PyExc_AttributeError, "module '%%s' has no attribute '%%U'",
+                 PyModule_GetName(module), name);
+    return NULL;
+}
+
+static int
+_wrap_%(PREFIX)s__set_all(PyObject *module)
+{
+    PyObject *dict = PyModule_GetDict(module);
+    PyObject *all;
+    PyObject *key, *value;
+    Py_ssize_t pos = 0;
+    const PyBindGenLazyAttr *attr;
+
+    /* 'from module import *' needs every public name, including the
+       lazily registered ones, which are missing from the dict */
+    all = PyList_New(0);
+    if (all == NULL) {
+        return -1;
+    }
+    while (PyDict_Next(dict, &pos, &key, &value)) {
+        if (PyUnicode_Check(key) && PyUnicode_GET_LENGTH(key) > 0
+            && PyUnicode_READ_CHAR(key, 0) != '_' && PyList_Append(all, key) < 0) {
+            Py_DECREF(all);
+            return -1;
+        }
+    }
+    for (attr = %(TABLE)s; attr->name != NULL; ++attr) {
+        PyObject *py_name;
+        if (attr->name[0] == '_' || PyDict_GetItemString(dict, attr->name) != NULL) {
+            continue;
+        }
+        py_name = PyUnicode_FromString(attr->name);
+        if (py_name == NULL || PyList_Append(all, py_name) < 0) {
+            Py_XDECREF(py_name);
+            Py_DECREF(all);
+            return -1;
+        }
+        Py_DECREF(py_name);
+    }
+    if (PyModule_AddObject(module, "__all__", all) < 0) {
+        Py_DECREF(all);
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *
+_wrap_%(PREFIX)s__dir__(PyObject *module, PyObject *PYBINDGEN_UNUSED(dummy))
+{
+    const PyBindGenLazyAttr *attr;
+    PyObject *names;
+    PyObject *retval;
+
+    names = PySet_New(PyModule_GetDict(module));
+    if (names == NULL) {
+        return NULL;
+    }
+    for (attr = %(TABLE)s; attr->name != NULL; ++attr) {
+        PyObject *py_name = PyUnicode_FromString(attr->name);
+        if (py_name == NULL || PySet_Add(names, py_name) < 0) {
+            Py_XDECREF(py_name);
+            Py_DECREF(names);
+            return NULL;
+        }
+        Py_DECREF(py_name);
+    }
+    retval = PySequence_List(names);
+    Py_DECREF(names);
+    return retval;
+}
+#endif
+''' % dict(PREFIX=self.prefix, TABLE=table_name, COUNT=len(names)))
 
+    def _generate_lazy_registrations(self, code_sink):
+        """(internal) generate the lazy registration functions of the whole module tree"""
+        assert self.parent is None
+        registrations = {}
+        for registration in self._lazy_registrations:
+            if registration.wrapper is not None:
+                registrations[id(registration.wrapper)] = registration
+        for registration in self._lazy_registrations:
+            outer_class = getattr(registration.wrapper, 'outer_class', None)
+            if outer_class is not None and id(outer_class) in registrations:
+                registrations[id(outer_class)].children.append(registration)
+
+        for registration in self._lazy_registrations:
+            registration.code_sink.writeln()
+            registration.generate(registrations)
+            registration.code_sink.writeln()
+
+        code_sink.writeln("int\n_wrap_%s__lazy_ready_type(PyTypeObject *type)" % self.prefix)
+        code_sink.writeln("{")
+        code_sink.indent()
+        code_sink.writeln("static const struct {\n"
+                          "    PyTypeObject *type;\n"
+                          "    int (*init)(void);\n"
+                          "} types[] = {")
+        code_sink.indent()
+        for registration in self._lazy_registrations:
+            for pytype in registration.pytypes:
+                code_sink.writeln("{%s, %s}," % (pytype, registration.function_name))
+        code_sink.writeln("{NULL, NULL}")
+        code_sink.unindent()
+        code_sink.writeln("};")
+        code_sink.writeln("int i;")
+        code_sink.writeln()
+        code_sink.writeln("for (i = 0; types[i].type != NULL; ++i) {")
+        code_sink.writeln("    if (types[i].type == type) {")
+        code_sink.writeln("        return types[i].init();")
+        code_sink.writeln("    }")
+        code_sink.writeln("}")
+        code_sink.writeln("return 0;")
+        code_sink.unindent()
+        code_sink.writeln("}")
+        code_sink.writeln()
 
     def __repr__(self):
         return "<pybindgen.module.Module %r>" % self.name
@@ -906,6 +2417,104 @@ class Module(ModuleBase):
         :param cpp_namespace: C++ namespace prefix associated with this module
         """
         super(Module, self).__init__(name, docstring=docstring, cpp_namespace=cpp_namespace)
+        self.lazy_init = False
+        self._lazy_registrations = []
+        self.c_api = None
+        self.multi_phase_init = False
+        self.isolated = False
+        self._state_members = [] # (ctype, name, dereference)
+
+    def set_lazy_init(self, flag=True):
+        """
+        Enables or disables lazy initialization of the module.
+
+        With lazy initialization, classes, containers, enums and
+        typedef aliases are not registered by the module init
+        function; instead, each one is readied and added to its module
+        the first time it is accessed, through a module level
+        __getattr__ (PEP 562).  Base and outer classes are registered
+        on demand, and so is the type of any wrapper object created
+        from C++.  This makes importing very large binding modules
+        much faster.  Submodules and exceptions are still created at
+        import time.  Python versions without PEP 562 (older than 3.7)
+        register everything at import time, as usual.  The on demand
+        registration is not thread safe, so lazy initialization
+        cannot be combined with settings.free_threading.
+
+        :param flag: True to enable lazy initialization
+        """
+        self.lazy_init = flag
+
+    def set_multi_phase_init(self, flag=True, isolated=False):
+        """
+        Enables or disables multi-phase module initialization (PEP
+        489) on Python 3.5 and later.
+
+        The init function then only returns the module definition,
+        and the module contents are set up by an exec slot, which the
+        import machinery runs on a module object it creates itself.
+        By default the wrapped types are static and shared by all
+        interpreters, so on Python 3.12 and later the module declares
+        that it does not support being imported in subinterpreters.
+
+        With isolated=True, each interpreter gets its own heap types
+        (created from the static type structures, which then only
+        serve as templates), exception types, type maps and wrapper
+        registries.  They are kept in a module state structure,
+        stored in the interpreter dictionary and reached through
+        macros named after the former globals, so the generated
+        wrappers are unchanged, if a little slower.  The module then
+        supports interpreters with their own GIL (PEP 684).  Isolated
+        modules need Python 3.12 and C++11, and cannot be combined
+        with settings.wrapper_profiling or settings.wrapper_accounting,
+        whose statistics are process wide.  Objects allocated by
+        L{PooledAllocationPolicy} pools are shared by all interpreters,
+        under a lock.  Virtual methods overridden in Python can be
+        called from any thread attached to the interpreter that
+        created the wrapper; threads without a Python thread state
+        are attached to the main interpreter by PyGILState_Ensure, so
+        in subinterpreters such calls must come from threads created
+        there.
+
+        Multi-phase initialization cannot be combined with lazy
+        initialization (see L{set_lazy_init}).
+
+        :param flag: True to enable multi-phase initialization
+        :param isolated: True to keep the module state per interpreter
+        """
+        self.multi_phase_init = flag
+        self.isolated = flag and isolated
+
+    def set_c_api_export(self, flag=True):
+        """
+        Enables or disables exporting a C API through a capsule, so
+        that other extension modules can wrap and unwrap objects of
+        this module, or call its function wrappers, without going
+        through Python.  See L{pybindgen.capi} for the contents of the
+        API, and L{generate_c_api_header} for the header other
+        modules need to use it.
+
+        :param flag: True to export the C API
+        """
+        if flag:
+            self.c_api = CApiExport(self)
+        else:
+            self.c_api = None
+
+    def generate_c_api_header(self, out, module_name=None):
+        """
+        Generates the header that other extension modules include to
+        import the C API of this module (see L{set_c_api_export}).
+
+        :type out: a file object or L{CodeSink}
+        :param module_name: python name of the module, if the
+           module_file_base_name parameter was given to L{generate}
+        """
+        if self.c_api is None:
+            raise ValueError("C API export is not enabled for module %s" % self.name)
+        if hasattr(out, 'write'):
+            out = FileCodeSink(out)
+        self.c_api.generate_header(out, module_name)
 
     def generate(self, out, module_file_base_name=None):
         """Generates the module
@@ -922,10 +2531,20 @@ class Module(ModuleBase):
         if isinstance(out, CodeSink):
             sink_manager = _MonolithicSinkManager(out)
         elif isinstance(out, MultiSectionFactory):
+            out.assign_sections(self)
             sink_manager = _MultiSectionSinkManager(out)
         else:
             raise TypeError
-        self.do_generate(sink_manager, module_file_base_name)
+        modules = [self]
+        for module in modules:
+            modules.extend(module.submodules)
+        classes = [class_ for module in modules for class_ in module.classes]
+        if settings.wrapper_accounting:
+            cache_wrapper_accounting(classes)
+        try:
+            self.do_generate(sink_manager, module_file_base_name)
+        finally:
+            cache_wrapper_accounting(classes, enabled=False)
         sink_manager.close()
 
     def get_python_to_c_type_converter_function_name(self, value_type):
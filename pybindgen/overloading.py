@@ -136,6 +136,12 @@ class OverloadedWrapper(object):
         """
         self.all_wrappers = list(self.wrappers)
 
+    def _release_code_generation_state(self, wrapper):
+        ## the wrapper code is written out; from now on only its
+        ## PyMethodDef entry is needed
+        if isinstance(wrapper, ForwardWrapperBase):
+            wrapper.release_code_generation_state()
+
     def generate(self, code_sink):
         """
         Generate all the wrappers plus the 'aggregator' wrapper to a code sink.
@@ -157,6 +163,7 @@ class OverloadedWrapper(object):
             assert self.wrapper_actual_name is not None
             self.wrapper_return = self.all_wrappers[0].wrapper_return
             self.wrapper_args = self.all_wrappers[0].wrapper_args
+            self._release_code_generation_state(self.all_wrappers[0])
         else:
             ## multiple overloaded wrappers case..
             flags = self.all_wrappers[0].get_py_method_def_flags()
@@ -178,6 +185,7 @@ class OverloadedWrapper(object):
 %s""" % (self.ERROR_RETURN,)
                 wrapper_name = "%s__%i" % (self.wrapper_actual_name, number)
                 wrapper.set_parse_error_return(error_return)
+                wrapper.overload_index = number
                 code_sink.writeln()
 
                 # wrapper.generate(code_sink, wrapper_name,
@@ -191,6 +199,7 @@ class OverloadedWrapper(object):
                     continue
 
                 delegate_wrappers.append(wrapper.wrapper_actual_name)
+                self._release_code_generation_state(wrapper)
 
             ## if all wrappers did not generate, then the overload
             ## aggregator wrapper should not be generated either..
@@ -554,3 +554,30 @@ static PyObject*
 
         code_sink.writeln(self.TEMPLATE % slots)
 
+
+
+class PyMappingMethods(object):
+    TEMPLATE = '''
+static PyMappingMethods %(variable)s = {
+    (lenfunc) %(mp_length)s,
+    (binaryfunc) %(mp_subscript)s,
+    (objobjargproc) %(mp_ass_subscript)s,
+};
+
+'''
+
+    def __init__(self):
+        self.slots = {}
+
+    def generate(self, code_sink):
+        """
+        Generates the structure.  All slots are optional except 'variable'.
+        """
+
+        slots = dict(self.slots)
+
+        slots.setdefault('mp_length', 'NULL')
+        slots.setdefault('mp_subscript', 'NULL')
+        slots.setdefault('mp_ass_subscript', 'NULL')
+
+        code_sink.writeln(self.TEMPLATE % slots)
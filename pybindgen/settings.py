@@ -32,6 +32,63 @@ threads around the funcion call, i.e. allows other Python threads to
 run during the call.
 """
 
+free_threading = False
+"""
+Generate code that is safe to run without the GIL, on free-threaded
+(PEP 703) builds of Python 3.14 and later.  When True, the wrapper
+registry (see :attr:`wrapper_registry`) is split into shards, each one
+protected by its own lock; the typeid maps used for automatic type
+narrowing are protected by a lock; the custodian/ward references are
+updated inside a critical section of the custodian; and the module
+declares that it does not need the GIL.  On builds with the GIL, the
+locks and critical sections compile to nothing.  All modules sharing
+wrapper registries or typeid maps must use the same value.
+"""
+
+wrapper_profiling = False
+"""
+Generate code to collect per wrapper call statistics.  When True,
+every function, method, constructor, attribute getter and setter
+wrapper, and every virtual method proxy, is instrumented to count its
+calls, the calls that failed before reaching C++ (argument conversion
+errors, or overloads that did not match), and the time spent
+converting arguments, in the C++ (or python) call, and converting the
+return value, plus a histogram of call durations in power of two
+nanosecond buckets.  The instrumentation compiles to nothing unless
+PYBINDGEN_PROFILE is defined when compiling the module, in which case
+the root module gets two extra functions: _wrapper_stats(), returning
+a dict of statistics keyed by python name, and _reset_wrapper_stats().
+The counters are not synchronized, so this cannot be combined with
+free_threading.
+"""
+
+wrapper_accounting = False
+"""
+Generate code to keep track of the live python wrappers of each
+class.  When True, every wrapper of a class defined by the module is
+linked into a per class list while it is alive, and the root module
+gets an extra function, _wrapper_accounting(), returning a dict keyed
+by python class name.  Each entry counts the live wrappers, how many
+of them own their C++ object, how many only borrow it, how many are
+detached from it (their ownership was transferred, or they were
+cleared), how many are held in the wrapper registry, and the total
+number of wrappers allocated and freed so far.  Classes with a custom
+tp_new or tp_dealloc slot are not accounted, and neither are the other
+classes of their hierarchy; a class only appears once one of its
+wrappers was allocated.
+"""
+
+wrapper_accounting_tracemalloc_domain = None
+"""
+If not None, an integer tracemalloc domain.  With wrapper_accounting,
+the accounted wrappers are also traced in that domain, so that
+tracemalloc snapshots filtered with
+tracemalloc.DomainFilter(True, domain) show where the live
+wrappers were allocated.  It can also be given when compiling the
+module, by defining PYBINDGEN_TRACEMALLOC_DOMAIN.  Requires python
+3.7 or later; it is ignored with older versions.
+"""
+
 
 error_handler = None
 """
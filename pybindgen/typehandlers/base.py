@@ -89,6 +89,9 @@ class CodeBlock(object):
     '''An intelligent code block that keeps track of cleanup actions.
     This object is to be used by TypeHandlers when generating code.'''
 
+    __slots__ = ('sink', 'predecessor', '_cleanup_actions', '_last_cleanup_position',
+                 'error_return', 'declarations')
+
     class CleanupHandle(object):
         """Handle for some cleanup code"""
         __slots__ = ['code_block', 'position']
@@ -244,6 +247,8 @@ class CodeBlock(object):
 class ParseTupleParameters(object):
     "Object to keep track of PyArg_ParseTuple (or similar) parameters"
 
+    __slots__ = ('_parse_tuple_items',)
+
     def __init__(self):
         """
         >>> tuple_params = ParseTupleParameters()
@@ -351,6 +356,8 @@ class ParseTupleParameters(object):
 class BuildValueParameters(object):
     "Object to keep track of Py_BuildValue (or similar) parameters"
 
+    __slots__ = ('_build_value_items',)
+
     def __init__(self):
         """
         >>> bld = BuildValueParameters()
@@ -420,6 +427,8 @@ class BuildValueParameters(object):
 class DeclarationsScope(object):
     """Manages variable declarations in a given scope."""
 
+    __slots__ = ('_declarations', 'declared_variables')
+
     def __init__(self, parent_scope=None):
         """
         Constructor
@@ -511,6 +520,25 @@ class DeclarationsScope(object):
 
 
 
+def write_profile_start(wrapper, code_block, name):
+    """
+    Instruments a wrapper for settings.wrapper_profiling: declares
+    its call statistics, starts timing the call in code_block, and
+    records the call in the cleanup code.  The wrapper must also write
+    PYBINDGEN_PROFILE_CALL() and PYBINDGEN_PROFILE_RETURN() around the
+    call it wraps.
+
+    :param wrapper: a forward or reverse wrapper
+    :param code_block: the first code block of the wrapper
+    :param name: name under which the calls are reported
+    """
+    wrapper.declarations.reserve_variable('pybindgen_profile_stats')
+    wrapper.declarations.reserve_variable('pybindgen_profile_timer')
+    wrapper.declarations.get_code_sink().writeln('PYBINDGEN_PROFILE_DECLARE("%s")' % name)
+    code_block.write_code('PYBINDGEN_PROFILE_START();')
+    code_block.add_cleanup_code('PYBINDGEN_PROFILE_RECORD();')
+
+
 class ReverseWrapperBase(object):
     """Generic base for all reverse wrapper generators.
 
@@ -603,6 +631,14 @@ class ReverseWrapperBase(object):
         """
         raise NotImplementedError
 
+    def get_profile_name(self):
+        """
+        Returns the name under which calls of this wrapper are reported
+        when settings.wrapper_profiling is enabled, or None if the
+        wrapper is not to be profiled (the default).
+        """
+        return None
+
     def generate(self, code_sink, wrapper_name, decl_modifiers=('static',),
                  decl_post_modifiers=()):
         """Generate the wrapper
@@ -625,13 +661,22 @@ class ReverseWrapperBase(object):
                 and not self.return_value.NO_RETVAL_DECL:
             self.declarations.declare_variable(self.return_value.ctype, 'retval')
 
+        from pybindgen import settings
+        profile_name = settings.wrapper_profiling and self.get_profile_name()
+        if profile_name:
+            write_profile_start(self, self.before_call, profile_name)
+
         ## convert the input parameters
         for param in self.parameters:
             param.convert_c_to_python(self)
 
         ## generate_python_call should include something like
         ## self.after_call.write_error_check('py_retval == NULL')
+        if profile_name:
+            self.before_call.write_code('PYBINDGEN_PROFILE_CALL();')
         self.generate_python_call()
+        if profile_name:
+            self.before_call.write_code('PYBINDGEN_PROFILE_RETURN();')
 
         ## convert the return value(s)
         self.return_value.convert_python_to_c(self)
@@ -762,14 +807,8 @@ class ForwardWrapperBase(object):
 
         self.return_value = return_value
         self.parameters = parameters
-        self.declarations = DeclarationsScope()
-        self.before_parse = CodeBlock(parse_error_return, self.declarations)
-        self.before_call = CodeBlock(parse_error_return, self.declarations,
-                                     predecessor=self.before_parse)
-        self.after_call = CodeBlock(error_return, self.declarations,
-                                    predecessor=self.before_call)
-        self.build_params = BuildValueParameters()
-        self.parse_params = ParseTupleParameters()
+        self._parse_error_return = parse_error_return
+        self._error_return = error_return
         self.call_params = []
         self.force_parse = force_parse
         self.meth_flags = []
@@ -784,8 +823,34 @@ class ForwardWrapperBase(object):
         self.wrapper_return = None # C type expression for the wrapper return
         self.wrapper_args = None # list of arguments to the wrapper function
 
+        self._create_code_generation_state()
+
+    def _create_code_generation_state(self):
+        self._declarations = DeclarationsScope()
+        self._before_parse = CodeBlock(self._parse_error_return, self._declarations)
+        self._before_call = CodeBlock(self._parse_error_return, self._declarations,
+                                      predecessor=self._before_parse)
+        self._after_call = CodeBlock(self._error_return, self._declarations,
+                                     predecessor=self._before_call)
+        self._build_params = BuildValueParameters()
+        self._parse_params = ParseTupleParameters()
         self._init_code_generation_state()
 
+    def _get_code_generation_state(name):
+        def getter(self):
+            if self._declarations is None:
+                ## released, see release_code_generation_state
+                self._create_code_generation_state()
+            return getattr(self, name)
+        return property(getter)
+    declarations = _get_code_generation_state('_declarations')
+    before_parse = _get_code_generation_state('_before_parse')
+    before_call = _get_code_generation_state('_before_call')
+    after_call = _get_code_generation_state('_after_call')
+    build_params = _get_code_generation_state('_build_params')
+    parse_params = _get_code_generation_state('_parse_params')
+    del _get_code_generation_state
+
     def _init_code_generation_state(self):
         if self.return_value is not None or self.HAVE_RETURN_VALUE:
             self.declarations.declare_variable('PyObject*', 'py_retval')
@@ -799,18 +864,28 @@ class ForwardWrapperBase(object):
         self.declarations.reserve_variable('kwargs')
 
     def reset_code_generation_state(self):
-        self.declarations.clear()
-        self.before_parse.clear()
-        self.before_call.clear()
-        self.after_call.clear()
-        self.build_params.clear()
-        self.parse_params.clear()
+        self._create_code_generation_state()
         self.call_params = []
         self.meth_flags = []
 
-        self._init_code_generation_state()
+    def release_code_generation_state(self):
+        """
+        Frees the code blocks, declarations and parameters of a
+        wrapper whose code has been written out.  The PyMethodDef flags
+        and the wrapper prototype are kept; the code generation state
+        is created again, as after reset_code_generation_state(), if
+        the wrapper is generated again.
+        """
+        self._declarations = None
+        self._before_parse = None
+        self._before_call = None
+        self._after_call = None
+        self._build_params = None
+        self._parse_params = None
+        self.call_params = []
 
     def set_parse_error_return(self, parse_error_return):
+        self._parse_error_return = parse_error_return
         self.before_parse.error_return = parse_error_return
         self.before_call.error_return = parse_error_return
 
@@ -840,6 +915,15 @@ class ForwardWrapperBase(object):
         """
         pass
 
+    def get_profile_name(self):
+        """
+        Returns the name under which calls of this wrapper are reported
+        when settings.wrapper_profiling is enabled.  The default is the
+        name of the C wrapper function; subclasses return the name
+        seen from Python.
+        """
+        return self.wrapper_actual_name
+
     def write_open_wrapper(self, code_sink, add_static=False):
         assert self.wrapper_actual_name is not None
         assert self.wrapper_return is not None
@@ -862,6 +946,13 @@ class ForwardWrapperBase(object):
         code_sink -- a CodeSink object that will receive the code
         """
 
+        from pybindgen import settings
+        profile_name = settings.wrapper_profiling and self.get_profile_name()
+        if profile_name:
+            if self.overload_index is not None:
+                profile_name = "%s[%i]" % (profile_name, self.overload_index)
+            write_profile_start(self, self.before_parse, profile_name)
+
         if self.unblock_threads:
             py_thread_state = self.declarations.declare_variable("PyThreadState*", "py_thread_state", "NULL")
             self.after_call.write_code(
@@ -892,7 +983,11 @@ class ForwardWrapperBase(object):
                 "     %s = PyEval_SaveThread();\n"
                 % (py_thread_state, ))
 
+        if profile_name:
+            self.before_call.write_code('PYBINDGEN_PROFILE_CALL();')
         self.generate_call(*gen_call_params)
+        if profile_name:
+            self.before_call.write_code('PYBINDGEN_PROFILE_RETURN();')
 
         params = self.parse_params.get_parameters()
         assert params[0][0] == '"'
@@ -1060,6 +1155,9 @@ class NullTypeTransformation(object):
         "identity transformation"
         return value
 
+## NullTypeTransformation has no state, all type handlers share this one
+_null_type_transformation = NullTypeTransformation()
+
 class TypeHandler(object):
     SUPPORTS_TRANSFORMATIONS = False
 
@@ -1087,7 +1185,7 @@ class TypeHandler(object):
                 raise TypeError
             self.ctype = str(self.type_traits.ctype)
         self.untransformed_ctype = self.ctype
-        self.transformation = NullTypeTransformation()
+        self.transformation = _null_type_transformation
 
     def _get_ctype_no_const(self):
         return str(self.type_traits.ctype_no_const)
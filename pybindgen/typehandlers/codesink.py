@@ -18,6 +18,10 @@ if DEBUG:
 
 class CodeSink(object):
     """Abstract base class for code sinks"""
+    ## the __dict__, for other attributes given to code sinks (see
+    ## utils.write_preamble), is only created when needed
+    __slots__ = ('indent_level', 'indent_stack', '_last_unindent_stack', '__dict__')
+
     def __init__(self):
         r'''Constructor
 
@@ -100,6 +104,8 @@ class FileCodeSink(CodeSink):
 class MemoryCodeSink(CodeSink):
     """A code sink that keeps the code in memory,
     and can later flush the code to another code sink"""
+    __slots__ = ('lines',)
+
     def __init__(self):
         "Constructor"
         CodeSink.__init__(self)
@@ -130,6 +136,7 @@ class MemoryCodeSink(CodeSink):
 class NullCodeSink(CodeSink):
     """A code sink that discards all content.  Useful to 'test' if code
     generation would work without actually generating anything."""
+    __slots__ = ()
 
     def __init__(self):
         "Constructor"
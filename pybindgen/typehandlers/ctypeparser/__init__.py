@@ -164,7 +164,7 @@ def parse_type(type_string):
     :param type_string: C type expression
     :returns: a L{CType} object representing the type
     """
-    tokens = list(tokenizer.GetTokens(type_string + '\n'))
+    tokens = tokenizer.GetTypeTokens(type_string)
     ctype, last_token = _parse_type_recursive(tokens)
     assert last_token is None
     return ctype
@@ -302,6 +302,9 @@ class TypeTraits(object):
 
     """
 
+    __slots__ = ('ctype', 'ctype_no_modifiers', 'ctype_no_const', 'ctype_no_const_no_ref',
+                 'type_is_const', 'type_is_reference', 'type_is_pointer', 'target_is_const', 'target')
+
     def __init__(self, ctype):
         self.ctype = parse_type(ctype)
         self.ctype_no_modifiers = self.ctype.clone()
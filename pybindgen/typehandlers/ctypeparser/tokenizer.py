@@ -23,6 +23,7 @@
 __author__ = 'nnorwitz@google.com (Neal Norwitz); minor changes by Gustavo J. A. M. Carneiro (gjcarneiro@gmail.com)'
 
 
+import re
 import sys
 
 #from cpp import utils
@@ -68,6 +69,8 @@ class Token(object):
     end contains the index of the last char of the token in the source
     """
 
+    __slots__ = ('token_type', 'name', 'start', 'end', 'whence')
+
     def __init__(self, token_type, name, start, end):
         self.token_type = token_type
         self.name = name
@@ -279,3 +282,43 @@ def GetTokens(source):
             return
         yield Token(token_type, source[start:i], start, i)
 
+
+
+# Tokens of type expressions, as found by GetTokens; the group names
+# are the token types.
+_TYPE_TOKEN_RX = re.compile(r"""
+    \s+
+  | (?P<NAME> (?: :: | [A-Za-z_$] ) (?: :: | [A-Za-z0-9_$] )* )
+  | (?P<CONSTANT> (?: 0[xX][0-9a-fA-F]* | [0-9][0-9eE+\-.]* )
+                  (?: [uU][lL][lL] | [lL][lL] | [uU][lL] | [lL] | [fF] | [uU] )?
+                | \.[0-9][0-9eE+\-]* [lLfF]? )
+  | (?P<SYNTAX> -> | (?P<op>[:+\-<>&|*=]) (?: (?P=op) | = )? | [()\[\]{}~!?^%;.,] | /(?![/*]) )
+""", re.VERBOSE)
+
+# What only GetTokens handles: comments, string and character
+# constants, pre-processor directives and line continuations.
+_NOT_TYPE_RX = re.compile(r"""['"#\\]|/[/*]""")
+
+
+def GetTypeTokens(source):
+    """
+    Returns the same Tokens as GetTokens, but is much faster on the
+    short strings of C++ type expressions, that need only names,
+    numbers and operators.  Other strings are passed on to GetTokens.
+
+    :param source: string of a C++ type expression.
+    :returns: a list of L{Token}s.
+    """
+    if _NOT_TYPE_RX.search(source) is None:
+        tokens = []
+        pos = 0
+        for m in _TYPE_TOKEN_RX.finditer(source):
+            start, pos2 = m.span()
+            if start != pos:
+                break # unexpected character
+            pos = pos2
+            if m.lastgroup is not None:
+                tokens.append(Token(m.lastgroup, m.group(), start, pos))
+        if pos == len(source):
+            return tokens
+    return list(GetTokens(source + '\n'))
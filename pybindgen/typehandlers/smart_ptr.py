@@ -182,8 +182,9 @@ class CppClassSharedPtrParameter(CppClassParameterBase):
 
             wrapper.before_call.write_error_check(
 
-                "%s && ((PyObject *) %s != Py_None) && !PyObject_IsInstance((PyObject *) %s, (PyObject *) &%s)"
-                % (self.py_name, self.py_name, self.py_name, self.cpp_class.pytypestruct),
+                "%s && ((PyObject *) %s != Py_None) && !%s"
+                % (self.py_name, self.py_name,
+                   self.cpp_class.module.get_instance_check(self.py_name, '&' + self.cpp_class.pytypestruct)),
 
                 'PyErr_SetString(PyExc_TypeError, "Parameter %i must be of type %s");' % (num, self.cpp_class.name))
 
@@ -1,7 +1,36 @@
 # docstrings not neede here (the type handler interfaces are fully
 # documented in base.py) pylint: disable-msg=C0111
 
-from .base import ReturnValue, PointerReturnValue, Parameter, PointerParameter, ReverseWrapperBase, ForwardWrapperBase
+from .base import ReturnValue, PointerReturnValue, Parameter, PointerParameter, ReverseWrapperBase, ForwardWrapperBase, \
+    NotSupportedError, TypeConfigurationError
+
+
+def _parse_buffer(wrapper, name, keyword, optional=False):
+    """
+    Parses a str or bytes-like (bytes, bytearray, memoryview)
+    argument into a Py_buffer, without copying or re-encoding it.
+    The buffer is released when the wrapper returns.  Returns the
+    name of the Py_buffer variable.
+    """
+    buf = wrapper.declarations.declare_variable("Py_buffer", name, "{NULL}")
+    wrapper.parse_params.add_parameter('s*', ['&'+buf], keyword, optional=optional)
+    wrapper.before_parse.add_cleanup_code("PyBuffer_Release(&%s);" % buf)
+    return buf
+
+
+def _build_string(wrapper, value, as_bytes, prepend=False):
+    """
+    Converts the C++ string (or string_view) expression value to
+    python, either as str, or as bytes if as_bytes is true.
+    """
+    if as_bytes:
+        wrapper.build_params.add_parameter(
+            'N', ["PyBytes_FromStringAndSize((%s).data(), (%s).size())" % (value, value)],
+            prepend=prepend)
+    else:
+        wrapper.build_params.add_parameter(
+            's#', ['(%s).data()' % value, '(%s).size()' % value],
+            prepend=prepend)
 
 
 class CStringParam(PointerParameter):
@@ -12,21 +41,41 @@ class CStringParam(PointerParameter):
 
     DIRECTIONS = [Parameter.DIRECTION_IN]
     CTYPES = ['char*']
-    
+
+    def __init__(self, ctype, name, direction=Parameter.DIRECTION_IN, is_const=False, default_value=None,
+                 transfer_ownership=False, with_length=False):
+        """
+        :param with_length: if true, the C function takes a (data,
+            length) pair of arguments instead of a NUL terminated
+            string, and any str or bytes-like object is passed as
+            data and length without copying
+        """
+        super(CStringParam, self).__init__(ctype, name, direction, is_const, default_value, transfer_ownership)
+        self.with_length = with_length
+
     def convert_c_to_python(self, wrapper):
         assert isinstance(wrapper, ReverseWrapperBase)
+        if self.with_length:
+            raise NotSupportedError("with_length not supported in reverse wrappers")
         wrapper.build_params.add_parameter('s', [self.value])
 
     def convert_python_to_c(self, wrapper):
         assert isinstance(wrapper, ForwardWrapperBase)
-        if self.default_value is None:
+        if self.with_length:
+            if self.default_value is not None:
+                raise NotSupportedError("with_length does not support default values")
+            buf = _parse_buffer(wrapper, self.name, self.value)
+            wrapper.call_params.append('(%s) %s.buf' % (self.ctype_no_const, buf))
+            wrapper.call_params.append('%s.len' % buf)
+        elif self.default_value is None:
             name = wrapper.declarations.declare_variable(self.ctype_no_const, self.name)
             wrapper.parse_params.add_parameter('s', ['&'+name], self.value)
+            wrapper.call_params.append(name)
         else:
             name = wrapper.declarations.declare_variable(self.ctype_no_const,
                                                          self.name, self.default_value)
             wrapper.parse_params.add_parameter('s', ['&'+name], self.value, optional=True)
-        wrapper.call_params.append(name)
+            wrapper.call_params.append(name)
 
 
 class CharParam(Parameter):
@@ -49,30 +98,28 @@ class StdStringParam(Parameter):
 
     DIRECTIONS = [Parameter.DIRECTION_IN]
     CTYPES = ['std::string']
-    
+
+    def __init__(self, ctype, name, direction=Parameter.DIRECTION_IN, is_const=False, default_value=None,
+                 as_bytes=False):
+        """
+        :param as_bytes: if true, the string is given to python as bytes instead of str
+        """
+        super(StdStringParam, self).__init__(ctype, name, direction, is_const, default_value)
+        self.as_bytes = as_bytes
+
     def convert_c_to_python(self, wrapper):
         assert isinstance(wrapper, ReverseWrapperBase)
-        ptr = wrapper.declarations.declare_variable("const char *", self.name + "_ptr")
-        len_ = wrapper.declarations.declare_variable("Py_ssize_t", self.name + "_len")
-        wrapper.before_call.write_code(
-            "%s = (%s).c_str();" % (ptr, self.value))
-        wrapper.before_call.write_code(
-            "%s = (%s).size();" % (len_, self.value))
-        wrapper.build_params.add_parameter('s#', [ptr, len_])
+        _build_string(wrapper, self.value, self.as_bytes)
 
     def convert_python_to_c(self, wrapper):
         assert isinstance(wrapper, ForwardWrapperBase)
         if self.default_value is None:
-            name = wrapper.declarations.declare_variable("const char *", self.name)
-            name_len = wrapper.declarations.declare_variable("Py_ssize_t", self.name+'_len')
-            wrapper.parse_params.add_parameter('s#', ['&'+name, '&'+name_len], self.value)
-            wrapper.call_params.append('std::string(%s, %s)' % (name, name_len))
+            buf = _parse_buffer(wrapper, self.name, self.value)
+            wrapper.call_params.append('std::string((const char *) %s.buf, %s.len)' % (buf, buf))
         else:
-            name = wrapper.declarations.declare_variable("const char *", self.name, 'NULL')
-            name_len = wrapper.declarations.declare_variable("Py_ssize_t", self.name+'_len')
-            wrapper.parse_params.add_parameter('s#', ['&'+name, '&'+name_len], self.value, optional=True)
-            wrapper.call_params.append('(%s ? std::string(%s, %s) : %s)'
-                                       % (name, name, name_len, self.default_value))
+            buf = _parse_buffer(wrapper, self.name, self.value, optional=True)
+            wrapper.call_params.append('(%s.buf ? std::string((const char *) %s.buf, %s.len) : %s)'
+                                       % (buf, buf, buf, self.default_value))
 
 
 class StdStringRefParam(Parameter):
@@ -81,42 +128,48 @@ class StdStringRefParam(Parameter):
                   Parameter.DIRECTION_OUT,
                   Parameter.DIRECTION_IN|Parameter.DIRECTION_OUT]
     CTYPES = ['std::string&']
-    
+
+    def __init__(self, ctype, name, direction=Parameter.DIRECTION_IN, is_const=False, default_value=None,
+                 as_bytes=False):
+        """
+        :param as_bytes: if true, the string is given to python as bytes instead of str
+        """
+        super(StdStringRefParam, self).__init__(ctype, name, direction, is_const, default_value)
+        self.as_bytes = as_bytes
+
     def convert_c_to_python(self, wrapper):
         assert isinstance(wrapper, ReverseWrapperBase)
 
-        ptr = None
         if self.direction & Parameter.DIRECTION_IN:
-            ptr = wrapper.declarations.declare_variable("const char *", self.name + "_ptr")
-            len_ = wrapper.declarations.declare_variable("Py_ssize_t", self.name + "_len")
-            wrapper.before_call.write_code(
-                "%s = (%s).c_str();" % (ptr, self.value))
-            wrapper.before_call.write_code(
-                "%s = (%s).size();" % (len_, self.value))
-            wrapper.build_params.add_parameter('s#', [ptr, len_])
+            _build_string(wrapper, self.value, self.as_bytes)
 
         if self.direction & Parameter.DIRECTION_OUT:
-            if ptr is None:
-                ptr = wrapper.declarations.declare_variable("const char *", self.name + "_ptr")
-                len_ = wrapper.declarations.declare_variable("Py_ssize_t", self.name + "_len")
+            ptr = wrapper.declarations.declare_variable("const char *", self.name + "_ptr")
+            len_ = wrapper.declarations.declare_variable("Py_ssize_t", self.name + "_len")
             wrapper.parse_params.add_parameter("s#", ['&'+ptr, '&'+len_], self.value)
             wrapper.after_call.write_code(
                 "%s = std::string(%s, %s);" % (self.value, ptr, len_))
 
     def convert_python_to_c(self, wrapper):
         assert isinstance(wrapper, ForwardWrapperBase)
-        name = wrapper.declarations.declare_variable("const char *", self.name)
-        name_len = wrapper.declarations.declare_variable("Py_ssize_t", self.name+'_len')
+
+        if self.direction == Parameter.DIRECTION_IN and self.type_traits.target_is_const:
+            ## const std::string&: bind the reference directly to a
+            ## string built from the buffer, no named temporary needed
+            buf = _parse_buffer(wrapper, self.name, self.value)
+            wrapper.call_params.append('std::string((const char *) %s.buf, %s.len)' % (buf, buf))
+            return
+
         name_std = wrapper.declarations.declare_variable("std::string", self.name + '_std')
         wrapper.call_params.append(name_std)
 
         if self.direction & Parameter.DIRECTION_IN:
-            wrapper.parse_params.add_parameter('s#', ['&'+name, '&'+name_len], self.value)
-            wrapper.before_call.write_code('%s = std::string(%s, %s);' %
-                                           (name_std, name, name_len))
+            buf = _parse_buffer(wrapper, self.name, self.value)
+            wrapper.before_call.write_code('%s.assign((const char *) %s.buf, %s.len);' %
+                                           (name_std, buf, buf))
 
         if self.direction & Parameter.DIRECTION_OUT:
-            wrapper.build_params.add_parameter("s#", ['('+name_std+').c_str()', '('+name_std+').size()'])
+            _build_string(wrapper, name_std, self.as_bytes)
 
 
 class StdStringPtrParam(PointerParameter):
@@ -125,23 +178,24 @@ class StdStringPtrParam(PointerParameter):
                   Parameter.DIRECTION_OUT,
                   Parameter.DIRECTION_IN|Parameter.DIRECTION_OUT]
     CTYPES = ['std::string*']
-    
+
+    def __init__(self, ctype, name, direction=Parameter.DIRECTION_IN, is_const=False, default_value=None,
+                 transfer_ownership=False, as_bytes=False):
+        """
+        :param as_bytes: if true, the string is given to python as bytes instead of str
+        """
+        super(StdStringPtrParam, self).__init__(ctype, name, direction, is_const, default_value,
+                                                transfer_ownership)
+        self.as_bytes = as_bytes
+
     def convert_c_to_python(self, wrapper):
         assert isinstance(wrapper, ReverseWrapperBase)
-        ptr = None
         if self.direction & Parameter.DIRECTION_IN:
-            ptr = wrapper.declarations.declare_variable("const char *", self.name + "_ptr")
-            len_ = wrapper.declarations.declare_variable("Py_ssize_t", self.name + "_len")
-            wrapper.before_call.write_code(
-                "%s = %s->c_str();" % (ptr, self.value))
-            wrapper.before_call.write_code(
-                "%s = %s->size();" % (len_, self.value))
-            wrapper.build_params.add_parameter('s#', [ptr, len_])
+            _build_string(wrapper, '*' + self.value, self.as_bytes)
 
         if self.direction & Parameter.DIRECTION_OUT:
-            if ptr is None:
-                ptr = wrapper.declarations.declare_variable("const char *", self.name + "_ptr")
-                len_ = wrapper.declarations.declare_variable("Py_ssize_t", self.name + "_len")
+            ptr = wrapper.declarations.declare_variable("const char *", self.name + "_ptr")
+            len_ = wrapper.declarations.declare_variable("Py_ssize_t", self.name + "_len")
             wrapper.parse_params.add_parameter("s#", ['&'+ptr, '&'+len_], self.value)
             wrapper.after_call.write_code(
                 "*%s = std::string(%s, %s);" % (self.value, ptr, len_))
@@ -152,8 +206,6 @@ class StdStringPtrParam(PointerParameter):
     def convert_python_to_c(self, wrapper):
         assert isinstance(wrapper, ForwardWrapperBase)
         assert self.default_value is None, "default_value not implemented yet"
-        name = wrapper.declarations.declare_variable("const char *", self.name)
-        name_len = wrapper.declarations.declare_variable("Py_ssize_t", self.name+'_len')
         if self.transfer_ownership:
             name_std = wrapper.declarations.declare_variable("std::string*", self.name + '_std', 'new std::string')
             wrapper.call_params.append('%s' % name_std)
@@ -164,12 +216,48 @@ class StdStringPtrParam(PointerParameter):
             name_std_value = name_std
 
         if self.direction & Parameter.DIRECTION_IN:
-            wrapper.parse_params.add_parameter('s#', ['&'+name, '&'+name_len], self.value)
-            wrapper.before_call.write_code('%s = std::string(%s, %s);' %
-                                           (name_std_value, name, name_len))
+            buf = _parse_buffer(wrapper, self.name, self.value)
+            wrapper.before_call.write_code('(%s).assign((const char *) %s.buf, %s.len);' %
+                                           (name_std_value, buf, buf))
 
         if self.direction & Parameter.DIRECTION_OUT:
-            wrapper.build_params.add_parameter("s#", ['('+name_std_value+').c_str()', '('+name_std_value+').size()'])
+            _build_string(wrapper, name_std_value, self.as_bytes)
+
+
+class StdStringViewParam(Parameter):
+    """
+    std::string_view (C++17) parameter; the view points straight into
+    the memory of the python str or bytes-like object.
+    """
+
+    DIRECTIONS = [Parameter.DIRECTION_IN]
+    CTYPES = ['std::string_view', 'std::string_view&']
+
+    def __init__(self, ctype, name, direction=Parameter.DIRECTION_IN, is_const=False, default_value=None,
+                 as_bytes=False):
+        """
+        :param as_bytes: if true, the string is given to python as bytes instead of str
+        """
+        super(StdStringViewParam, self).__init__(ctype, name, direction, is_const, default_value)
+        ## the view is a temporary over the python object; it cannot
+        ## be bound to a non-const reference, nor written back
+        if self.type_traits.type_is_reference and not self.type_traits.target_is_const:
+            raise TypeConfigurationError("non-const std::string_view references are not supported")
+        self.as_bytes = as_bytes
+
+    def convert_c_to_python(self, wrapper):
+        assert isinstance(wrapper, ReverseWrapperBase)
+        _build_string(wrapper, self.value, self.as_bytes)
+
+    def convert_python_to_c(self, wrapper):
+        assert isinstance(wrapper, ForwardWrapperBase)
+        if self.default_value is None:
+            buf = _parse_buffer(wrapper, self.name, self.value)
+            wrapper.call_params.append('std::string_view((const char *) %s.buf, %s.len)' % (buf, buf))
+        else:
+            buf = _parse_buffer(wrapper, self.name, self.value, optional=True)
+            wrapper.call_params.append('(%s.buf ? std::string_view((const char *) %s.buf, %s.len) : %s)'
+                                       % (buf, buf, buf, self.default_value))
 
 
 class CharReturn(ReturnValue):
@@ -208,6 +296,13 @@ class StdStringReturn(ReturnValue):
 
     CTYPES = ['std::string']
 
+    def __init__(self, ctype, is_const=False, as_bytes=False):
+        """
+        :param as_bytes: if true, the string is returned to python as bytes instead of str
+        """
+        super(StdStringReturn, self).__init__(ctype, is_const)
+        self.as_bytes = as_bytes
+
     def get_c_error_return(self):
         return "return std::string();"
     
@@ -219,15 +314,20 @@ class StdStringReturn(ReturnValue):
             "%s = std::string(%s, %s);" % (self.value, ptr, len_))
 
     def convert_c_to_python(self, wrapper):
-        wrapper.build_params.add_parameter("s#", ['(%s).c_str()' % self.value,
-                                                  '(%s).size()' % self.value],
-                                           prepend=True)
+        _build_string(wrapper, self.value, self.as_bytes, prepend=True)
 
 
 class StdStringRefReturn(ReturnValue):
 
     CTYPES = ['std::string &']
 
+    def __init__(self, ctype, is_const=False, as_bytes=False):
+        """
+        :param as_bytes: if true, the string is returned to python as bytes instead of str
+        """
+        super(StdStringRefReturn, self).__init__(ctype, is_const)
+        self.as_bytes = as_bytes
+
     # Implementing reverse wrapper with reference types is not impossible but really hard
     def get_c_error_return(self):
         raise NotImplementedError
@@ -235,9 +335,28 @@ class StdStringRefReturn(ReturnValue):
         raise NotImplementedError
 
     def convert_c_to_python(self, wrapper):
-        wrapper.build_params.add_parameter("s#", ['(%s).c_str()' % self.value,
-                                                  '(%s).size()' % self.value],
-                                           prepend=True)
+        _build_string(wrapper, self.value, self.as_bytes, prepend=True)
+
+
+class StdStringViewReturn(ReturnValue):
+
+    CTYPES = ['std::string_view']
+
+    def __init__(self, ctype, is_const=False, as_bytes=False):
+        """
+        :param as_bytes: if true, the string is returned to python as bytes instead of str
+        """
+        super(StdStringViewReturn, self).__init__(ctype, is_const)
+        self.as_bytes = as_bytes
+
+    # a view of a python object would dangle as soon as the reverse wrapper returns
+    def get_c_error_return(self):
+        raise NotImplementedError
+    def convert_python_to_c(self, wrapper):
+        raise NotImplementedError
+
+    def convert_c_to_python(self, wrapper):
+        _build_string(wrapper, self.value, self.as_bytes, prepend=True)
 
 
 class GlibStringParam(Parameter):
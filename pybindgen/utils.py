@@ -53,10 +53,10 @@ def write_preamble(code_sink, min_python_version=None):
             setattr(code_sink, "have_written_preamble", None)
 
     code_sink.writeln('''/* This file was generated by PyBindGen %s */
-#define PY_SSIZE_T_CLEAN
-#include <Python.h>
+#define PY_SSIZE_T_CLEAN''' % '.'.join([str(x) for x in __version__]))
+    code_sink.writeln('''#include <Python.h>
 #include <stddef.h>
-''' % '.'.join([str(x) for x in __version__]))
+''')
 
     if min_python_version < (2, 4):
         code_sink.writeln(r'''
@@ -119,6 +119,250 @@ typedef void* cmpfunc;
 #endif
 ''')
 
+    code_sink.writeln(r'''
+#if PY_VERSION_HEX < 0x030900A6
+#define PyObject_GC_IsTracked(o) _PyObject_GC_IS_TRACKED(o)
+#endif
+
+#if PY_VERSION_HEX < 0x030900A4 && !defined(Py_SET_TYPE)
+#define Py_SET_TYPE(obj, type) ((Py_TYPE(obj) = (type)), (void) 0)
+#endif
+
+#if PY_VERSION_HEX >= 0x03070000 && !defined(PyEval_ThreadsInitialized)
+/* threads are always initialized since 3.7; the function is gone in 3.13 */
+#define PyEval_ThreadsInitialized() 1
+#endif
+''')
+
+    if settings.wrapper_profiling:
+        code_sink.writeln(r'''
+#ifndef _PyBindGenWrapperStats_defined_
+#define _PyBindGenWrapperStats_defined_
+#ifdef PYBINDGEN_PROFILE
+#if defined(_WIN32)
+# include <windows.h>
+#else
+# include <time.h>
+#endif
+
+#define PYBINDGEN_PROFILE_BUCKETS 32
+
+typedef struct _PyBindGenWrapperStats {
+    const char *name;
+    struct _PyBindGenWrapperStats *next;
+    int registered;
+    unsigned long long calls;
+    unsigned long long misses;
+    unsigned long long conversion_ns;
+    unsigned long long call_ns;
+    unsigned long long return_ns;
+    unsigned long long histogram[PYBINDGEN_PROFILE_BUCKETS];
+} PyBindGenWrapperStats;
+
+typedef struct {
+    unsigned long long start;
+    unsigned long long call;
+    unsigned long long returned;
+} PyBindGenProfileTimer;
+
+static inline unsigned long long
+pybindgen_profile_clock(void)
+{
+#if defined(_WIN32)
+    LARGE_INTEGER counter, frequency;
+    QueryPerformanceCounter(&counter);
+    QueryPerformanceFrequency(&frequency);
+    return (unsigned long long) (counter.QuadPart * (1e9 / frequency.QuadPart));
+#else
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (unsigned long long) now.tv_sec * 1000000000ULL + now.tv_nsec;
+#endif
+}
+
+static inline void
+pybindgen_profile_record(PyBindGenWrapperStats **list, PyBindGenWrapperStats *stats,
+                         PyBindGenProfileTimer *timer)
+{
+    unsigned long long now = pybindgen_profile_clock();
+    unsigned long long elapsed;
+    int bucket;
+
+    if (!stats->registered) {
+        stats->registered = 1;
+        stats->next = *list;
+        *list = stats;
+    }
+    if (!timer->call) {
+        stats->misses++;
+        return;
+    }
+    if (!timer->returned) { /* the call raised an exception */
+        timer->returned = now;
+    }
+    stats->calls++;
+    stats->conversion_ns += timer->call - timer->start;
+    stats->call_ns += timer->returned - timer->call;
+    stats->return_ns += now - timer->returned;
+    elapsed = now - timer->start;
+    for (bucket = 0; elapsed > 1 && bucket < PYBINDGEN_PROFILE_BUCKETS - 1; bucket++) {
+        elapsed >>= 1;
+    }
+    stats->histogram[bucket]++;
+}
+
+# define PYBINDGEN_PROFILE_DECLARE(name) \
+    static PyBindGenWrapperStats pybindgen_profile_stats = {name, NULL, 0, 0, 0, 0, 0, 0, {0}}; \
+    PyBindGenProfileTimer pybindgen_profile_timer;
+# define PYBINDGEN_PROFILE_START() \
+    (pybindgen_profile_timer.call = pybindgen_profile_timer.returned = 0, \
+     pybindgen_profile_timer.start = pybindgen_profile_clock())
+# define PYBINDGEN_PROFILE_CALL() (pybindgen_profile_timer.call = pybindgen_profile_clock())
+# define PYBINDGEN_PROFILE_RETURN() (pybindgen_profile_timer.returned = pybindgen_profile_clock())
+# define PYBINDGEN_PROFILE_RECORD() \
+    pybindgen_profile_record(&PYBINDGEN_PROFILE_LIST, &pybindgen_profile_stats, &pybindgen_profile_timer)
+#else
+# define PYBINDGEN_PROFILE_DECLARE(name)
+# define PYBINDGEN_PROFILE_START()
+# define PYBINDGEN_PROFILE_CALL()
+# define PYBINDGEN_PROFILE_RETURN()
+# define PYBINDGEN_PROFILE_RECORD()
+#endif
+#endif
+''')
+
+    if settings.free_threading:
+        code_sink.writeln(r'''
+#ifndef _PyBindGenMutex_defined_
+#define _PyBindGenMutex_defined_
+#ifdef Py_GIL_DISABLED
+typedef PyMutex PyBindGenMutex;
+# define PYBINDGEN_LOCK(mutex) PyMutex_Lock(&(mutex))
+# define PYBINDGEN_UNLOCK(mutex) PyMutex_Unlock(&(mutex))
+# define PYBINDGEN_BEGIN_CRITICAL_SECTION(op) Py_BEGIN_CRITICAL_SECTION(op)
+# define PYBINDGEN_END_CRITICAL_SECTION() Py_END_CRITICAL_SECTION()
+#else
+typedef struct { char unused; } PyBindGenMutex;
+# define PYBINDGEN_LOCK(mutex)
+# define PYBINDGEN_UNLOCK(mutex)
+# define PYBINDGEN_BEGIN_CRITICAL_SECTION(op) {
+# define PYBINDGEN_END_CRITICAL_SECTION() }
+#endif
+#endif
+''')
+
+    if settings.wrapper_accounting:
+        if settings.wrapper_accounting_tracemalloc_domain is not None:
+            code_sink.writeln("#ifndef PYBINDGEN_TRACEMALLOC_DOMAIN\n"
+                              "#define PYBINDGEN_TRACEMALLOC_DOMAIN %i\n"
+                              "#endif" % settings.wrapper_accounting_tracemalloc_domain)
+        if settings.free_threading:
+            accounting_code = dict(MUTEX="    PyBindGenMutex mutex;\n",
+                                   LOCK="    PYBINDGEN_LOCK(list->mutex);\n",
+                                   UNLOCK="    PYBINDGEN_UNLOCK(list->mutex);\n",
+                                   LOCK_LISTS="        PYBINDGEN_LOCK(lists->mutex);\n",
+                                   UNLOCK_LISTS="        PYBINDGEN_UNLOCK(lists->mutex);\n")
+        else:
+            accounting_code = dict(MUTEX='', LOCK='', UNLOCK='', LOCK_LISTS='', UNLOCK_LISTS='')
+        code_sink.writeln(r'''
+#ifndef _PyBindGenLiveList_defined_
+#define _PyBindGenLiveList_defined_
+#if defined(PYBINDGEN_TRACEMALLOC_DOMAIN) && PY_VERSION_HEX >= 0x03070000
+# if defined(__cplusplus) && PY_VERSION_HEX >= 0x03080000
+/* the tracemalloc declarations of Python.h lack extern "C" since
+   python 3.8, so a C++ call would not link against them */
+namespace pybindgen_tracemalloc {
+extern "C" int PyTraceMalloc_Track(unsigned int domain, uintptr_t ptr, size_t size);
+extern "C" int PyTraceMalloc_Untrack(unsigned int domain, uintptr_t ptr);
+}
+#  define PYBINDGEN_TRACEMALLOC_API pybindgen_tracemalloc::
+# else
+#  define PYBINDGEN_TRACEMALLOC_API
+# endif
+# define PYBINDGEN_TRACEMALLOC_TRACK(wrapper) \
+    PYBINDGEN_TRACEMALLOC_API PyTraceMalloc_Track(PYBINDGEN_TRACEMALLOC_DOMAIN, (uintptr_t) (wrapper), \
+                                                  Py_TYPE(wrapper)->tp_basicsize)
+# define PYBINDGEN_TRACEMALLOC_UNTRACK(wrapper) \
+    PYBINDGEN_TRACEMALLOC_API PyTraceMalloc_Untrack(PYBINDGEN_TRACEMALLOC_DOMAIN, (uintptr_t) (wrapper))
+#else
+# define PYBINDGEN_TRACEMALLOC_TRACK(wrapper)
+# define PYBINDGEN_TRACEMALLOC_UNTRACK(wrapper)
+#endif
+
+typedef struct _PyBindGenLiveLink {
+    PyObject *wrapper;
+    struct _PyBindGenLiveList *list;
+    struct _PyBindGenLiveLink *next;
+    struct _PyBindGenLiveLink **pprev;
+} PyBindGenLiveLink;
+
+typedef struct {
+    unsigned long long live;
+    unsigned long long owned;
+    unsigned long long borrowed;
+    unsigned long long detached;
+    unsigned long long registered;
+} PyBindGenLiveCounts;
+
+typedef struct _PyBindGenLiveList {
+    const char *name;
+    void (*count)(PyBindGenLiveCounts *counts);
+    struct _PyBindGenLiveList *next;
+    int registered;
+    unsigned long long allocated;
+    unsigned long long freed;
+    PyBindGenLiveLink *first;
+%(MUTEX)s} PyBindGenLiveList;
+
+typedef struct {
+    PyBindGenLiveList *first;
+%(MUTEX)s} PyBindGenLiveLists;
+
+static inline void
+pybindgen_live_link(PyBindGenLiveLists *lists, PyBindGenLiveList *list, PyBindGenLiveLink *link, PyObject *wrapper)
+{
+    if (!list->registered) {
+%(LOCK_LISTS)s        if (!list->registered) {
+            list->next = lists->first;
+            lists->first = list;
+            list->registered = 1;
+        }
+%(UNLOCK_LISTS)s    }
+%(LOCK)s    link->wrapper = wrapper;
+    link->list = list;
+    link->next = list->first;
+    if (link->next != NULL) {
+        link->next->pprev = &link->next;
+    }
+    link->pprev = &list->first;
+    list->first = link;
+    list->allocated++;
+%(UNLOCK)s    PYBINDGEN_TRACEMALLOC_TRACK(wrapper);
+}
+
+static inline void
+pybindgen_live_unlink(PyBindGenLiveLink *link)
+{
+    PyBindGenLiveList *list = link->list;
+
+    if (link->pprev == NULL) { /* not accounted */
+        return;
+    }
+%(LOCK)s    *link->pprev = link->next;
+    if (link->next != NULL) {
+        link->next->pprev = link->pprev;
+    }
+    link->pprev = NULL;
+    list->freed++;
+%(UNLOCK)s    PYBINDGEN_TRACEMALLOC_UNTRACK(link->wrapper);
+}
+
+#define PYBINDGEN_LIVE_LINK(list, wrapper) \
+    pybindgen_live_link(&PYBINDGEN_LIVE_LISTS, &(list), &(wrapper)->live, (PyObject *) (wrapper))
+#define PYBINDGEN_LIVE_UNLINK(wrapper) pybindgen_live_unlink(&(wrapper)->live)
+#endif
+''' % accounting_code)
+
 
     code_sink.writeln(r'''
 #if     __GNUC__ > 2
@@ -129,6 +373,13 @@ typedef void* cmpfunc;
 # define PYBINDGEN_UNUSED(param) param
 #endif  /* !__GNUC__ */
 
+#if defined(__cplusplus) && (__cplusplus >= 201103L || (defined(_MSC_VER) && _MSC_VER >= 1600))
+# include <utility>
+# define PYBINDGEN_MOVE(value) std::move(value)
+#else
+# define PYBINDGEN_MOVE(value) (value)
+#endif
+
 #ifndef _PyBindGenWrapperFlags_defined_
 #define _PyBindGenWrapperFlags_defined_
 typedef enum _PyBindGenWrapperFlags {
@@ -23,7 +23,15 @@ class WrapperRegistry(object):
     def write_register_new_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
         raise NotImplementedError
         
-    def write_lookup_wrapper(self, code_block, wrapper_type, wrapper_lvalue, object_rvalue):
+    def write_lookup_wrapper(self, code_block, wrapper_type, wrapper_lvalue, object_rvalue,
+                             new_reference=True):
+        """
+        Writes code that sets wrapper_lvalue to the registered wrapper
+        of object_rvalue, or to NULL.  With new_reference=False the
+        wrapper is a borrowed reference, only fit to be compared with
+        another wrapper; no reference count is touched, so the code
+        can run with other locks held.
+        """
         raise NotImplementedError
 
     def write_unregister_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
@@ -45,13 +53,14 @@ class NullWrapperRegistry(WrapperRegistry):
 
     def generate(self, code_sink, module):
         pass
-    def generate_import(self, code_sink, module, import_from_module):
+    def generate_import(self, code_sink, code_block, module_pyobj_var, module=None):
         pass
 
     def write_register_new_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
         pass
         
-    def write_lookup_wrapper(self, code_block, wrapper_type, wrapper_lvalue, object_rvalue):
+    def write_lookup_wrapper(self, code_block, wrapper_type, wrapper_lvalue, object_rvalue,
+                             new_reference=True):
         raise NotSupportedError
 
     def write_unregister_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
@@ -69,44 +78,132 @@ class StdMapWrapperRegistry(WrapperRegistry):
     def __init__(self, base_name):
         super(StdMapWrapperRegistry, self).__init__(base_name)
         self.map_name = "%s_wrapper_registry" % base_name
+        from pybindgen import settings
+        if settings.free_threading:
+            self.map_type = "PyBindGenWrapperRegistry"
+        else:
+            self.map_type = "std::map<void*, PyObject*>"
+
+    def _generate_sharded_registry(self, code_sink, module):
+        """generate the definition of the sharded registry, used in free threading mode"""
+        try:
+            module.declare_one_time_definition("PyBindGenWrapperRegistry")
+        except KeyError:
+            return
+        code_sink.writeln('''
+#ifdef Py_GIL_DISABLED
+# define PYBINDGEN_WRAPPER_REGISTRY_SHARDS 16
+#else
+# define PYBINDGEN_WRAPPER_REGISTRY_SHARDS 1
+#endif
+
+/* a registered wrapper may be losing its last reference in another
+   thread, which does not take the shard lock to do so; it is only
+   returned if a new reference can still be taken */
+#if PY_VERSION_HEX >= 0x030E0000
+# define PYBINDGEN_ENABLE_TRY_INCREF(obj) PyUnstable_EnableTryIncRef(obj)
+# define PYBINDGEN_TRY_INCREF(obj) PyUnstable_TryIncRef(obj)
+#elif defined(Py_GIL_DISABLED)
+# error "free-threaded builds need PyUnstable_TryIncRef, from Python 3.14"
+#else
+/* with the GIL, a wrapper without references is being deallocated
+   and about to unregister itself */
+# define PYBINDGEN_ENABLE_TRY_INCREF(obj)
+# define PYBINDGEN_TRY_INCREF(obj) (Py_REFCNT(obj) > 0 ? (Py_INCREF(obj), 1) : 0)
+#endif
+
+struct PyBindGenWrapperRegistryShard
+{
+    PyBindGenMutex mutex;
+    std::map<void*, PyObject*> map;
+};
+
+struct PyBindGenWrapperRegistry
+{
+    PyBindGenWrapperRegistryShard shards[PYBINDGEN_WRAPPER_REGISTRY_SHARDS];
+
+    PyBindGenWrapperRegistryShard &get_shard(void *object)
+    {
+        return shards[(reinterpret_cast<size_t>(object) >> 4) % PYBINDGEN_WRAPPER_REGISTRY_SHARDS];
+    }
+};
+''')
 
     def generate_forward_declarations(self, code_sink, module, import_from_module):
         module.add_include("<map>")
         module.add_include("<iostream>")
         #code_sink.writeln("#include <map>")
         #code_sink.writeln("#include <iostream>")
+        if self.map_type == "PyBindGenWrapperRegistry":
+            self._generate_sharded_registry(code_sink, module)
         if import_from_module:
-            code_sink.writeln("extern std::map<void*, PyObject*> *_%s;" % self.map_name)
+            module.declare_global(code_sink, self.map_type + ' *', '_' + self.map_name)
             code_sink.writeln("#define %s (*_%s)" % (self.map_name, self.map_name))
         else:
-            code_sink.writeln("extern std::map<void*, PyObject*> %s;" % self.map_name)
+            module.declare_global(code_sink, self.map_type, self.map_name)
 
     def generate(self, code_sink, module):
-        code_sink.writeln("std::map<void*, PyObject*> %s;" % self.map_name)
+        module.define_global(code_sink, self.map_type, self.map_name)
         # register the map in the module namespace
-        module.after_init.write_code("PyModule_AddObject(m, (char *) \"_%s\", PyCObject_FromVoidPtr(&%s, NULL));"
-                                     % (self.map_name, self.map_name))
+        module.get_init_code_block().write_code(
+            "PyModule_AddObject(m, (char *) \"_%s\", PyCObject_FromVoidPtr(&%s, NULL));"
+            % (self.map_name, self.map_name))
 
-    def generate_import(self, code_sink, code_block, module_pyobj_var):
-        code_sink.writeln("std::map<void*, PyObject*> *_%s;" % self.map_name)
+    def generate_import(self, code_sink, code_block, module_pyobj_var, module=None):
+        if module is None:
+            code_sink.writeln("%s *_%s;" % (self.map_type, self.map_name))
+        else:
+            module.define_global(code_sink, self.map_type + ' *', '_' + self.map_name)
         code_block.write_code("PyObject *_cobj = PyObject_GetAttrString(%s, (char*) \"_%s\");"
                               % (module_pyobj_var, self.map_name))
         code_block.write_code("if (_cobj == NULL) {\n"
                               "    _%(MAP)s = NULL;\n"
                               "    PyErr_Clear();\n"
                               "} else {\n"
-                              "    _%(MAP)s = reinterpret_cast< std::map<void*, PyObject*> *> (PyCObject_AsVoidPtr (_cobj));\n"
+                              "    _%(MAP)s = reinterpret_cast< %(TYPE)s *> (PyCObject_AsVoidPtr (_cobj));\n"
                               "    Py_DECREF(_cobj);\n"
                               "}"
-                              % dict(MAP=self.map_name))
+                              % dict(MAP=self.map_name, TYPE=self.map_type))
 
     def write_register_new_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
+        if self.map_type == "PyBindGenWrapperRegistry":
+            code_block.write_code("{\n"
+                                  "    PyBindGenWrapperRegistryShard &shard = %(MAP)s.get_shard((void *) %(OBJECT_VALUE)s);\n"
+                                  "    PYBINDGEN_ENABLE_TRY_INCREF((PyObject *) %(WRAPPER)s);\n"
+                                  "    PYBINDGEN_LOCK(shard.mutex);\n"
+                                  "    shard.map[(void *) %(OBJECT_VALUE)s] = (PyObject *) %(WRAPPER)s;\n"
+                                  "    PYBINDGEN_UNLOCK(shard.mutex);\n"
+                                  "}"
+                                  % dict(MAP=self.map_name, WRAPPER=wrapper_lvalue, OBJECT_VALUE=object_rvalue))
+            return
         code_block.write_code("%s[(void *) %s] = (PyObject *) %s;" % (self.map_name, object_rvalue, wrapper_lvalue))
         #code_block.write_code('std::cerr << "Register Wrapper: obj=" <<(void *) %s << ", wrapper=" << %s << std::endl;'
         #                      % (object_rvalue, wrapper_lvalue))
         
-    def write_lookup_wrapper(self, code_block, wrapper_type, wrapper_lvalue, object_rvalue):
+    def write_lookup_wrapper(self, code_block, wrapper_type, wrapper_lvalue, object_rvalue,
+                             new_reference=True):
         iterator = code_block.declare_variable("std::map<void*, PyObject*>::const_iterator", "wrapper_lookup_iter")
+        if self.map_type == "PyBindGenWrapperRegistry":
+            ## a wrapper that is being deallocated by another thread,
+            ## and is about to unregister itself, must not be resurrected
+            if new_reference:
+                try_incref = " || !PYBINDGEN_TRY_INCREF(%s->second)" % iterator
+            else:
+                try_incref = ""
+            code_block.write_code("{\n"
+                                  "    PyBindGenWrapperRegistryShard &shard = %(MAP)s.get_shard((void *) %(OBJECT_VALUE)s);\n"
+                                  "    PYBINDGEN_LOCK(shard.mutex);\n"
+                                  "    %(ITER)s = shard.map.find((void *) %(OBJECT_VALUE)s);\n"
+                                  "    if (%(ITER)s == shard.map.end()%(TRY_INCREF)s) {\n"
+                                  "        %(WRAPPER)s = NULL;\n"
+                                  "    } else {\n"
+                                  "        %(WRAPPER)s = (%(TYPE)s *) %(ITER)s->second;\n"
+                                  "    }\n"
+                                  "    PYBINDGEN_UNLOCK(shard.mutex);\n"
+                                  "}"
+                                  % dict(ITER=iterator, MAP=self.map_name, WRAPPER=wrapper_lvalue,
+                                         TYPE=wrapper_type, OBJECT_VALUE=object_rvalue, TRY_INCREF=try_incref))
+            return
         #code_block.write_code('std::cerr << "Lookup Wrapper: obj=" <<(void *) %s << " map size: " << %s.size() << std::endl;'
         #                      % (object_rvalue, self.map_name))
         code_block.write_code("%s = %s.find((void *) %s);" % (iterator, self.map_name, object_rvalue))
@@ -114,14 +211,30 @@ class StdMapWrapperRegistry(WrapperRegistry):
                               "    %(WRAPPER)s = NULL;\n"
                               "} else {\n"
                               "    %(WRAPPER)s = (%(TYPE)s *) %(ITER)s->second;\n"
-                              "    Py_INCREF(%(WRAPPER)s);\n"
+                              "%(INCREF)s"
                               "}\n"
-                              % dict(ITER=iterator, MAP=self.map_name, WRAPPER=wrapper_lvalue, TYPE=wrapper_type))
+                              % dict(ITER=iterator, MAP=self.map_name, WRAPPER=wrapper_lvalue, TYPE=wrapper_type,
+                                     INCREF=(new_reference and "    Py_INCREF(%s);\n" % wrapper_lvalue or "")))
         
     def write_unregister_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
         #code_block.write_code('std::cerr << "Erase Wrapper: obj=" <<(void *) %s << std::endl;'
         #                      % (object_rvalue))
         iterator = code_block.declare_variable("std::map<void*, PyObject*>::iterator", "wrapper_lookup_iter")
+        if self.map_type == "PyBindGenWrapperRegistry":
+            ## only remove the entry if it was not replaced by a newer
+            ## wrapper in the meantime
+            code_block.write_code("{\n"
+                                  "    PyBindGenWrapperRegistryShard &shard = %(MAP)s.get_shard((void *) %(OBJECT_VALUE)s);\n"
+                                  "    PYBINDGEN_LOCK(shard.mutex);\n"
+                                  "    %(ITER)s = shard.map.find((void *) %(OBJECT_VALUE)s);\n"
+                                  "    if (%(ITER)s != shard.map.end() && %(ITER)s->second == (PyObject *) %(WRAPPER)s) {\n"
+                                  "        shard.map.erase(%(ITER)s);\n"
+                                  "    }\n"
+                                  "    PYBINDGEN_UNLOCK(shard.mutex);\n"
+                                  "}"
+                                  % dict(ITER=iterator, MAP=self.map_name, WRAPPER=wrapper_lvalue,
+                                         OBJECT_VALUE=object_rvalue))
+            return
         code_block.write_code("%(ITER)s = %(MAP)s.find((void *) %(OBJECT_VALUE)s);\n"
                               "if (%(ITER)s != %(MAP)s.end()) {\n"
                               "    %(MAP)s.erase(%(ITER)s);\n"
@@ -0,0 +1,30 @@
+// -*- Mode: C++; c-file-style: "stroustrup"; indent-tabs-mode:nil; -*-
+#include "strview.h"
+
+
+std::size_t
+view_length (std::string_view view)
+{
+    return view.size ();
+}
+
+std::string
+view_concat (const std::string_view &first, std::string_view second)
+{
+    std::string result (first);
+    result += second;
+    return result;
+}
+
+std::string_view
+static_name ()
+{
+    static const char name[] = "static\0name";
+    return std::string_view (name, sizeof (name) - 1);
+}
+
+std::size_t
+call_visit (Visitor *visitor, const std::string &value)
+{
+    return visitor->visit (std::string_view (value));
+}
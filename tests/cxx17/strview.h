@@ -0,0 +1,24 @@
+// -*- Mode: C++; c-file-style: "stroustrup"; indent-tabs-mode:nil; -*-
+#ifndef   	STRVIEW_H_
+# define   	STRVIEW_H_
+
+#include <string>
+#include <string_view>
+
+
+std::size_t view_length (std::string_view view);
+std::string view_concat (const std::string_view &first, std::string_view second = "!");
+std::string_view static_name ();
+
+class Visitor
+{
+public:
+    virtual ~Visitor () {}
+    virtual std::size_t visit (std::string_view view) { return view.size (); }
+};
+
+// calls visitor->visit with a view of the given string
+std::size_t call_visit (Visitor *visitor, const std::string &value);
+
+
+#endif 	    /* !STRVIEW_H_ */
@@ -0,0 +1,36 @@
+#! /usr/bin/env python
+from __future__ import unicode_literals, print_function
+
+import sys
+
+import pybindgen
+from pybindgen import Module, FileCodeSink, param, retval
+
+
+def my_module_gen(out_file):
+
+    mod = Module('strview')
+
+    mod.add_include ('"strview.h"')
+
+    mod.add_function('view_length', 'std::size_t', [param('std::string_view', 'view')])
+    mod.add_function('view_concat', 'std::string',
+                     [param('const std::string_view&', 'first'),
+                      param('std::string_view', 'second', default_value='"!"')])
+    mod.add_function('static_name', 'std::string_view', [])
+    mod.add_function('static_name', retval('std::string_view', as_bytes=True), [],
+                     custom_name='static_name_bytes')
+
+    Visitor = mod.add_class('Visitor', allow_subclassing=True)
+    Visitor.add_constructor([])
+    Visitor.add_method('visit', 'std::size_t', [param('std::string_view', 'view')],
+                       is_virtual=True)
+    mod.add_function('call_visit', 'std::size_t',
+                     [param('Visitor *', 'visitor', transfer_ownership=False),
+                      param('const std::string&', 'value')])
+
+    mod.generate(FileCodeSink(out_file))
+
+
+if __name__ == '__main__':
+    my_module_gen(sys.stdout)
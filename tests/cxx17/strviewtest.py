@@ -0,0 +1,40 @@
+from __future__ import unicode_literals, print_function
+import sys
+import os.path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'build', 'tests', 'cxx17'))
+import strview
+
+import unittest
+
+
+class TestStringView(unittest.TestCase):
+
+    def test_param(self):
+        self.assertEqual(strview.view_length("hello"), 5)
+        self.assertEqual(strview.view_length(b"a\x00b"), 3)
+        self.assertEqual(strview.view_length(bytearray(b"xyz")), 3)
+        self.assertEqual(strview.view_length(memoryview(b"xyz")[1:]), 2)
+        self.assertRaises(TypeError, strview.view_length, 3)
+
+    def test_const_ref_param_and_default_value(self):
+        self.assertEqual(strview.view_concat("hello", " world"), "hello world")
+        self.assertEqual(strview.view_concat(b"hello"), "hello!")
+
+    def test_return(self):
+        self.assertEqual(strview.static_name(), "static\x00name")
+        self.assertEqual(strview.static_name_bytes(), b"static\x00name")
+
+    def test_reverse_param(self):
+        class Visitor(strview.Visitor):
+            def visit(self, view):
+                self.seen = view
+                return 2*len(view)
+        visitor = Visitor()
+        self.assertEqual(strview.call_visit(visitor, "abc"), 6)
+        self.assertEqual(visitor.seen, "abc")
+        self.assertEqual(strview.call_visit(strview.Visitor(), "abc"), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
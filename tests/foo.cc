@@ -26,6 +26,20 @@ int get_int_from_float(double from_float, int multiplier)
     return (int) from_float*multiplier;
 }
 
+int count_byte(const char *data, size_t len, char byte)
+{
+    int count = 0;
+    for (size_t i = 0; i < len; i++)
+        if (data[i] == byte)
+            count++;
+    return count;
+}
+
+std::string get_binary_string()
+{
+    return std::string("\x00\xff\x00" "binary", 9);
+}
+
 
 std::string SomeObject::staticData = std::string("Hello Static World!");
 
@@ -322,6 +336,22 @@ int set_simple_list (SimpleStructList list)
     return count;
 }
 
+std::vector<bool> get_bool_vec (int size)
+{
+    std::vector<bool> retval;
+    for (int i = 0; i < size; i++)
+        retval.push_back(i % 2 == 0);
+    return retval;
+}
+
+int count_bool_vec (std::vector<bool> vec)
+{
+    int count = 0;
+    for (std::vector<bool>::iterator iter = vec.begin(); iter != vec.end(); iter++)
+        count += *iter;
+    return count;
+}
+
 
 SimpleStructList
 TestContainer::get_simple_list ()
@@ -557,3 +587,74 @@ test_args_kwargs(const char *args, const char *kwargs)
     return (int) (kwargs - args);
 }
 
+
+int PooledEvent::instance_count = 0;
+
+PooledEvent*
+pooled_event_new (int id)
+{
+    return new PooledEvent (id);
+}
+
+PooledEvent
+pooled_event_copy (const PooledEvent &event)
+{
+    return event;
+}
+
+int
+pooled_event_delete (PooledEvent *event)
+{
+    int id = event->get_id ();
+    delete event;
+    return id;
+}
+
+int
+PooledEventFactory::consume (int id)
+{
+    return pooled_event_delete (make (id));
+}
+
+
+int ViewedItem::copies = 0;
+
+ViewedItemVec
+get_viewed_items (int count)
+{
+    ViewedItemVec items;
+    items.reserve (count);
+    for (int i = 0; i < count; i++)
+        items.push_back (ViewedItem (i));
+    return items;
+}
+
+ViewedItemPtrVec
+get_viewed_item_ptrs ()
+{
+    static ViewedItem first (1), second (2);
+    ViewedItemPtrVec items;
+    items.push_back (&first);
+    items.push_back (NULL);
+    items.push_back (&second);
+    return items;
+}
+
+ViewedItemMap
+get_viewed_item_map ()
+{
+    ViewedItemMap items;
+    items.insert (std::make_pair (std::string ("one"), ViewedItem (1)));
+    items.insert (std::make_pair (std::string ("two"), ViewedItem (2)));
+    return items;
+}
+
+
+int Movable::copies = 0;
+int Movable::moves = 0;
+
+Movable
+make_movable (int value)
+{
+    return Movable (value);
+}
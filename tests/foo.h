@@ -38,6 +38,9 @@ int get_int_from_string(const char *from_string, int multiplier=1);
 // -#- name=get_int; @multiplier(default_value=1) -#-
 int get_int_from_float(double from_float, int multiplier);
 
+int count_byte(const char *data, size_t len, char byte);
+std::string get_binary_string();
+
 // In this example PointerHolder<T> automatically implies
 // caller_owns_return=True when used as ReturnValue, and
 // transfer_ownership=False when used as parameter.
@@ -811,6 +814,10 @@ typedef std::map<std::string, simple_struct_t> SimpleStructMap;
 SimpleStructList get_simple_list ();
 int set_simple_list (SimpleStructList list);
 
+// elements of std::vector<bool> are proxies, not bool lvalues
+std::vector<bool> get_bool_vec (int size);
+int count_bool_vec (std::vector<bool> vec);
+
 class TestContainer
 {
 public:
@@ -1342,4 +1349,81 @@ public:
 
 int test_args_kwargs(const char *args, const char *kwargs);
 
+
+// allocated from a pool by the wrappers
+class PooledEvent
+{
+    int m_id;
+public:
+    static int instance_count;
+    PooledEvent (int id) : m_id (id) { instance_count++; }
+    PooledEvent (const PooledEvent &other) : m_id (other.m_id) { instance_count++; }
+    virtual ~PooledEvent () { instance_count--; }
+    int get_id () const { return m_id; }
+    virtual int get_priority () const { return 0; }
+    int call_get_priority () const { return get_priority (); }
+};
+
+class PooledPacket : public PooledEvent
+{
+    char m_payload[200];
+public:
+    PooledPacket (int id) : PooledEvent (id) { m_payload[0] = 0; }
+    virtual int get_priority () const { return 1; }
+};
+
+// make() may be overridden in python; consume() deletes the event it makes
+class PooledEventFactory
+{
+public:
+    virtual ~PooledEventFactory () {}
+    virtual PooledEvent* make (int id) { return new PooledEvent (id); }
+    int consume (int id);
+};
+
+PooledEvent* pooled_event_new (int id);
+PooledEvent pooled_event_copy (const PooledEvent &event);
+int pooled_event_delete (PooledEvent *event);
+
+
+// elements of containers wrapped with view=True
+class ViewedItem
+{
+    int m_value;
+public:
+    static int copies;
+    ViewedItem () : m_value (0) {}
+    ViewedItem (int value) : m_value (value) {}
+    ViewedItem (const ViewedItem &other) : m_value (other.m_value) { copies++; }
+    virtual ~ViewedItem () {}
+    int get_value () const { return m_value; }
+    void set_value (int value) { m_value = value; }
+};
+
+typedef std::vector<ViewedItem> ViewedItemVec;
+typedef std::vector<ViewedItem*> ViewedItemPtrVec;
+typedef std::map<std::string, ViewedItem> ViewedItemMap;
+
+ViewedItemVec get_viewed_items (int count);
+ViewedItemPtrVec get_viewed_item_ptrs ();
+ViewedItemMap get_viewed_item_map ();
+
+// a class with a real move constructor, counting copies and moves
+class Movable
+{
+    int m_value;
+public:
+    static int copies;
+    static int moves;
+    Movable (int value) : m_value (value) {}
+    Movable (const Movable &other) : m_value (other.m_value) { copies++; }
+#if __cplusplus >= 201103L
+    Movable (Movable &&other) : m_value (other.m_value) { moves++; }
+#endif
+    Movable &operator= (const Movable &other) { m_value = other.m_value; copies++; return *this; }
+    int get_value () const { return m_value; }
+};
+
+Movable make_movable (int value);
+
 #endif 	    /* !FOO_H_ */
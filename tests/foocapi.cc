@@ -0,0 +1,106 @@
+// -*- Mode: C++; c-file-style: "stroustrup"; indent-tabs-mode:nil; -*-
+//
+// A hand written extension module that uses the C API exported by the
+// foo module (see Module.set_c_api_export), through the foo_capi.h
+// header generated by 'foomodulegen.py <srcdir> --c-api-header'.
+
+#define PY_SSIZE_T_CLEAN
+#include "foo_capi.h"
+#include <cstring>
+
+
+// returns the datum of a foo.Foo, unwrapped without copying
+static PyObject *
+foocapi_get_datum (PyObject *, PyObject *obj)
+{
+    Foo *foo = Pyfoo_API->Foo_unwrap (obj);
+    if (foo == NULL) {
+        return NULL;
+    }
+    std::string datum = foo->get_datum ();
+    return Py_BuildValue ((char *) "s#", datum.data (), (Py_ssize_t) datum.size ());
+}
+
+// returns the datum of a copy of a foo.Foo
+static PyObject *
+foocapi_get_datum_copy (PyObject *, PyObject *obj)
+{
+    Foo foo;
+    if (!Pyfoo_API->Foo_to_c (obj, &foo)) {
+        return NULL;
+    }
+    std::string datum = foo.get_datum ();
+    return Py_BuildValue ((char *) "s#", datum.data (), (Py_ssize_t) datum.size ());
+}
+
+// creates a new foo.Foo from C++
+static PyObject *
+foocapi_make_foo (PyObject *, PyObject *args)
+{
+    const char *datum;
+    if (!PyArg_ParseTuple (args, (char *) "s", &datum)) {
+        return NULL;
+    }
+    Foo foo (datum);
+    return Pyfoo_API->Foo_from_c (&foo);
+}
+
+// calls a function of the foo module through its method table
+static PyObject *
+foocapi_call (PyObject *, PyObject *args)
+{
+    const char *name;
+    PyObject *call_args;
+    if (!PyArg_ParseTuple (args, (char *) "sO!", &name, &PyTuple_Type, &call_args)) {
+        return NULL;
+    }
+    for (const PyMethodDef *def = Pyfoo_API->foo_functions; def->ml_name != NULL; ++def) {
+        if (std::strcmp (def->ml_name, name) == 0) {
+            PyObject *function = PyCFunction_New ((PyMethodDef *) def, NULL);
+            if (function == NULL) {
+                return NULL;
+            }
+            PyObject *retval = PyObject_Call (function, call_args, NULL);
+            Py_DECREF (function);
+            return retval;
+        }
+    }
+    PyErr_Format (PyExc_KeyError, "%s", name);
+    return NULL;
+}
+
+static PyMethodDef foocapi_functions[] = {
+    {(char *) "get_datum", (PyCFunction) foocapi_get_datum, METH_O, NULL},
+    {(char *) "get_datum_copy", (PyCFunction) foocapi_get_datum_copy, METH_O, NULL},
+    {(char *) "make_foo", (PyCFunction) foocapi_make_foo, METH_VARARGS, NULL},
+    {(char *) "call", (PyCFunction) foocapi_call, METH_VARARGS, NULL},
+    {NULL, NULL, 0, NULL}
+};
+
+#if PY_VERSION_HEX >= 0x03000000
+static struct PyModuleDef foocapi_moduledef = {
+    PyModuleDef_HEAD_INIT,
+    "foocapi",
+    NULL,
+    -1,
+    foocapi_functions,
+};
+
+extern "C" PyObject *
+PyInit_foocapi (void)
+{
+    if (Pyfoo_ImportCAPI () < 0) {
+        return NULL;
+    }
+    return PyModule_Create (&foocapi_moduledef);
+}
+#else
+extern "C" void
+initfoocapi (void)
+{
+    if (Pyfoo_ImportCAPI () < 0) {
+        return;
+    }
+    Py_InitModule3 ((char *) "foocapi", foocapi_functions, NULL);
+}
+#endif
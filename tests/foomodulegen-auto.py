@@ -19,6 +19,16 @@ def my_module_gen():
     pygen_file = open(sys.argv[3], "wt")
     module_parser = ModuleParser('foo2', '::')
     module_parser.enable_anonymous_containers = True
+    ## the output must not depend on it (see tests/wscript)
+    module_parser.parallel_jobs = int(os.environ.get("PYBINDGEN_PARALLEL_JOBS", "1"))
+
+    ## a pre-scan hook with a side effect, which a parallel scan must
+    ## not lose
+    scanned_definitions = []
+    def pre_scan_hook(dummy_module_parser, pygccxml_definition, dummy_global_annotations,
+                      dummy_parameter_annotations):
+        scanned_definitions.append(pygccxml_definition.name)
+    module_parser.add_pre_scan_hook(pre_scan_hook)
 
     print("PYTHON_INCLUDES:", repr(sys.argv[2]), file=sys.stderr)
     gccxml_options = dict(
@@ -40,6 +50,7 @@ def my_module_gen():
 
     foomodulegen_common.customize_module(module)
 
+    out.writeln("/* %i definitions pre-scanned */" % len(scanned_definitions))
     module.generate(out)
 
 
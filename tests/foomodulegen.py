@@ -12,6 +12,7 @@ from pybindgen import CppMethod, CppConstructor, CppClass, Enum
 from pybindgen.function import CustomFunctionWrapper
 from pybindgen.cppmethod import CustomCppMethodWrapper
 from pybindgen import cppclass
+from pybindgen.module import BalancedMultiSectionFactory
 
 from pybindgen import param, retval
 
@@ -19,9 +20,24 @@ import foomodulegen_common
 
 
 
-def my_module_gen(out_file):
+## optional build variants of the module, each one built as foo_<variant>
+VARIANTS = ['lazy', 'multi_phase', 'isolated', 'free_threading', 'profiling', 'accounting', 'split']
 
-    mod = Module('foo')
+
+def my_module_gen(out_file, variant=None, c_api_header_file=None):
+
+    if variant is None:
+        mod = Module('foo')
+    else:
+        assert variant in VARIANTS
+        mod = Module('foo_' + variant)
+    ## the registries and locks are chosen as the classes are added
+    pybindgen.settings.free_threading = (variant == 'free_threading')
+    ## compiled with PYBINDGEN_PROFILE defined, see tests/wscript
+    pybindgen.settings.wrapper_profiling = (variant == 'profiling')
+    pybindgen.settings.wrapper_accounting = (variant == 'accounting')
+    if variant == 'accounting':
+        pybindgen.settings.wrapper_accounting_tracemalloc_domain = 0x7062 # see footest.py
     foomodulegen_common.customize_module_pre(mod)
 
     mod.add_include ('"foo.h"')
@@ -114,6 +130,11 @@ int %s::custom_method_added_by_a_hook(int x)
                       Parameter.new('int', 'multiplier', default_value='1')],
                      custom_name="get_int")
 
+    mod.add_function('count_byte', 'int',
+                     [Parameter.new('const char*', 'data', with_length=True),
+                      Parameter.new('char', 'byte')])
+    mod.add_function('get_binary_string', ReturnValue.new('std::string', as_bytes=True), [])
+
 
 
     SomeObject = mod.add_class('SomeObject', allow_subclassing=True)
@@ -440,6 +461,10 @@ int %s::custom_method_added_by_a_hook(int x)
 
     mod.add_container('std::set<float>', 'float', 'set')
 
+    mod.add_container('std::vector<bool>', 'bool', 'vector')
+    mod.add_function('get_bool_vec', ReturnValue.new('std::vector<bool>'), [param('int', 'size')])
+    mod.add_function('count_bool_vec', 'int', [Parameter.new('std::vector<bool>', 'vec')])
+
     TestContainer = mod.add_class('TestContainer', allow_subclassing=True)
     TestContainer.add_constructor([])
     TestContainer.add_instance_attribute('m_floatSet', 'std::set<float>')
@@ -613,6 +638,53 @@ int %s::custom_method_added_by_a_hook(int x)
     mod.add_function("test_args_kwargs", "int", [param("const char *", "args"), param("const char *", "kwargs")])
 
 
+    PooledEvent = mod.add_class('PooledEvent', allow_subclassing=True,
+                                memory_policy=cppclass.PooledAllocationPolicy(slots_per_slab=64))
+    PooledEvent.add_constructor([param('int', 'id')])
+    PooledEvent.add_copy_constructor()
+    PooledEvent.add_static_attribute('instance_count', ReturnValue.new('int'))
+    PooledEvent.add_method('get_id', 'int', [], is_const=True)
+    PooledEvent.add_method('get_priority', 'int', [], is_const=True, is_virtual=True)
+    PooledEvent.add_method('call_get_priority', 'int', [], is_const=True)
+
+    PooledPacket = mod.add_class('PooledPacket', parent=PooledEvent)
+    PooledPacket.add_constructor([param('int', 'id')])
+
+    mod.add_function('pooled_event_new', retval('PooledEvent*', caller_owns_return=True), [param('int', 'id')])
+    mod.add_function('pooled_event_copy', 'PooledEvent', [param('const PooledEvent&', 'event')])
+    mod.add_function('pooled_event_delete', 'int', [param('PooledEvent*', 'event', transfer_ownership=True)])
+
+    PooledEventFactory = mod.add_class('PooledEventFactory', allow_subclassing=True)
+    PooledEventFactory.add_constructor([])
+    PooledEventFactory.add_method('make', retval('PooledEvent*', caller_owns_return=True),
+                                  [param('int', 'id')], is_virtual=True)
+    PooledEventFactory.add_method('consume', 'int', [param('int', 'id')])
+
+
+    ViewedItem = mod.add_class('ViewedItem', allow_subclassing=True)
+    ViewedItem.add_constructor([param('int', 'value')])
+    ViewedItem.add_copy_constructor()
+    ViewedItem.add_static_attribute('copies', ReturnValue.new('int'))
+    ViewedItem.add_method('get_value', 'int', [], is_const=True)
+    ViewedItem.add_method('set_value', 'void', [param('int', 'value')])
+
+    mod.add_container('ViewedItemVec', 'ViewedItem', 'vector', view=True)
+    mod.add_container('ViewedItemPtrVec', retval('ViewedItem*', caller_owns_return=False), 'vector', view=True)
+    mod.add_container('ViewedItemMap', ('std::string', 'ViewedItem'), 'map', view=True)
+    mod.add_function('get_viewed_items', 'ViewedItemVec', [param('int', 'count')])
+    mod.add_function('get_viewed_item_ptrs', 'ViewedItemPtrVec', [])
+    mod.add_function('get_viewed_item_map', 'ViewedItemMap', [])
+
+    Movable = mod.add_class('Movable')
+    Movable.add_constructor([param('int', 'value')])
+    Movable.add_copy_constructor()
+    Movable.set_has_move_constructor()
+    Movable.add_static_attribute('copies', ReturnValue.new('int'))
+    Movable.add_static_attribute('moves', ReturnValue.new('int'))
+    Movable.add_method('get_value', 'int', [], is_const=True)
+    mod.add_function('make_movable', 'Movable', [param('int', 'value')])
+
+
     #### --- error handler ---
     class MyErrorHandler(pybindgen.settings.ErrorHandler):
         def __init__(self):
@@ -629,20 +701,59 @@ int %s::custom_method_added_by_a_hook(int x)
 
     foomodulegen_common.customize_module(mod)
 
+    ## export the C API used by other extension modules
+    mod.set_c_api_export()
+
+    if variant == 'lazy':
+        mod.set_lazy_init()
+    elif variant == 'multi_phase':
+        ## PEP 489 multi-phase initialization
+        mod.set_multi_phase_init()
+    elif variant == 'isolated':
+        ## heap types and per-interpreter state (Python >= 3.12)
+        mod.set_multi_phase_init(isolated=True)
+
     ## ---- finally, generate the whole thing ----
-    mod.generate(FileCodeSink(out_file))
+    if variant == 'split':
+        ## out_file is the name of the main file; the sections include
+        ## a precompiled header, see tests/wscript
+        factory = BalancedMultiSectionFactory(out_file, 4, precompiled_header=True)
+        mod.generate(factory)
+        factory.close()
+    else:
+        mod.generate(FileCodeSink(out_file))
+
+    if c_api_header_file is not None:
+        mod.generate_c_api_header(c_api_header_file)
+
+
+def my_c_api_header_gen(out_file, variant=None):
+    import io
+    my_module_gen(io.StringIO(), variant, out_file)
 
 
 if __name__ == '__main__':
     import os
+    args = sys.argv[2:]
+    if args and args[0] == '--c-api-header':
+        my_c_api_header_gen(sys.stdout, *args[1:])
+        sys.exit(0)
+    if args:
+        variant = args[0]
+    else:
+        variant = None
+    if variant == 'split':
+        out_file = args[1]
+    else:
+        out_file = sys.stdout
     if "PYBINDGEN_ENABLE_PROFILING" in os.environ:
         try:
             import cProfile as profile
         except ImportError:
-            my_module_gen(sys.stdout)
+            my_module_gen(out_file, variant)
         else:
             print("** running under profiler", file=sys.stderr)
-            profile.run('my_module_gen(sys.stdout)', 'foomodulegen.pstat')
+            profile.run('my_module_gen(out_file, variant)', 'foomodulegen.pstat')
     else:
-        my_module_gen(sys.stdout)
+        my_module_gen(out_file, variant)
 
@@ -10,8 +10,17 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
 which = int(sys.argv[1]) # which version of the tests we are going to test
 del sys.argv[1]
 
+## optional build variant of the manually generated module (see foomodulegen.py)
+if which == 1 and len(sys.argv) > 1 and not sys.argv[1].startswith('-'):
+    variant = sys.argv.pop(1)
+else:
+    variant = None
+
 if which == 1: # generated from foomodulegen.py (manual)
-    import foo
+    if variant is None:
+        import foo
+    else:
+        foo = __import__('foo_' + variant)
 elif which == 2:
     import foo2 as foo # generated automatically with one-step gccxml-to-C++
 elif which == 3:
@@ -126,6 +135,18 @@ class TestFoo(unittest.TestCase):
         v1 = foo.get_int(123.0, 2)
         self.assertEqual(v1, 123*2)
 
+    def test_buffer_param(self):
+        self.assertEqual(foo.count_byte(b"a\x00b\x00", b"\x00"), 2)
+        self.assertEqual(foo.count_byte(bytearray(b"xax"), b"x"), 2)
+        self.assertEqual(foo.count_byte(memoryview(b"xax")[1:], b"x"), 1)
+        self.assertEqual(foo.count_byte("xax", b"a"), 1)
+
+        zoo = foo.Zoo(bytearray(b"binary"))
+        self.assertEqual(zoo.get_datum(), "binary")
+
+    def test_bytes_return(self):
+        self.assertEqual(foo.get_binary_string(), b"\x00\xff\x00binary")
+
     def test_overloaded_methods(self):
         obj = foo.SomeObject("zbr")
         
@@ -203,6 +224,19 @@ class TestFoo(unittest.TestCase):
             pass
         self.assertEqual(foo.SomeObject.instance_count, count_before)
 
+    def test_nosubclass_gc_tracking(self):
+        """Check that only objects that may form cycles are tracked by the GC"""
+        if not hasattr(gc, 'is_tracked'):
+            return
+        t = foo.SomeObject("xxx")
+        self.assertFalse(gc.is_tracked(t))
+        t.xxx = 1
+        self.assertTrue(gc.is_tracked(t))
+
+        class Test(foo.SomeObject):
+            pass
+        self.assertTrue(gc.is_tracked(Test("xxx")))
+
     def test_virtual_no_subclass(self):
         t = foo.SomeObject("xxx")
         self.assertEqual(t.call_get_prefix(), "xxx")
@@ -376,6 +410,9 @@ class TestFoo(unittest.TestCase):
         Foobar_count3 = foo.Foobar.instance_count
         self.assertEqual(Foobar_count3, Foobar_count2)
 
+        ## wards are kept in a dedicated slot, not in the instance dict
+        self.assertFalse(hasattr(obj1, '__wards__'))
+
         ## now, deleting foo1 should keep the Foobar count the same, since
         ## obj1 is keeping it alive
         del foo1, foo2
@@ -928,6 +965,43 @@ class TestFoo(unittest.TestCase):
             self.assertEqual(v1.xpto, 2*v.xpto)
 
 
+    def test_container_param_by_ref_wrapped(self):
+        l = []
+        for i in range(10):
+            simple = foo.simple_struct_t()
+            simple.xpto = i
+            l.append(simple)
+        container = foo.SimpleStructList(l)
+
+        ## a wrapped container is passed by reference to its own storage
+        test = foo.TestContainer()
+        rv, container1 = test.set_simple_list_by_ref(container)
+        self.assertEqual(rv, sum(range(10))*2)
+        self.assertTrue(container1 is container)
+        self.assertEqual([v.xpto for v in container], [2*i for i in range(10)])
+
+    def test_container_param_by_ref_live_iterator(self):
+        l = []
+        for i in range(10):
+            simple = foo.simple_struct_t()
+            simple.xpto = i
+            l.append(simple)
+        container = foo.SimpleStructList(l)
+
+        ## a container with an open iterator is copied, not modified in place
+        it = iter(container)
+        test = foo.TestContainer()
+        rv, container1 = test.set_simple_list_by_ref(container)
+        self.assertEqual(rv, sum(range(10))*2)
+        self.assertFalse(container1 is container)
+        self.assertEqual([v.xpto for v in container1], [2*i for i in range(10)])
+        self.assertEqual([v.xpto for v in it], list(range(10)))
+
+        ## once the iterator is gone the storage is used directly again
+        del it
+        rv, container2 = test.set_simple_list_by_ref(container)
+        self.assertTrue(container2 is container)
+
     def test_unnamed_container(self):
         test = foo.TestContainer()
         container = test.get_simple_vec()
@@ -940,6 +1014,31 @@ class TestFoo(unittest.TestCase):
         rv = test.set_simple_vec(container)
         self.assertEqual(rv, sum(range(10)))
 
+    def test_container_sequence_protocol(self):
+        test = foo.TestContainer()
+        container = test.get_simple_vec()
+        self.assertEqual(len(container), 10)
+        self.assertEqual(container[3].xpto, 3)
+        self.assertEqual(container[-1].xpto, 9)
+        self.assertRaises(IndexError, lambda: container[10])
+
+        simple = foo.simple_struct_t()
+        simple.xpto = 100
+        container[3] = simple
+        self.assertEqual(container[3].xpto, 100)
+        self.assertEqual(test.set_simple_vec(container), sum(range(10)) - 3 + 100)
+
+        self.assertEqual(len(test.get_simple_list()), 10)
+
+    def test_bool_vector_container(self):
+        container = foo.get_bool_vec(5)
+        self.assertEqual(list(container), [True, False, True, False, True])
+        self.assertEqual(container[1], False)
+        self.assertEqual(container[-1], True)
+        container[1] = True
+        self.assertEqual(container[1], True)
+        self.assertEqual(foo.count_bool_vec(container), 4)
+
 
     def test_map_container(self):
         test = foo.TestContainer()
@@ -954,6 +1053,16 @@ class TestFoo(unittest.TestCase):
         rv = test.set_simple_map(container)
         self.assertEqual(rv, sum(range(10)))
 
+    def test_map_container_lookup(self):
+        test = foo.TestContainer()
+        container = test.get_simple_map()
+        self.assertEqual(len(container), 10)
+        self.assertEqual(container["7"].xpto, 7)
+        self.assertRaises(KeyError, lambda: container["xpto"])
+        self.assertTrue("7" in container)
+        self.assertFalse("xpto" in container)
+        self.assertFalse(7 in container)
+
     def test_copy(self):
         s1 = foo.simple_struct_t()
         s1.xpto = 123
@@ -1507,6 +1616,310 @@ class TestFoo(unittest.TestCase):
         while gc.collect():
             pass
 
+    def test_c_api_capsule(self):
+        import ctypes
+        capsule_is_valid = ctypes.pythonapi.PyCapsule_IsValid
+        capsule_is_valid.restype = ctypes.c_int
+        capsule_is_valid.argtypes = [ctypes.py_object, ctypes.c_char_p]
+        self.assertTrue(capsule_is_valid(foo._C_API, (foo.__name__ + "._C_API").encode('ascii')))
+
+    if which == 1 and variant is None: # foocapi is built against the foo module only
+        def test_c_api_consumer(self):
+            import foocapi
+            f = foo.Foo("hello")
+            self.assertEqual(foocapi.get_datum(f), "hello")
+            self.assertEqual(foocapi.get_datum_copy(f), "hello")
+            self.assertRaises(TypeError, foocapi.get_datum, 3)
+            self.assertRaises(TypeError, foocapi.get_datum_copy, 3)
+            f2 = foocapi.make_foo("world")
+            self.assertTrue(isinstance(f2, foo.Foo))
+            self.assertEqual(f2.get_datum(), "world")
+            self.assertEqual(foocapi.call("get_int", (123.0, 2)), 246)
+
+    if variant in ('multi_phase', 'isolated') and sys.version_info >= (3, 5):
+        def test_multi_phase_init(self):
+            import importlib.util
+            mod = importlib.util.module_from_spec(foo.__spec__)
+            foo.__spec__.loader.exec_module(mod)
+            self.assertTrue(mod is not foo)
+            self.assertTrue(mod.SomeObject is foo.SomeObject)
+            self.assertTrue(mod.DomainError is foo.DomainError)
+            self.assertEqual(mod.xpto.some_function(), foo.xpto.some_function())
+
+    if variant in ('multi_phase', 'isolated') and sys.version_info >= (3, 12):
+        def _run_in_subinterpreter(self, script):
+            try:
+                import _interpreters
+            except ImportError: # Python 3.12
+                import _xxsubinterpreters as _interpreters
+            interp = _interpreters.create()
+            try:
+                try:
+                    error = _interpreters.run_string(interp, script)
+                except _interpreters.RunFailedError as ex: # Python 3.12
+                    error = ex
+            finally:
+                _interpreters.destroy(interp)
+            return error
+
+    if variant == 'multi_phase' and sys.version_info >= (3, 12):
+        def test_subinterpreter_refused(self):
+            error = self._run_in_subinterpreter(
+                "import sys\n"
+                "sys.path[:] = %r\n"
+                "import %s\n" % (sys.path, foo.__name__))
+            self.assertTrue(error is not None)
+            self.assertTrue('subinterpreters' in str(error), str(error))
+
+    if variant == 'isolated' and sys.version_info >= (3, 12):
+        def test_subinterpreter(self):
+            script = """
+import sys
+sys.path[:] = %r
+import %s as foo
+
+ln, msg = foo.SomeObject("hello ").add_prefix("gjc")
+assert msg == "hello gjc", msg
+
+class Test(foo.SomeObject):
+    def get_prefix(self):
+        return "yyy"
+assert Test("xxx").call_get_prefix() == "yyy"
+
+try:
+    foo.my_inverse_func(0)
+except foo.DomainError:
+    pass
+else:
+    raise AssertionError("DomainError not raised")
+
+assert [simple.xpto for simple in foo.get_simple_list()] == list(range(10))
+""" % (sys.path, foo.__name__)
+            for dummy in range(2):
+                error = self._run_in_subinterpreter(script)
+                self.assertTrue(error is None, getattr(error, 'formatted', error))
+            ## the types of the main interpreter are untouched
+            self.assertEqual(foo.SomeObject("hello ").add_prefix("gjc")[1], "hello gjc")
+            self.assertTrue(isinstance(foo.SomeObject, type))
+            self.assertTrue(foo.SomeObject.__flags__ & (1 << 9)) # Py_TPFLAGS_HEAPTYPE
+
+    if variant == 'lazy':
+        def test_lazy_init_star_import(self):
+            namespace = {}
+            exec("from %s import *" % foo.__name__, namespace)
+            self.assertTrue(namespace['SomeObject'] is foo.SomeObject)
+            self.assertTrue(namespace['ViewedItemVec'] is foo.ViewedItemVec)
+            self.assertTrue(namespace['xpto'] is foo.xpto)
+            self.assertEqual(len(foo.__all__), len(set(foo.__all__)))
+            self.assertFalse([name for name in foo.__all__ if name.startswith('_')])
+
+    if variant == 'free_threading':
+        def test_wrapper_registry_threads(self):
+            import threading
+            obj = foo.SomeObject("")
+            errors = []
+            def worker():
+                try:
+                    ## the wrapper of the same object is registered,
+                    ## looked up and unregistered concurrently
+                    for dummy in range(2000):
+                        z1 = obj.get_internal_zbr()
+                        z2 = obj.get_internal_zbr()
+                        if z1 is not z2:
+                            raise AssertionError("wrapper not found in the registry")
+                        del z1, z2
+                except Exception as ex:
+                    errors.append(ex)
+            threads = [threading.Thread(target=worker) for dummy in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+
+    if variant == 'profiling':
+        def test_wrapper_stats(self):
+            foo._reset_wrapper_stats()
+            for dummy in range(10):
+                foo.function_that_takes_foo(foo.Foo("x"))
+            self.assertRaises(TypeError, foo.function_that_takes_foo, 3)
+            stats = foo._wrapper_stats()
+            names = [name for name in stats if name.startswith(foo.__name__ + '.function_that_takes_foo')]
+            self.assertEqual(sum([stats[name]['calls'] for name in names]), 10)
+            self.assertEqual(sum([stats[name]['misses'] for name in names]), 1)
+            self.assertEqual(sum(stats[names[0]]['histogram']), stats[names[0]]['calls'])
+            foo._reset_wrapper_stats()
+            self.assertEqual(foo._wrapper_stats()[names[0]]['calls'], 0)
+
+    if variant == 'accounting':
+        def test_wrapper_accounting(self):
+            while gc.collect():
+                pass
+            before = foo._wrapper_accounting().get(foo.__name__ + '.Foo', {'live': 0, 'detached': 0, 'registered': 0})
+            obj = foo.SomeObject("")
+            f1 = foo.Foo("hello")
+            f2 = foo.Foo("world")
+            obj.set_foo_ptr(f2)
+            stats = foo._wrapper_accounting()[foo.__name__ + '.Foo']
+            self.assertEqual(stats['live'], before['live'] + 2)
+            self.assertEqual(stats['detached'], before['detached'] + 1)
+            self.assertEqual(stats['live'], stats['owned'] + stats['borrowed'] + stats['detached'])
+            f3 = obj.get_foo_ptr()
+            stats = foo._wrapper_accounting()[foo.__name__ + '.Foo']
+            self.assertEqual(stats['registered'], before['registered'] + 1)
+            del f1, f2, f3
+            while gc.collect():
+                pass
+            stats = foo._wrapper_accounting()[foo.__name__ + '.Foo']
+            self.assertEqual(stats['live'], before['live'])
+            self.assertEqual(stats['allocated'] - stats['freed'], stats['live'])
+
+        if sys.version_info >= (3, 7):
+            def test_wrapper_accounting_tracemalloc(self):
+                import tracemalloc
+                domain = 0x7062 # see foomodulegen.py
+                tracemalloc.start()
+                try:
+                    wrappers = [foo.Foo("hello") for dummy in range(10)]
+                    snapshot = tracemalloc.take_snapshot().filter_traces(
+                        [tracemalloc.DomainFilter(True, domain)])
+                    self.assertTrue(len(snapshot.traces) >= len(wrappers))
+                    del wrappers
+                    snapshot = tracemalloc.take_snapshot().filter_traces(
+                        [tracemalloc.DomainFilter(True, domain)])
+                    self.assertEqual(len(snapshot.traces), 0)
+                finally:
+                    tracemalloc.stop()
+
+    if which == 1: # the memory policy is not scanned by gccxml
+        def test_pooled_allocation(self):
+            while gc.collect():
+                pass
+            before = foo.PooledEvent._pool_stats()
+            instance_count = foo.PooledEvent.instance_count
+            events = [foo.PooledEvent(i) for i in range(100)]
+            events.append(foo.PooledPacket(100))
+            events.append(foo.pooled_event_copy(events[0]))
+            events.append(copy.copy(events[1]))
+            stats = foo.PooledEvent._pool_stats()
+            self.assertEqual(stats['in_use'], before['in_use'] + 103)
+            self.assertTrue(stats['capacity'] >= stats['in_use'])
+            self.assertEqual(stats['slabs'] * 64, stats['capacity'])
+            self.assertEqual(foo.PooledPacket._pool_stats(), stats)
+            self.assertEqual([event.get_id() for event in events[-5:]], [98, 99, 100, 0, 1])
+            self.assertEqual(events[100].get_priority(), 1)
+            del events
+            while gc.collect():
+                pass
+            stats = foo.PooledEvent._pool_stats()
+            self.assertEqual(stats['in_use'], before['in_use'])
+            self.assertEqual(foo.PooledEvent.instance_count, instance_count)
+
+            ## the slots are reused
+            capacity = stats['capacity']
+            events = [foo.PooledEvent(i) for i in range(100)]
+            self.assertEqual(foo.PooledEvent._pool_stats()['capacity'], capacity)
+            del events
+
+        def test_pooled_allocation_subclass(self):
+            class MyEvent(foo.PooledEvent):
+                def get_priority(self):
+                    return 7
+            before = foo.PooledEvent._pool_stats()
+            event = MyEvent(1)
+            self.assertEqual(event.call_get_priority(), 7)
+            self.assertEqual(foo.PooledEvent._pool_stats()['in_use'], before['in_use'] + 1)
+            del event
+            while gc.collect():
+                pass
+            self.assertEqual(foo.PooledEvent._pool_stats()['in_use'], before['in_use'])
+
+        def test_pooled_allocation_not_from_pool(self):
+            before = foo.PooledEvent._pool_stats()
+            instance_count = foo.PooledEvent.instance_count
+            event = foo.pooled_event_new(5)
+            self.assertEqual(foo.pooled_event_delete(event), 5)
+            event = foo.pooled_event_new(6)
+            del event
+            while gc.collect():
+                pass
+            stats = foo.PooledEvent._pool_stats()
+            self.assertEqual(stats['deleted'], before['deleted'] + 1)
+            self.assertEqual(stats['allocated'], before['allocated'])
+            self.assertEqual(foo.PooledEvent.instance_count, instance_count)
+
+            event = foo.PooledEvent(7)
+            self.assertRaises(TypeError, foo.pooled_event_delete, event)
+            self.assertEqual(event.get_id(), 7)
+
+        def test_pooled_allocation_returned_to_cpp(self):
+            class MyFactory(foo.PooledEventFactory):
+                def make(self, id):
+                    return foo.PooledEvent(id * 2)
+            while gc.collect():
+                pass
+            before = foo.PooledEvent._pool_stats()
+            instance_count = foo.PooledEvent.instance_count
+            factory = MyFactory()
+            ## C++ deletes a copy of the event, made outside of the pool
+            self.assertEqual(factory.consume(21), 42)
+            self.assertEqual(foo.PooledEventFactory().consume(5), 5)
+            while gc.collect():
+                pass
+            stats = foo.PooledEvent._pool_stats()
+            self.assertEqual(stats['in_use'], before['in_use'])
+            self.assertEqual(stats['allocated'], before['allocated'] + 1)
+            self.assertEqual(foo.PooledEvent.instance_count, instance_count)
+
+    if which == 1: # the container view option is not scanned by gccxml
+        def test_container_view(self):
+            items = foo.get_viewed_items(3)
+            copies = foo.ViewedItem.copies
+            self.assertEqual(len(items), 3)
+            self.assertEqual([item.get_value() for item in items], [0, 1, 2])
+            self.assertEqual(items[2].get_value(), 2)
+            self.assertEqual(foo.ViewedItem.copies, copies)
+
+            ## the element wrappers reference the elements in place
+            item = items[1]
+            item.set_value(10)
+            self.assertEqual(items[1].get_value(), 10)
+
+            ## and keep the container alive
+            del items
+            while gc.collect():
+                pass
+            self.assertEqual(item.get_value(), 10)
+            item.set_value(11)
+            self.assertEqual(item.get_value(), 11)
+
+        def test_container_view_pointers(self):
+            items = foo.get_viewed_item_ptrs()
+            self.assertEqual(len(items), 3)
+            self.assertTrue(items[1] is None)
+            self.assertEqual([item and item.get_value() for item in items], [1, None, 2])
+
+        def test_container_view_mapping(self):
+            items = foo.get_viewed_item_map()
+            copies = foo.ViewedItem.copies
+            item = items['two']
+            self.assertEqual(item.get_value(), 2)
+            item.set_value(20)
+            self.assertEqual(items['two'].get_value(), 20)
+            self.assertEqual(foo.ViewedItem.copies, copies)
+            del items
+            while gc.collect():
+                pass
+            self.assertEqual(item.get_value(), 20)
+
+    if which == 1: # set_has_move_constructor is not scanned by gccxml
+        def test_move_constructed_return_value(self):
+            copies = foo.Movable.copies
+            moves = foo.Movable.moves
+            movable = foo.make_movable(5)
+            self.assertEqual(movable.get_value(), 5)
+            self.assertEqual(foo.Movable.copies, copies)
+            self.assertEqual(foo.Movable.moves, moves + 1)
 
 
 if __name__ == '__main__':
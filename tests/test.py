@@ -2,7 +2,7 @@ from __future__ import unicode_literals, print_function
 import pybindgen.typehandlers.base as typehandlers
 from pybindgen.typehandlers import stringtype, ctypeparser
 import pybindgen.typehandlers.codesink as codesink
-from pybindgen import module, cppclass, overloading, utils
+from pybindgen import module, cppclass, overloading, utils, settings
     
 
 import unittest
@@ -60,9 +60,293 @@ class ParamLookupTests(unittest.TestCase):
         transformed = typehandlers.Parameter.new('MySmartPointer<testtype>', 'name')
         self.assertTrue(isinstance(transformed, TestParam))
         self.assertTrue(transformed.has_been_transformed)
+
+    def testStringViewReference(self):
+        handler = typehandlers.Parameter.new('const std::string_view&', 'name')
+        self.assertTrue(isinstance(handler, stringtype.StdStringViewParam))
+        self.assertRaises(typehandlers.TypeConfigurationError,
+                          typehandlers.Parameter.new, 'std::string_view&', 'name')
         
 
 
+## (method, argument) calls of a pygen sink, as ModuleParser makes them
+PYGEN_MAIN = [
+    ('writeln', "from pybindgen import Module, FileCodeSink, param, retval, cppclass, typehandlers"),
+    ('writeln', ""),
+    ('writeln', """
+import pybindgen.settings
+import warnings
+
+class ErrorHandler(pybindgen.settings.ErrorHandler):
+    def handle_error(self, wrapper, exception, traceback_):
+        warnings.warn("exception %r in wrapper %s" % (exception, wrapper))
+        return True
+pybindgen.settings.error_handler = ErrorHandler()
+
+"""),
+    ('writeln', "import sys"),
+    ('writeln', "import apimodel_section"),
+    ('writeln', "def module_init():"), ('indent', None),
+    ('writeln', "root_module = Module('apimodel', cpp_namespace='::')"),
+    ('writeln', "root_module.add_include('\"apimodel.h\"')"),
+    ('writeln', "return root_module"), ('unindent', None),
+    ('writeln', "def register_types(module):"), ('indent', None),
+    ('writeln', "root_module = module.get_root()"),
+    ('writeln', "## a comment"),
+    ('writeln', "module.add_class('Base', allow_subclassing=True, memory_policy=cppclass.ReferenceCountingMethodsPolicy("
+                "incref_method='Ref', decref_method='Unref', peekref_method='GetRef'))"),
+    ('writeln', "module.add_enum('Color', ['RED', 'GREEN'])"),
+    ('writeln', "module.add_container('std::vector< int >', 'int', container_type=u'vector')"),
+    ('writeln', "nested_module = module.add_cpp_namespace('ns')"),
+    ('writeln', "register_types_ns(nested_module)"),
+    ('writeln', "root_module.begin_section('apimodel_section')"),
+    ('writeln', "apimodel_section.register_types(module)"),
+    ('writeln', "\ntry:\n    import apimodel_section_local\nexcept ImportError:\n    pass\n"
+                "else:\n    apimodel_section_local.register_types(module)\n"),
+    ('writeln', "root_module.end_section('apimodel_section')"),
+    ('writeln', "return"), ('unindent', None),
+    ('writeln', "def register_types_ns(module):"), ('indent', None),
+    ('writeln', "root_module = module.get_root()"),
+    ('writeln', "module.add_class('Inner')"),
+    ('writeln', "return"), ('unindent', None),
+    ('writeln', "def register_methods(root_module):"), ('indent', None),
+    ('writeln', "register_Base_methods(root_module, root_module['Base'])"),
+    ('writeln', "register_Inner_methods(root_module, root_module['ns::Inner'])"),
+    ('writeln', "return"), ('unindent', None),
+    ('writeln', "def register_Base_methods(root_module, cls):"), ('indent', None),
+    ('writeln', "cls.add_constructor([])"),
+    ('writeln', "cls.add_method('Get', \n               'int', \n               [param('int', 'x', default_value='1')], "
+                "\n               is_virtual=True, is_const=True)"),
+    ('writeln', "cls.add_instance_attribute('value', 'int', is_const=False)"),
+    ('writeln', "cls.add_binary_comparison_operator('==')"),
+    ('writeln', "return"), ('unindent', None),
+    ('writeln', "def register_Inner_methods(root_module, cls):"), ('indent', None),
+    ('writeln', "cls.add_method('Set', 'void', [param('std::vector< int > const &', 'values')])"),
+    ('writeln', "cls.set_cannot_be_constructed(\"pure virtual method %r not wrapped\" % 'Foo')"),
+    ('writeln', "return"), ('unindent', None),
+    ('writeln', "def register_functions(root_module):"), ('indent', None),
+    ('writeln', "module = root_module"),
+    ('writeln', "module.add_function('Make', retval('Base *', caller_owns_return=True), [param('Color', 'color')])"),
+    ('writeln', "return"), ('unindent', None),
+    ('writeln', "def main():"), ('indent', None),
+    ('writeln', "out = FileCodeSink(sys.stdout)"),
+    ('writeln', "root_module = module_init()"),
+    ('writeln', "register_types(root_module)"),
+    ('writeln', "register_methods(root_module)"),
+    ('writeln', "register_functions(root_module)"),
+    ('writeln', "root_module.generate(out)"), ('unindent', None),
+    ('writeln', "if __name__ == '__main__':\n    main()"),
+]
+
+PYGEN_SECTION = [
+    ('writeln', "from pybindgen import Module, FileCodeSink, param, retval, cppclass, typehandlers"),
+    ('writeln', "def register_types(module):"), ('indent', None),
+    ('writeln', "root_module = module.get_root()"),
+    ('writeln', "module.add_class('Derived', parent=root_module['Base'])"),
+    ('writeln', "return"), ('unindent', None),
+]
+
+PYGEN_SECTION_LOCAL = """
+def register_types(module):
+    module['Derived'].add_method('Local', 'int', [])
+"""
+
+
+class ApiModelTests(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+        sys.path.insert(0, self.directory)
+
+    def tearDown(self):
+        import shutil
+        sys.path.remove(self.directory)
+        for name in ['apimodel_section_local']:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.directory)
+
+    def _write(self, file_name, sink_class, calls):
+        import os.path
+        with open(os.path.join(self.directory, file_name), 'w') as output:
+            sink = sink_class(output)
+            for method, argument in calls:
+                if argument is None:
+                    getattr(sink, method)()
+                else:
+                    getattr(sink, method)(argument)
+        return os.path.join(self.directory, file_name)
+
+    def _run(self, *args):
+        import os, subprocess
+        from pybindgen import apimodel
+        pybindgen_directory = os.path.dirname(os.path.dirname(os.path.abspath(apimodel.__file__)))
+        env = dict(os.environ, PYTHONHASHSEED='0',
+                   PYTHONPATH=os.pathsep.join([self.directory, pybindgen_directory]))
+        return subprocess.check_output((sys.executable,) + args, env=env).decode('utf-8')
+
+    def _write_models(self):
+        from pybindgen import apimodel
+        import os.path
+        with open(os.path.join(self.directory, 'apimodel_section_local.py'), 'w') as local:
+            local.write(PYGEN_SECTION_LOCAL)
+        self._write('apimodel_main.py', codesink.FileCodeSink, PYGEN_MAIN)
+        self._write('apimodel_section.py', codesink.FileCodeSink, PYGEN_SECTION)
+        self._write('apimodel_section.json', apimodel.ApiModelCodeSink, PYGEN_SECTION)
+        return self._write('apimodel.json', apimodel.ApiModelCodeSink, PYGEN_MAIN)
+
+    def testSameModuleAsPygen(self):
+        import os.path
+        main_file_name = self._write_models()
+        expected = self._run(os.path.join(self.directory, 'apimodel_main.py'))
+        self.assertTrue('Local' in expected)
+        generated = self._run('-c', "import sys\n"
+                              "from pybindgen import FileCodeSink\n"
+                              "from pybindgen.apimodel import load_api_model\n"
+                              "load_api_model(sys.argv[1]).generate(FileCodeSink(sys.stdout))\n",
+                              main_file_name)
+        self.assertEqual(generated, expected)
+
+    def testSectionsLoadedOnFirstUse(self):
+        from pybindgen import apimodel
+        model = apimodel.ApiModel(self._write_models())
+        root_module = model.call('module_init')
+        self.assertEqual(list(model._sections.keys()), ['__main__'])
+        model.call('register_types', root_module)
+        self.assertEqual(sorted(model._sections.keys()), ['__main__', 'apimodel_section'])
+        self.assertTrue('Local' in root_module['Derived'].methods) # customized
+
+
+class BalancedMultiSectionTests(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def _read(self, file_name):
+        import os.path
+        with open(os.path.join(self.directory, file_name)) as section_file:
+            return section_file.read()
+
+    def _generate(self, **kwargs):
+        import os.path
+        mod = module.Module('bar')
+        mod.add_include('"bar.h"')
+        mod.begin_section('bar_pinned')
+        mod.add_class('Pinned').add_method('Get', 'int', [])
+        mod.end_section('bar_pinned')
+        for index in range(6):
+            class_ = mod.add_class('Class%i' % index)
+            for method in range(index + 1):
+                class_.add_method('Method%i' % method, 'int', [])
+        mod.add_function('Function', 'int', [])
+
+        factory = module.BalancedMultiSectionFactory(os.path.join(self.directory, 'barmodule.cc'), 3, **kwargs)
+        mod.generate(factory)
+        factory.close()
+        return mod, factory
+
+    def testSections(self):
+        import os
+        mod, factory = self._generate()
+
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['bar_pinned.cc', 'barmodule.cc', 'barmodule.h',
+                          'barmodule_part0.cc', 'barmodule_part1.cc', 'barmodule_part2.cc'])
+        self.assertTrue('_wrap_PyPinned_Get' in self._read('bar_pinned.cc'))
+        sizes = [factory.section_sizes[name] for name in factory.section_names]
+        self.assertTrue(max(sizes) - min(sizes) <= max([factory.estimate_wrapper_size(class_)
+                                                        for class_ in mod.classes]))
+        for name in factory.section_names:
+            code = self._read(name + '.cc')
+            self.assertEqual(code.count('#include "barmodule.h"'), 1)
+        for index in range(6):
+            sections = [name for name in factory.section_names
+                        if ('_wrap_PyClass%i_Method0(' % index) in self._read(name + '.cc')]
+            self.assertEqual(len(sections), 1)
+
+    def testPrecompiledHeader(self):
+        import os
+        mod, factory = self._generate(precompiled_header=True)
+        hints = factory.get_build_hints()
+        self.assertEqual(hints['precompiled_header'], os.path.join(self.directory, 'barmodule_pch.h'))
+        self.assertEqual(sorted([os.path.basename(source) for source in hints['sources']]),
+                         ['bar_pinned.cc', 'barmodule.cc',
+                          'barmodule_part0.cc', 'barmodule_part1.cc', 'barmodule_part2.cc'])
+        precompiled_header = self._read('barmodule_pch.h')
+        self.assertTrue('#include <Python.h>' in precompiled_header)
+        self.assertTrue('#include "bar.h"' in precompiled_header)
+        header = self._read('barmodule.h')
+        self.assertFalse('#include' in header)
+        self.assertTrue('PyClass0' in header)
+        for source in hints['sources']:
+            self.assertTrue(self._read(source).startswith('#include "barmodule_pch.h"\n'
+                                                          '#include "barmodule.h"\n'))
+
+        ## an unchanged precompiled header is not rewritten
+        os.utime(hints['precompiled_header'], (0, 0))
+        self._generate(precompiled_header=True)
+        self.assertEqual(os.stat(hints['precompiled_header']).st_mtime, 0)
+
+
+class WrapperAccountingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_accounting = settings.wrapper_accounting
+        settings.wrapper_accounting = True
+
+    def tearDown(self):
+        settings.wrapper_accounting = self.saved_accounting
+
+    def testCustomSlotsExcludeHierarchy(self):
+        mod = module.Module('accounting')
+        base = mod.add_class('Base')
+        derived = mod.add_class('Derived', parent=base)
+        other = mod.add_class('Other')
+        self.assertTrue(base.wrapper_accounting)
+        self.assertTrue(derived.wrapper_accounting)
+
+        ## the subclass would inherit the tp_new linking its wrappers
+        derived.slots['tp_dealloc'] = '_wrap_custom_tp_dealloc'
+        self.assertFalse(base.wrapper_accounting)
+        self.assertFalse(derived.wrapper_accounting)
+        self.assertTrue(other.wrapper_accounting)
+
+    def testCachedWhileGenerating(self):
+        mod = module.Module('accounting')
+        base = mod.add_class('Base')
+        derived = mod.add_class('Derived', parent=base)
+        cppclass.cache_wrapper_accounting([base, derived])
+        derived.slots['tp_dealloc'] = '_wrap_custom_tp_dealloc'
+        self.assertTrue(derived.wrapper_accounting)
+
+        ## generating the module computes and then forgets the cache
+        mod.generate(codesink.MemoryCodeSink())
+        self.assertFalse(base.wrapper_accounting)
+        del derived.slots['tp_dealloc']
+        self.assertTrue(derived.wrapper_accounting)
+
+
+class WrapperProfilingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_settings = (settings.wrapper_profiling, settings.free_threading)
+        settings.wrapper_profiling = True
+
+    def tearDown(self):
+        settings.wrapper_profiling, settings.free_threading = self.saved_settings
+
+    def testFreeThreadingRejected(self):
+        settings.free_threading = True
+        mod = module.Module('profiling')
+        mod.add_function('f', None, [])
+        self.assertRaises(ValueError, mod.generate, codesink.MemoryCodeSink())
+
+
 if __name__ == '__main__':
     suite = unittest.TestSuite()
 
@@ -83,6 +367,10 @@ if __name__ == '__main__':
             suite.addTest(doctest.DocTestSuite(mod))
 
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ParamLookupTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ApiModelTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(BalancedMultiSectionTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(WrapperAccountingTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(WrapperProfilingTests))
     runner = unittest.TextTestRunner()
     runner.run(suite)
 
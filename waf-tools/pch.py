@@ -0,0 +1,37 @@
+"""
+Precompiled headers for C++ task generators, e.g. for a module
+generated by pybindgen's BalancedMultiSectionFactory with
+precompiled_header=True:
+
+	bld(features='cxx cxxshlib pyext pch',
+	    source=['foomodule.cc', 'foomodule_part0.cc', 'foomodule_part1.cc'],
+	    pch='foomodule_pch.h',
+	    target='foo')
+
+The header is compiled, with the flags of the task generator, to a
+.gch file next to it, which gcc then uses instead of the header when
+a source file includes it before anything else.  Other compilers
+just include the header.
+"""
+
+from waflib import Task, TaskGen
+
+
+class cxxpch(Task.Task):
+	run_str = '${CXX} ${ARCH_ST:ARCH} ${CXXFLAGS} ${CPPFLAGS} ${FRAMEWORKPATH_ST:FRAMEWORKPATH} ${CPPPATH_ST:INCPATHS} ${DEFINES_ST:DEFINES} -x c++-header ${SRC} -o ${TGT}'
+	color = 'BLUE'
+	ext_out = ['.h']
+
+
+@TaskGen.feature('pch')
+@TaskGen.after_method('propagate_uselib_vars', 'apply_incpaths', 'process_source')
+def apply_pch(self):
+	header = getattr(self, 'pch', None)
+	if not header or self.env['CXX_NAME'] != 'gcc':
+		return
+	if isinstance(header, str):
+		header = self.path.find_or_declare(header)
+	task = self.create_task('cxxpch', header, header.parent.find_or_declare(header.name + '.gch'))
+	for compiled_task in getattr(self, 'compiled_tasks', []):
+		compiled_task.set_run_after(task)
+		compiled_task.dep_nodes.append(task.outputs[0])